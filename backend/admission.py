@@ -0,0 +1,217 @@
+import os
+import math
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+import metrics
+
+logger = logging.getLogger(__name__)
+
+REJECTIONS = metrics.registry.counter(
+    'pennysprout_parse_rejections_total', 'Parse requests turned away with 429, by the limit they hit',
+    labels=('queue', 'limit'))
+
+# Seconds per file Retry-After assumes until a parse has been timed
+INITIAL_FILE_SECONDS = 1.0
+
+# Weight of the latest request in the moving average of seconds per file
+FILE_SECONDS_WEIGHT = 0.2
+
+# Seconds between a process's heartbeats for the files it holds in a shared count, and without
+# one after which they are given back, as the process is taken to be gone
+ADMISSION_HEARTBEAT = 10
+ADMISSION_EXPIRY = 60
+
+
+class Overloaded(Exception):
+    """
+    No room to parse a request's files now; retry_after is a suggested wait in whole seconds
+    """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ParseAdmission:
+    """
+    Admission control for parsing: a bound on the files being parsed or
+    waiting for a parser, overall and per tenant.
+
+    A request is admitted with all of its files or turned away with
+    Overloaded, so the queue in front of the `workers` parser processes
+    never grows past queue_limit files and no tenant holds more than
+    tenant_limit of them while others wait. A request is always admitted
+    while nothing else (overall, or of its tenant) is in flight, so a batch
+    larger than a limit still gets its turn. A limit of 0 is no limit.
+
+    acquire() counts files for requests parsed while the client waits: in
+    the SQLite file at path, shared by every server process using it, or
+    in this process without one. In the shared count, each process tags
+    its files with a token of its own and a thread renews their heartbeat
+    every ADMISSION_HEARTBEAT seconds while it holds any; files whose
+    heartbeat is older than ADMISSION_EXPIRY, left by a process that died,
+    are given back by the next acquire(). This relies only on the clocks of
+    the hosts sharing the file agreeing to within the expiry. check() takes
+    the counts from elsewhere, e.g. the job queue's backlog. name labels
+    rejections in the metrics.
+    """
+
+    def __init__(self, name, queue_limit, tenant_limit, workers, path=None):
+        self.name = name
+        self.queue_limit = queue_limit
+        self.tenant_limit = tenant_limit
+        self.workers = max(1, workers)
+        self.path = path
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._tenants = {}
+        self._file_seconds = INITIAL_FILE_SECONDS
+        # This process's token and the count of its admissions in the shared count
+        self._token = None
+        self._token_pid = None
+        self._held = 0
+        if path:
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                # Admissions were once tagged with pids, which mean nothing across hosts; they are only in flight
+                if 'pid' in [row[1] for row in conn.execute("PRAGMA table_info(admissions)")]:
+                    conn.execute("DROP TABLE admissions")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS admissions (
+                        id INTEGER PRIMARY KEY,
+                        queue TEXT NOT NULL,
+                        tenant TEXT,
+                        files INTEGER NOT NULL,
+                        token TEXT NOT NULL,
+                        heartbeat_at REAL NOT NULL
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS admissions_token ON admissions (token)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def check(self, files, in_flight, tenant_in_flight, file_seconds=None):
+        """
+        Raise Overloaded if admitting `files` more files would go over a
+        limit; file_seconds overrides the estimate used for retry_after
+        """
+        if self.queue_limit and in_flight and in_flight + files > self.queue_limit:
+            REJECTIONS.inc(queue=self.name, limit='queue')
+            raise Overloaded(f"The parse queue is full ({in_flight} files); try again later",
+                             self.retry_after(in_flight + files - self.queue_limit, file_seconds))
+        if self.tenant_limit and tenant_in_flight and tenant_in_flight + files > self.tenant_limit:
+            REJECTIONS.inc(queue=self.name, limit='tenant')
+            raise Overloaded(f"{tenant_in_flight} of your files are still being parsed; try again when they finish",
+                             self.retry_after(tenant_in_flight + files - self.tenant_limit, file_seconds))
+
+    def retry_after(self, files, file_seconds=None):
+        """
+        Whole seconds the parser processes should take to get through `files` files
+        """
+        return max(1, math.ceil((file_seconds or self._file_seconds) * files / self.workers))
+
+    def acquire(self, tenant, files):
+        """
+        Admit a request's files or raise Overloaded.
+
+        Returns the function that gives the files' places back, which must
+        be called once the request is done with them; calling it again does
+        nothing.
+        """
+        if not files:
+            return lambda: None
+        admission_id = None
+        if self.path:
+            with self._connect() as conn:
+                # Counting and admitting in one write transaction, so processes admit one at a time
+                conn.execute("BEGIN IMMEDIATE")
+                now = time.time()
+                # Held by a process that stopped renewing them: one killed mid-request, on any host
+                conn.execute("DELETE FROM admissions WHERE heartbeat_at < ?", (now - ADMISSION_EXPIRY,))
+                self.check(files, *self._counts(conn, tenant))
+                admission_id = conn.execute(
+                    "INSERT INTO admissions (queue, tenant, files, token, heartbeat_at) VALUES (?, ?, ?, ?, ?)",
+                    (self.name, tenant, files, self._process_token(), now)).lastrowid
+            with self._lock:
+                self._held += 1
+        else:
+            with self._lock:
+                tenant_in_flight = self._tenants.get(tenant, 0)
+                self.check(files, self._in_flight, tenant_in_flight)
+                self._in_flight += files
+                self._tenants[tenant] = tenant_in_flight + files
+        start = time.monotonic()
+        released = False
+
+        def release():
+            nonlocal released
+            with self._lock:
+                if released:
+                    return
+                released = True
+                if admission_id is not None:
+                    self._held -= 1
+                    with self._connect() as conn:
+                        conn.execute("DELETE FROM admissions WHERE id = ?", (admission_id,))
+                else:
+                    self._in_flight -= files
+                    remaining = self._tenants.pop(tenant) - files
+                    if remaining:
+                        self._tenants[tenant] = remaining
+                # The files were parsed up to `workers` at a time
+                seconds = (time.monotonic() - start) * min(files, self.workers) / files
+                self._file_seconds += FILE_SECONDS_WEIGHT * (seconds - self._file_seconds)
+
+        return release
+
+    def in_flight(self, tenant=None):
+        """
+        Files admitted by acquire() and not yet released, overall or of one tenant
+        """
+        if self.path:
+            with self._connect() as conn:
+                in_flight, tenant_in_flight = self._counts(conn, tenant)
+            return in_flight if tenant is None else tenant_in_flight
+        with self._lock:
+            return self._in_flight if tenant is None else self._tenants.get(tenant, 0)
+
+    def _counts(self, conn, tenant):
+        return conn.execute(
+            "SELECT COALESCE(SUM(files), 0), COALESCE(SUM(CASE WHEN tenant IS ? THEN files END), 0) "
+            "FROM admissions WHERE queue = ?", (tenant, self.name)).fetchone()
+
+    def _process_token(self):
+        """
+        Return this process's token, starting its heartbeat thread on first use; a forked process gets its own
+        """
+        with self._lock:
+            if self._token_pid != os.getpid():
+                self._token = uuid.uuid4().hex
+                self._token_pid = os.getpid()
+                self._held = 0
+                threading.Thread(target=self._heartbeat, args=(self._token,), name=f"{self.name}-admission-heartbeat",
+                                 daemon=True).start()
+            return self._token
+
+    def _heartbeat(self, token):
+        while True:
+            time.sleep(ADMISSION_HEARTBEAT)
+            if not self._held:
+                continue
+            try:
+                with self._connect() as conn:
+                    conn.execute("UPDATE admissions SET heartbeat_at = ? WHERE token = ?", (time.time(), token))
+            except sqlite3.Error as e:
+                logger.error(f"Admission heartbeat failed: {str(e)}")
@@ -0,0 +1,84 @@
+import numpy as np
+from categorizer import UNCATEGORIZED
+
+
+def factorize(keys):
+    """
+    Return (unique keys in first-seen order, integer code of each key)
+    """
+    codes_by_key = dict.fromkeys(keys)
+    for code, key in enumerate(codes_by_key):
+        codes_by_key[key] = code
+    return list(codes_by_key), np.fromiter(map(codes_by_key.__getitem__, keys), dtype=np.int64, count=len(keys))
+
+
+def _group_sum(codes, size, *weights):
+    """
+    Group-by-sum over integer codes: return row counts and one sum per weight array
+    """
+    counts = np.bincount(codes, minlength=size)
+    # bincount sums in float64, which is exact for cent totals below 2**53
+    sums = [np.rint(np.bincount(codes, weights=weight, minlength=size)).astype(np.int64) for weight in weights]
+    return counts, sums
+
+
+def _codes(array_column):
+    return np.frombuffer(array_column, dtype=np.uint32).astype(np.int64)
+
+
+def rollup(batch, merchant_ids=None):
+    """
+    Group a TransactionBatch into the totals behind the Dashboard and Insights views.
+
+    Returns lists of rows, with every amount in cents:
+      monthly:         (month, income, expense, count)
+      merchants:       (merchant, expense, count)    expenses only; the merchant
+                       is merchant_ids[description] if given, else the description
+      category_months: (category, month, expense, count)    expenses only
+      accounts:        (account, net, count)
+    Positive amounts are income and everything else counts as expense, like
+    the client-side analysis this replaces.
+    """
+    result = {"monthly": [], "merchants": [], "category_months": [], "accounts": []}
+    if not len(batch):
+        return result
+
+    cents = np.frombuffer(batch.cents, dtype=np.int64)
+    income = np.where(cents > 0, cents, 0)
+    expense = np.where(cents > 0, 0, -cents)
+
+    # Epoch days -> months since 1970-01, grouped by sorting the few distinct values
+    month_numbers = np.frombuffer(batch.days, dtype=np.int32).astype('datetime64[D]').astype('datetime64[M]')
+    month_keys, month_codes = np.unique(month_numbers, return_inverse=True)
+    months = np.datetime_as_string(month_keys).tolist()
+
+    counts, (income_sums, expense_sums) = _group_sum(month_codes, len(months), income, expense)
+    result["monthly"] = list(zip(months, income_sums.tolist(), expense_sums.tolist(), counts.tolist()))
+
+    # The batch's dictionary codes are reused; only the dictionaries are normalized
+    accounts, account_remap = factorize([account or '' for account in batch.accounts])
+    counts, (net_sums,) = _group_sum(account_remap[_codes(batch.account_codes)], len(accounts), cents)
+    result["accounts"] = list(zip(accounts, net_sums.tolist(), counts.tolist()))
+
+    is_expense = cents < 0
+    if is_expense.any():
+        spent = -cents[is_expense]
+
+        spent_descriptions = [description for description, spending
+                              in zip(batch.descriptions, is_expense.tolist()) if spending]
+        if merchant_ids is not None:
+            spent_descriptions = [merchant_ids[description] for description in spent_descriptions]
+        merchants, merchant_codes = factorize(spent_descriptions)
+        counts, (spent_sums,) = _group_sum(merchant_codes, len(merchants), spent)
+        result["merchants"] = list(zip(merchants, spent_sums.tolist(), counts.tolist()))
+
+        # Group on (category, month) pairs through a single integer code per row
+        categories, category_remap = factorize([category or UNCATEGORIZED for category in batch.categories])
+        category_codes = category_remap[_codes(batch.category_codes)[is_expense]]
+        pair_codes = category_codes * len(months) + month_codes[is_expense]
+        counts, (spent_sums,) = _group_sum(pair_codes, len(categories) * len(months), spent)
+        result["category_months"] = [
+            (categories[code // len(months)], months[code % len(months)], int(spent_sums[code]), int(counts[code]))
+            for code in np.flatnonzero(counts).tolist()
+        ]
+    return result
@@ -1,589 +1,748 @@
 import os
 import json
-import re
+import time
 import logging
-from datetime import datetime
-from flask import Flask, request, jsonify
+import shutil
+import tempfile
+import importlib
+from functools import partial
+from flask import Blueprint, Flask, Response, current_app, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-import PyPDF2
+import metrics
+from admission import Overloaded, ParseAdmission
+from categorizer import (CATEGORY_KEYWORDS, current_category_keywords, get_categorizer, set_category_keywords,
+                         use_stored_rules)
+from dedup import UploadDeduplicator
+from export import ARROW_FORMATS, EXPORT_FORMATS, arrow_available, batch_columns, iter_export
+from ml_categorizer import fill_uncategorized, get_ml_categorizer
+from ingest import DEFAULT_PARSE_LIMITS, DEFAULT_PARSE_TIMEOUT, DEFAULT_PARSE_WORKERS, iter_parse_files, parse_files
+from parse_cache import DEFAULT_PARSE_CACHE_MAX_BYTES, ParseCache, content_key, parser_fingerprint, sha256_stream
+from jobs import DEFAULT_JOB_MAX_ATTEMPTS, JobQueue
+from transaction_store import DEFAULT_PAGE_SIZE, DEFAULT_TOP_MERCHANTS, TransactionStore
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-CORS(app)
-
-# Configure upload folder
-UPLOAD_FOLDER = 'uploads'
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
-
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'pdf'}
 
-def allowed_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+# Accept header value that selects the streaming parse-statements response
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# Modules the first parse would otherwise import; a warm start loads them up front
+WARM_START_MODULES = ('PyPDF2', 'PyPDF2._cmap', 'pdf_layout')
+
+api = Blueprint('api', __name__)
 
-# Dictionary of known bank/card statement formats
-BANK_FORMATS = {
-    'discover': {
-        'header_patterns': [r'DISCOVER', r'(CARD|CARDMEMBER)'],  # Relaxed pattern matching
-        'transaction_patterns': [
-            r'(\d{2}/\d{2})\s+(.*?)\s+(\w+)\s+([-]?\$?\d+\.\d{2})$',
-            r'(\d{2}/\d{2}/\d{2})\s+(.*?)\s+(\w+)\s+([-]?\$\d+\.\d{2})$',
-            r'(\d{2}/\d{2})\s+(.*?)\s+([-]?\$?\d+\.\d{2})$'
-        ],
-        'transaction_section_markers': ['TRANS.', 'DATE', 'PURCHASES', 'MERCHANT', 'CATEGORY', 'AMOUNT'],
-        'balance_pattern': r'New Balance[:\s]+\$([\d,]+\.\d{2})',
-        'credit_limit_pattern': r'Credit Line[:\s]+\$([\d,]+)',
-        'payment_due_pattern': r'Payment Due Date[:\s]+([\d/]+)',
-        'minimum_payment_pattern': r'Minimum Payment Due[:\s]+\$([\d,]+\.\d{2})'
-    },
-    'orange_county_credit_union': {
-        'header_patterns': [r'ORANGE COUNTY', r'CREDIT UNION'],  # Relaxed pattern matching
-        'transaction_patterns': [
-            r'(\d{2}/\d{2}/\d{2})\s+(\d{2}/\d{2}/\d{2})\s+([-]?\d+\.\d{2})?\s+(\d+\.\d{2})?\s+(\d+\.\d{2})\s+(.*?)$',
-            r'(\d{2}/\d{2}/\d{2})\s+(\d{2}/\d{2}/\d{2})\s+([-]?\d+\.\d{2})\s+(.*?)\s+([-]?\d+\.\d{2})$'
-        ],
-        'transaction_section_markers': ['Transaction', 'Date', 'Posting', 'Date', 'Withdrawal', 'Deposit', 'Balance'],
-        'balance_pattern': r'Ending Balance[:\s]+\$([\d,]+\.\d{2})',
-        'beginning_balance_pattern': r'Beginning Balance[:\s]+\$([\d,]+\.\d{2})',
+def default_config():
+    """
+    Settings read from the environment, with their defaults
+    """
+    parse_workers = int(os.environ.get('PARSE_WORKERS', DEFAULT_PARSE_WORKERS))
+    server_workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+    # Parser processes behind the admission counts: every server process's when they share JOBS_PATH
+    parsers = max(1, parse_workers) * (server_workers if os.environ.get('JOBS_PATH', 'jobs.sqlite3') else 1)
+    return {
+        'LOG_LEVEL': os.environ.get('LOG_LEVEL', 'INFO').upper(),  # DEBUG logs every pattern match and fallback row
+        'UPLOAD_FOLDER': os.environ.get('UPLOAD_FOLDER', 'uploads'),
+        'MAX_CONTENT_LENGTH': 16 * 1024 * 1024,  # 16MB max upload size
+        'PARSE_WORKERS': parse_workers,  # 0 parses in-process
+        'SERVER_WORKERS': server_workers,  # server processes, as gunicorn.conf.py sets WEB_CONCURRENCY
+        # Seconds each file may parse for once a parser process starts on it (PARSE_WORKERS > 0 only)
+        'PARSE_TIMEOUT': float(os.environ.get('PARSE_TIMEOUT', DEFAULT_PARSE_TIMEOUT)),
+        # Per-file budgets, 0 for none; CPU and memory only hold in parser processes (PARSE_WORKERS > 0)
+        'PARSE_CPU_SECONDS': int(os.environ.get('PARSE_CPU_SECONDS', DEFAULT_PARSE_LIMITS['cpu_seconds'])),
+        'PARSE_MEMORY_MB': int(os.environ.get('PARSE_MEMORY_MB', DEFAULT_PARSE_LIMITS['memory_mb'])),
+        'PARSE_MAX_PAGES': int(os.environ.get('PARSE_MAX_PAGES', DEFAULT_PARSE_LIMITS['max_pages'])),
+        # Rows the looser passes may find in a statement no transaction section matched
+        'FALLBACK_MAX_ROWS': int(os.environ.get('FALLBACK_MAX_ROWS', DEFAULT_PARSE_LIMITS['max_fallback_rows'])),
+        # Files parsing or waiting to before a 429, counted across the server processes sharing JOBS_PATH (per
+        # process without it); by default 4 per parser process of all of them. 0 for no limit
+        'PARSE_QUEUE_LIMIT': int(os.environ.get('PARSE_QUEUE_LIMIT', 4 * parsers)),
+        # Of those, per tenant: by default half the parsers, so one tenant cannot take them all
+        'PARSE_TENANT_LIMIT': int(os.environ.get('PARSE_TENANT_LIMIT', max(1, parsers // 2))),
+        # Request header naming the tenant, set by an authenticating proxy; empty uses the client address
+        'TENANT_HEADER': os.environ.get('TENANT_HEADER', ''),
+        # >1 splits 100+ page PDFs by page range; in parser processes, only without CPU time and memory limits
+        'PAGE_WORKERS': int(os.environ.get('PAGE_WORKERS', 0)),
+        # Read table sections by column position (pdf_layout); off until checked against more real statements
+        'PDF_LAYOUT': os.environ.get('PDF_LAYOUT', '') == '1',
+        'SPOOL_THRESHOLD': int(os.environ.get('SPOOL_THRESHOLD', 4 * 1024 * 1024)),  # bytes parsed in memory
+        'PARSE_CACHE_PATH': os.environ.get('PARSE_CACHE_PATH', 'parse_cache.sqlite3'),  # empty disables
+        'PARSE_CACHE_MAX_BYTES': int(os.environ.get('PARSE_CACHE_MAX_BYTES', DEFAULT_PARSE_CACHE_MAX_BYTES)),
+        'TRANSACTION_STORE_PATH': os.environ.get('TRANSACTION_STORE_PATH', 'transactions.sqlite3'),  # empty disables
+        'JOBS_PATH': os.environ.get('JOBS_PATH', 'jobs.sqlite3'),  # empty disables the job API
+        'JOB_MAX_ATTEMPTS': int(os.environ.get('JOB_MAX_ATTEMPTS', DEFAULT_JOB_MAX_ATTEMPTS)),
+        'JOB_QUEUE_LIMIT': int(os.environ.get('JOB_QUEUE_LIMIT', 1000)),  # queued or running job files; 0 for no limit
+        'JOB_TENANT_LIMIT': int(os.environ.get('JOB_TENANT_LIMIT', 100)),  # of those, per tenant
+        # Off: jobs re-queued at startup wait for the next job request or JobQueue.resume() (see gunicorn.conf.py)
+        'START_JOB_DISPATCHER': os.environ.get('START_JOB_DISPATCHER', '1') == '1',
+        'WARM_START': os.environ.get('WARM_START', '') == '1',  # load parser state now, not on first use
+        'PROFILE_REQUESTS': os.environ.get('PROFILE_REQUESTS', '') == '1',  # allow ?profile=1 per request
+        'PROFILE_DIR': os.environ.get('PROFILE_DIR', 'profiles')
     }
-}
-
-# Categories for transactions based on keywords
-CATEGORY_KEYWORDS = {
-    'Restaurants': ['restaurant', 'cafe', 'coffee', 'food', 'dining', 'dine', 'eat', 'tst*', 'burger', 'pizza', 
-                   'breakfast', 'lunch', 'dinner', 'bar', 'grill', 'kitchen', 'bakery', 'donut', 'wing', 'jollibee',
-                   'wingstop', 'elpolloloco', 'matcha', 'boba', 'tea studio', 'marugame', 'carls jr'],
-    'Groceries': ['grocery', 'supermarket', 'market', 'food', 'sprouts', 'target', 'walmart', 'costco', 'trader', 
-                 'whole foods', 'farmers market', 'mitsuwa', 'lazy acres'],
-    'Transportation': ['gas', 'fuel', 'chevron', 'shell', 'uber', 'lyft', 'taxi', 'car', 'auto', 'parking', 'toll'],
-    'Entertainment': ['movie', 'cinema', 'theater', 'concert', 'event', 'ticket', 'netflix', 'spotify', 'hulu', 
-                     'disney', 'amazon prime', 'game', 'steam', 'playstation', 'xbox', 'amusement', 'bowlero', 'round1'],
-    'Shopping': ['amazon', 'target', 'walmart', 'ebay', 'etsy', 'clothing', 'shoe', 'apparel', 'store', 'mall', 
-                'shop', 'retail', 'uniqlo', 'merchandise', 'top canvas', 'pop mart'],
-    'Utilities': ['electric', 'water', 'gas', 'utility', 'internet', 'phone', 'cable', 'att', 'verizon', 'spectrum', 
-                 'comcast', 'bill'],
-    'Health': ['doctor', 'hospital', 'clinic', 'medical', 'dental', 'pharmacy', 'prescription', 'cvs', 'walgreens', 
-              'health', 'fitness', 'gym'],
-    'Travel': ['hotel', 'flight', 'airline', 'airbnb', 'vacation', 'trip', 'travel', 'booking'],
-    'Education': ['school', 'college', 'university', 'tuition', 'book', 'course', 'class', 'education', 'student'],
-    'Subscription': ['subscription', 'membership', 'recurring'],
-    'Financial': ['payment', 'transfer', 'deposit', 'withdraw', 'fee', 'interest', 'loan', 'mortgage', 'rent'],
-    'Insurance': ['insurance', 'premium', 'coverage', 'policy'],
-    'Gifts & Donations': ['gift', 'donation', 'charity', 'contribute'],
-    'Services': ['service', 'repair', 'maintenance', 'clean', 'salon', 'barber', 'haircut', 'spa', 'laundry', 
-                'college liquidation', 'parking']
-}
-
-def categorize_transaction(description):
-    """
-    Simple rule-based categorization
-    """
-    # Convert description to lowercase for better matching
-    description_lower = description.lower()
-    
-    # First, check direct matches with keywords
-    for category, keywords in CATEGORY_KEYWORDS.items():
-        for keyword in keywords:
-            if keyword.lower() in description_lower:
-                return category
-    
-    # If no direct match is found, return 'Uncategorized'
-    return 'Uncategorized'
 
-def parse_pdf(file_path):
+def create_app(config=None):
     """
-    Parse a PDF file to extract bank statement information
+    Build the app: settings from the environment, overridden by config, and
+    the stores they enable.
+
+    With WARM_START, everything requests would load on first use (the PDF
+    reader, compiled categorizers, the category model, the dedup filter) is
+    loaded now. A prefork server that loads the app before forking (see
+    gunicorn.conf.py) then shares it between its workers copy-on-write.
     """
-    logger.debug(f"Parsing PDF file: {file_path}")
-    try:
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            
-            # Extract text from all pages
-            full_text = ""
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                full_text += page.extract_text() + "\n"
-            
-            logger.debug(f"First 200 characters of PDF: {full_text[:200]}")
-            
-            # Identify the bank type based on patterns
-            bank_type = identify_bank_type(full_text)
-            
-            if bank_type:
-                logger.info(f"Identified bank type: {bank_type}")
-                # Extract statement information based on bank type
-                return extract_statement_info(full_text, bank_type)
-            else:
-                # If bank type cannot be determined, try a fallback
-                logger.warning("Bank type not identified. Checking for known keywords...")
-                
-                # Check for Discover keywords
-                if 'DISCOVER' in full_text or 'Discover' in full_text:
-                    logger.info("Found Discover keyword. Using Discover format.")
-                    return extract_statement_info(full_text, 'discover')
-                # Check for Orange County Credit Union keywords
-                elif 'ORANGE COUNTY' in full_text or 'Credit Union' in full_text:
-                    logger.info("Found OCCU keyword. Using OCCU format.")
-                    return extract_statement_info(full_text, 'orange_county_credit_union')
-                else:
-                    logger.error("Unsupported bank statement format")
-                    return {
-                        "error": "Unsupported bank statement format. Currently supporting Discover and Orange County Credit Union statements."
-                    }
-    except Exception as e:
-        logger.error(f"Error parsing PDF: {str(e)}")
-        raise Exception(f"Error parsing PDF: {str(e)}")
-
-def identify_bank_type(text):
-    """
-    Identify the bank type based on header patterns
-    """
-    for bank, patterns in BANK_FORMATS.items():
-        header_matches = 0
-        for pattern in patterns['header_patterns']:
-            if re.search(pattern, text, re.IGNORECASE):
-                header_matches += 1
-                logger.debug(f"Matched pattern '{pattern}' for bank '{bank}'")
-        
-        # If all header patterns match, return the bank type
-        if header_matches == len(patterns['header_patterns']):
-            return bank
-    
-    return None
+    start = time.perf_counter()
+    app = Flask(__name__)
+    app.config.update(default_config())
+    app.config.update(config or {})
+    logging.basicConfig(level=app.config['LOG_LEVEL'])
+    CORS(app)
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+    # Persistent cache of parse results keyed on the uploaded PDF bytes
+    parse_cache = None
+    if app.config['PARSE_CACHE_PATH']:
+        parse_cache = ParseCache(app.config['PARSE_CACHE_PATH'], app.config['PARSE_CACHE_MAX_BYTES'])
+    app.extensions['parse_cache'] = parse_cache
+
+    # Queryable store of every parsed transaction
+    transaction_store = None
+    if app.config['TRANSACTION_STORE_PATH']:
+        transaction_store = TransactionStore(app.config['TRANSACTION_STORE_PATH'])
+        # Rules never edited through the API catch up with changes to CATEGORY_KEYWORDS since the last run
+        if transaction_store.follows_builtin_rules():
+            transaction_store.recategorize(CATEGORY_KEYWORDS, fill_uncategorized, builtin=True)
+    app.extensions['transaction_store'] = transaction_store
+    # Every process, parser processes included, categorizes by the rules in the store
+    use_stored_rules(app.config['TRANSACTION_STORE_PATH'] or None)
+
+    # Bounds on the files waiting for the parser processes, overall and per tenant, counted in the job
+    # store, so the server processes sharing it are held to the same limits and drain them together
+    parse_workers = app.config['PARSE_WORKERS'] or DEFAULT_PARSE_WORKERS
+    parsers = parse_workers * (app.config['SERVER_WORKERS'] if app.config['JOBS_PATH'] else 1)
+    app.extensions['parse_admission'] = ParseAdmission('parse', app.config['PARSE_QUEUE_LIMIT'],
+                                                       app.config['PARSE_TENANT_LIMIT'], parsers,
+                                                       path=app.config['JOBS_PATH'] or None)
+    app.extensions['job_admission'] = ParseAdmission('jobs', app.config['JOB_QUEUE_LIMIT'],
+                                                     app.config['JOB_TENANT_LIMIT'], parsers)
+
+    # Background parse jobs, queued in SQLite and run on the parser process pool
+    job_queue = None
+    if app.config['JOBS_PATH']:
+        job_queue = JobQueue(app.config['JOBS_PATH'], os.path.join(app.config['UPLOAD_FOLDER'], 'jobs'),
+                             workers=parse_workers,
+                             timeout=app.config['PARSE_TIMEOUT'],
+                             page_workers=app.config['PAGE_WORKERS'],
+                             max_attempts=app.config['JOB_MAX_ATTEMPTS'],
+                             on_result=partial(_store_job_result, app),
+                             start=app.config['START_JOB_DISPATCHER'],
+                             limits=_parse_limits(app.config),
+                             layout=app.config['PDF_LAYOUT'])
+    app.extensions['job_queue'] = job_queue
 
-def extract_statement_info(text, bank_type):
+    app.register_blueprint(api)
+    if app.config['WARM_START']:
+        _warm_start(app)
+    logger.info(f"Created app in {time.perf_counter() - start:.2f} s")
+    return app
+
+def _warm_start(app):
     """
-    Extract statement information based on the bank type
+    Load what requests would otherwise load on first use
     """
-    logger.debug(f"Extracting statement info for bank type: {bank_type}")
-    bank_format = BANK_FORMATS[bank_type]
-    
-    # Extract basic information
-    statement_info = {
-        "bank_type": bank_type,
-        "transactions": []
-    }
-    
-    # Try to extract balance
-    balance_match = re.search(bank_format.get('balance_pattern', ''), text)
-    if balance_match:
-        statement_info["balance"] = float(balance_match.group(1).replace(',', ''))
-    
-    # Extract additional information based on bank type
-    if bank_type == 'discover':
-        # Extract credit limit
-        credit_limit_match = re.search(bank_format['credit_limit_pattern'], text)
-        if credit_limit_match:
-            statement_info["credit_limit"] = float(credit_limit_match.group(1).replace(',', ''))
-        
-        # Extract payment due date
-        payment_due_match = re.search(bank_format['payment_due_pattern'], text)
-        if payment_due_match:
-            statement_info["payment_due_date"] = payment_due_match.group(1)
-        
-        # Extract minimum payment
-        min_payment_match = re.search(bank_format['minimum_payment_pattern'], text)
-        if min_payment_match:
-            statement_info["minimum_payment"] = float(min_payment_match.group(1).replace(',', ''))
-    
-    elif bank_type == 'orange_county_credit_union':
-        # Extract beginning balance
-        beginning_balance_match = re.search(bank_format['beginning_balance_pattern'], text)
-        if beginning_balance_match:
-            statement_info["beginning_balance"] = float(beginning_balance_match.group(1).replace(',', ''))
-    
-    # Extract transactions
-    statement_info["transactions"] = extract_transactions(text, bank_type)
-    
-    if not statement_info["transactions"]:
-        logger.warning(f"No transactions found for {bank_type} statement")
-        
-        # If this is a Discover card, try an alternative parsing approach
-        if bank_type == 'discover':
-            logger.info("Trying alternative transaction parsing for Discover")
-            # Look for date-amount-description patterns
-            alt_transactions = []
-            
-            # Find all lines with a date at the beginning
-            date_pattern = r'(\d{2}/\d{2})(?:/\d{2})?\s+(.*?)\s+(\$?-?\d+\.\d{2})$'
-            for line in text.split('\n'):
-                match = re.search(date_pattern, line.strip())
-                if match:
-                    date_str, description, amount_str = match.groups()
-                    
-                    # Convert date to yyyy-mm-dd format
-                    try:
-                        date_obj = datetime.strptime(date_str, '%m/%d')
-                        current_year = datetime.now().year
-                        date_formatted = f"{current_year}-{date_obj.month:02d}-{date_obj.day:02d}"
-                        
-                        # Format amount (remove $ and handle negatives)
-                        amount = float(amount_str.replace('$', '').replace(',', ''))
-                        
-                        # Categorize transaction
-                        category = categorize_transaction(description)
-                        
-                        alt_transactions.append({
-                            "date": date_formatted,
-                            "description": description.strip(),
-                            "category": category,
-                            "amount": amount,
-                            "account": "Discover Credit Card"
-                        })
-                        logger.debug(f"Found alternative transaction: {date_str} - {description} - {amount_str}")
-                    except Exception as e:
-                        logger.error(f"Error parsing alternative transaction: {str(e)}")
-            
-            if alt_transactions:
-                logger.info(f"Found {len(alt_transactions)} alternative transactions")
-                statement_info["transactions"] = alt_transactions
-    else:
-        logger.info(f"Found {len(statement_info['transactions'])} transactions for {bank_type} statement")
-    
-    # If still no transactions, look for anything that looks like a transaction
-    if not statement_info["transactions"]:
-        logger.warning("Still no transactions found. Trying last resort parsing...")
-        last_resort_transactions = []
-        
-        # Look for any line with a dollar amount
-        amount_pattern = r'.*?(\$?\d+\.\d{2}).*'
-        date_pattern = r'(\d{2}/\d{2}(?:/\d{2})?)'
-        
-        for line in text.split('\n'):
-            line = line.strip()
-            if '$' in line and re.search(amount_pattern, line):
-                # Try to find a date in the line
-                date_match = re.search(date_pattern, line)
-                date_str = date_match.group(1) if date_match else '01/01'
-                
-                # Extract amount
-                amount_match = re.search(amount_pattern, line)
-                if amount_match:
-                    amount_str = amount_match.group(1)
-                    
-                    # Get description (everything except the amount)
-                    description = line.replace(amount_str, '').strip()
-                    
-                    # Convert date to yyyy-mm-dd format
-                    try:
-                        if '/' in date_str and len(date_str) <= 5:  # MM/DD format
-                            date_obj = datetime.strptime(date_str, '%m/%d')
-                            current_year = datetime.now().year
-                            date_formatted = f"{current_year}-{date_obj.month:02d}-{date_obj.day:02d}"
-                        elif '/' in date_str:  # MM/DD/YY format
-                            date_obj = datetime.strptime(date_str, '%m/%d/%y')
-                            date_formatted = date_obj.strftime('%Y-%m-%d')
-                        else:
-                            date_formatted = f"{datetime.now().year}-01-01"
-                        
-                        # Format amount
-                        amount = float(amount_str.replace('$', '').replace(',', ''))
-                        
-                        # Categorize transaction
-                        category = categorize_transaction(description)
-                        
-                        last_resort_transactions.append({
-                            "date": date_formatted,
-                            "description": description,
-                            "category": category,
-                            "amount": amount,
-                            "account": "Credit Card"
-                        })
-                        logger.debug(f"Found last resort transaction: {date_formatted} - {description} - {amount}")
-                    except Exception as e:
-                        logger.error(f"Error parsing last resort transaction: {str(e)}")
-        
-        if last_resort_transactions:
-            logger.info(f"Found {len(last_resort_transactions)} last resort transactions")
-            statement_info["transactions"] = last_resort_transactions
-    
-    return statement_info
+    for module in WARM_START_MODULES:
+        importlib.import_module(module)
+    get_categorizer()
+    get_ml_categorizer()
+    if app.extensions['transaction_store']:
+        app.extensions['transaction_store'].warm()
+
+def _parse_cache():
+    return current_app.extensions['parse_cache']
+
+def _transaction_store():
+    return current_app.extensions['transaction_store']
 
-def extract_transactions(text, bank_type):
+def _job_queue():
+    return current_app.extensions['job_queue']
+
+def _tenant():
     """
-    Extract transactions from statement text based on bank type
+    Who the request is for, as far as admission control goes
     """
-    logger.debug(f"Extracting transactions for bank type: {bank_type}")
-    bank_format = BANK_FORMATS[bank_type]
-    transactions = []
-    
-    if bank_type == 'discover':
-        # Find the "Transactions" section
-        transaction_sections = re.findall(r'TRANS\.\s+DATE\s+PURCHASES.*?(?=\n\s*TOTAL FEES|$)', text, re.DOTALL)
-        
-        if transaction_sections:
-            transaction_section = transaction_sections[0]
-            logger.debug("Found transaction section for Discover statement")
-            
-            # Use different transaction patterns based on format
-            for line in transaction_section.split('\n'):
-                # Skip empty lines or header lines
-                if not line.strip() or any(marker in line for marker in bank_format['transaction_section_markers']):
-                    continue
-                
-                # Try different transaction patterns
-                for pattern in bank_format['transaction_patterns']:
-                    match = re.search(pattern, line)
-                    if match:
-                        # Extract transaction details based on the pattern
-                        if len(match.groups()) == 4:  # Pattern with 4 groups
-                            date, description, category, amount_str = match.groups()
-                            # Convert date to yyyy-mm-dd format
-                            date_obj = datetime.strptime(date, '%m/%d')
-                            # Assume current year, can be adjusted
-                            current_year = datetime.now().year
-                            date_formatted = f"{current_year}-{date_obj.month:02d}-{date_obj.day:02d}"
-                            
-                            # Format amount (remove $ and handle negatives)
-                            amount = float(amount_str.replace('$', '').replace(',', ''))
-                            
-                            # For Discover, expenses are already negative
-                            
-                            transactions.append({
-                                "date": date_formatted,
-                                "description": description.strip(),
-                                "category": category,
-                                "amount": amount,
-                                "account": "Discover Credit Card"
-                            })
-                            break
-                        elif len(match.groups()) == 3:  # Pattern with 3 groups
-                            date, description, amount_str = match.groups()
-                            # Convert date to yyyy-mm-dd format
-                            date_obj = datetime.strptime(date, '%m/%d')
-                            current_year = datetime.now().year
-                            date_formatted = f"{current_year}-{date_obj.month:02d}-{date_obj.day:02d}"
-                            
-                            # Format amount (remove $ and handle negatives)
-                            amount = float(amount_str.replace('$', '').replace(',', ''))
-                            
-                            # Categorize transaction
-                            category = categorize_transaction(description)
-                            
-                            transactions.append({
-                                "date": date_formatted,
-                                "description": description.strip(),
-                                "category": category,
-                                "amount": amount,
-                                "account": "Discover Credit Card"
-                            })
-                            break
-        else:
-            logger.warning("No transaction section found in Discover statement")
-        
-        # Also look for payments and credits
-        payment_sections = re.findall(r'TRANS\.\s+DATE\s+PAYMENTS AND CREDITS.*?(?=\n\s*TRANS|$)', text, re.DOTALL)
-        
-        if payment_sections:
-            payment_section = payment_sections[0]
-            logger.debug("Found payments and credits section for Discover statement")
-            
-            for line in payment_section.split('\n'):
-                # Skip empty lines or header lines
-                if not line.strip() or any(marker in line for marker in bank_format['transaction_section_markers']):
-                    continue
-                
-                # Look for payment patterns
-                payment_match = re.search(r'(\d{2}/\d{2})\s+(.*?)\s+([-]?\$?\d+\.\d{2})', line)
-                if payment_match:
-                    date, description, amount_str = payment_match.groups()
-                    
-                    # Convert date to yyyy-mm-dd format
-                    date_obj = datetime.strptime(date, '%m/%d')
-                    current_year = datetime.now().year
-                    date_formatted = f"{current_year}-{date_obj.month:02d}-{date_obj.day:02d}"
-                    
-                    # Format amount
-                    amount = float(amount_str.replace('$', '').replace(',', ''))
-                    
-                    transactions.append({
-                        "date": date_formatted,
-                        "description": description.strip(),
-                        "category": "Payment",
-                        "amount": amount,
-                        "account": "Discover Credit Card"
-                    })
-    
-    elif bank_type == 'orange_county_credit_union':
-        # Find transaction sections - PACIFIC CHECKING and PACIFIC SAVINGS
-        checking_sections = re.findall(r'PACIFIC CHECKING.*?(?=PACIFIC SAVINGS|\Z)', text, re.DOTALL)
-        savings_sections = re.findall(r'PACIFIC SAVINGS.*?(?=PACIFIC CHECKING|\Z)', text, re.DOTALL)
-        
-        # Process checking account transactions
-        if checking_sections:
-            logger.debug("Found checking account section for OCCU statement")
-            for line in checking_sections[0].split('\n'):
-                # Skip empty lines or header lines
-                if not line.strip() or any(marker in line for marker in bank_format['transaction_section_markers']):
-                    continue
-                
-                # Match transaction pattern for withdraw/deposit format
-                trans_match = re.search(r'(\d{2}/\d{2}/\d{2})\s+(\d{2}/\d{2}/\d{2})\s+(-?\d+\.\d{2})?\s+(\d+\.\d{2})?\s+(\d+\.\d{2})\s+(.*?)$', line)
-                if trans_match:
-                    trans_date, post_date, withdrawal, deposit, balance, description = trans_match.groups()
-                    
-                    # Convert date to yyyy-mm-dd format
-                    date_obj = datetime.strptime(trans_date, '%m/%d/%y')
-                    date_formatted = date_obj.strftime('%Y-%m-%d')
-                    
-                    # Determine amount (negative for withdrawals, positive for deposits)
-                    amount = 0
-                    if withdrawal:
-                        amount = -float(withdrawal)
-                    elif deposit:
-                        amount = float(deposit)
-                    
-                    # Categorize transaction
-                    category = categorize_transaction(description)
-                    
-                    transactions.append({
-                        "date": date_formatted,
-                        "description": description.strip(),
-                        "category": category,
-                        "amount": amount,
-                        "account": "Pacific Checking"
-                    })
+    header = current_app.config['TENANT_HEADER']
+    return (request.headers.get(header) if header else None) or request.remote_addr or 'unknown'
+
+@api.before_app_request
+def _start_request():
+    g.request_start = time.perf_counter()
+    g.profiler = None
+    if current_app.config['PROFILE_REQUESTS'] and (request.args.get('profile') == '1'
+                                                   or request.headers.get('X-Profile') == '1'):
+        import cProfile
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # Only one profiler can run at a time, e.g. with a concurrent profiled request
+            logger.warning(f"Not profiling {request.path}: {str(e)}")
         else:
-            logger.warning("No checking account section found in OCCU statement")
-        
-        # Process savings account transactions
-        if savings_sections:
-            logger.debug("Found savings account section for OCCU statement")
-            for line in savings_sections[0].split('\n'):
-                # Skip empty lines or header lines
-                if not line.strip() or any(marker in line for marker in bank_format['transaction_section_markers']):
+            g.profiler = profiler
+
+@api.after_app_request
+def _finish_request(response):
+    profiler = g.get('profiler')
+    if profiler is not None:
+        profiler.disable()
+        os.makedirs(current_app.config['PROFILE_DIR'], exist_ok=True)
+        profile_path = os.path.join(current_app.config['PROFILE_DIR'],
+                                    f"{request.endpoint or 'unknown'}-{time.time_ns()}.prof")
+        profiler.dump_stats(profile_path)
+        logger.info(f"Wrote profile of {request.path} to {profile_path}")
+        response.headers['X-Profile'] = profile_path
+    if 'request_start' in g:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - g.request_start,
+                                        endpoint=endpoint, status=response.status_code)
+    return response
+
+def allowed_file(filename):
+    return '.' in filename and \
+           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def _read_uploads(files, fingerprint, spool_dir=None):
+    """
+    Serve repeat uploads from the parse cache and queue the rest for parsing.
+
+    Uploads are parsed straight from memory; only those above SPOOL_THRESHOLD
+    are spooled to a unique temp file. With spool_dir every upload is
+    spooled there instead. Returns (uploads, pending,
+    spooled_paths, errors) where each upload is (filename, digest,
+    cached statement_data, index into pending) and each pending entry is
+    (cache key, source).
+    """
+    parse_cache = _parse_cache()
+    uploads = []
+    pending = []
+    spooled_paths = []
+    errors = []
+    for file in files:
+        logger.debug(f"Processing file: {file.filename}")
+        if file and allowed_file(file.filename):
+            filename = secure_filename(file.filename)
+            try:
+                digest, size = sha256_stream(file.stream)
+                key = content_key(digest, fingerprint)
+                statement_data = parse_cache.get(key) if parse_cache else None
+                if statement_data is not None:
+                    logger.debug(f"Parse cache hit for {filename}")
+                    uploads.append((filename, digest, statement_data, None))
                     continue
-                
-                # Match transaction pattern for withdraw/deposit format
-                trans_match = re.search(r'(\d{2}/\d{2}/\d{2})\s+(\d{2}/\d{2}/\d{2})\s+(-?\d+\.\d{2})?\s+(\d+\.\d{2})?\s+(\d+\.\d{2})\s+(.*?)$', line)
-                if trans_match:
-                    trans_date, post_date, withdrawal, deposit, balance, description = trans_match.groups()
-                    
-                    # Convert date to yyyy-mm-dd format
-                    date_obj = datetime.strptime(trans_date, '%m/%d/%y')
-                    date_formatted = date_obj.strftime('%Y-%m-%d')
-                    
-                    # Determine amount (negative for withdrawals, positive for deposits)
-                    amount = 0
-                    if withdrawal:
-                        amount = -float(withdrawal)
-                    elif deposit:
-                        amount = float(deposit)
-                    
-                    # Categorize transaction
-                    category = categorize_transaction(description)
-                    
-                    transactions.append({
-                        "date": date_formatted,
-                        "description": description.strip(),
-                        "category": category,
-                        "amount": amount,
-                        "account": "Pacific Savings"
-                    })
+                file.stream.seek(0)
+                if spool_dir is None and size <= current_app.config['SPOOL_THRESHOLD']:
+                    source = file.stream.read()
+                else:
+                    fd, source = tempfile.mkstemp(suffix=f"_{filename}",
+                                                  dir=spool_dir or current_app.config['UPLOAD_FOLDER'])
+                    spooled_paths.append(source)
+                    with os.fdopen(fd, 'wb') as spooled:
+                        shutil.copyfileobj(file.stream, spooled)
+                    logger.debug(f"Spooled {size} byte upload to: {source}")
+                pending.append((key, source))
+                uploads.append((filename, digest, None, len(pending) - 1))
+            except Exception as e:
+                logger.error(f"Error reading file: {str(e)}")
+                errors.append({"file": file.filename, "error": f"Error reading file: {str(e)}"})
         else:
-            logger.warning("No savings account section found in OCCU statement")
-    
-    # Categorize transactions that don't have a category yet
-    for transaction in transactions:
-        if 'category' not in transaction or not transaction['category'] or transaction['category'] == 'Uncategorized':
-            transaction['category'] = categorize_transaction(transaction['description'])
-    
+            logger.error(f"Invalid file format for {file.filename}. Only PDF files are allowed.")
+            errors.append({"file": file.filename, "error": "Invalid file format. Only PDF files are allowed."})
+    return uploads, pending, spooled_paths, errors
+
+def _remove_spooled(spooled_paths):
+    for file_path in spooled_paths:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+def _finish_upload(filename, digest, fingerprint, statement_data, error, deduplicator):
+    """
+    Store a parsed upload without the rows already stored or in an earlier
+    file of the upload; returns the error message if it did not parse.
+
+    statement_data keeps every parsed row, so the upload shows in full even
+    when it was all stored before; the rows left out of the store are
+    listed under statement_data["duplicates"].
+    """
+    if error is None and "error" in statement_data:
+        error = statement_data["error"]
+    if error is not None:
+        logger.error(f"Error parsing file {filename}: {error}")
+        return f"Error parsing file: {error}"
+    transactions, keys, duplicates = deduplicator.dedupe(filename, digest, statement_data["transactions"])
+    if duplicates:
+        logger.info(f"Not storing {len(duplicates)} duplicate transactions from {filename}")
+        statement_data["duplicates"] = duplicates
+    transaction_store = _transaction_store()
+    if transaction_store:
+        if not transaction_store.has_statement(digest, fingerprint):
+            transaction_store.add_statement(digest, fingerprint, filename, transactions, keys)
+        statement_data["merchants"] = transaction_store.merchant_names(statement_data["transactions"].descriptions)
+    return None
+
+def _statement_info(statement_data):
+    return {key: value for key, value in statement_data.items()
+            if key not in ("transactions", "duplicates", "merchants")}
+
+def _transaction_dicts(statement_data, newest_first=False):
+    """
+    Return a parsed statement's transactions as dicts, with the merchant each
+    description was clustered into when the store is enabled
+    """
+    transactions = statement_data["transactions"]
+    if newest_first:
+        transactions = transactions.sorted_by_date(reverse=True)
+    transactions = transactions.to_dicts()
+    merchants = statement_data.get("merchants")
+    if merchants is not None:
+        for transaction in transactions:
+            transaction["merchant"] = merchants.get(transaction["description"])
     return transactions
 
-@app.route('/api/parse-statements', methods=['POST'])
-def parse_statements():
+def _store_job_result(app, file, statement_data):
     """
-    API endpoint to parse uploaded bank statements
+    Cache and store a file parsed by the job queue, on its dispatcher thread
+    """
+    with app.app_context():
+        _cache_result(file["cache_key"], statement_data, None)
+        # Earlier files of the job are already in the store, so a fresh deduplicator sees them
+        return _finish_upload(file["filename"], file["sha256"], parser_fingerprint(app.config['PDF_LAYOUT']),
+                              statement_data, None,
+                              UploadDeduplicator(_transaction_store()))
+
+def _cache_result(key, statement_data, error):
+    parse_cache = _parse_cache()
+    if parse_cache and error is None and "error" not in statement_data:
+        parse_cache.put(key, statement_data)
+
+def _parse_limits(config):
+    """
+    Per-file parse limits (see ingest.DEFAULT_PARSE_LIMITS) from the settings; 0 lifts one
+    """
+    return {
+        "cpu_seconds": config['PARSE_CPU_SECONDS'] or None,
+        "memory_mb": config['PARSE_MEMORY_MB'] or None,
+        "max_pages": config['PARSE_MAX_PAGES'] or None,
+        "max_fallback_rows": config['FALLBACK_MAX_ROWS'] or None
+    }
+
+def _parse_options():
+    return {
+        "workers": current_app.config['PARSE_WORKERS'],
+        "timeout": current_app.config['PARSE_TIMEOUT'],
+        "page_workers": current_app.config['PAGE_WORKERS'],
+        "limits": _parse_limits(current_app.config),
+        "layout": current_app.config['PDF_LAYOUT']
+    }
+
+def _overloaded(error):
+    """
+    429 response telling the client when to try again
+    """
+    logger.warning(f"Turned away a parse request from {_tenant()}: {error}")
+    response = jsonify({"error": str(error), "retry_after": error.retry_after})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 429
+
+def _wants_ndjson():
+    best = request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+def _check_upload_request():
+    """
+    Return an error response if the request carries no files, else None
     """
-    logger.info("Received request to parse statements")
-    
     # Check if files are present in the request
     if 'files' not in request.files:
         logger.error("No files provided in the request")
         return jsonify({"error": "No files provided in the request"}), 400
     
-    files = request.files.getlist('files')
-    logger.debug(f"Received {len(files)} files")
-    
     # Check if the file list is empty
+    files = request.files.getlist('files')
     if not files or files[0].filename == '':
         logger.error("No files selected for upload")
         return jsonify({"error": "No files selected for upload"}), 400
+    return None
+
+@api.route('/api/parse-statements', methods=['POST'])
+def parse_statements():
+    """
+    API endpoint to parse uploaded bank statements
+    """
+    logger.info("Received request to parse statements")
+    invalid = _check_upload_request()
+    if invalid:
+        return invalid
+    
+    files = request.files.getlist('files')
+    logger.debug(f"Received {len(files)} files")
+    
+    fingerprint = parser_fingerprint(current_app.config['PDF_LAYOUT'])
+    uploads, pending, spooled_paths, errors = _read_uploads(files, fingerprint)
+    
+    # Cached files take no place in the parse queue
+    try:
+        release = current_app.extensions['parse_admission'].acquire(_tenant(), len(pending))
+    except Overloaded as e:
+        _remove_spooled(spooled_paths)
+        return _overloaded(e)
+    
+    if _wants_ndjson():
+        # The generator runs after this returns, so it keeps the request context to reach the stores
+        records = _stream_statements(uploads, pending, spooled_paths, errors, fingerprint, release)
+        response = Response(stream_with_context(records), mimetype=NDJSON_MIMETYPE)
+        # Also when the client goes away before the stream starts
+        response.call_on_close(release)
+        return response
     
+    try:
+        results = parse_files([source for _, source in pending], **_parse_options())
+    finally:
+        release()
+        # Clean up spooled uploads
+        _remove_spooled(spooled_paths)
+    
+    for (key, _), (statement_data, error) in zip(pending, results):
+        _cache_result(key, statement_data, error)
+    
+    # Merge in upload order so the response does not depend on worker timing
+    parsed = []
+    deduplicator = UploadDeduplicator(_transaction_store())
+    for filename, digest, statement_data, result_index in uploads:
+        error = None
+        if result_index is not None:
+            statement_data, error = results[result_index]
+        error = _finish_upload(filename, digest, fingerprint, statement_data, error, deduplicator)
+        if error is not None:
+            errors.append({"file": filename, "error": error})
+            continue
+        parsed.append((filename, statement_data))
+    
+    return _combined_response(parsed, errors)
+
+def _combined_response(parsed, errors):
+    """
+    Merge (filename, statement_data) pairs into one date-sorted JSON response
+    """
+    serialize_start = time.perf_counter()
     all_transactions = []
     statement_info = {}
+    duplicates = []
     
-    for file in files:
-        logger.debug(f"Processing file: {file.filename}")
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            
-            try:
-                # Save the file
-                file.save(file_path)
-                logger.debug(f"File saved to: {file_path}")
-                
-                try:
-                    # Parse the PDF file
-                    statement_data = parse_pdf(file_path)
-                    
-                    if "error" in statement_data:
-                        logger.error(f"Error in statement data: {statement_data['error']}")
-                        return jsonify(statement_data), 400
-                    
-                    # Add transactions to the combined list
-                    all_transactions.extend(statement_data["transactions"])
-                    
-                    # Update statement_info with non-transaction data
-                    for key, value in statement_data.items():
-                        if key != "transactions":
-                            if key not in statement_info:
-                                statement_info[key] = {}
-                            statement_info[key][filename] = value
-                    
-                    # Clean up uploaded file
-                    os.remove(file_path)
-                    logger.debug(f"File removed after processing: {file_path}")
-                    
-                except Exception as e:
-                    # Clean up on error
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                    logger.error(f"Error parsing file: {str(e)}")
-                    return jsonify({"error": f"Error parsing file: {str(e)}"}), 500
-            except Exception as e:
-                logger.error(f"Error saving file: {str(e)}")
-                return jsonify({"error": f"Error saving file: {str(e)}"}), 500
-        else:
-            logger.error(f"Invalid file format for {file.filename}. Only PDF files are allowed.")
-            return jsonify({"error": f"Invalid file format for {file.filename}. Only PDF files are allowed."}), 400
+    for filename, statement_data in parsed:
+        # Add transactions to the combined list
+        all_transactions.extend(_transaction_dicts(statement_data))
+        duplicates.extend({"file": filename, **row} for row in statement_data.get("duplicates", ()))
+        
+        # Update statement_info with non-transaction data
+        for key, value in _statement_info(statement_data).items():
+            if key not in statement_info:
+                statement_info[key] = {}
+            statement_info[key][filename] = value
     
     # Check if any transactions were found
     if not all_transactions:
         logger.error("No transaction data found in the provided files")
-        return jsonify({"error": "No transaction data found in the provided files"}), 400
+        return jsonify({"error": "No transaction data found in the provided files", "errors": errors}), 400
     
     # Sort all transactions by date
     all_transactions.sort(key=lambda x: x["date"], reverse=True)
     
     # Return combined data
     logger.info(f"Returning {len(all_transactions)} transactions")
-    return jsonify({
+    response = jsonify({
         "transactions": all_transactions,
-        "statement_info": statement_info
+        "statement_info": statement_info,
+        "duplicates": duplicates,
+        "errors": errors
     })
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - serialize_start, stage='serialize')
+    return response
+
+def _stream_statements(uploads, pending, spooled_paths, errors, fingerprint, release):
+    """
+    Yield NDJSON records for each file as soon as it is parsed.
+
+    Per file: a "statement" record with its statement_info, then one
+    "transaction" record per transaction, newest first; or an "error"
+    record. Rows left out of the store as duplicates follow as "duplicate"
+    records.
+    Cached files come first, the rest in the order they finish. A final
+    "summary" record carries the counts and every error. release gives
+    back the files' places in the parse queue once all are parsed.
+    """
+    def record(kind, **fields):
+        return json.dumps({"type": kind, **fields}) + "\n"
+    
+    def statement_records(filename, statement_data):
+        transactions = _transaction_dicts(statement_data, newest_first=True)
+        duplicates = statement_data.get("duplicates", [])
+        yield record("statement", file=filename, statement_info=_statement_info(statement_data),
+                     transactions=len(transactions), duplicates=len(duplicates))
+        for transaction in transactions:
+            yield record("transaction", file=filename, **transaction)
+        for duplicate in duplicates:
+            yield record("duplicate", file=filename, **duplicate)
+    
+    counts = {"files": 0, "transactions": 0, "duplicates": 0}
+    deduplicator = UploadDeduplicator(_transaction_store())
+    
+    def finish(filename, digest, statement_data, error):
+        error = _finish_upload(filename, digest, fingerprint, statement_data, error, deduplicator)
+        if error is not None:
+            errors.append({"file": filename, "error": error})
+            return [record("error", file=filename, error=error)]
+        counts["files"] += 1
+        counts["transactions"] += len(statement_data["transactions"])
+        counts["duplicates"] += len(statement_data.get("duplicates", ()))
+        return statement_records(filename, statement_data)
+    
+    try:
+        for error in list(errors):
+            yield record("error", **error)
+        for filename, digest, statement_data, result_index in uploads:
+            if result_index is None:
+                yield from finish(filename, digest, statement_data, None)
+        
+        by_index = {result_index: (filename, digest)
+                    for filename, digest, _, result_index in uploads if result_index is not None}
+        for index, statement_data, error in iter_parse_files([source for _, source in pending],
+                                                             **_parse_options()):
+            _cache_result(pending[index][0], statement_data, error)
+            filename, digest = by_index[index]
+            yield from finish(filename, digest, statement_data, error)
+    finally:
+        release()
+        _remove_spooled(spooled_paths)
+    
+    logger.info(f"Streamed {counts['transactions']} transactions from {counts['files']} files")
+    yield record("summary", errors=errors, **counts)
+
+@api.route('/api/jobs', methods=['POST'])
+def create_job():
+    """
+    API endpoint to queue uploaded bank statements for background parsing
+    """
+    logger.info("Received request to create a parse job")
+    job_queue = _job_queue()
+    if not job_queue:
+        return jsonify({"error": "Job API is disabled"}), 404
+    invalid = _check_upload_request()
+    if invalid:
+        return invalid
+    
+    files = request.files.getlist('files')
+    tenant = _tenant()
+    # Checked before spooling, with every file counted as if it needed parsing
+    queued, tenant_queued, file_seconds = job_queue.backlog(tenant)
+    try:
+        current_app.extensions['job_admission'].check(len(files), queued, tenant_queued, file_seconds)
+    except Overloaded as e:
+        return _overloaded(e)
+    fingerprint = parser_fingerprint(current_app.config['PDF_LAYOUT'])
+    job_id, job_dir = job_queue.new_job()
+    uploads, pending, _, errors = _read_uploads(files, fingerprint, spool_dir=job_dir)
+    
+    job_files = []
+    deduplicator = UploadDeduplicator(_transaction_store())
+    for filename, digest, statement_data, pending_index in uploads:
+        job_file = {"filename": filename, "sha256": digest}
+        if pending_index is None:
+            # Cached parse: store it now and record it as done
+            error = _finish_upload(filename, digest, fingerprint, statement_data, None, deduplicator)
+            job_file.update({"error": error} if error else {"result": statement_data})
+        else:
+            job_file["cache_key"], job_file["path"] = pending[pending_index]
+        job_files.append(job_file)
+    job_files.extend({"filename": error["file"], "error": error["error"]} for error in errors)
+    
+    job_queue.create_job(job_id, job_files, tenant)
+    return jsonify(job_queue.status(job_id)), 202
+
+@api.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    API endpoint to poll a parse job's per-file progress
+    """
+    job_queue = _job_queue()
+    status = job_queue.status(job_id) if job_queue else None
+    if status is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(status)
 
-@app.route('/api/categorize', methods=['POST'])
+@api.route('/api/jobs/<job_id>/results', methods=['GET'])
+def get_job_results(job_id):
+    """
+    API endpoint returning a finished job's transactions like /api/parse-statements
+    """
+    job_queue = _job_queue()
+    status = job_queue.status(job_id) if job_queue else None
+    if status is None:
+        return jsonify({"error": "Job not found"}), 404
+    if status["status"] in ('queued', 'running'):
+        return jsonify({"error": "Job is still running", "progress": status["progress"]}), 409
+    
+    parsed = []
+    errors = []
+    for filename, statement_data, error in job_queue.results(job_id):
+        if statement_data is None:
+            errors.append({"file": filename, "error": error})
+        else:
+            parsed.append((filename, statement_data))
+    return _combined_response(parsed, errors)
+
+@api.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """
+    API endpoint to cancel a job's queued and running files
+    """
+    job_queue = _job_queue()
+    if not job_queue or not job_queue.cancel(job_id):
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_queue.status(job_id))
+
+@api.route('/api/jobs/<job_id>/retry', methods=['POST'])
+def retry_job(job_id):
+    """
+    API endpoint to re-queue a job's failed files
+    """
+    job_queue = _job_queue()
+    if not job_queue or job_queue.status(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+    job_queue.retry(job_id)
+    return jsonify(job_queue.status(job_id))
+
+@api.route('/api/jobs/<job_id>', methods=['DELETE'])
+def delete_job(job_id):
+    """
+    API endpoint to cancel a job and discard its records and files
+    """
+    job_queue = _job_queue()
+    if not job_queue or not job_queue.delete(job_id):
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({"deleted": job_id})
+
+@api.route('/api/transactions', methods=['GET'])
+def get_transactions():
+    """
+    API endpoint to filter, search and page through stored transactions
+    """
+    transaction_store = _transaction_store()
+    if not transaction_store:
+        return jsonify({"error": "Transaction store is disabled"}), 404
+    
+    args = request.args
+    try:
+        transactions, next_cursor = transaction_store.query(
+            account=args.get('account'),
+            category=args.get('category'),
+            start_date=args.get('start_date'),
+            end_date=args.get('end_date'),
+            min_amount=args.get('min_amount', type=float),
+            max_amount=args.get('max_amount', type=float),
+            search=args.get('q'),
+            sort=args.get('sort', 'date'),
+            direction=args.get('direction', 'desc'),
+            limit=args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+            cursor=args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify({"transactions": transactions, "next_cursor": next_cursor})
+
+@api.route('/api/export', methods=['GET'])
+def export_transactions():
+    """
+    API endpoint streaming stored transactions, or a finished job's, as gzip
+    CSV, Parquet or an Arrow IPC stream.
+
+    Takes /api/transactions' filters (not search); with ?job= it exports
+    that job's parsed rows instead, which have no id. Rows are written in
+    chunks as they are read, so memory does not grow with the export.
+    """
+    args = request.args
+    export_format = args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": f"Unknown export format {export_format!r}; "
+                                 f"expected one of {', '.join(EXPORT_FORMATS)}"}), 400
+    if export_format in ARROW_FORMATS and not arrow_available():
+        return jsonify({"error": f"The {export_format} export needs pyarrow, which is not installed"}), 501
+
+    job_id = args.get('job')
+    if job_id:
+        job_queue = _job_queue()
+        status = job_queue.status(job_id) if job_queue else None
+        if status is None:
+            return jsonify({"error": "Job not found"}), 404
+        if status["status"] in ('queued', 'running'):
+            return jsonify({"error": "Job is still running", "progress": status["progress"]}), 409
+        chunks = (batch_columns(statement_data["transactions"], statement_data.get("merchants"))
+                  for _, statement_data, _ in job_queue.results(job_id) if statement_data is not None)
+    else:
+        transaction_store = _transaction_store()
+        if not transaction_store:
+            return jsonify({"error": "Transaction store is disabled"}), 404
+        chunks = transaction_store.export_chunks(
+            account=args.get('account'),
+            category=args.get('category'),
+            start_date=args.get('start_date'),
+            end_date=args.get('end_date'),
+            min_amount=args.get('min_amount', type=float),
+            max_amount=args.get('max_amount', type=float)
+        )
+
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    name = f"transactions-{job_id}" if job_id else 'transactions'
+    return Response(stream_with_context(iter_export(chunks, export_format)), mimetype=mimetype,
+                    headers={"Content-Disposition": f'attachment; filename="{name}.{extension}"'})
+
+@api.route('/api/aggregates', methods=['GET'])
+@api.route('/api/aggregates/<section>', methods=['GET'])
+def get_aggregates(section=None):
+    """
+    API endpoint for the monthly, category and merchant rollups behind the Dashboard and Insights
+    """
+    transaction_store = _transaction_store()
+    if not transaction_store:
+        return jsonify({"error": "Transaction store is disabled"}), 404
+    
+    aggregates = transaction_store.aggregates(
+        start_month=request.args.get('start_month'),
+        end_month=request.args.get('end_month'),
+        top_merchants=request.args.get('merchants', DEFAULT_TOP_MERCHANTS, type=int)
+    )
+    if section is None:
+        return jsonify(aggregates)
+    if section not in aggregates:
+        return jsonify({"error": f"Unknown aggregate {section}"}), 404
+    return jsonify({section: aggregates[section]})
+
+@api.route('/api/recurring', methods=['GET'])
+def get_recurring():
+    """
+    API endpoint for recurring charges (subscriptions, bills, memberships) found in the stored history
+    """
+    transaction_store = _transaction_store()
+    if not transaction_store:
+        return jsonify({"error": "Transaction store is disabled"}), 404
+
+    active = request.args.get('active')
+    charges = transaction_store.recurring(active=None if active is None else active in ('1', 'true'))
+    monthly_total = sum(charge["monthly_amount"] for charge in charges if charge["active"])
+    return jsonify({"recurring": charges, "monthly_total": round(monthly_total, 2)})
+
+@api.route('/api/categorize', methods=['POST'])
 def categorize_transactions():
     """
     API endpoint to categorize transactions
@@ -596,20 +755,80 @@ def categorize_transactions():
     transactions = request.json['transactions']
     logger.debug(f"Categorizing {len(transactions)} transactions")
     
-    for transaction in transactions:
-        transaction['category'] = categorize_transaction(transaction['description'])
+    descriptions = [transaction['description'] for transaction in transactions]
+    categories = get_categorizer().categorize_many(descriptions)
+    fill_uncategorized(descriptions, categories)
+    for transaction, category in zip(transactions, categories):
+        transaction['category'] = category
     
     return jsonify({"transactions": transactions})
 
-@app.route('/api/categories', methods=['GET'])
+@api.route('/api/categories', methods=['GET'])
 def get_categories():
     """
     API endpoint to get available categories
     """
     logger.info("Received request to get categories")
-    return jsonify({"categories": list(CATEGORY_KEYWORDS.keys())})
+    return jsonify({"categories": list(current_category_keywords().keys())})
+
+@api.route('/api/categories/keywords', methods=['GET'])
+def get_category_keywords():
+    """
+    API endpoint to get the keyword rules as a list of {category, keywords}, in precedence order
+    """
+    return jsonify({"rules": [{"category": category, "keywords": keywords}
+                              for category, keywords in current_category_keywords().items()]})
+
+@api.route('/api/categories/keywords', methods=['PUT'])
+def put_category_keywords():
+    """
+    API endpoint to replace the keyword rules and recategorize the stored
+    transactions they affect, returned as a diff.
+
+    Rules are a list rather than an object so their precedence survives JSON
+    encoders that sort keys. With the transaction store, the rules are kept
+    in it, for every server and parser process and across restarts;
+    without it they only change for this process until it restarts.
+    """
+    rules = (request.get_json(silent=True) or {}).get('rules')
+    if not isinstance(rules, list) or not all(
+            isinstance(rule, dict) and isinstance(rule.get('category'), str) and isinstance(rule.get('keywords'), list)
+            and all(isinstance(keyword, str) for keyword in rule['keywords']) for rule in rules):
+        return jsonify({"error": "Expected {\"rules\": [{\"category\": ..., \"keywords\": [...]}, ...]}"}), 400
+
+    category_keywords = {rule['category']: rule['keywords'] for rule in rules}
+    transaction_store = _transaction_store()
+    if not transaction_store:
+        set_category_keywords(category_keywords)
+        return jsonify({"keywords": [], "checked": 0, "changes": []})
+    return jsonify(transaction_store.recategorize(category_keywords, fill_uncategorized))
+
+@api.route('/api/categorizer/cache', methods=['GET'])
+def get_categorizer_cache():
+    """
+    API endpoint to report category cache hit/miss/eviction counters
+    """
+    return jsonify(get_categorizer().cache_info())
+
+@api.route('/api/parse-cache', methods=['GET'])
+def get_parse_cache():
+    """
+    API endpoint to report parse cache hit-rate metrics
+    """
+    parse_cache = _parse_cache()
+    if not parse_cache:
+        return jsonify({"error": "Parse cache is disabled"}), 404
+    return jsonify(parse_cache.info())
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Per-stage parse timings, fallback counters and request latencies in the
+    Prometheus text format
+    """
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
 
-@app.route('/api/test', methods=['GET'])
+@api.route('/api/test', methods=['GET'])
 def test_api():
     """
     API endpoint to test if the server is running
@@ -617,4 +836,5 @@ def test_api():
     return jsonify({"status": "API is running"})
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    # Development server; production runs wsgi:app under gunicorn (see gunicorn.conf.py)
+    create_app().run(debug=True)
\ No newline at end of file
@@ -0,0 +1,779 @@
+import os
+import re
+import json
+import glob
+import hashlib
+import logging
+from bisect import bisect_right
+from datetime import datetime
+from functools import lru_cache
+from itertools import accumulate
+import metrics
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    # Python < 3.11
+    import sre_parse
+from categorizer import UNCATEGORIZED, build_trie_pattern, get_categorizer
+from ml_categorizer import fill_batch, get_ml_categorizer
+from transaction_batch import EPOCH_ORDINAL, TransactionBatch, to_cents
+
+logger = logging.getLogger(__name__)
+
+LAYOUT_SECTIONS = metrics.registry.counter(
+    'pennysprout_layout_sections_total', 'Sections of positioned PDF text by how their rows were read',
+    labels=('method',))
+
+# Entry point group third-party packages use to ship extra formats
+ENTRY_POINT_GROUP = 'pennysprout.bank_formats'
+
+# Directory of extra YAML format files, loaded after the built-in formats; not named after this
+# module, which a directory of the same name would shadow once it became a package
+DEFAULT_FORMATS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bank_format_specs')
+
+# Built-in bank/card statement formats, as declarative specs.
+#
+# header_patterns      regexes (case-insensitive) that must all occur to identify the format
+# signature_tokens     lowercase literals implied by header_patterns, used to index detection;
+#                      by default the literal text the header patterns require
+# fallback_keywords    case-sensitive literals that select the format when detection fails
+# info_fields          statement-level values: the first match of each pattern, group 1
+# sections             transaction sections: the first match of each section pattern is
+#                      split into lines and each line is tried against the row patterns
+# fallback_rows        optional looser pass over every line when no section yields rows
+#
+# Row fields name the regex groups: date, description, category, amount, or withdrawal
+# and deposit with sign 'withdrawal_deposit'. Other names are ignored.
+#
+# A section's optional columns map the same field names to regexes for their table
+# header cells, left to right. When a PDF's positioned text has that header row, the
+# section's rows are read by column position instead of the row patterns.
+BANK_FORMATS = {
+    'discover': {
+        'name': 'Discover',
+        'header_patterns': [r'DISCOVER', r'(CARD|CARDMEMBER)'],  # Relaxed pattern matching
+        'signature_tokens': ['discover', 'card'],
+        'fallback_keywords': ['DISCOVER', 'Discover'],
+        'transaction_section_markers': ['TRANS.', 'DATE', 'PURCHASES', 'MERCHANT', 'CATEGORY', 'AMOUNT'],
+        'info_fields': {
+            'balance': {'pattern': r'New Balance[:\s]+\$([\d,]+\.\d{2})', 'type': 'amount'},
+            'credit_limit': {'pattern': r'Credit Line[:\s]+\$([\d,]+)', 'type': 'amount'},
+            'payment_due_date': {'pattern': r'Payment Due Date[:\s]+([\d/]+)', 'type': 'text'},
+            'minimum_payment': {'pattern': r'Minimum Payment Due[:\s]+\$([\d,]+\.\d{2})', 'type': 'amount'}
+        },
+        'sections': [
+            {
+                'name': 'transaction section',
+                'pattern': r'TRANS\.\s+DATE\s+PURCHASES.*?(?=\n\s*TOTAL FEES|$)',
+                'account': 'Discover Credit Card',
+                'date_format': '%m/%d',
+                'columns': {'date': r'DATE', 'description': r'PURCHASES', 'category': r'CATEGORY',
+                            'amount': r'AMOUNT'},
+                'rows': [
+                    {'pattern': r'(\d{2}/\d{2})\s+(.*?)\s+(\w+)\s+([-]?\$?\d+\.\d{2})$',
+                     'fields': ['date', 'description', 'category', 'amount']},
+                    {'pattern': r'(\d{2}/\d{2}/\d{2})\s+(.*?)\s+(\w+)\s+([-]?\$\d+\.\d{2})$',
+                     'fields': ['date', 'description', 'category', 'amount']},
+                    {'pattern': r'(\d{2}/\d{2})\s+(.*?)\s+([-]?\$?\d+\.\d{2})$',
+                     'fields': ['date', 'description', 'amount']}
+                ]
+            },
+            {
+                'name': 'payments and credits section',
+                'pattern': r'TRANS\.\s+DATE\s+PAYMENTS AND CREDITS.*?(?=\n\s*TRANS|$)',
+                'account': 'Discover Credit Card',
+                'date_format': '%m/%d',
+                'category': 'Payment',
+                'required': False,
+                'columns': {'date': r'DATE', 'description': r'PAYMENTS', 'amount': r'AMOUNT'},
+                'rows': [
+                    {'pattern': r'(\d{2}/\d{2})\s+(.*?)\s+([-]?\$?\d+\.\d{2})',
+                     'fields': ['date', 'description', 'amount']}
+                ]
+            }
+        ],
+        'fallback_rows': {
+            'name': 'alternative',
+            'account': 'Discover Credit Card',
+            'date_format': '%m/%d',
+            'rows': [
+                {'pattern': r'(\d{2}/\d{2})(?:/\d{2})?\s+(.*?)\s+(\$?-?\d+\.\d{2})$',
+                 'fields': ['date', 'description', 'amount']}
+            ]
+        }
+    },
+    'orange_county_credit_union': {
+        'name': 'Orange County Credit Union',
+        'header_patterns': [r'ORANGE COUNTY', r'CREDIT UNION'],  # Relaxed pattern matching
+        'fallback_keywords': ['ORANGE COUNTY', 'Credit Union'],
+        'transaction_section_markers': ['Transaction', 'Date', 'Posting', 'Date', 'Withdrawal', 'Deposit', 'Balance'],
+        'info_fields': {
+            'balance': {'pattern': r'Ending Balance[:\s]+\$([\d,]+\.\d{2})', 'type': 'amount'},
+            'beginning_balance': {'pattern': r'Beginning Balance[:\s]+\$([\d,]+\.\d{2})', 'type': 'amount'}
+        },
+        'sections': [
+            {
+                'name': 'checking account section',
+                'pattern': r'PACIFIC CHECKING.*?(?=PACIFIC SAVINGS|\Z)',
+                'account': 'Pacific Checking',
+                'date_format': '%m/%d/%y',
+                'sign': 'withdrawal_deposit',
+                'columns': {'date': r'TRANSACTION DATE', 'post_date': r'POSTING DATE', 'withdrawal': r'WITHDRAWAL',
+                            'deposit': r'DEPOSIT', 'balance': r'BALANCE', 'description': r'DESCRIPTION'},
+                'rows': [
+                    {'pattern': r'(\d{2}/\d{2}/\d{2})\s+(\d{2}/\d{2}/\d{2})\s+([-]?\d+\.\d{2})?\s+(\d+\.\d{2})?\s+(\d+\.\d{2})\s+(.*?)$',
+                     'fields': ['date', 'post_date', 'withdrawal', 'deposit', 'balance', 'description']}
+                ]
+            },
+            {
+                'name': 'savings account section',
+                'pattern': r'PACIFIC SAVINGS.*?(?=PACIFIC CHECKING|\Z)',
+                'account': 'Pacific Savings',
+                'date_format': '%m/%d/%y',
+                'sign': 'withdrawal_deposit',
+                'columns': {'date': r'TRANSACTION DATE', 'post_date': r'POSTING DATE', 'withdrawal': r'WITHDRAWAL',
+                            'deposit': r'DEPOSIT', 'balance': r'BALANCE', 'description': r'DESCRIPTION'},
+                'rows': [
+                    {'pattern': r'(\d{2}/\d{2}/\d{2})\s+(\d{2}/\d{2}/\d{2})\s+([-]?\d+\.\d{2})?\s+(\d+\.\d{2})?\s+(\d+\.\d{2})\s+(.*?)$',
+                     'fields': ['date', 'post_date', 'withdrawal', 'deposit', 'balance', 'description']}
+                ]
+            }
+        ]
+    }
+}
+
+SIGN_CONVENTIONS = {'as_is', 'negate', 'withdrawal_deposit'}
+
+# Table cells read as amounts: optional sign and dollar sign, thousands separators, cents
+AMOUNT_CELL = re.compile(r'-?\$?-?\d{1,3}(?:,?\d{3})*\.\d{2}')
+AMOUNT_FIELDS = ('amount', 'withdrawal', 'deposit')
+
+# Most rows the fallback and last resort passes may emit for one statement
+DEFAULT_MAX_FALLBACK_ROWS = 5000
+
+# Shortest literal taken from header patterns as a detection token
+MIN_SIGNATURE_TOKEN = 3
+
+REPEAT_OPS = tuple(getattr(sre_parse, name) for name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT')
+                   if hasattr(sre_parse, name))
+
+INFO_FIELD_TYPES = {
+    'amount': lambda value: float(value.replace(',', '')),
+    'text': lambda value: value
+}
+
+def parse_amount(amount_str):
+    """
+    Convert an amount such as "-$1,234.56" to a float
+    """
+    return float(amount_str.replace('$', '').replace(',', ''))
+
+def _one_past(max_rows):
+    """
+    Rows for a capped pass to read: one past the cap, to tell a full statement from a cut one
+    """
+    return None if max_rows is None else max_rows + 1
+
+@lru_cache(maxsize=4096)
+def statement_day(date_str, date_format, year):
+    """
+    Convert a statement date to days since 1970-01-01; formats without a year use the given year
+    """
+    date_obj = datetime.strptime(date_str, date_format).date()
+    if '%y' not in date_format and '%Y' not in date_format:
+        date_obj = date_obj.replace(year=year)
+    return date_obj.toordinal() - EPOCH_ORDINAL
+
+def _required_literals(pattern):
+    """
+    Return the runs of literal text every match of a regex must contain
+    """
+    def walk(items):
+        runs = []
+        run = ''
+        for op, value in items:
+            if op is sre_parse.LITERAL:
+                run += chr(value)
+                continue
+            runs.append(run)
+            run = ''
+            if op is sre_parse.SUBPATTERN:
+                runs += walk(value[-1])
+            elif op is sre_parse.BRANCH:
+                # Only what every alternative requires; common prefixes were already factored out
+                runs += set.intersection(*(set(walk(alternative)) for alternative in value[1]))
+            elif op in REPEAT_OPS and value[0] >= 1:
+                runs += walk(value[2])
+        runs.append(run)
+        return runs
+
+    return [run for run in walk(sre_parse.parse(pattern)) if run]
+
+def signature_tokens(header_patterns):
+    """
+    Lowercase literals that text matching every header pattern (ignoring case) must contain
+    """
+    tokens = set()
+    for pattern in header_patterns:
+        tokens.update(run.strip().lower() for run in _required_literals(pattern))
+    # Shorter tokens would match nearly everywhere and narrow nothing
+    return {token for token in tokens if len(token) >= MIN_SIGNATURE_TOKEN}
+
+class RowSpec:
+    """
+    One compiled row pattern and the names of its groups
+    """
+
+    def __init__(self, spec):
+        pattern = re.compile(spec['pattern'])
+        self.search = pattern.search
+        self.fields = list(spec['fields'])
+        if pattern.groups != len(self.fields):
+            raise ValueError(f"Row pattern {spec['pattern']!r} has {pattern.groups} groups "
+                             f"but {len(self.fields)} fields")
+        # Group index of each meaningful field, None when the row lacks it
+        for field in ('date', 'description', 'category', 'amount', 'withdrawal', 'deposit'):
+            setattr(self, field, self.fields.index(field) if field in self.fields else None)
+
+class ColumnSpec:
+    """
+    Table columns of a section: the fields in header order and their header cell patterns
+    """
+
+    def __init__(self, columns):
+        self.fields = list(columns)
+        self.labels = [re.compile(label, re.IGNORECASE) for label in columns.values()]
+        for field in ('date', 'description', 'category', 'amount', 'withdrawal', 'deposit'):
+            setattr(self, field, self.fields.index(field) if field in self.fields else None)
+        self.amount_columns = [index for index, field in enumerate(self.fields) if field in AMOUNT_FIELDS]
+
+    def match_header(self, cells):
+        """
+        Return the (x0, x1) extent of each column's header cell, or None if
+        the cells are not this table's header row
+        """
+        extents = []
+        position = 0
+        for label in self.labels:
+            for index in range(position, len(cells)):
+                if label.search(cells[index][2]):
+                    extents.append(cells[index][:2])
+                    position = index + 1
+                    break
+            else:
+                return None
+        return extents
+
+    def split(self, cells, extents):
+        """
+        Return each column's text in a row, None where empty; a cell belongs to
+        the column whose header its left or right edge lines up with best
+        """
+        groups = [None] * len(self.fields)
+        for x0, x1, text in cells:
+            column = min(range(len(extents)),
+                         key=lambda index: min(abs(x0 - extents[index][0]), abs(x1 - extents[index][1])))
+            groups[column] = text if groups[column] is None else f"{groups[column]} {text}"
+        return groups
+
+class SectionSpec:
+    """
+    A compiled transaction section: where it is, how its rows read, and what they mean
+    """
+
+    def __init__(self, spec, bank_type):
+        self.name = spec.get('name', 'transaction section')
+        self.pattern = re.compile(spec['pattern'], re.DOTALL) if spec.get('pattern') else None
+        self.account = spec['account']
+        self.date_format = spec.get('date_format', '%m/%d')
+        self.category = spec.get('category')
+        self.sign = spec.get('sign', 'as_is')
+        self.required = spec.get('required', True)
+        self.rows = [RowSpec(row) for row in spec['rows']]
+        self.columns = ColumnSpec(spec['columns']) if spec.get('columns') else None
+        if self.sign not in SIGN_CONVENTIONS:
+            raise ValueError(f"{bank_type}: unknown sign convention {self.sign!r} in {self.name}")
+        amount_fields = {'withdrawal', 'deposit'} if self.sign == 'withdrawal_deposit' else {'amount'}
+        for row in self.rows + ([self.columns] if self.columns else []):
+            if 'date' not in row.fields or not amount_fields & set(row.fields):
+                raise ValueError(f"{bank_type}: rows in {self.name} need a date and "
+                                 f"{' or '.join(sorted(amount_fields))} field")
+
+class FormatParser:
+    """
+    Statement parser compiled once from a declarative format spec.
+
+    Each section is located with one regex search and its lines are read in
+    a single pass.
+    """
+
+    # Last resort: any line carrying a dollar amount
+    last_resort_amount_pattern = re.compile(r'.*?(\$?\d+\.\d{2}).*')
+    last_resort_date_pattern = re.compile(r'(\d{2}/\d{2}(?:/\d{2})?)')
+
+    def __init__(self, bank_type, spec):
+        for key in ('header_patterns', 'sections'):
+            if key not in spec:
+                raise ValueError(f"Bank format {bank_type!r} is missing {key!r}")
+        self.bank_type = bank_type
+        self.spec = spec
+        self.name = spec.get('name', bank_type)
+        self.header_patterns = [re.compile(pattern, re.IGNORECASE) for pattern in spec['header_patterns']]
+        self.fallback_keywords = list(spec.get('fallback_keywords', []))
+
+        # Detection tokens: declared, or else the literal text the header patterns require
+        tokens = spec.get('signature_tokens')
+        if tokens is None:
+            tokens = signature_tokens(spec['header_patterns'])
+        self.signature_tokens = {token.lower() for token in tokens}
+
+        markers = spec.get('transaction_section_markers', [])
+        self.is_marker_line = (re.compile('|'.join(re.escape(marker) for marker in markers)).search
+                               if markers else None)
+        self.info_patterns = [(key, re.compile(field['pattern']), INFO_FIELD_TYPES[field.get('type', 'amount')])
+                              for key, field in spec.get('info_fields', {}).items()]
+        self.sections = [SectionSpec(section, bank_type) for section in spec['sections']]
+        self.fallback = SectionSpec(spec['fallback_rows'], bank_type) if spec.get('fallback_rows') else None
+
+    def matches(self, text):
+        """
+        True if every header pattern of this format occurs in the text
+        """
+        for pattern in self.header_patterns:
+            if not pattern.search(text):
+                return False
+            logger.debug("Matched pattern '%s' for bank '%s'", pattern.pattern, self.bank_type)
+        return True
+
+    def extract_statement_info(self, text, layout=None, max_fallback_rows=DEFAULT_MAX_FALLBACK_ROWS):
+        """
+        Extract header fields and transactions, falling back to looser passes
+        when the transaction sections yield nothing.
+
+        layout, the PDF's positioned text rows (see pdf_layout), lets table
+        sections be read by column position; text must then be built from it.
+        The looser passes stop at max_fallback_rows rows (None for no cap),
+        as a document of anything but transactions can match them on every
+        line; statement_info["truncated"] is then set.
+        """
+        logger.debug(f"Extracting statement info for bank type: {self.bank_type}")
+        categorizer = get_categorizer()
+
+        statement_info = {
+            "bank_type": self.bank_type,
+            "transactions": []
+        }
+
+        for key, pattern, convert in self.info_patterns:
+            match = pattern.search(text)
+            if match:
+                statement_info[key] = convert(match.group(1))
+
+        if layout is not None:
+            with metrics.timed('layout'):
+                statement_info["transactions"] = self.extract_layout_transactions(layout, categorizer)
+        else:
+            with metrics.timed('extract'):
+                statement_info["transactions"] = self.extract_transactions(text, categorizer)
+
+        if not statement_info["transactions"]:
+            logger.warning(f"No transactions found for {self.bank_type} statement")
+            if self.fallback:
+                logger.info(f"Trying {self.fallback.name} transaction parsing for {self.name}")
+                metrics.PARSE_FALLBACKS.inc(path=self.fallback.name)
+                with metrics.timed(self.fallback.name):
+                    alt_transactions = self._section_rows(text.split('\n'), self.fallback, categorizer.categorize,
+                                                          fallback=True, max_rows=_one_past(max_fallback_rows))
+                alt_transactions = self._cap_fallback(statement_info, alt_transactions, self.fallback.name,
+                                                      max_fallback_rows)
+                if alt_transactions:
+                    logger.info(f"Found {len(alt_transactions)} {self.fallback.name} transactions")
+                    statement_info["transactions"] = alt_transactions
+        else:
+            logger.info(f"Found {len(statement_info['transactions'])} transactions for {self.bank_type} statement")
+
+        # If still no transactions, look for anything that looks like a transaction
+        if not statement_info["transactions"]:
+            logger.warning("Still no transactions found. Trying last resort parsing...")
+            metrics.PARSE_FALLBACKS.inc(path='last_resort')
+            with metrics.timed('last_resort'):
+                last_resort_transactions = self.last_resort_transactions(text, categorizer,
+                                                                         _one_past(max_fallback_rows))
+            last_resort_transactions = self._cap_fallback(statement_info, last_resort_transactions, 'last resort',
+                                                          max_fallback_rows)
+            if last_resort_transactions:
+                logger.info(f"Found {len(last_resort_transactions)} last resort transactions")
+                statement_info["transactions"] = last_resort_transactions
+
+        # Rows the keyword rules could not place go to the trained model, if there is one
+        if statement_info["transactions"] and get_ml_categorizer():
+            with metrics.timed('ml_categorize'):
+                filled = fill_batch(statement_info["transactions"])
+            logger.debug("Model categorized %d transactions", filled)
+
+        return statement_info
+
+    def _cap_fallback(self, statement_info, transactions, name, max_rows):
+        """
+        Keep a looser pass's first max_rows transactions; it reads one more, so a row past the cap shows one was dropped
+        """
+        if max_rows is None or len(transactions) <= max_rows:
+            return transactions
+        logger.warning(f"Stopped {name} parsing of a {self.name} statement at {max_rows} rows")
+        metrics.PARSE_LIMITS.inc(limit='fallback_rows')
+        statement_info["truncated"] = True
+        return transactions.take(range(max_rows))
+
+    def extract_transactions(self, text, categorizer=None):
+        """
+        Extract transactions from every section of the statement, in section order
+        """
+        logger.debug(f"Extracting transactions for bank type: {self.bank_type}")
+        categorize = (categorizer or get_categorizer()).categorize
+        transactions = TransactionBatch()
+        for section in self.sections:
+            # Only the first occurrence of each section is read
+            match = section.pattern.search(text)
+            if match:
+                logger.debug(f"Found {section.name} for {self.bank_type} statement")
+                self._section_rows(match.group(0).split('\n'), section, categorize, transactions)
+            elif section.required:
+                logger.warning(f"No {section.name} found in {self.bank_type} statement")
+        return transactions
+
+    def extract_layout_transactions(self, rows, categorizer=None):
+        """
+        Extract transactions from positioned text rows, (page, y, cells) with
+        cells as (x0, x1, text), in section order.
+
+        Sections are located in the rows' text as in extract_transactions. A
+        section with columns whose header row is found is read by column
+        position in one pass; any other goes through its row patterns.
+        """
+        logger.debug(f"Extracting layout transactions for bank type: {self.bank_type}")
+        categorize = (categorizer or get_categorizer()).categorize
+        lines = [' '.join(cell[2] for cell in cells) for _, _, cells in rows]
+        text = '\n'.join(lines)
+        line_starts = [0, *accumulate(len(line) + 1 for line in lines)]
+        transactions = TransactionBatch()
+        for section in self.sections:
+            match = section.pattern.search(text)
+            if not match:
+                if section.required:
+                    logger.warning(f"No {section.name} found in {self.bank_type} statement")
+                continue
+            first = bisect_right(line_starts, match.start()) - 1
+            last = bisect_right(line_starts, max(match.start(), match.end() - 1))
+            extents = None
+            if section.columns:
+                for header, (_, _, cells) in enumerate(rows[first:last], start=first):
+                    extents = section.columns.match_header(cells)
+                    if extents:
+                        break
+            if extents:
+                LAYOUT_SECTIONS.inc(method='columns')
+                self._table_rows(rows[header + 1:last], section, extents, categorize, transactions)
+            else:
+                LAYOUT_SECTIONS.inc(method='patterns')
+                self._section_rows(match.group(0).split('\n'), section, categorize, transactions)
+        return transactions
+
+    def _table_rows(self, rows, section, extents, categorize, batch):
+        """
+        Append the transactions in a section's table rows, read by column, to a batch.
+
+        Rows without a valid date and amount (totals, page furniture, repeated
+        headers) are skipped; a row with text only in the description column
+        continues the description of the transaction above it.
+        """
+        columns = section.columns
+        current_year = datetime.now().year
+        parsed = []
+        previous = None
+        for _, _, cells in rows:
+            groups = columns.split(cells, extents)
+            if groups[columns.date] is None:
+                if (previous is not None and columns.description is not None and groups[columns.description]
+                        and sum(group is not None for group in groups) == 1):
+                    previous[columns.description] = ' '.join(
+                        filter(None, (previous[columns.description], groups[columns.description])))
+                    continue
+            elif self._clean_table_row(groups, columns, section, current_year):
+                parsed.append(groups)
+                previous = groups
+                continue
+            logger.debug("Skipped %s row: %s", section.name, groups)
+            previous = None
+        batch.extend_rows([self._build_row(groups, columns, section, current_year, categorize) for groups in parsed],
+                          section.account)
+        return batch
+
+    def _clean_table_row(self, groups, columns, section, current_year):
+        """
+        True if a row's date and amount cells are valid, normalizing the amounts in place
+        """
+        try:
+            statement_day(groups[columns.date], section.date_format, current_year)
+        except ValueError:
+            return False
+        amounts = [index for index in columns.amount_columns if groups[index] is not None]
+        if not amounts or not all(AMOUNT_CELL.fullmatch(groups[index]) for index in amounts):
+            return False
+        for index in amounts:
+            groups[index] = groups[index].replace('$', '').replace(',', '')
+        return True
+
+    def _section_rows(self, lines, section, categorize, batch=None, fallback=False, max_rows=None):
+        """
+        Append the transactions in the lines of one section to a batch, returning the batch.
+
+        The fallback pass matches stripped lines, does not skip marker lines,
+        and logs and skips rows that fail to convert instead of raising.
+        Reading stops once max_rows rows are found.
+        """
+        rows = []
+        is_marker_line = None if fallback else self.is_marker_line
+        current_year = datetime.now().year
+        row_specs = section.rows
+        for line in lines:
+            if max_rows is not None and len(rows) >= max_rows:
+                break
+            if fallback:
+                line = line.strip()
+            # Skip empty lines or header lines
+            if not line.strip() or (is_marker_line and is_marker_line(line)):
+                continue
+
+            for row_spec in row_specs:
+                match = row_spec.search(line)
+                if not match:
+                    continue
+                try:
+                    rows.append(self._build_row(match.groups(), row_spec, section, current_year, categorize))
+                except Exception as e:
+                    if not fallback:
+                        raise
+                    logger.error(f"Error parsing {section.name} transaction: {str(e)}")
+                break
+
+        if batch is None:
+            batch = TransactionBatch()
+        batch.extend_rows(rows, section.account)
+        return batch
+
+    def _build_row(self, groups, row_spec, section, current_year, categorize):
+        day = statement_day(groups[row_spec.date], section.date_format, current_year)
+        description = groups[row_spec.description] if row_spec.description is not None else None
+        description = (description or '').strip()
+
+        if section.sign == 'withdrawal_deposit':
+            # Negative for withdrawals, positive for deposits
+            withdrawal = groups[row_spec.withdrawal] if row_spec.withdrawal is not None else None
+            deposit = groups[row_spec.deposit] if row_spec.deposit is not None else None
+            amount = 0
+            if withdrawal:
+                amount = -float(withdrawal)
+            elif deposit:
+                amount = float(deposit)
+        else:
+            amount = parse_amount(groups[row_spec.amount])
+            if section.sign == 'negate':
+                amount = -amount
+
+        # A statement-supplied category wins unless it is missing or Uncategorized
+        category = groups[row_spec.category] if row_spec.category is not None else None
+        if not category or category == UNCATEGORIZED:
+            category = section.category or categorize(description)
+
+        return day, description, category, amount
+
+    def last_resort_transactions(self, text, categorizer, max_rows=None):
+        """
+        Treat any line with a dollar amount as a transaction, up to max_rows of them
+        """
+        transactions = TransactionBatch()
+        current_year = datetime.now().year
+        for line in text.split('\n'):
+            if max_rows is not None and len(transactions) >= max_rows:
+                break
+            line = line.strip()
+            if '$' not in line:
+                continue
+            amount_match = self.last_resort_amount_pattern.search(line)
+            if not amount_match:
+                continue
+
+            # Try to find a date in the line
+            date_match = self.last_resort_date_pattern.search(line)
+            date_str = date_match.group(1) if date_match else '01/01'
+
+            # Get description (everything except the amount)
+            amount_str = amount_match.group(1)
+            description = line.replace(amount_str, '').strip()
+
+            try:
+                if '/' in date_str and len(date_str) <= 5:  # MM/DD format
+                    day = statement_day(date_str, '%m/%d', current_year)
+                elif '/' in date_str:  # MM/DD/YY format
+                    day = statement_day(date_str, '%m/%d/%y', current_year)
+                else:
+                    day = statement_day('01/01', '%m/%d', current_year)
+
+                transactions.append(day, description, categorizer.categorize(description),
+                                    to_cents(parse_amount(amount_str)), "Credit Card")
+                logger.debug("Found last resort transaction: %s - %s - %s", date_str, description, amount_str)
+            except Exception as e:
+                logger.error(f"Error parsing last resort transaction: {str(e)}")
+        return transactions
+
+class FormatRegistry:
+    """
+    Ordered set of compiled bank formats with an index for detection.
+
+    Every signature token of every format is compiled into one alternation,
+    so a single scan of the first page finds which formats are candidates;
+    only those have their header patterns checked, in registration order.
+    """
+
+    def __init__(self):
+        self.parsers = {}
+        self._token_pattern = None
+        self._token_prefixes = {}
+        self._unindexed = []
+
+    def register(self, bank_type, spec):
+        """
+        Compile and add a format; a format with the same id is replaced
+        """
+        parser = FormatParser(bank_type, spec)
+        if bank_type in self.parsers:
+            logger.warning(f"Replacing bank format {bank_type!r}")
+        self.parsers[bank_type] = parser
+        self._build_index()
+        return parser
+
+    def register_all(self, formats, source='built-in'):
+        for bank_type, spec in formats.items():
+            try:
+                self.register(bank_type, spec)
+                logger.debug(f"Registered {source} bank format {bank_type!r}")
+            except Exception as e:
+                logger.error(f"Skipping {source} bank format {bank_type!r}: {str(e)}")
+
+    def load_entry_points(self, group=ENTRY_POINT_GROUP):
+        """
+        Register formats published by installed packages under the entry point group.
+
+        Each entry point resolves to a {bank_type: spec} mapping or a callable returning one.
+        """
+        from importlib.metadata import entry_points
+
+        found = entry_points()
+        found = found.select(group=group) if hasattr(found, 'select') else found.get(group, [])
+        for entry_point in found:
+            try:
+                formats = entry_point.load()
+                if callable(formats):
+                    formats = formats()
+            except Exception as e:
+                logger.error(f"Could not load bank formats from entry point {entry_point.name!r}: {str(e)}")
+                continue
+            self.register_all(formats, source=f"entry point {entry_point.name!r}")
+
+    def load_yaml_dir(self, directory):
+        """
+        Register formats from every *.yaml/*.yml file in a directory, in name order.
+
+        Each file holds a {bank_type: spec} mapping. Needs PyYAML.
+        """
+        paths = sorted(glob.glob(os.path.join(directory, '*.yaml')) + glob.glob(os.path.join(directory, '*.yml')))
+        if not paths:
+            return
+        try:
+            import yaml
+        except ImportError:
+            logger.warning(f"PyYAML is not installed; ignoring bank formats in {directory}")
+            return
+        for path in paths:
+            try:
+                with open(path) as file:
+                    formats = yaml.safe_load(file) or {}
+            except Exception as e:
+                logger.error(f"Could not read bank formats from {path}: {str(e)}")
+                continue
+            self.register_all(formats, source=os.path.basename(path))
+
+    def _build_index(self):
+        tokens = set()
+        self._unindexed = []
+        for bank_type, parser in self.parsers.items():
+            if parser.signature_tokens:
+                tokens |= parser.signature_tokens
+            else:
+                self._unindexed.append(bank_type)
+        # The scan reports the longest token at each position, so remember the
+        # shorter tokens that are its prefixes
+        self._token_prefixes = {token: {other for other in tokens if token.startswith(other)} for token in tokens}
+        self._token_pattern = re.compile(f"(?=({build_trie_pattern(tokens)}))") if tokens else None
+
+    def candidates(self, text):
+        """
+        Return the ids of formats whose signature tokens all occur in the text
+        """
+        present = set()
+        if self._token_pattern is not None:
+            for token in set(self._token_pattern.findall(text.lower())):
+                present |= self._token_prefixes[token]
+        return {bank_type for bank_type, parser in self.parsers.items()
+                if parser.signature_tokens and parser.signature_tokens <= present} | set(self._unindexed)
+
+    def identify(self, text):
+        """
+        Return the first registered format whose header patterns all match, or None
+        """
+        candidates = self.candidates(text)
+        for bank_type, parser in self.parsers.items():
+            if bank_type in candidates and parser.matches(text):
+                return bank_type
+        return None
+
+    def identify_by_keyword(self, text):
+        """
+        Return the first registered format with a fallback keyword in the text, or None
+        """
+        for bank_type, parser in self.parsers.items():
+            if any(keyword in text for keyword in parser.fallback_keywords):
+                return bank_type
+        return None
+
+    def supported_names(self):
+        names = [parser.name for parser in self.parsers.values()]
+        if len(names) > 1:
+            return f"{', '.join(names[:-1])} and {names[-1]}"
+        return names[0] if names else 'no'
+
+    def fingerprint(self):
+        """
+        Hash of every registered spec, for caches of parse results
+        """
+        specs = [[bank_type, parser.spec] for bank_type, parser in self.parsers.items()]
+        return hashlib.sha256(json.dumps(specs, sort_keys=True).encode()).hexdigest()[:16]
+
+    def __getitem__(self, bank_type):
+        return self.parsers[bank_type]
+
+    def __contains__(self, bank_type):
+        return bank_type in self.parsers
+
+def load_default_registry():
+    """
+    Built-in formats, then installed entry points, then YAML files from
+    BANK_FORMATS_DIR (default: backend/bank_format_specs/)
+    """
+    registry = FormatRegistry()
+    registry.register_all(BANK_FORMATS)
+    registry.load_entry_points()
+    registry.load_yaml_dir(os.environ.get('BANK_FORMATS_DIR', DEFAULT_FORMATS_DIR))
+    return registry
+
+registry = load_default_registry()
@@ -0,0 +1,64 @@
+"""
+Stored benchmark baselines and regression checks.
+
+Results are {name: seconds} maps kept per suite in baselines.json next to
+this file. Timings are machine-specific, so record a baseline on the machine
+you compare on (--save-baseline) before relying on the regression flags.
+"""
+import json
+import os
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baselines.json')
+
+# A benchmark this much slower than its baseline is flagged
+DEFAULT_THRESHOLD = 0.2
+
+
+def load_baseline(suite, path=BASELINE_PATH):
+    """
+    Return the stored {name: seconds} baseline of a suite, or {} if there is none
+    """
+    try:
+        with open(path) as baseline_file:
+            return json.load(baseline_file).get(suite, {})
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(suite, results, path=BASELINE_PATH):
+    """
+    Store results as the suite's baseline, keeping the other suites' baselines
+    """
+    try:
+        with open(path) as baseline_file:
+            baselines = json.load(baseline_file)
+    except FileNotFoundError:
+        baselines = {}
+    baselines[suite] = {name: round(seconds, 6) for name, seconds in sorted(results.items())}
+    with open(path, 'w') as baseline_file:
+        json.dump(baselines, baseline_file, indent=2, sort_keys=True)
+        baseline_file.write('\n')
+
+
+def print_results(results):
+    for name, seconds in results.items():
+        print(f"  {name:<28} {seconds * 1000:10.3f} ms")
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Print each result next to its baseline; returns the names that regressed
+    """
+    regressions = []
+    for name, seconds in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            print(f"  {name:<28} {seconds * 1000:10.3f} ms   (no baseline)")
+            continue
+        change = seconds / previous - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"  {name:<28} {seconds * 1000:10.3f} ms   baseline {previous * 1000:10.3f} ms  {change:+7.1%}{flag}")
+    return regressions
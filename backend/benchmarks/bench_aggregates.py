@@ -0,0 +1,110 @@
+"""
+Benchmark the /api/aggregates rollups at 10k, 100k and 1M transactions.
+
+For each size, compares a from-scratch pure-Python recompute (what Insights
+and the Dashboard do on every render) against the NumPy rollup of a
+TransactionBatch, then loads a transaction store and times ingesting one
+more statement (the incremental rollup update) and reading the aggregates
+back. Payload sizes are for the
+aggregates JSON versus the full transaction list.
+
+Run from the backend directory:
+    python -m benchmarks.bench_aggregates --sizes 10000 100000 1000000
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+from aggregates import rollup
+from benchmarks.synthetic import synthetic_transactions
+from transaction_batch import TransactionBatch
+from transaction_store import TransactionStore
+
+
+def python_recompute(transactions):
+    """
+    Dict-based equivalent of rollup, like the client-side analyzeTransactions
+    """
+    monthly = {}
+    merchants = {}
+    category_months = {}
+    accounts = {}
+    for transaction in transactions:
+        month = transaction["date"][:7]
+        amount = transaction["amount"]
+        totals = monthly.setdefault(month, [0.0, 0.0, 0])
+        totals[2] += 1
+        if amount > 0:
+            totals[0] += amount
+        else:
+            totals[1] -= amount
+        account = accounts.setdefault(transaction["account"], [0.0, 0])
+        account[0] += amount
+        account[1] += 1
+        if amount < 0:
+            merchant = merchants.setdefault(transaction["description"], [0.0, 0])
+            merchant[0] -= amount
+            merchant[1] += 1
+            cell = category_months.setdefault((transaction["category"], month), [0.0, 0])
+            cell[0] -= amount
+            cell[1] += 1
+    return monthly, merchants, category_months, accounts
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--statement', type=int, default=500, help='transactions in the incrementally added statement')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    for size in args.sizes:
+        transactions = synthetic_transactions(size)
+        python_time = best_of(lambda: python_recompute(transactions), args.repeat)
+        batch = TransactionBatch.from_dicts(transactions)
+        numpy_time = best_of(lambda: rollup(batch), args.repeat)
+
+        with tempfile.TemporaryDirectory() as directory:
+            store = TransactionStore(os.path.join(directory, 'transactions.sqlite3'))
+            for index in range(0, size, 50000):
+                store.add_statement(f"{index:064x}", 'bench', f"statement_{index}.pdf",
+                                    batch.take(range(index, min(index + 50000, size))))
+
+            extra = synthetic_transactions(args.statement, seed=size)
+            start = time.perf_counter()
+            store.add_statement('f' * 64, 'bench', 'incremental.pdf', TransactionBatch.from_dicts(extra))
+            ingest_time = time.perf_counter() - start
+
+            reads = []
+            for _ in range(20):
+                start = time.perf_counter()
+                aggregates = store.aggregates()
+                reads.append(time.perf_counter() - start)
+
+        aggregates_bytes = len(json.dumps(aggregates))
+        transactions_bytes = len(json.dumps(transactions))
+        print(f"{size:>9,} transactions")
+        print(f"  python recompute  {python_time * 1000:9.1f} ms")
+        print(f"  numpy rollup      {numpy_time * 1000:9.1f} ms   {python_time / numpy_time:.1f}x")
+        print(f"  ingest {args.statement} rows   {ingest_time * 1000:9.1f} ms   (rows + rollup update)")
+        print(f"  read aggregates   {statistics.median(reads) * 1000:9.2f} ms")
+        print(f"  payload           {aggregates_bytes:>9,} bytes vs {transactions_bytes:,} bytes of transactions")
+
+
+if __name__ == '__main__':
+    main()
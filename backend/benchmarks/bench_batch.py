@@ -0,0 +1,77 @@
+"""
+Benchmark TransactionBatch against the list-of-dicts transaction representation.
+
+Parses a synthetic statement into a batch, then compares the batch with the
+same rows as one dict per transaction: retained memory, the pickle payload
+sent back from parser processes, and the time to build, pickle and
+round-trip each.
+
+Run from the backend directory:
+    python -m benchmarks.bench_batch --transactions 100000
+"""
+import argparse
+import logging
+import pickle
+import time
+import tracemalloc
+
+from benchmarks.synthetic import discover_statement_text, occu_statement_text
+from statement_parser import identify_bank_type, parse_statement_text
+
+
+def best_of(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def retained_bytes(function):
+    """
+    Bytes still allocated by function's result once it returns
+    """
+    tracemalloc.start()
+    result = function()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--transactions', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    for name, text in (('discover', discover_statement_text(args.transactions)),
+                       ('occu', occu_statement_text(args.transactions))):
+        bank_type = identify_bank_type(text)
+        parse = lambda: parse_statement_text(text, bank_type)["transactions"]
+        parse_time, batch = best_of(parse, args.repeat)
+        to_dicts_time, dicts = best_of(batch.to_dicts, args.repeat)
+
+        batch_memory = retained_bytes(parse)
+        dicts_memory = retained_bytes(lambda: parse().to_dicts())
+        batch_pickle_time, _ = best_of(lambda: pickle.loads(pickle.dumps(batch)), args.repeat)
+        dicts_pickle_time, _ = best_of(lambda: pickle.loads(pickle.dumps(dicts)), args.repeat)
+        batch_pickle = len(pickle.dumps(batch))
+        dicts_pickle = len(pickle.dumps(dicts))
+
+        print(f"{name}: {len(batch):,} transactions")
+        print(f"  parse into batch    {parse_time * 1000:8.1f} ms   (to_dicts at the API: {to_dicts_time * 1000:.1f} ms)")
+        print(f"  memory              {batch_memory / 2**20:8.1f} MiB batch  vs {dicts_memory / 2**20:.1f} MiB dicts "
+              f"({dicts_memory / batch_memory:.1f}x)")
+        print(f"  pickle payload      {batch_pickle / 2**20:8.1f} MiB batch  vs {dicts_pickle / 2**20:.1f} MiB dicts "
+              f"({dicts_pickle / batch_pickle:.1f}x)")
+        print(f"  pickle round trip   {batch_pickle_time * 1000:8.1f} ms batch  vs {dicts_pickle_time * 1000:.1f} ms dicts "
+              f"({dicts_pickle_time / batch_pickle_time:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
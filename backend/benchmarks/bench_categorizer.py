@@ -0,0 +1,116 @@
+"""
+Benchmark the compiled keyword categorizer against the original nested loop.
+
+Also measures the cached categorizer on a repeat-heavy workload where a small
+set of merchants recurs with different store numbers.
+
+Run from the backend directory:
+    python -m benchmarks.bench_categorizer --size 1000000
+"""
+import argparse
+import random
+import time
+
+from categorizer import (CATEGORY_KEYWORDS, UNCATEGORIZED, CachedCategorizer, CategoryCache,
+                         KeywordCategorizer)
+
+MERCHANT_WORDS = ['TST*', 'SQ*', 'MATCHA', 'CAFE', 'SPROUTS', 'FARMERS', 'CHEVRON', 'NETFLIX.COM', 'AMAZON',
+                  'MKTPL', 'UNIQLO', 'VERIZON', 'CVS/PHARMACY', 'AIRBNB', 'PAYMENT', 'THANK', 'YOU',
+                  'IRVINE', 'COSTA', 'MESA', 'CA', 'ANAHEIM', 'LOS', 'ANGELES', 'ONLINE', 'PURCHASE',
+                  'ZELLE', 'ACH', 'DEBIT', 'POS', 'WITHDRAWAL', 'ROUND1', 'BOWLERO', 'LAZY', 'ACRES']
+
+
+def legacy_categorize_transaction(description):
+    """
+    The original per-call nested loop, kept here as the baseline
+    """
+    description_lower = description.lower()
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        for keyword in keywords:
+            if keyword.lower() in description_lower:
+                return category
+    return UNCATEGORIZED
+
+
+def synthetic_descriptions(size, seed=42):
+    """
+    Generate statement-like merchant descriptions
+    """
+    rng = random.Random(seed)
+    descriptions = []
+    for _ in range(size):
+        words = rng.sample(MERCHANT_WORDS, rng.randint(2, 5))
+        if rng.random() < 0.5:
+            words.append(str(rng.randint(1000, 99999)))
+        descriptions.append(' '.join(words))
+    return descriptions
+
+
+def repeat_heavy_descriptions(size, merchants, seed=42):
+    """
+    Generate descriptions drawn from a fixed merchant set with varying store numbers
+    """
+    rng = random.Random(seed)
+    names = synthetic_descriptions(merchants, seed)
+    # Skew towards the first merchants the way real statements do
+    weights = [1.0 / (rank + 1) for rank in range(merchants)]
+    picks = rng.choices(names, weights=weights, k=size)
+    return [f"{name} #{rng.randint(1, 9999)}" for name in picks]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--merchants', type=int, default=5000,
+                        help='distinct merchants in the repeat-heavy workload')
+    args = parser.parse_args()
+
+    descriptions = synthetic_descriptions(args.size, args.seed)
+
+    start = time.perf_counter()
+    categorizer = KeywordCategorizer(CATEGORY_KEYWORDS)
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = [legacy_categorize_transaction(d) for d in descriptions]
+    legacy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = categorizer.categorize_many(descriptions)
+    compiled_seconds = time.perf_counter() - start
+
+    mismatches = sum(1 for a, b in zip(expected, actual) if a != b)
+
+    print(f"descriptions:      {args.size:,}")
+    print(f"build:             {build_seconds * 1000:.2f} ms")
+    print(f"legacy loop:       {legacy_seconds:.2f} s ({args.size / legacy_seconds:,.0f}/s)")
+    print(f"compiled:          {compiled_seconds:.2f} s ({args.size / compiled_seconds:,.0f}/s)")
+    print(f"speed-up:          {legacy_seconds / compiled_seconds:.2f}x")
+    print(f"mismatches:        {mismatches}")
+
+    repeated = repeat_heavy_descriptions(args.size, args.merchants, args.seed)
+
+    start = time.perf_counter()
+    uncached = categorizer.categorize_many(repeated)
+    uncached_seconds = time.perf_counter() - start
+
+    cached_categorizer = CachedCategorizer(categorizer, CategoryCache())
+    start = time.perf_counter()
+    cached = cached_categorizer.categorize_many(repeated)
+    cached_seconds = time.perf_counter() - start
+    cache_mismatches = sum(1 for a, b in zip(uncached, cached) if a != b)
+    info = cached_categorizer.cache_info()
+
+    print(f"repeat-heavy ({args.merchants:,} merchants)")
+    print(f"  uncached:        {uncached_seconds:.2f} s ({args.size / uncached_seconds:,.0f}/s)")
+    print(f"  cached:          {cached_seconds:.2f} s ({args.size / cached_seconds:,.0f}/s)")
+    print(f"  hit rate:        {info['hit_rate']:.1%} ({info['evictions']:,} evictions)")
+    print(f"  mismatches:      {cache_mismatches}")
+
+    if mismatches or cache_mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark upload deduplication against a large transaction store.
+
+Loads synthetic transactions into a temporary store, then times the dedup
+check of a statement of new rows (answered by the Bloom filter) and of a
+statement that repeats stored rows (answered by the dedup-key index), with
+and without the Bloom filter in front. The first check also builds the
+filter from the stored keys; that one-off cost is reported separately.
+
+Run from the backend directory:
+    python -m benchmarks.bench_dedup --transactions 1000000
+"""
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.synthetic import synthetic_transactions
+from dedup import UploadDeduplicator
+from transaction_batch import TransactionBatch
+from transaction_store import TransactionStore
+
+
+class AlwaysMaybe:
+    """
+    Stand-in filter that sends every key to the index
+    """
+
+    def might_contain_many(self, keys):
+        import numpy as np
+        return np.ones(len(keys), dtype=bool)
+
+
+def time_dedupe(store, batch, samples):
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        _, _, dropped = UploadDeduplicator(store).dedupe('upload.pdf', 'upload', batch)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), len(dropped)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--transactions', type=int, default=1000000)
+    parser.add_argument('--per-statement', type=int, default=5000, help='transactions per stored statement')
+    parser.add_argument('--statement', type=int, default=500, help='transactions in the checked statement')
+    parser.add_argument('--samples', type=int, default=20)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    transactions = synthetic_transactions(args.transactions)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = TransactionStore(os.path.join(directory, 'transactions.sqlite3'))
+        start = time.perf_counter()
+        for index in range(0, len(transactions), args.per_statement):
+            store.add_statement(f"{index:064x}", 'bench', f"statement_{index}.pdf",
+                                TransactionBatch.from_dicts(transactions[index:index + args.per_statement]))
+        print(f"loaded {len(transactions):,} transactions in {time.perf_counter() - start:.1f} s")
+
+        fresh = TransactionBatch.from_dicts(synthetic_transactions(args.statement, seed=7, start_year=2030))
+        repeated = TransactionBatch.from_dicts(transactions[:args.statement])
+
+        start = time.perf_counter()
+        store.find_dedup_keys([])
+        print(f"Bloom filter build:   {(time.perf_counter() - start) * 1000:8.1f} ms (once per process)")
+
+        for name, batch in (('new rows', fresh), ('repeated rows', repeated)):
+            seconds, dropped = time_dedupe(store, batch, args.samples)
+            print(f"{name + ', Bloom':<22}{seconds * 1000:8.2f} ms  {dropped:,} of {len(batch):,} dropped")
+
+        # Same checks with every key looked up in the index
+        store._sync_bloom = lambda conn: AlwaysMaybe()
+        for name, batch in (('new rows', fresh), ('repeated rows', repeated)):
+            seconds, dropped = time_dedupe(store, batch, args.samples)
+            print(f"{name + ', index only':<22}{seconds * 1000:8.2f} ms  {dropped:,} of {len(batch):,} dropped")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark /api/export throughput and memory.
+
+Seeds a store per --transactions size, then streams the whole store
+through the endpoint in each format, plus one account's rows for one year
+to show filters being pushed down into the chunk queries. Each export runs
+in a forked process that reports its throughput, output size and peak RSS
+growth (Linux only). The growth should be about the same at every size,
+as only one chunk is held at a time.
+
+Seeding 10M rows takes several minutes; --directory keeps the seeded
+stores for later runs.
+
+Run from the backend directory:
+    python -m benchmarks.bench_export --transactions 1000000 10000000 --directory /tmp/export-bench
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.synthetic import synthetic_transactions
+from transaction_batch import TransactionBatch
+from transaction_store import TransactionStore
+
+FORMATS = ('csv', 'parquet', 'arrow')
+
+# Earliest date synthetic_transactions generates
+FIRST_DAY = '2019-01-01'
+
+# Rows generated and stored per synthetic statement while seeding
+SEED_STATEMENT = 100000
+
+
+def status_mib(field):
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1]) / 1024
+
+
+def seeded_store(directory, transactions):
+    """
+    Return the path of a store holding `transactions` synthetic rows, seeding it if needed
+    """
+    path = os.path.join(directory, f"transactions_{transactions}.sqlite3")
+    if os.path.exists(path):
+        conn = sqlite3.connect(path)
+        try:
+            if conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0] == transactions:
+                return path
+        finally:
+            conn.close()
+        os.remove(path)
+    store = TransactionStore(path)
+    start = time.perf_counter()
+    for index in range(0, transactions, SEED_STATEMENT):
+        rows = synthetic_transactions(min(SEED_STATEMENT, transactions - index), seed=index)
+        store.add_statement(f"{index:064x}", 'bench', f"statement_{index}.pdf", TransactionBatch.from_dicts(rows))
+    print(f"seeded {transactions:,} transactions in {time.perf_counter() - start:.0f} s")
+    return path
+
+
+def measure(path, export_format, query):
+    """
+    Stream one export in a forked process; returns (seconds, bytes, peak RSS growth in MiB)
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        from app import create_app
+
+        app = create_app({'TRANSACTION_STORE_PATH': path, 'PARSE_CACHE_PATH': '', 'JOBS_PATH': ''})
+        client = app.test_client()
+        # Warm up on the first day's rows, so loading pyarrow and its kernels is not counted as growth
+        client.get(f"/api/export?format={export_format}&end_date={FIRST_DAY}").get_data()
+        baseline = status_mib('VmRSS')
+        # Reset the peak (VmHWM) to the current RSS, so startup does not count
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        start = time.perf_counter()
+        response = client.get(f"/api/export?{query}", buffered=False)
+        size = sum(len(chunk) for chunk in response.response)
+        seconds = time.perf_counter() - start
+        peak = status_mib('VmHWM')
+        with os.fdopen(write_fd, 'w') as pipe:
+            pipe.write(json.dumps([seconds, size, peak - baseline]))
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as pipe:
+        result = json.loads(pipe.read())
+    os.waitpid(pid, 0)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--transactions', type=int, nargs='+', default=[1000000])
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=list(FORMATS))
+    parser.add_argument('--directory', help='keep seeded stores here instead of a temporary directory')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as scratch:
+        directory = args.directory or scratch
+        os.makedirs(directory, exist_ok=True)
+        for transactions in args.transactions:
+            path = seeded_store(directory, transactions)
+            for export_format in args.formats:
+                for label, query in (('all rows', f"format={export_format}"),
+                                     ('1 account, 1 year', f"format={export_format}&account=Pacific%20Checking"
+                                                           f"&start_date=2021-01-01&end_date=2021-12-31")):
+                    seconds, size, growth = measure(path, export_format, query)
+                    rate = f"{transactions / seconds:>9,.0f} rows/s" if label == 'all rows' else ' ' * 16
+                    print(f"{transactions:>11,} rows  {export_format:<8}{label:<19}{seconds:7.2f} s  {rate}  "
+                          f"{size / 2 ** 20:8.1f} MiB  peak RSS +{growth:5.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
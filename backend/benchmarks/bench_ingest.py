@@ -0,0 +1,58 @@
+"""
+Benchmark parallel statement ingestion across parser pool sizes.
+
+Writes a batch of synthetic Discover PDFs to a temporary directory and times
+ingest.parse_files over them with 1, 4 and 8 worker processes.
+
+Run from the backend directory:
+    python -m benchmarks.bench_ingest --files 12 --transactions 2000
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic import discover_statement_text, text_to_pdf
+from ingest import parse_files, shutdown_parse_pool
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=12, help='statements per batch')
+    parser.add_argument('--transactions', type=int, default=2000, help='purchases per statement')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--repeat', type=int, default=3, help='best-of repetitions per pool size')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_paths = []
+        for index in range(args.files):
+            file_path = os.path.join(directory, f"statement_{index:02d}.pdf")
+            with open(file_path, 'wb') as file:
+                file.write(text_to_pdf(discover_statement_text(args.transactions, seed=index)))
+            file_paths.append(file_path)
+
+        print(f"{args.files} files x {args.transactions} transactions, {os.cpu_count()} CPUs")
+        baseline = None
+        for workers in args.workers:
+            # Warm the pool so process start-up is not counted
+            parse_files(file_paths[:1], workers=workers)
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                results = parse_files(file_paths, workers=workers)
+                timings.append(time.perf_counter() - start)
+            errors = [error for _, error in results if error]
+            if errors:
+                raise SystemExit(f"parse errors: {errors}")
+            best = min(timings)
+            baseline = baseline or best
+            print(f"workers={workers:<3} {best:.2f} s  speed-up {baseline / best:.2f}x")
+        shutdown_parse_pool()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Benchmark layout-aware PDF parsing against the extract_text path.
+
+Renders synthetic statements as plain PDFs (one text run per line) and as
+tabular PDFs (one positioned run per table cell, as bank statements are
+usually drawn), then parses each with and without layout. Rows parsed from
+the plain PDF's text are the ground truth; a statement counts as correct
+when a path reproduces them exactly, and recall is the share of truth rows
+it recovered.
+
+Run from the backend directory:
+    python -m benchmarks.bench_layout --statements 20 --transactions 200
+"""
+import argparse
+import logging
+import time
+from collections import Counter
+
+from benchmarks.synthetic import statement_pdf
+from statement_parser import parse_pdf
+
+
+def row_keys(statement):
+    return [(row["date"], row["description"], row["category"], row["amount"], row["account"])
+            for row in statement["transactions"].to_dicts()]
+
+
+def recovered(truth, rows):
+    return sum((Counter(truth) & Counter(rows)).values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--statements', type=int, default=20, help='statements per bank and rendering')
+    parser.add_argument('--transactions', type=int, default=200, help='transactions per statement')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    for bank in ('discover', 'occu'):
+        pdfs = {tabular: [statement_pdf(bank, args.transactions, seed, tabular=tabular)
+                          for seed in range(args.statements)] for tabular in (False, True)}
+        truth = [row_keys(parse_pdf(pdf, layout=False)) for pdf in pdfs[False]]
+        total = sum(len(rows) for rows in truth)
+        for tabular in (False, True):
+            for layout in (False, True):
+                start = time.perf_counter()
+                parsed = [row_keys(parse_pdf(pdf, layout=layout)) for pdf in pdfs[tabular]]
+                seconds = time.perf_counter() - start
+                correct = sum(rows == expected for rows, expected in zip(parsed, truth))
+                found = sum(recovered(expected, rows) for rows, expected in zip(parsed, truth))
+                name = f"{bank}, {'tabular' if tabular else 'plain'} PDF, {'layout' if layout else 'text'}"
+                print(f"{name:<30}{len(pdfs[tabular]) / seconds:8.1f} statements/s  "
+                      f"{correct}/{len(parsed)} exact  recall {found / total:6.1%}")
+
+
+if __name__ == '__main__':
+    main()
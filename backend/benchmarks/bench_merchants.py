@@ -0,0 +1,130 @@
+"""
+Benchmark merchant clustering of transaction descriptions.
+
+Generates descriptions for synthetic merchants the way card statements
+vary them (store and reference numbers, cities, processor prefixes), then
+clusters growing numbers of distinct descriptions with MerchantIndex and
+reports throughput alongside pairwise precision and recall against the
+planted merchants. Time per description should stay flat as the count
+grows, since LSH avoids comparing every pair. With --store it also times
+storing a statement of new descriptions in a store already holding the
+largest set, which assigns them through the stored LSH buckets.
+
+Run from the backend directory:
+    python -m benchmarks.bench_merchants --descriptions 50000 100000 200000 400000 --store
+"""
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+
+from merchants import MerchantIndex
+from transaction_batch import TransactionBatch
+from transaction_store import TransactionStore
+
+SYLLABLES = ('ka', 'lo', 'mi', 'ra', 'zen', 'tor', 'vi', 'sa', 'bel', 'qu', 'dri', 'mo', 'nex', 'pa', 'lu', 'ster')
+KINDS = ('CAFE', 'MARKET', 'GRILL', 'PHARMACY', 'FITNESS', 'AUTO', 'BOOKS', 'SALON', 'DELI', 'HARDWARE', '')
+CITIES = ('IRVINE', 'COSTA MESA', 'TUSTIN', 'SANTA ANA', 'LONG BEACH', 'ANAHEIM', 'SAN DIEGO', 'LOS ANGELES',
+          'PASADENA', 'TORRANCE', 'FULLERTON', 'CERRITOS')
+STATES = ('CA', 'NV', 'AZ', 'OR', 'WA')
+
+
+def planted_merchants(count, seed=42):
+    rng = random.Random(seed)
+    # One merchant per brand, so "KAVI" and "KAVI DELI" are never planted as two
+    names = {}
+    while len(names) < count:
+        brand = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).upper()
+        names.setdefault(brand, f"{brand} {rng.choice(KINDS)}".strip())
+    return sorted(names.values())
+
+
+def description_variant(name, rng):
+    """
+    One way a statement might print a merchant's name
+    """
+    city = f"{rng.choice(CITIES)} {rng.choice(STATES)}"
+    style = rng.randrange(4)
+    if style == 0:
+        return f"{name} #{rng.randint(100, 99999)} {city}"
+    if style == 1:
+        return f"TST* {name} {rng.randint(1000, 9999)} {city}"
+    if style == 2:
+        reference = ''.join(rng.choice('ABCDEFGHJKLMNPQRSTUVWXYZ0123456789') for _ in range(6))
+        return f"{name}*{reference} {rng.randint(100, 999)}-{rng.randint(100, 999)}-{rng.randint(1000, 9999)} {city}"
+    return f"SQ *{name} {rng.randint(10, 99999):05d} {city}"
+
+
+def planted_descriptions(count, merchants, seed=42):
+    """
+    Return (distinct descriptions, planted merchant of each)
+    """
+    rng = random.Random(seed)
+    descriptions = {}
+    while len(descriptions) < count:
+        name = rng.choice(merchants)
+        descriptions.setdefault(description_variant(name, rng), name)
+    return list(descriptions), list(descriptions.values())
+
+
+def pair_counts(labels):
+    return sum(count * (count - 1) // 2 for count in Counter(labels).values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--descriptions', type=int, nargs='+', default=[50000, 100000, 200000])
+    parser.add_argument('--merchants', type=int, default=20000, help='planted merchants')
+    parser.add_argument('--statement', type=int, default=500, help='new descriptions in the stored statement')
+    parser.add_argument('--store', action='store_true', help='also time incremental assignment in a store')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    merchants = planted_merchants(args.merchants)
+    for count in args.descriptions:
+        descriptions, truth = planted_descriptions(count, merchants)
+        start = time.perf_counter()
+        assigned, created, _ = MerchantIndex().assign(descriptions)
+        seconds = time.perf_counter() - start
+
+        together = pair_counts(zip(assigned, truth))
+        precision = together / max(1, pair_counts(assigned))
+        recall = together / max(1, pair_counts(truth))
+        print(f"{count:>9,} descriptions: {seconds:6.2f} s  {seconds / count * 1e6:5.1f} us/description  "
+              f"{len(created):,} merchants for {len(set(truth)):,} planted  "
+              f"precision {precision:.3f}  recall {recall:.3f}")
+
+    if not args.store:
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        store = TransactionStore(os.path.join(directory, 'transactions.sqlite3'))
+        batch = TransactionBatch.from_dicts([
+            {"date": "2024-01-01", "description": description, "category": "Shopping", "amount": -1.0,
+             "account": "Discover Credit Card"} for description in descriptions])
+        start = time.perf_counter()
+        store.add_statement('0' * 64, 'bench', 'history.pdf', batch)
+        print(f"store {len(batch):,} new descriptions at once: {time.perf_counter() - start:.1f} s")
+
+        fresh, _ = planted_descriptions(args.statement, merchants, seed=7)
+        statement = TransactionBatch.from_dicts([
+            {"date": "2024-02-01", "description": description, "category": "Shopping", "amount": -1.0,
+             "account": "Discover Credit Card"} for description in fresh])
+        start = time.perf_counter()
+        store.add_statement('f' * 64, 'bench', 'new.pdf', statement)
+        stored_seconds = time.perf_counter() - start
+
+        assign = store._assign_merchants
+        store._assign_merchants = lambda conn, descriptions: {description: 0 for description in descriptions}
+        start = time.perf_counter()
+        store.add_statement('e' * 64, 'bench', 'again.pdf', statement)
+        plain_seconds = time.perf_counter() - start
+        store._assign_merchants = assign
+        print(f"store a {len(statement):,}-row statement of new descriptions: {stored_seconds * 1000:.1f} ms, "
+              f"{plain_seconds * 1000:.1f} ms without merchant assignment")
+
+
+if __name__ == '__main__':
+    main()
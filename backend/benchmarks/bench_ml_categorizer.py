@@ -0,0 +1,69 @@
+"""
+Benchmark the ML fallback categorizer against the keyword path.
+
+Trains a model on synthetic descriptions labelled by the keyword rules, then
+times keyword categorization, batch model scoring, and the combined path
+(keywords, then the model for whatever is left Uncategorized) over the same
+descriptions. Needs scikit-learn.
+
+Run from the backend directory:
+    python -m benchmarks.bench_ml_categorizer --size 100000
+"""
+import argparse
+import time
+
+from benchmarks.bench_categorizer import repeat_heavy_descriptions, synthetic_descriptions
+from categorizer import CATEGORY_KEYWORDS, UNCATEGORIZED, KeywordCategorizer
+from ml_categorizer import MLCategorizer
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def combined(keywords, model, descriptions):
+    categories = keywords.categorize_many(descriptions)
+    left = [index for index, category in enumerate(categories) if category == UNCATEGORIZED]
+    for index, category in zip(left, model.predict_many([descriptions[index] for index in left])):
+        categories[index] = category
+    return categories
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=100_000, help='descriptions to categorize')
+    parser.add_argument('--train', type=int, default=50_000, help='labelled descriptions to train on')
+    parser.add_argument('--merchants', type=int, default=5000,
+                        help='distinct merchants in the repeat-heavy workload')
+    args = parser.parse_args()
+
+    keywords = KeywordCategorizer(CATEGORY_KEYWORDS)
+    training = synthetic_descriptions(args.train, seed=7)
+    labels = keywords.categorize_many(training)
+    labelled = [(description, label) for description, label in zip(training, labels) if label != UNCATEGORIZED]
+    model, train_seconds = timed(lambda: MLCategorizer.train(*zip(*labelled)))
+    print(f"trained on {len(labelled):,} labelled rows in {train_seconds:.2f} s")
+
+    for name, descriptions in (('unique', synthetic_descriptions(args.size)),
+                               (f"repeat-heavy ({args.merchants:,} merchants)",
+                                repeat_heavy_descriptions(args.size, args.merchants))):
+        expected, keyword_seconds = timed(lambda: keywords.categorize_many(descriptions))
+        predicted, model_seconds = timed(lambda: model.predict_many(descriptions))
+        filled, combined_seconds = timed(lambda: combined(keywords, model, descriptions))
+        matched = [(e, p) for e, p in zip(expected, predicted) if e != UNCATEGORIZED]
+        agreement = sum(e == p for e, p in matched) / len(matched) if matched else 0.0
+        left = expected.count(UNCATEGORIZED)
+        rescued = left - filled.count(UNCATEGORIZED)
+
+        print(f"{name}: {args.size:,} descriptions")
+        print(f"  keywords:            {keyword_seconds * 1000:8.1f} ms")
+        print(f"  model, every row:    {model_seconds * 1000:8.1f} ms  "
+              f"({agreement:.1%} agree with the keyword rules)")
+        print(f"  keywords + model:    {combined_seconds * 1000:8.1f} ms  "
+              f"({rescued:,} of {left:,} Uncategorized rows filled)")
+
+
+if __name__ == '__main__':
+    main()
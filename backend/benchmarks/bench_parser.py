@@ -0,0 +1,44 @@
+"""
+Report statement parser throughput on synthetic Discover and Orange County
+Credit Union statements.
+
+Parser output is checked against golden files by tests/test_golden.py.
+
+Run from the backend directory:
+    python -m benchmarks.bench_parser --transactions 20000
+"""
+import argparse
+import logging
+import time
+
+from benchmarks.synthetic import discover_statement_text, occu_statement_text
+from statement_parser import identify_bank_type, parse_statement_text
+
+
+def measure(name, text, repeat):
+    lines = text.count('\n') + 1
+    bank_type = identify_bank_type(text)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        statement = parse_statement_text(text, bank_type)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{name:<10} {lines:>9,} lines  {len(statement['transactions']):>9,} rows  "
+          f"{best * 1000:9.1f} ms  {lines / best:>12,.0f} lines/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--transactions', type=int, default=20000, help='rows per synthetic statement')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    measure('discover', discover_statement_text(args.transactions) + '\n', args.repeat)
+    measure('occu', occu_statement_text(args.transactions) + '\n', args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark incremental recategorization after keyword rule edits.
+
+Loads synthetic transactions, categorized by the keyword rules as parsing
+does, into a temporary store, then times TransactionStore.recategorize for
+typical edits (adding, removing and moving a keyword, swapping two
+categories' precedence) and reverting each one. For comparison it also
+times categorizing every stored row again, which is what pushing the whole
+history back through /api/categorize costs before any writes.
+
+Run from the backend directory:
+    python -m benchmarks.bench_recategorize --transactions 1000000
+"""
+import argparse
+import copy
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic import synthetic_transactions
+from categorizer import CATEGORY_KEYWORDS, KeywordCategorizer
+from transaction_batch import TransactionBatch
+from transaction_store import TransactionStore
+
+
+def edits():
+    """
+    Yield (name, edited copy of CATEGORY_KEYWORDS)
+    """
+    added = copy.deepcopy(CATEGORY_KEYWORDS)
+    added['Restaurants'].append('mkt')
+    yield 'add a keyword', added
+
+    removed = copy.deepcopy(CATEGORY_KEYWORDS)
+    removed['Restaurants'].remove('jollibee')
+    yield 'remove a keyword', removed
+
+    moved = copy.deepcopy(CATEGORY_KEYWORDS)
+    moved['Entertainment'].remove('netflix')
+    moved['Subscription'].append('netflix')
+    yield 'move a keyword', moved
+
+    categories = list(CATEGORY_KEYWORDS.items())
+    categories[1], categories[4] = categories[4], categories[1]
+    yield 'swap two categories', copy.deepcopy(dict(categories))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--transactions', type=int, default=1000000)
+    parser.add_argument('--per-statement', type=int, default=5000, help='transactions per stored statement')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    categorizer = KeywordCategorizer(CATEGORY_KEYWORDS)
+    transactions = synthetic_transactions(args.transactions)
+    for transaction in transactions:
+        transaction["category"] = categorizer.categorize(transaction["description"])
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = TransactionStore(os.path.join(directory, 'transactions.sqlite3'))
+        start = time.perf_counter()
+        for index in range(0, len(transactions), args.per_statement):
+            store.add_statement(f"{index:064x}", 'bench', f"statement_{index}.pdf",
+                                TransactionBatch.from_dicts(transactions[index:index + args.per_statement]))
+        print(f"loaded {len(transactions):,} transactions in {time.perf_counter() - start:.1f} s")
+
+        start = time.perf_counter()
+        with store._connect() as conn:
+            descriptions = [description for (description,) in conn.execute("SELECT description FROM transactions")]
+        categorizer.categorize_many(descriptions)
+        print(f"{'categorize every row':<22}{(time.perf_counter() - start) * 1000:9.1f} ms")
+
+        for name, edited in edits():
+            for label, rules in ((name, edited), ('  revert', CATEGORY_KEYWORDS)):
+                start = time.perf_counter()
+                result = store.recategorize(rules)
+                seconds = time.perf_counter() - start
+                print(f"{label:<22}{seconds * 1000:9.1f} ms  {result['checked']:,} rows checked, "
+                      f"{len(result['changes']):,} changed")
+
+
+if __name__ == '__main__':
+    main()
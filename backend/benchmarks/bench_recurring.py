@@ -0,0 +1,131 @@
+"""
+Benchmark recurring-charge detection.
+
+Mixes planted subscriptions (weekly, monthly and annual charges with date
+jitter and the odd price change) into synthetic one-off spending, then
+times recurring.detect over the whole history and reports how many planted
+subscriptions it found and how many other merchants it flagged. With
+--store it also times storing one more statement in a loaded transaction
+store, which re-detects only the merchants that statement charged.
+
+Run from the backend directory:
+    python -m benchmarks.bench_recurring --transactions 1000000 --store
+"""
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from benchmarks.synthetic import synthetic_transactions
+from merchants import MerchantIndex
+from recurring import detect
+from transaction_batch import TransactionBatch
+from transaction_store import TransactionStore
+
+PLANTED_CADENCES = (('weekly', 7), ('monthly', 30), ('annual', 365))
+
+
+def subscription_transactions(subscriptions, seed=42, start=date(2019, 1, 1), end=date(2023, 12, 31)):
+    """
+    Return (transaction dicts, {subscription name: cadence}) for planted subscriptions
+    """
+    rng = random.Random(seed)
+    transactions = []
+    planted = {}
+    for index in range(subscriptions):
+        cadence, period = PLANTED_CADENCES[index % len(PLANTED_CADENCES)]
+        # Letters only, as numbers end a merchant's name; leading, as the first word weighs most in clustering
+        name = ''.join(chr(ord('A') + int(digit)) for digit in f"{index:05d}") + ' SUBSCRIPTION'
+        amount = rng.randint(500, 5000) / 100
+        day = start + timedelta(days=rng.randrange(period))
+        while day <= end:
+            if rng.random() < 0.05:
+                amount = round(amount * 1.1, 2)
+            charged = day + timedelta(days=rng.randint(-1, 1))
+            transactions.append({"date": charged.isoformat(), "description": f"{name} #{rng.randint(100, 999)}",
+                                 "category": "Services", "amount": -amount, "account": "Discover Credit Card"})
+            day += timedelta(days=period)
+        planted[name] = cadence
+    return transactions, planted
+
+
+def columns(transactions):
+    """
+    Return (description, merchant id, days, cents) columns of the charges, clustered as the store would
+    """
+    charges = [transaction for transaction in transactions if transaction["amount"] < 0]
+    descriptions = [transaction["description"] for transaction in charges]
+    distinct = list(dict.fromkeys(descriptions))
+    merchant_ids = dict(zip(distinct, MerchantIndex().assign(distinct)[0]))
+    codes = np.array([merchant_ids[description] for description in descriptions], dtype=np.int64)
+    days = np.array([transaction["date"] for transaction in charges], dtype='datetime64[D]').astype(np.int64)
+    cents = np.rint(np.array([transaction["amount"] for transaction in charges]) * -100).astype(np.int64)
+    return descriptions, codes, days, cents
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--transactions', type=int, default=1000000, help='one-off transactions')
+    parser.add_argument('--subscriptions', type=int, default=300, help='planted recurring merchants')
+    parser.add_argument('--per-statement', type=int, default=5000, help='transactions per stored statement')
+    parser.add_argument('--store', action='store_true', help='also time incremental detection in a store')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    planted_rows, planted = subscription_transactions(args.subscriptions)
+    transactions = synthetic_transactions(args.transactions) + planted_rows
+    random.Random(1).shuffle(transactions)
+
+    descriptions, codes, days, cents = columns(transactions)
+    start = time.perf_counter()
+    found = detect(codes, days, cents)
+    seconds = time.perf_counter() - start
+    cadences = {charge["merchant"]: charge["cadence"] for charge in found}
+    # The merchant each planted subscription was clustered into
+    subscriptions = {description.rsplit(' #', 1)[0]: code for description, code in zip(descriptions, codes.tolist())
+                     if description.rsplit(' #', 1)[0] in planted}
+    recalled = sum(cadences.get(subscriptions.get(name)) == cadence for name, cadence in planted.items())
+    flagged = len(set(cadences) - set(subscriptions.values()))
+    print(f"detect over {len(days):,} charges, {len(set(codes.tolist())):,} merchants: {seconds * 1000:.1f} ms")
+    print(f"  {recalled} of {len(planted)} planted subscriptions found with the right cadence, "
+          f"{flagged} other merchants flagged")
+
+    if not args.store:
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        store = TransactionStore(os.path.join(directory, 'transactions.sqlite3'))
+        for index in range(0, len(transactions), args.per_statement):
+            store.add_statement(f"{index:064x}", 'bench', f"statement_{index}.pdf",
+                                TransactionBatch.from_dicts(transactions[index:index + args.per_statement]))
+
+        statement, _ = subscription_transactions(args.subscriptions, seed=7, start=date(2024, 1, 1),
+                                                 end=date(2024, 1, 31))
+        statement += synthetic_transactions(500, seed=7, start_year=2024, years=1)
+        batch = TransactionBatch.from_dicts(statement)
+        start = time.perf_counter()
+        store.add_statement('f' * 64, 'bench', 'new.pdf', batch)
+        stored_seconds = time.perf_counter() - start
+
+        # The same statement again, with recurring-charge refresh skipped
+        refresh = store._refresh_recurring
+        store._refresh_recurring = lambda conn, merchant_ids: None
+        start = time.perf_counter()
+        store.add_statement('e' * 64, 'bench', 'again.pdf', batch)
+        plain_seconds = time.perf_counter() - start
+        store._refresh_recurring = refresh
+
+        start = time.perf_counter()
+        charges = store.recurring()
+        read_seconds = time.perf_counter() - start
+        print(f"store a {len(batch):,}-row statement: {stored_seconds * 1000:.1f} ms, "
+              f"{plain_seconds * 1000:.1f} ms without recurring-charge refresh")
+        print(f"read {len(charges):,} recurring charges: {read_seconds * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
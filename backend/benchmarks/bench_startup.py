@@ -0,0 +1,195 @@
+"""
+Benchmark app startup and per-worker memory under a prefork server.
+
+Each scenario runs in a fresh interpreter that forks --workers workers with
+os.fork, as gunicorn does:
+
+    lazy     every worker imports and creates the app after the fork
+             (gunicorn without preload_app)
+    preload  the master creates the app, then forks; workers load the PDF
+             reader, category model and dedup filter on first use
+    warm     the master creates the app with WARM_START and freezes the
+             collector before forking, as wsgi.py and gunicorn.conf.py do
+
+Every worker then serves an upload, a categorize request and a transaction
+query. Reported per scenario: the master's startup, each worker's own
+startup and first upload (means), and memory once every worker has served
+its requests, read from /proc (Linux only): RSS, PSS (shared pages split
+between the processes sharing them) and USS (pages no other process
+shares) per worker, and the PSS of master and workers together, which is
+what the server really costs. The store is seeded with --transactions rows
+and a category model trained on them, so the dedup filter and the model
+are of a realistic size.
+
+Run from the backend directory:
+    python -m benchmarks.bench_startup --workers 4 --transactions 200000
+"""
+import argparse
+import gc
+import io
+import json
+import logging
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import DISCOVER_MERCHANTS, statement_pdf, synthetic_transactions
+
+SCENARIOS = ('lazy', 'preload', 'warm')
+
+
+def memory():
+    """
+    Return this process's (RSS, PSS, USS) in MiB
+    """
+    fields = {}
+    with open('/proc/self/smaps_rollup') as smaps:
+        for line in smaps:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return fields['Rss'], fields['Pss'], fields['Private_Clean'] + fields['Private_Dirty']
+
+
+def app_config(directory):
+    return {
+        'PARSE_CACHE_PATH': os.path.join(directory, 'parse_cache.sqlite3'),
+        'TRANSACTION_STORE_PATH': os.path.join(directory, 'transactions.sqlite3'),
+        'JOBS_PATH': os.path.join(directory, 'jobs.sqlite3'),
+        'UPLOAD_FOLDER': os.path.join(directory, 'uploads'),
+        # Parse in the worker itself, so its memory includes the parse
+        'PARSE_WORKERS': 0,
+        'START_JOB_DISPATCHER': False
+    }
+
+
+def seed(directory, transactions):
+    """
+    Fill a store with synthetic statements and train a category model on them
+    """
+    from ml_categorizer import MLCategorizer, labelled_from_store
+    from transaction_batch import TransactionBatch
+    from transaction_store import TransactionStore
+
+    config = app_config(directory)
+    store = TransactionStore(config['TRANSACTION_STORE_PATH'])
+    rows = synthetic_transactions(transactions)
+    for index in range(0, len(rows), 5000):
+        store.add_statement(f"{index:064x}", 'bench', f"statement_{index}.pdf",
+                            TransactionBatch.from_dicts(rows[index:index + 5000]))
+    model_path = os.path.join(directory, 'category_model.pkl')
+    MLCategorizer.train(*labelled_from_store(config['TRANSACTION_STORE_PATH'])).save(model_path)
+    return model_path
+
+
+def serve(app, config, index):
+    """
+    Worker body: create the app unless it was inherited, then serve the requests
+    """
+    start = time.perf_counter()
+    if app is None:
+        from app import create_app
+        app = create_app(config)
+    startup = time.perf_counter() - start
+
+    client = app.test_client()
+    pdf = statement_pdf('discover', 200, seed=1000 + index)
+    start = time.perf_counter()
+    response = client.post('/api/parse-statements', data={'files': (io.BytesIO(pdf), f"upload_{index}.pdf")})
+    upload = time.perf_counter() - start
+    assert response.status_code == 200, response.get_data(as_text=True)
+
+    # Unknown merchants fall through to the category model
+    descriptions = [description for description, _ in DISCOVER_MERCHANTS] + [f"UNKNOWN SHOP {n}" for n in range(50)]
+    response = client.post('/api/categorize', json={"transactions": [{"description": d} for d in descriptions]})
+    assert response.status_code == 200
+    assert client.get('/api/transactions?limit=100').status_code == 200
+    return {"startup": startup, "upload": upload}
+
+
+def run_scenario(scenario, workers, directory):
+    """
+    Start the master for a scenario, fork its workers and print the results as JSON
+    """
+    logging.disable(logging.CRITICAL)
+    config = app_config(directory)
+    start = time.perf_counter()
+    app = None
+    if scenario != 'lazy':
+        from app import create_app
+        app = create_app(dict(config, WARM_START=scenario == 'warm'))
+        if scenario == 'warm':
+            gc.freeze()
+    master_startup = time.perf_counter() - start
+
+    # Everyone measures memory between the two waits, while every process is alive
+    barrier = multiprocessing.Barrier(workers + 1)
+    children = []
+    for index in range(workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            result = serve(app, config, index)
+            barrier.wait()
+            result["memory"] = memory()
+            barrier.wait()
+            with os.fdopen(write_fd, 'w') as pipe:
+                pipe.write(json.dumps(result))
+            os._exit(0)
+        os.close(write_fd)
+        children.append((pid, read_fd))
+
+    barrier.wait()
+    master_memory = memory()
+    barrier.wait()
+    results = []
+    for pid, read_fd in children:
+        with os.fdopen(read_fd) as pipe:
+            results.append(json.loads(pipe.read()))
+        os.waitpid(pid, 0)
+    print(json.dumps({"master_startup": master_startup, "master_memory": master_memory, "workers": results}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--transactions', type=int, default=200000, help='rows in the seeded store')
+    parser.add_argument('--scenario', choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument('--directory', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        run_scenario(args.scenario, args.workers, args.directory)
+        return
+
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as directory:
+        model_path = seed(directory, args.transactions)
+        environment = dict(os.environ, CATEGORY_MODEL_PATH=model_path)
+        print(f"{'scenario':<10}{'master':>9}{'worker':>9}{'upload':>9}"
+              f"{'RSS':>10}{'PSS':>10}{'USS':>10}{'total PSS':>12}")
+        for scenario in SCENARIOS:
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_startup', '--scenario', scenario,
+                 '--workers', str(args.workers), '--directory', directory],
+                env=environment, check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            workers = result["workers"]
+
+            def mean(values):
+                return sum(values) / len(values)
+
+            rss, pss, uss = (mean([worker["memory"][field] for worker in workers]) for field in range(3))
+            total = result["master_memory"][1] + sum(worker["memory"][1] for worker in workers)
+            print(f"{scenario:<10}{result['master_startup']:8.2f}s"
+                  f"{mean([worker['startup'] for worker in workers]):8.2f}s"
+                  f"{mean([worker['upload'] for worker in workers]):8.2f}s"
+                  f"{rss:7.1f}MiB{pss:7.1f}MiB{uss:7.1f}MiB{total:9.1f}MiB")
+
+
+if __name__ == '__main__':
+    main()
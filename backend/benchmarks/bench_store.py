@@ -0,0 +1,81 @@
+"""
+Benchmark /api/transactions queries against a large transaction store.
+
+Loads synthetic transactions into a temporary SQLite store (in statements of
+--per-statement rows) and reports p50/p95 latency of typical filter, search,
+sort and deep-page queries.
+
+Run from the backend directory:
+    python -m benchmarks.bench_store --transactions 1000000
+"""
+import argparse
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from benchmarks.synthetic import synthetic_transactions
+from transaction_batch import TransactionBatch
+from transaction_store import TransactionStore
+
+QUERIES = {
+    'first page': {},
+    'account filter': {'account': 'Pacific Checking'},
+    'category + date range': {'category': 'Restaurants', 'start_date': '2021-01-01', 'end_date': '2021-06-30'},
+    'amount range by amount': {'min_amount': -50, 'max_amount': -20, 'sort': 'amount', 'direction': 'asc'},
+    'search, common': {'search': 'matcha'},
+    'search, no match': {'search': 'starbucks'},
+    'search, short word': {'search': 'cv'},
+    'search substring + account': {'search': 'prout', 'account': 'Discover Credit Card'},
+    'sort by description': {'sort': 'description', 'direction': 'asc'},
+}
+
+
+def time_query(store, params, samples, pages):
+    """
+    Time the first page plus following pages via the cursor
+    """
+    timings = []
+    for _ in range(samples):
+        cursor = None
+        for _ in range(pages):
+            start = time.perf_counter()
+            _, cursor = store.query(cursor=cursor, **params)
+            timings.append(time.perf_counter() - start)
+            if cursor is None:
+                break
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--transactions', type=int, default=1000000)
+    parser.add_argument('--per-statement', type=int, default=5000, help='transactions per stored statement')
+    parser.add_argument('--samples', type=int, default=20, help='runs per query')
+    parser.add_argument('--pages', type=int, default=5, help='pages followed per run')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    transactions = synthetic_transactions(args.transactions)
+    random.Random(1).shuffle(transactions)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = TransactionStore(os.path.join(directory, 'transactions.sqlite3'))
+        start = time.perf_counter()
+        for index in range(0, len(transactions), args.per_statement):
+            store.add_statement(f"{index:064x}", 'bench', f"statement_{index}.pdf",
+                                TransactionBatch.from_dicts(transactions[index:index + args.per_statement]))
+        elapsed = time.perf_counter() - start
+        print(f"loaded {len(transactions):,} transactions in {elapsed:.1f} s "
+              f"({len(transactions) / elapsed:,.0f} rows/s)")
+
+        for name, params in QUERIES.items():
+            timings = sorted(time_query(store, params, args.samples, args.pages))
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            print(f"{name:<26} p50 {statistics.median(timings) * 1000:7.2f} ms   p95 {p95 * 1000:7.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Microbenchmark every stage of the statement pipeline and flag regressions.
+
+Times PDF text extraction, bank identification, transaction extraction for
+both formats, categorization, the whole parse_pdf call and the aggregates
+rollup on synthetic statements. Each stage reports the median of --repeat
+runs, compared with the stored baseline; any stage slower than the baseline
+by more than --threshold fails the run.
+
+Run from the backend directory:
+    python -m benchmarks.bench_suite --transactions 2000
+    python -m benchmarks.bench_suite --transactions 2000 --save-baseline
+"""
+import argparse
+import io
+import logging
+import statistics
+import time
+
+import PyPDF2
+
+from aggregates import rollup
+from benchmarks.baselines import DEFAULT_THRESHOLD, compare, load_baseline, print_results, save_baseline
+from benchmarks.synthetic import statement_text, synthetic_transactions, text_to_pdf
+from categorizer import CATEGORY_KEYWORDS, KeywordCategorizer, categorize_transaction
+from statement_parser import identify_bank_type, iter_page_text, parse_pdf, parse_statement_text
+from transaction_batch import TransactionBatch
+
+SUITE = 'microbench'
+
+
+def median_time(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def stages(transactions):
+    """
+    Return {stage name: zero-argument callable} over statements of the given size
+    """
+    discover_text = statement_text('discover', transactions) + '\n'
+    occu_text = statement_text('occu', transactions) + '\n'
+    discover_pdf = text_to_pdf(discover_text)
+    discover_type = identify_bank_type(discover_text)
+    occu_type = identify_bank_type(occu_text)
+    descriptions = [transaction["description"] for transaction in synthetic_transactions(transactions)]
+    categorizer = KeywordCategorizer(CATEGORY_KEYWORDS)
+    batch = TransactionBatch.from_dicts(synthetic_transactions(transactions * 10))
+
+    return {
+        'pdf_text': lambda: ''.join(iter_page_text(PyPDF2.PdfReader(io.BytesIO(discover_pdf)))),
+        'identify_bank_type': lambda: identify_bank_type(occu_text),
+        'extract_discover': lambda: parse_statement_text(discover_text, discover_type),
+        'extract_occu': lambda: parse_statement_text(occu_text, occu_type),
+        'categorize_many': lambda: categorizer.categorize_many(descriptions),
+        # Goes through the shared category cache, so mostly measures hits
+        'categorize_transaction': lambda: [categorize_transaction(description) for description in descriptions],
+        'parse_pdf': lambda: parse_pdf(discover_pdf),
+        'aggregates_rollup': lambda: rollup(batch),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--transactions', type=int, default=2000, help='rows per synthetic statement')
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--stage', nargs='+', help='only run these stages')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='fractional slowdown over the baseline that counts as a regression')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baseline')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    benchmarks = stages(args.transactions)
+    if args.stage:
+        unknown = set(args.stage) - set(benchmarks)
+        if unknown:
+            raise SystemExit(f"unknown stages: {', '.join(sorted(unknown))}")
+        benchmarks = {name: benchmarks[name] for name in args.stage}
+
+    results = {}
+    for name, function in benchmarks.items():
+        # One untimed run warms caches and lazy imports
+        function()
+        results[name] = median_time(function, args.repeat)
+
+    suite = f"{SUITE}-{args.transactions}"
+    print(f"{args.transactions:,} rows per statement, median of {args.repeat}")
+    if args.save_baseline:
+        save_baseline(suite, dict(load_baseline(suite), **results))
+        print_results(results)
+        print(f"baseline saved as {suite}")
+        return
+
+    regressions = compare(results, load_baseline(suite), args.threshold)
+    if regressions:
+        raise SystemExit(f"regressions over {args.threshold:.0%}: {', '.join(regressions)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark the upload path: save-to-disk-and-reopen versus parsing in memory.
+
+Reports per-upload latency and the read/write syscalls and bytes counted in
+/proc/self/io (Linux only) for both paths.
+
+Run from the backend directory:
+    python -m benchmarks.bench_upload --uploads 50 --transactions 200
+"""
+import argparse
+import io
+import logging
+import os
+import tempfile
+import time
+
+from werkzeug.datastructures import FileStorage
+
+from benchmarks.synthetic import discover_statement_text, text_to_pdf
+from statement_parser import parse_pdf
+
+
+def read_proc_io():
+    """
+    Return the I/O counters of this process, or None off Linux
+    """
+    try:
+        with open('/proc/self/io') as proc_io:
+            return {key: int(value) for key, value in (line.split(':') for line in proc_io)}
+    except OSError:
+        return None
+
+
+def disk_round_trip(storage, upload_folder):
+    file_path = os.path.join(upload_folder, 'statement.pdf')
+    storage.save(file_path)
+    try:
+        return parse_pdf(file_path)
+    finally:
+        os.remove(file_path)
+
+
+def in_memory(storage, upload_folder):
+    return parse_pdf(storage.stream.read())
+
+
+def measure(name, handler, pdf, uploads, upload_folder):
+    before = read_proc_io()
+    start = time.perf_counter()
+    for _ in range(uploads):
+        storage = FileStorage(stream=io.BytesIO(pdf), filename='statement.pdf')
+        handler(storage, upload_folder)
+    elapsed = time.perf_counter() - start
+    after = read_proc_io()
+
+    print(f"{name:<18} {elapsed / uploads * 1000:8.2f} ms/upload", end='')
+    if before and after:
+        per_upload = {key: (after[key] - before[key]) / uploads
+                      for key in ('syscr', 'syscw', 'rchar', 'wchar')}
+        print(f"  read syscalls {per_upload['syscr']:6.1f}  write syscalls {per_upload['syscw']:6.1f}"
+              f"  read {per_upload['rchar'] / 1024:7.1f} KiB  written {per_upload['wchar'] / 1024:7.1f} KiB")
+    else:
+        print()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--uploads', type=int, default=50)
+    parser.add_argument('--transactions', type=int, default=200, help='purchases per statement')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    pdf = text_to_pdf(discover_statement_text(args.transactions))
+    print(f"{args.uploads} uploads of a {len(pdf) / 1024:.1f} KiB statement")
+
+    with tempfile.TemporaryDirectory() as upload_folder:
+        disk = measure('disk round-trip', disk_round_trip, pdf, args.uploads, upload_folder)
+        memory = measure('in memory', in_memory, pdf, args.uploads, upload_folder)
+    print(f"latency reduction: {(1 - memory / disk):.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+"""
+HTTP load driver for /api/parse-statements and /api/categorize.
+
+Sends requests from --concurrency client threads for --duration seconds
+(or until --requests have been sent) and reports throughput, latency
+percentiles and errors per endpoint. Uploads cycle through --distinct
+synthetic statements, so with the parse cache enabled the first pass misses
+and later passes hit. --serve starts the app in this process on a free port
+with its stores in a temporary directory; otherwise --url points at a
+running server.
+
+Each client thread sends its own X-Tenant-ID (--serve sets TENANT_HEADER
+to match). With --monster, another --monster-concurrency threads upload a
+pathological statement as one more tenant during the parse-statements run:
+--monster-pages pages of lines that only the fallback pass reads. Compare
+the normal clients' p99 with the parse limits on (the defaults) and off
+(PARSE_TENANT_LIMIT=0 PARSE_MAX_PAGES=0 PARSE_CPU_SECONDS=0 FALLBACK_MAX_ROWS=0).
+
+Run from the backend directory:
+    python -m benchmarks.load_test --serve --duration 20 --concurrency 8
+    python -m benchmarks.load_test --url http://localhost:5000 --endpoint categorize --save-baseline
+    python -m benchmarks.load_test --serve --endpoint parse-statements --monster
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.baselines import DEFAULT_THRESHOLD, compare, load_baseline, save_baseline
+from benchmarks.synthetic import statement_text, synthetic_transactions, text_to_pdf
+
+SUITE = 'load'
+ENDPOINTS = ('parse-statements', 'categorize')
+
+
+def multipart_body(files):
+    """
+    Encode (filename, bytes) pairs as a multipart/form-data 'files' field
+    """
+    boundary = uuid.uuid4().hex
+    body = bytearray()
+    for filename, content in files:
+        body += (f"--{boundary}\r\nContent-Disposition: form-data; name=\"files\"; filename=\"{filename}\"\r\n"
+                 "Content-Type: application/pdf\r\n\r\n").encode()
+        body += content + b'\r\n'
+    body += f"--{boundary}--\r\n".encode()
+    return bytes(body), f"multipart/form-data; boundary={boundary}"
+
+
+def parse_requests(distinct, transactions, files_per_request):
+    """
+    Return (body, content type) payloads for /api/parse-statements
+    """
+    payloads = []
+    for index in range(distinct):
+        files = []
+        for offset in range(files_per_request):
+            seed = index * files_per_request + offset
+            bank = ('discover', 'occu')[seed % 2]
+            files.append((f"{bank}_{seed}.pdf", text_to_pdf(statement_text(bank, transactions, seed))))
+        payloads.append(multipart_body(files))
+    return payloads
+
+
+def monster_pdf(pages):
+    """
+    Return a statement that is recognized as Discover but has no sections,
+    so every line goes to the fallback pass
+    """
+    lines = ['DISCOVER IT CARD']
+    lines += [f"{n % 12 + 1:02d}/{n % 28 + 1:02d} ITEM {n} ${n % 97}.{n % 100:02d}" for n in range(pages * 100)]
+    return text_to_pdf('\n'.join(lines), lines_per_page=100)
+
+
+def categorize_requests(distinct, transactions):
+    """
+    Return (body, content type) payloads for /api/categorize
+    """
+    return [
+        (json.dumps({"transactions": [{"description": transaction["description"]}
+                                      for transaction in synthetic_transactions(transactions, seed)]}).encode(),
+         'application/json')
+        for seed in range(distinct)
+    ]
+
+
+def send(url, payload, tenant):
+    """
+    POST one payload; returns (seconds, HTTP status or None on a connection error)
+    """
+    body, content_type = payload
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': content_type, 'X-Tenant-ID': tenant},
+                                     method='POST')
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = None
+    return time.perf_counter() - start, status
+
+
+def run_load(url, payloads, concurrency, duration, max_requests, monster=None, monster_concurrency=0):
+    """
+    Drive one endpoint and return (latencies of successful requests, statuses, elapsed seconds,
+    statuses of the monster tenant's requests)
+    """
+    payload_cycle = itertools.cycle(payloads)
+    lock = threading.Lock()
+    latencies = []
+    statuses = {}
+    monster_statuses = {}
+    sent = itertools.count()
+    deadline = time.perf_counter() + duration
+
+    def client(index):
+        while time.perf_counter() < deadline:
+            if max_requests and next(sent) >= max_requests:
+                return
+            with lock:
+                payload = next(payload_cycle)
+            seconds, status = send(url, payload, f"client-{index}")
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(seconds)
+
+    def monster_client():
+        while time.perf_counter() < deadline:
+            # A comment after %%EOF makes every upload new to the parse cache
+            payload = multipart_body([('monster.pdf', monster + f"%{uuid.uuid4().hex}\n".encode())])
+            _, status = send(url, payload, 'monster')
+            with lock:
+                monster_statuses[status] = monster_statuses.get(status, 0) + 1
+            if status == 429:
+                # A well-behaved client would wait for Retry-After; a monster does not wait long
+                time.sleep(0.1)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency + monster_concurrency) as pool:
+        futures = [pool.submit(client, index) for index in range(concurrency)]
+        if monster is not None:
+            futures += [pool.submit(monster_client) for _ in range(monster_concurrency)]
+        for future in futures:
+            future.result()
+    return latencies, statuses, time.perf_counter() - start, monster_statuses
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def serve_app():
+    """
+    Start the app on a free local port in a daemon thread; returns its base URL
+    """
+    directory = tempfile.mkdtemp(prefix='pennysprout-load-')
+    for variable, filename in (('PARSE_CACHE_PATH', 'parse_cache.sqlite3'),
+                               ('TRANSACTION_STORE_PATH', 'transactions.sqlite3'),
+                               ('JOBS_PATH', 'jobs.sqlite3')):
+        os.environ.setdefault(variable, os.path.join(directory, filename))
+    os.environ.setdefault('TENANT_HEADER', 'X-Tenant-ID')
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    server = make_server('127.0.0.1', 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--serve', action='store_true', help='run the app in-process instead of using --url')
+    parser.add_argument('--endpoint', choices=ENDPOINTS, nargs='+', default=list(ENDPOINTS))
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10, help='seconds per endpoint')
+    parser.add_argument('--requests', type=int, default=0, help='stop after this many requests per endpoint')
+    parser.add_argument('--distinct', type=int, default=8, help='distinct payloads to cycle through')
+    parser.add_argument('--transactions', type=int, default=200, help='rows per statement or categorize request')
+    parser.add_argument('--files', type=int, default=2, help='statements per parse-statements request')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--save-baseline', action='store_true', help='store the p50/p95 latencies as the baseline')
+    parser.add_argument('--monster', action='store_true', help='add a tenant uploading a pathological statement')
+    parser.add_argument('--monster-pages', type=int, default=1000)
+    parser.add_argument('--monster-concurrency', type=int, default=4)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    url = serve_app() if args.serve else args.url.rstrip('/')
+
+    results = {}
+    for endpoint in args.endpoint:
+        monster = None
+        if endpoint == 'parse-statements':
+            payloads = parse_requests(args.distinct, args.transactions, args.files)
+            monster = monster_pdf(args.monster_pages) if args.monster else None
+        else:
+            payloads = categorize_requests(args.distinct, args.transactions)
+        latencies, statuses, elapsed, monster_statuses = run_load(
+            f"{url}/api/{endpoint}", payloads, args.concurrency, args.duration, args.requests, monster,
+            args.monster_concurrency)
+        total = sum(statuses.values())
+        errors = total - statuses.get(200, 0)
+        print(f"{endpoint}: {total:,} requests in {elapsed:.1f} s ({total / elapsed:,.1f}/s), "
+              f"{errors:,} errors {dict(sorted(statuses.items(), key=str))}")
+        if monster_statuses:
+            print(f"  monster: {sum(monster_statuses.values()):,} requests "
+                  f"{dict(sorted(monster_statuses.items(), key=str))}")
+        if not latencies:
+            continue
+        latencies.sort()
+        print(f"  p50 {percentile(latencies, 0.5) * 1000:.1f} ms  p95 {percentile(latencies, 0.95) * 1000:.1f} ms  "
+              f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms  mean {statistics.mean(latencies) * 1000:.1f} ms")
+        results[f"{endpoint} p50"] = percentile(latencies, 0.5)
+        results[f"{endpoint} p95"] = percentile(latencies, 0.95)
+
+    suite = f"{SUITE}-{args.transactions}x{args.concurrency}"
+    if args.save_baseline:
+        save_baseline(suite, dict(load_baseline(suite), **results))
+        print(f"baseline saved as {suite}")
+        return
+
+    regressions = compare(results, load_baseline(suite), args.threshold)
+    if regressions:
+        raise SystemExit(f"regressions over {args.threshold:.0%}: {', '.join(regressions)}")
+
+
+if __name__ == '__main__':
+    main()
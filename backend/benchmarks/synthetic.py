@@ -0,0 +1,264 @@
+"""
+Synthetic bank statements for benchmarks.
+
+Also writes statements to disk for the load driver or manual testing:
+    python -m benchmarks.synthetic /tmp/statements --files 5 --transactions 2000
+"""
+import argparse
+import os
+import random
+
+DISCOVER_MERCHANTS = [
+    ('TST* MATCHA CAFE IRVINE CA', 'Restaurants'),
+    ('SPROUTS FARMERS MKT #123 IRVINE CA', 'Supermarkets'),
+    ('CHEVRON 0091234 COSTA MESA CA', 'Gasoline'),
+    ('NETFLIX.COM LOS GATOS CA', 'Services'),
+    ('AMAZON MKTPL*2K4LL1 AMZN.COM/BILL WA', 'Merchandise'),
+    ('UNIQLO IRVINE SPECTRUM IRVINE CA', 'Merchandise'),
+    ('ROUND1 BOWLING MAINPLACE SANTA ANA CA', 'Entertainment'),
+    ('CVS/PHARMACY #09876 IRVINE CA', 'Services'),
+    ('LAZY ACRES MARKET LONG BEACH CA', 'Supermarkets'),
+    ('JOLLIBEE CERRITOS CA', 'Restaurants'),
+]
+
+
+def discover_statement_text(transactions=40, seed=42, separator=' '):
+    """
+    Return the text of a Discover statement with the given number of purchases;
+    table cells are joined with separator
+    """
+    rng = random.Random(seed)
+    lines = [
+        'DISCOVER IT CARD',
+        'Cardmember Since 2019',
+        'New Balance: $1,234.56',
+        'Credit Line: $5,000',
+        'Payment Due Date: 04/12/24',
+        'Minimum Payment Due: $35.00',
+        separator.join(('TRANS. DATE', 'PAYMENTS AND CREDITS', 'AMOUNT')),
+        separator.join(('03/02', 'INTERNET PAYMENT - THANK YOU', '-$500.00')),
+        separator.join(('TRANS. DATE', 'PURCHASES', 'MERCHANT CATEGORY', 'AMOUNT')),
+    ]
+    for _ in range(transactions):
+        description, category = rng.choice(DISCOVER_MERCHANTS)
+        lines.append(separator.join((f"03/{rng.randint(1, 28):02d}", description, category,
+                                     f"${rng.randint(100, 20000) / 100:.2f}")))
+    lines.append('TOTAL FEES FOR THIS PERIOD $0.00')
+    return '\n'.join(lines)
+
+
+OCCU_DESCRIPTIONS = [
+    ('POS WITHDRAWAL TRADER JOES #123 IRVINE CA', 'withdrawal'),
+    ('ACH DEBIT SOCALGAS PAYMENT', 'withdrawal'),
+    ('ACH DEBIT VERIZON WIRELESS BILL', 'withdrawal'),
+    ('DISCOVER E-PAYMENT 1234', 'withdrawal'),
+    ('ZELLE TRANSFER TO J SMITH', 'withdrawal'),
+    ('POS WITHDRAWAL 24 HOUR FITNESS', 'withdrawal'),
+    ('ACH DEPOSIT ACME CORP PAYROLL', 'deposit'),
+    ('DEPOSIT MOBILE CHECK', 'deposit'),
+    ('DIVIDEND', 'deposit'),
+]
+
+
+def occu_statement_text(transactions=40, seed=42, separator=' '):
+    """
+    Return the text of an Orange County Credit Union statement with checking
+    and savings sections splitting the given number of transactions; table
+    cells are joined with separator
+    """
+    rng = random.Random(seed)
+    lines = [
+        'ORANGE COUNTY\'S CREDIT UNION',
+        'Statement Period 01/01/24 - 01/31/24',
+        'Beginning Balance: $2,500.00',
+        'Ending Balance: $3,104.27',
+    ]
+    checking = transactions - transactions // 4
+    for account, count in (('PACIFIC CHECKING', checking), ('PACIFIC SAVINGS', transactions - checking)):
+        balance = rng.randint(100000, 500000) / 100
+        lines.append(f"{account} 0001234567")
+        lines.append(separator.join(('Transaction Date', 'Posting Date', 'Withdrawal', 'Deposit', 'Balance',
+                                     'Description')))
+        for _ in range(count):
+            description, kind = rng.choice(OCCU_DESCRIPTIONS)
+            day = rng.randint(1, 28)
+            amount = rng.randint(100, 50000) / 100
+            if kind == 'withdrawal' and amount > balance:
+                # Keep the running balance positive
+                description, kind = 'ACH DEPOSIT ACME CORP PAYROLL', 'deposit'
+            dates = (f"01/{day:02d}/24", f"01/{min(day + 1, 28):02d}/24")
+            if kind == 'withdrawal':
+                balance -= amount
+                lines.append(separator.join((*dates, f"{amount:.2f}", '', f"{balance:.2f}", description)))
+            else:
+                balance += amount
+                lines.append(separator.join((*dates, '', f"{amount:.2f}", f"{balance:.2f}", description)))
+    return '\n'.join(lines)
+
+
+def synthetic_transactions(count, seed=42, start_year=2019, years=5):
+    """
+    Return parsed-transaction dicts spread over several years and both accounts
+    """
+    rng = random.Random(seed)
+    transactions = []
+    for _ in range(count):
+        date = f"{start_year + rng.randrange(years)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        if rng.random() < 0.7:
+            description, category = rng.choice(DISCOVER_MERCHANTS)
+            transactions.append({"date": date, "description": description, "category": category,
+                                 "amount": -rng.randint(100, 20000) / 100, "account": "Discover Credit Card"})
+        else:
+            description, kind = rng.choice(OCCU_DESCRIPTIONS)
+            amount = rng.randint(100, 300000) / 100
+            transactions.append({"date": date, "description": description,
+                                 "category": "Income" if kind == 'deposit' else "Financial",
+                                 "amount": amount if kind == 'deposit' else -amount, "account": "Pacific Checking"})
+    return transactions
+
+
+# Helvetica advance widths per 1pt of font size, for right-aligned amounts
+HELVETICA_WIDTHS = {**dict.fromkeys('0123456789$', 0.556), '.': 0.278, ',': 0.278, '-': 0.333, ' ': 0.278}
+
+
+def _pdf_string(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _text_width(text, size):
+    """
+    Approximate Helvetica width of text, exact for digits and amount punctuation
+    """
+    return size * sum(HELVETICA_WIDTHS.get(char, 0.556) for char in text)
+
+
+def _table_commands(line, y, column_stops, size=9):
+    """
+    Content stream commands placing the tab-separated cells of a line at column
+    stops; the last cell always goes in the last column
+    """
+    commands = []
+    cells = line.split('\t')
+    for index, cell in enumerate(cells):
+        if not cell:
+            continue
+        x, align = column_stops[index if index < len(cells) - 1 else -1]
+        if align == 'right':
+            x -= _text_width(cell, size)
+        commands.append(f"1 0 0 1 {x:.2f} {y} Tm ({_pdf_string(cell)}) Tj")
+    return commands
+
+
+def text_to_pdf(text, lines_per_page=50, column_stops=None):
+    """
+    Render plain text lines into a minimal single-font PDF and return its bytes.
+
+    With column_stops, lines holding tabs are laid out as table rows: one
+    positioned text run per cell, like the tables of real statements, instead
+    of one run per line.
+    """
+    lines = text.split('\n')
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+    # Object 1: catalog, 2: page tree, 3: font, then a page + content pair per page
+    objects = [None, None, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    page_ids = []
+    for page_lines in pages:
+        commands = ['BT', '/F1 9 Tf']
+        for number, line in enumerate(page_lines):
+            y = 756 - 11 * number
+            if column_stops and '\t' in line:
+                commands += _table_commands(line, y, column_stops)
+            else:
+                commands.append(f"1 0 0 1 36 {y} Tm ({_pdf_string(line)}) Tj")
+        commands.append('ET')
+        stream = '\n'.join(commands).encode('latin-1', 'replace')
+        objects.append(b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream')
+        content_id = len(objects)
+        objects.append(('<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+                        f'/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>').encode())
+        page_ids.append(len(objects))
+    objects[0] = b'<< /Type /Catalog /Pages 2 0 R >>'
+    kids = ' '.join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    output = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref_offset = len(output)
+    output += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for offset in offsets:
+        output += b'%010d 00000 n \n' % offset
+    output += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref_offset)
+    return bytes(output)
+
+
+STATEMENT_GENERATORS = {
+    'discover': discover_statement_text,
+    'occu': occu_statement_text,
+}
+
+# (x, alignment) of each table column in tabular PDFs
+TABLE_COLUMNS = {
+    'discover': [(36, 'left'), (110, 'left'), (330, 'left'), (560, 'right')],
+    'occu': [(36, 'left'), (130, 'left'), (260, 'right'), (330, 'right'), (400, 'right'), (420, 'left')],
+}
+
+
+def statement_text(bank, transactions=40, seed=42):
+    """
+    Return the text of a synthetic statement for one of STATEMENT_GENERATORS
+    """
+    return STATEMENT_GENERATORS[bank](transactions, seed)
+
+
+def statement_pdf(bank, transactions=40, seed=42, tabular=False):
+    """
+    Return a synthetic statement as PDF bytes; tabular lays its tables out in
+    positioned columns instead of one text run per line
+    """
+    if not tabular:
+        return text_to_pdf(statement_text(bank, transactions, seed))
+    return text_to_pdf(STATEMENT_GENERATORS[bank](transactions, seed, separator='\t'),
+                       column_stops=TABLE_COLUMNS[bank])
+
+
+def write_statements(directory, bank, files, transactions, seed=42, pdf=True, tabular=False):
+    """
+    Write synthetic statements to a directory as PDFs (or .txt) and return their paths
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for index in range(files):
+        path = os.path.join(directory, f"{bank}_{transactions}_{index:03d}.{'pdf' if pdf else 'txt'}")
+        if pdf:
+            with open(path, 'wb') as statement_file:
+                statement_file.write(statement_pdf(bank, transactions, seed + index, tabular))
+        else:
+            with open(path, 'w') as statement_file:
+                statement_file.write(statement_text(bank, transactions, seed + index) + '\n')
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write synthetic Discover and OCCU statements')
+    parser.add_argument('output', help='directory to write statements to')
+    parser.add_argument('--bank', choices=sorted(STATEMENT_GENERATORS), nargs='+', default=sorted(STATEMENT_GENERATORS))
+    parser.add_argument('--files', type=int, default=1, help='statements per bank')
+    parser.add_argument('--transactions', type=int, default=200, help='transactions per statement')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--text', action='store_true', help='write plain text instead of PDFs')
+    parser.add_argument('--tabular', action='store_true', help='lay tables out in positioned columns')
+    args = parser.parse_args()
+
+    for bank in args.bank:
+        for path in write_statements(args.output, bank, args.files, args.transactions, args.seed,
+                                     pdf=not args.text, tabular=args.tabular):
+            print(f"{path}  {os.path.getsize(path) / 1024:,.1f} KiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,455 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Categories for transactions based on keywords
+CATEGORY_KEYWORDS = {
+    'Restaurants': ['restaurant', 'cafe', 'coffee', 'food', 'dining', 'dine', 'eat', 'tst*', 'burger', 'pizza',
+                   'breakfast', 'lunch', 'dinner', 'bar', 'grill', 'kitchen', 'bakery', 'donut', 'wing', 'jollibee',
+                   'wingstop', 'elpolloloco', 'matcha', 'boba', 'tea studio', 'marugame', 'carls jr'],
+    'Groceries': ['grocery', 'supermarket', 'market', 'food', 'sprouts', 'target', 'walmart', 'costco', 'trader',
+                 'whole foods', 'farmers market', 'mitsuwa', 'lazy acres'],
+    'Transportation': ['gas', 'fuel', 'chevron', 'shell', 'uber', 'lyft', 'taxi', 'car', 'auto', 'parking', 'toll'],
+    'Entertainment': ['movie', 'cinema', 'theater', 'concert', 'event', 'ticket', 'netflix', 'spotify', 'hulu',
+                     'disney', 'amazon prime', 'game', 'steam', 'playstation', 'xbox', 'amusement', 'bowlero', 'round1'],
+    'Shopping': ['amazon', 'target', 'walmart', 'ebay', 'etsy', 'clothing', 'shoe', 'apparel', 'store', 'mall',
+                'shop', 'retail', 'uniqlo', 'merchandise', 'top canvas', 'pop mart'],
+    'Utilities': ['electric', 'water', 'gas', 'utility', 'internet', 'phone', 'cable', 'att', 'verizon', 'spectrum',
+                 'comcast', 'bill'],
+    'Health': ['doctor', 'hospital', 'clinic', 'medical', 'dental', 'pharmacy', 'prescription', 'cvs', 'walgreens',
+              'health', 'fitness', 'gym'],
+    'Travel': ['hotel', 'flight', 'airline', 'airbnb', 'vacation', 'trip', 'travel', 'booking'],
+    'Education': ['school', 'college', 'university', 'tuition', 'book', 'course', 'class', 'education', 'student'],
+    'Subscription': ['subscription', 'membership', 'recurring'],
+    'Financial': ['payment', 'transfer', 'deposit', 'withdraw', 'fee', 'interest', 'loan', 'mortgage', 'rent'],
+    'Insurance': ['insurance', 'premium', 'coverage', 'policy'],
+    'Gifts & Donations': ['gift', 'donation', 'charity', 'contribute'],
+    'Services': ['service', 'repair', 'maintenance', 'clean', 'salon', 'barber', 'haircut', 'spa', 'laundry',
+                'college liquidation', 'parking']
+}
+
+UNCATEGORIZED = 'Uncategorized'
+
+# Maximum number of normalized descriptions kept in the category cache
+CATEGORY_CACHE_SIZE = 65536
+
+
+def build_trie_pattern(keywords):
+    """
+    Build a regex alternation shaped like a prefix trie of the keywords.
+
+    At any position the pattern matches the longest keyword starting there.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def render(node):
+        terminal = '' in node
+        branches = [re.escape(char) + render(child)
+                    for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        if len(branches) == 1:
+            body = branches[0]
+            needs_group = terminal
+        else:
+            body = '|'.join(branches)
+            needs_group = True
+        if needs_group:
+            body = f"(?:{body})"
+        return body + '?' if terminal else body
+
+    return render(trie)
+
+
+def _sees_store_number(keyword):
+    """
+    True if a keyword can match across the space before a trailing store
+    number, or within the number itself
+    """
+    def number_char(char):
+        return char.isdigit() or char == '#'
+
+    if all(char.isspace() or number_char(char) for char in keyword):
+        return True
+    return any(char.isspace() and (index == len(keyword) - 1 or number_char(keyword[index + 1]))
+               for index, char in enumerate(keyword))
+
+
+class KeywordCategorizer:
+    """
+    Keyword categorizer compiled once from a category -> keywords table.
+
+    A description gets the first category (in table order) owning any keyword
+    that occurs in it, exactly like the original nested loop, but every
+    keyword is found in a single regex scan of the lowercased description.
+    """
+
+    def __init__(self, category_keywords):
+        self.categories = list(category_keywords.keys())
+
+        # Rank of the first category that lists each keyword
+        keyword_rank = {}
+        for rank, keywords in enumerate(category_keywords.values()):
+            for keyword in keywords:
+                keyword = keyword.lower()
+                if keyword and keyword not in keyword_rank:
+                    keyword_rank[keyword] = rank
+
+        # The scan only reports the longest keyword at each position, so fold in
+        # the ranks of all keywords that are prefixes of it
+        self._best_rank = {}
+        self._prefixes = {}
+        for keyword, rank in keyword_rank.items():
+            prefixes = [keyword]
+            for end in range(1, len(keyword)):
+                prefix_rank = keyword_rank.get(keyword[:end])
+                if prefix_rank is None:
+                    continue
+                prefixes.append(keyword[:end])
+                if prefix_rank < rank:
+                    rank = prefix_rank
+            self._best_rank[keyword] = rank
+            self._prefixes[keyword] = prefixes
+
+        if keyword_rank:
+            # Zero-width lookahead so overlapping keywords are all seen
+            self._pattern = re.compile(f"(?=({build_trie_pattern(keyword_rank)}))")
+        else:
+            self._pattern = None
+
+        # Whether dropping trailing store numbers ("... 1234", "... #0042") from
+        # a description can change its category
+        self.ignores_store_numbers = not any(_sees_store_number(keyword) for keyword in keyword_rank)
+
+    def categorize(self, description):
+        """
+        Return the category for a single description
+        """
+        if self._pattern is None:
+            return UNCATEGORIZED
+
+        best_rank = None
+        best_rank_lookup = self._best_rank
+        for keyword in self._pattern.findall(description.lower()):
+            rank = best_rank_lookup[keyword]
+            if best_rank is None or rank < best_rank:
+                best_rank = rank
+                if rank == 0:
+                    break
+
+        if best_rank is None:
+            return UNCATEGORIZED
+        return self.categories[best_rank]
+
+    def categorize_many(self, descriptions):
+        """
+        Return the category for each description, in order
+        """
+        categorize = self.categorize
+        return [categorize(description) for description in descriptions]
+
+    def keywords_in(self, description):
+        """
+        Return the set of keywords occurring anywhere in a description
+        """
+        if self._pattern is None:
+            return set()
+        found = set()
+        for keyword in self._pattern.findall(description.lower()):
+            found.update(self._prefixes[keyword])
+        return found
+
+
+def keyword_owners(category_keywords):
+    """
+    Return {lowercased keyword: first category, in table order, listing it}
+    """
+    owners = {}
+    for category, keywords in category_keywords.items():
+        for keyword in keywords:
+            keyword = keyword.lower()
+            if keyword and keyword not in owners:
+                owners[keyword] = category
+    return owners
+
+
+def changed_keywords(old_keywords, new_keywords):
+    """
+    Return the keywords whose occurrence in a description can make the two
+    category -> keywords tables categorize it differently.
+
+    Those are keywords added, removed or moved to another category, plus
+    every keyword of two categories whose precedence was swapped. A
+    description containing none of them gets the same category from both.
+    """
+    old_owners = keyword_owners(old_keywords)
+    new_owners = keyword_owners(new_keywords)
+    changed = {keyword for keyword in old_owners.keys() | new_owners.keys()
+               if old_owners.get(keyword) != new_owners.get(keyword)}
+
+    new_order = {category: index for index, category in enumerate(new_keywords)}
+    kept = [category for category in old_keywords if category in new_order]
+    reordered = set()
+    for index, category in enumerate(kept):
+        for later in kept[index + 1:]:
+            if new_order[later] < new_order[category]:
+                reordered.update((category, later))
+    changed.update(keyword for keyword, category in new_owners.items() if category in reordered)
+    return changed
+
+
+def normalize_description(description):
+    """
+    Normalize a merchant description for caching: lowercase, collapse
+    whitespace and drop trailing store numbers
+    """
+    tokens = description.lower().split()
+    # Trailing store/terminal numbers such as "1234" or "#0042"
+    while tokens and tokens[-1].lstrip('#').isdigit():
+        tokens.pop()
+    return ' '.join(tokens)
+
+
+class CategoryCache:
+    """
+    Bounded LRU cache of normalized description -> category
+    """
+
+    def __init__(self, maxsize=CATEGORY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            category = self._entries.get(key)
+            if category is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return category
+
+    def put(self, key, category):
+        with self._lock:
+            self._entries[key] = category
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def info(self):
+        """
+        Return the cache counters
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+class CachedCategorizer:
+    """
+    Keyword categorizer fronted by an LRU cache.
+
+    Descriptions are always categorized as given. The cache is keyed on the
+    normalized description only where that cannot change the category: the
+    whitespace is already single spaces and no keyword can see a trailing
+    store number. Any other description is its own key.
+    """
+
+    def __init__(self, categorizer, cache):
+        self.categorizer = categorizer
+        self.cache = cache
+
+    def cache_key(self, description):
+        """
+        Return the key a description's category is cached under
+        """
+        lowered = description.lower()
+        tokens = lowered.split()
+        if not self.categorizer.ignores_store_numbers or ' '.join(tokens) != lowered:
+            return description
+        while tokens and tokens[-1].lstrip('#').isdigit():
+            tokens.pop()
+        return ' '.join(tokens)
+
+    def categorize(self, description):
+        """
+        Return the category for a single description
+        """
+        key = self.cache_key(description)
+        category = self.cache.get(key)
+        if category is None:
+            category = self.categorizer.categorize(description)
+            self.cache.put(key, category)
+        return category
+
+    def categorize_many(self, descriptions):
+        """
+        Return the category for each description, in order
+        """
+        categorize = self.categorize
+        return [categorize(description) for description in descriptions]
+
+    def cache_info(self):
+        return self.cache.info()
+
+
+# Seconds a process keeps categorizing by the stored rules before it checks their version again
+RULES_POLL_INTERVAL = 1.0
+
+_categorizer_lock = threading.Lock()
+# Bumped by set_category_keywords, so a CATEGORY_KEYWORDS edit is seen without fingerprinting the table
+_keywords_version = 0
+# ((rules path, version), category -> keywords table, CachedCategorizer compiled from it), swapped as one
+_current = ((None, _keywords_version), CATEGORY_KEYWORDS,
+            CachedCategorizer(KeywordCategorizer(CATEGORY_KEYWORDS), CategoryCache()))
+
+# SQLite file whose settings hold the rules every process shares (see use_stored_rules); None uses
+# CATEGORY_KEYWORDS
+_rules_path = None
+_rules_connections = threading.local()
+# time.monotonic() of this process's last look at the stored rules' version
+_rules_checked_at = float('-inf')
+
+
+def use_stored_rules(path):
+    """
+    Take the category rules from the settings table of the SQLite file at
+    path (the transaction store) from now on; None goes back to
+    CATEGORY_KEYWORDS.
+
+    The store keeps the rules under 'category_keywords' and bumps
+    'category_rules_version' whenever it changes them, so every process
+    reading from it, parser processes included, picks up a change made in
+    any of them within RULES_POLL_INTERVAL seconds (see get_categorizer).
+    """
+    global _rules_path
+    _rules_path = path or None
+
+
+def stored_rules_changed():
+    """
+    Have the next get_categorizer() call read the stored rules' version,
+    e.g. once this process has stored new rules
+    """
+    global _rules_checked_at
+    _rules_checked_at = float('-inf')
+
+
+def stored_rules_path():
+    return _rules_path
+
+
+def _rules_connection():
+    local = _rules_connections
+    # Parser processes are forked, and a SQLite connection must not cross a fork
+    if getattr(local, 'key', None) != (os.getpid(), _rules_path):
+        local.conn = sqlite3.connect(_rules_path)
+        local.key = (os.getpid(), _rules_path)
+    return local.conn
+
+
+def _stored_rules_version():
+    row = _rules_connection().execute(
+        "SELECT value FROM settings WHERE key = 'category_rules_version'").fetchone()
+    return (_rules_path, row[0] if row else None)
+
+
+def _stored_rules():
+    """
+    Return (version, category -> keywords table) of the stored rules, read together
+    """
+    settings = dict(_rules_connection().execute(
+        "SELECT key, value FROM settings WHERE key IN ('category_keywords', 'category_rules_version')"))
+    return (_rules_path, settings.get('category_rules_version')), json.loads(settings['category_keywords'])
+
+
+def get_categorizer(refresh=False):
+    """
+    Return the categorizer compiled from the current keyword table.
+
+    That is the stored rules when use_stored_rules() named a store, whose
+    version is read at most once per RULES_POLL_INTERVAL seconds, or now
+    with refresh=True; otherwise CATEGORY_KEYWORDS, recompiled after
+    set_category_keywords() changes it. Each compiled categorizer has a
+    cache of its own, so a thread still holding the previous one cannot
+    fill the new cache with the old rules' categories.
+    """
+    global _current, _rules_checked_at
+    if _rules_path is None:
+        fingerprint = (None, _keywords_version)
+    else:
+        now = time.monotonic()
+        if not refresh and _current[0][0] == _rules_path and now - _rules_checked_at < RULES_POLL_INTERVAL:
+            return _current[2]
+        fingerprint = _stored_rules_version()
+        _rules_checked_at = now
+    if fingerprint != _current[0]:
+        with _categorizer_lock:
+            if fingerprint != _current[0]:
+                category_keywords = CATEGORY_KEYWORDS
+                if _rules_path is not None:
+                    fingerprint, category_keywords = _stored_rules()
+                previous = _current[2].cache
+                cache = CategoryCache(previous.maxsize)
+                cache.invalidations = previous.invalidations + 1
+                _current = (fingerprint, category_keywords,
+                            CachedCategorizer(KeywordCategorizer(category_keywords), cache))
+    return _current[2]
+
+
+def current_category_keywords():
+    """
+    Return the category -> keywords table get_categorizer() compiles; do not modify it
+    """
+    get_categorizer()
+    return _current[1]
+
+
+def set_category_keywords(category_keywords):
+    """
+    Replace CATEGORY_KEYWORDS in place and recompile the categorizer; with
+    stored rules, store them with TransactionStore.recategorize instead.
+    Edit CATEGORY_KEYWORDS through this alone, as only it tells the
+    categorizer.
+    """
+    global _keywords_version
+    with _categorizer_lock:
+        CATEGORY_KEYWORDS.clear()
+        CATEGORY_KEYWORDS.update({category: list(keywords) for category, keywords in category_keywords.items()})
+        _keywords_version += 1
+    return get_categorizer()
+
+
+def categorize_transaction(description):
+    """
+    Simple rule-based categorization
+    """
+    return get_categorizer().categorize(description)
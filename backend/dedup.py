@@ -0,0 +1,115 @@
+import math
+import hashlib
+import numpy as np
+from categorizer import normalize_description
+
+# Bloom filter sizing: false-positive rate, and the capacity of a new filter
+BLOOM_ERROR_RATE = 0.01
+MIN_BLOOM_CAPACITY = 1 << 16
+
+_MASK32 = np.uint64(0xFFFFFFFF)
+
+
+def dedup_keys(batch):
+    """
+    Return a signed 64-bit dedup key per row of a TransactionBatch.
+
+    Rows are keyed on account, date, amount and normalized description, plus
+    how many identical rows came before it in the same batch: two identical
+    coffees on one statement are two purchases, but the second coffee of an
+    overlapping statement is the same purchase as the second coffee here.
+    """
+    keys = []
+    occurrences = {}
+    accounts = batch.accounts
+    for day, cents, description, account_code in zip(batch.days, batch.cents, batch.descriptions,
+                                                     batch.account_codes):
+        identity = f"{accounts[account_code] or ''}\x1f{day}\x1f{cents}\x1f{normalize_description(description)}"
+        occurrence = occurrences.get(identity, 0)
+        occurrences[identity] = occurrence + 1
+        digest = hashlib.blake2b(f"{identity}\x1f{occurrence}".encode(), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, 'little', signed=True))
+    return keys
+
+
+class BloomFilter:
+    """
+    Bloom filter over 64-bit dedup keys, held in a NumPy bit array.
+
+    The keys are already uniform hashes, so the k probe positions come
+    from double hashing their two 32-bit halves. Answers "maybe present" or
+    "definitely absent"; nothing can be removed.
+    """
+
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        self.capacity = max(1, capacity)
+        self.bit_count = max(64, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.bit_count / self.capacity * math.log(2)))
+        self.bits = np.zeros((self.bit_count + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def _positions(self, keys):
+        values = np.asarray(keys, dtype=np.int64).view(np.uint64)
+        low = values & _MASK32
+        high = (values >> np.uint64(32)) | np.uint64(1)
+        probes = np.arange(self.hash_count, dtype=np.uint64)
+        return (low[:, None] + probes[None, :] * high[:, None]) % np.uint64(self.bit_count)
+
+    def add_many(self, keys):
+        if not len(keys):
+            return
+        positions = self._positions(keys).ravel()
+        np.bitwise_or.at(self.bits, (positions >> np.uint64(3)).astype(np.intp),
+                         (np.uint8(1) << (positions & np.uint64(7)).astype(np.uint8)))
+        self.count += len(keys)
+
+    def might_contain_many(self, keys):
+        """
+        Return a boolean array: False means the key was never added
+        """
+        if not len(keys):
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(keys)
+        bytes_ = self.bits[(positions >> np.uint64(3)).astype(np.intp)]
+        return ((bytes_ >> (positions & np.uint64(7)).astype(np.uint8)) & 1).all(axis=1).astype(bool)
+
+
+class UploadDeduplicator:
+    """
+    Drops rows of each statement in an upload that are already in the
+    transaction store, or in an earlier statement of the same upload.
+    """
+
+    def __init__(self, store=None):
+        self.store = store
+        # Dedup key -> file it was first seen in, for this upload
+        self.seen = {}
+
+    def dedupe(self, filename, sha256, batch):
+        """
+        Return (kept batch, dedup keys of the kept rows, dropped rows).
+
+        Rows of the statement's own earlier copy in the store (same SHA-256)
+        do not count as duplicates. Each dropped row is a transaction dict
+        with a "duplicate_of" filename.
+        """
+        keys = dedup_keys(batch)
+        stored = self.store.find_dedup_keys(keys, exclude_sha256=sha256) if self.store else {}
+        keep = []
+        dropped = []
+        rows = None
+        for index, key in enumerate(keys):
+            original = self.seen.get(key) or stored.get(key)
+            if original is None:
+                keep.append(index)
+                continue
+            if rows is None:
+                rows = list(batch.rows())
+            date, description, category, amount, account = rows[index]
+            dropped.append({"date": date, "description": description, "category": category, "amount": amount,
+                            "account": account, "duplicate_of": original})
+        for index in keep:
+            self.seen.setdefault(keys[index], filename)
+        if not dropped:
+            return batch, keys, dropped
+        return batch.take(keep), [keys[index] for index in keep], dropped
@@ -0,0 +1,170 @@
+import io
+import csv
+import zlib
+import importlib.util
+import metrics
+from transaction_batch import day_to_iso
+
+# Columns of every export, in order; rows parsed but not stored have no id
+EXPORT_COLUMNS = ('id', 'date', 'description', 'merchant', 'category', 'account', 'amount')
+
+# Rows per chunk read from the store, which is also the CSV write, Arrow record batch and Parquet row group
+DEFAULT_EXPORT_CHUNK = 16384
+
+# format -> (mimetype, file extension)
+EXPORT_FORMATS = {
+    'csv': ('application/gzip', 'csv.gz'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+# Formats written with pyarrow
+ARROW_FORMATS = ('parquet', 'arrow')
+
+EXPORTED_ROWS = metrics.registry.counter(
+    'pennysprout_exported_transactions_total', 'Transactions written by /api/export', labels=('format',))
+
+
+def arrow_available():
+    """
+    True if pyarrow, needed for the Parquet and Arrow formats, is installed
+    """
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def batch_columns(batch, merchants=None):
+    """
+    Return a TransactionBatch as one chunk of export columns
+    """
+    merchants = merchants or {}
+    categories = batch.categories
+    accounts = batch.accounts
+    return {
+        "id": [None] * len(batch),
+        "date": [day_to_iso(day) for day in batch.days],
+        "description": batch.descriptions,
+        "merchant": [merchants.get(description) for description in batch.descriptions],
+        "category": [categories[code] for code in batch.category_codes],
+        "account": [accounts[code] for code in batch.account_codes],
+        "amount": [cents / 100 for cents in batch.cents]
+    }
+
+
+class _Spool:
+    """
+    Write-only file that hands over everything written to it since the last take()
+    """
+
+    def __init__(self):
+        self.closed = False
+        self._parts = []
+        self._position = 0
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def iter_csv_gzip(chunks):
+    """
+    Yield a gzip-compressed CSV of chunks of export columns, with a header row
+    """
+    # wbits 31 writes the gzip container, so the output is a .csv.gz file
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow(EXPORT_COLUMNS)
+    for columns in chunks:
+        writer.writerows(zip(*(columns[name] for name in EXPORT_COLUMNS)))
+        EXPORTED_ROWS.inc(len(columns["id"]), format='csv')
+        data = compressor.compress(text.getvalue().encode())
+        text.seek(0)
+        text.truncate()
+        if data:
+            yield data
+    yield compressor.compress(text.getvalue().encode()) + compressor.flush()
+
+
+def arrow_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ('id', pa.int64()),
+        ('date', pa.date32()),
+        ('description', pa.string()),
+        ('merchant', pa.string()),
+        ('category', pa.string()),
+        ('account', pa.string()),
+        ('amount', pa.float64())
+    ])
+
+
+def record_batch(columns, schema):
+    """
+    Return a chunk of export columns as an Arrow record batch
+    """
+    import pyarrow as pa
+
+    arrays = []
+    for field in schema:
+        if field.name == 'date':
+            # ISO dates, converted in one vectorized cast
+            arrays.append(pa.array(columns['date'], pa.string()).cast(pa.date32()))
+        else:
+            arrays.append(pa.array(columns[field.name], field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def iter_arrow(chunks, export_format):
+    """
+    Yield an Arrow IPC stream or a Parquet file of chunks of export columns.
+
+    Each chunk is written as one record batch (one row group for Parquet)
+    and handed on as soon as it is encoded, so only one chunk is ever held.
+    Needs pyarrow.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = arrow_schema()
+    spool = _Spool()
+    sink = pa.PythonFile(spool, mode='w')
+    if export_format == 'parquet':
+        writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    for columns in chunks:
+        writer.write_batch(record_batch(columns, schema))
+        EXPORTED_ROWS.inc(len(columns["id"]), format=export_format)
+        data = spool.take()
+        if data:
+            yield data
+    writer.close()
+    yield spool.take()
+
+
+def iter_export(chunks, export_format):
+    """
+    Yield the bytes of an export in one of EXPORT_FORMATS from chunks of
+    export columns ({column: values} over EXPORT_COLUMNS)
+    """
+    if export_format == 'csv':
+        return iter_csv_gzip(chunks)
+    if export_format in ARROW_FORMATS:
+        return iter_arrow(chunks, export_format)
+    raise ValueError(f"Unknown export format {export_format!r}; expected one of {', '.join(EXPORT_FORMATS)}")
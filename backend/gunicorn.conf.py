@@ -0,0 +1,33 @@
+import gc
+import os
+
+# Run from the backend directory:
+#     gunicorn -c gunicorn.conf.py
+
+wsgi_app = 'wsgi:app'
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+# Set in the environment too, so the app sizes the admission limits the workers share for all of them
+workers = int(os.environ.setdefault('WEB_CONCURRENCY', '2'))
+# Threads keep a worker serving while one of its requests waits on the parser pool or streams NDJSON
+worker_class = 'gthread'
+threads = int(os.environ.get('THREADS', 4))
+
+# Load the app (stores, compiled parser tables and categorizers, the category model) once in the master
+# and fork workers from it, so they start warm and share those pages copy-on-write
+preload_app = True
+
+# Every worker has a parser pool of its own; split the CPUs between them unless told otherwise
+os.environ.setdefault('PARSE_WORKERS', str(max(1, (os.cpu_count() or 1) // workers)))
+
+
+def when_ready(server):
+    # Objects loaded by the master live as long as the workers do. Freezing them keeps the cyclic
+    # collector from writing to their headers, which would copy the shared pages into every worker.
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    # Files re-queued at startup run on worker dispatcher threads, not in the master
+    job_queue = worker.wsgi.extensions.get('job_queue')
+    if job_queue:
+        job_queue.resume()
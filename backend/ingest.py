@@ -0,0 +1,433 @@
+import os
+import math
+import time
+import atexit
+import signal
+import logging
+import itertools
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import metrics
+from bank_formats import DEFAULT_MAX_FALLBACK_ROWS
+from categorizer import get_categorizer, stored_rules_path, use_stored_rules
+from statement_parser import ParseLimitExceeded, describe_pdf_source, parse_pdf
+
+logger = logging.getLogger(__name__)
+
+# Default number of parser processes and per-file parse timeout (seconds)
+DEFAULT_PARSE_WORKERS = os.cpu_count() or 1
+DEFAULT_PARSE_TIMEOUT = 120
+
+# Seconds a parse may run past its timeout, e.g. stuck in C code the timeout's signal cannot
+# interrupt, before the watchdog kills its pool
+PARSE_KILL_GRACE = 10
+
+# Seconds between the watchdog's checks of the running parses
+WATCHDOG_INTERVAL = 1.0
+
+# Budgets of one file's parse; None lifts one. CPU time and memory are
+# only enforced in parser processes (see parse_budget)
+DEFAULT_PARSE_LIMITS = {
+    "cpu_seconds": 60,
+    "memory_mb": 1024,
+    "max_pages": 500,
+    "max_fallback_rows": DEFAULT_MAX_FALLBACK_ROWS
+}
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+# Address space this process had mapped before its first budgeted parse
+_base_address_space = None
+
+# In a parser process: the pool's shared (started, task) slots and the index of its own
+_slots = None
+_slot = None
+
+
+def _init_parser_process(started, tasks, next_slot, rules_path):
+    global _slots, _slot
+    with next_slot.get_lock():
+        _slot = next_slot.value
+        next_slot.value += 1
+    _slots = (started, tasks)
+    # Spawned processes would not see the parent's setting
+    use_stored_rules(rules_path)
+
+
+class ParserPool:
+    """
+    Process pool running parse_pdf_in_worker, with a watchdog for parses
+    that overrun their timeout.
+
+    A parse stops itself at its timeout (see parse_budget), which frees its
+    process for the next file. Each process also reports the parse it is
+    running in shared memory; one still running PARSE_KILL_GRACE seconds
+    past its timeout, e.g. stuck in C code, gets every process of the pool
+    killed and the pool replaced, as a ProcessPoolExecutor cannot lose one
+    process and carry on. The pool's other unfinished parses then fail with
+    BrokenProcessPool too; timed_out() tells the overrunning one apart.
+    """
+
+    def __init__(self, workers, rules_path=None):
+        self.workers = workers
+        self.rules_path = rules_path
+        self._started = multiprocessing.Array('d', workers, lock=False)
+        self._tasks = multiprocessing.Array('q', workers, lock=False)
+        self._executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_parser_process,
+                                             initargs=(self._started, self._tasks, multiprocessing.Value('i', 0),
+                                                       rules_path))
+        self._lock = threading.Lock()
+        self._task_ids = itertools.count(1)
+        # Task -> (future, timeout) of the parses with a timeout
+        self._timed = {}
+        self._overran = set()
+        self._closed = threading.Event()
+        self._retired = threading.Event()
+        threading.Thread(target=self._watch, name='parse-watchdog', daemon=True).start()
+
+    def parse(self, source, page_workers=0, limits=None, timeout=None, layout=False):
+        """
+        Submit parse_pdf_in_worker for one PDF; returns its future (see parse_result)
+        """
+        task = next(self._task_ids)
+        future = self._executor.submit(parse_pdf_in_worker, source, page_workers, limits, timeout, layout, task)
+        if timeout:
+            with self._lock:
+                self._timed[task] = (future, timeout)
+            future.add_done_callback(lambda _: self._forget(task))
+        return future
+
+    def _forget(self, task):
+        with self._lock:
+            self._timed.pop(task, None)
+
+    def timed_out(self, future):
+        """
+        True if the parse failed because the watchdog killed it for overrunning its timeout
+        """
+        return future in self._overran
+
+    def _watch(self):
+        while not self._closed.wait(WATCHDOG_INTERVAL):
+            now = time.time()
+            for slot in range(self.workers):
+                task = self._tasks[slot]
+                started = self._started[slot]
+                # Skip idle slots, and ones whose process moved on to the next parse as they were read
+                if not started or self._tasks[slot] != task:
+                    continue
+                with self._lock:
+                    future, timeout = self._timed.get(task, (None, None))
+                if future is not None and now - started > timeout + PARSE_KILL_GRACE:
+                    logger.error(f"Parse still running {now - started:.0f} s after it started, past its "
+                                 f"{timeout} s timeout; killing the parser pool")
+                    self._overran.add(future)
+                    self.kill()
+                    return
+            with self._lock:
+                if self._retired.is_set() and not self._timed:
+                    return
+
+    def kill(self):
+        """
+        Kill every parser process and drop the pool; its unfinished parses fail with BrokenProcessPool
+        """
+        # ProcessPoolExecutor has no public way to stop a running call before Python 3.14
+        processes = list((self._executor._processes or {}).values())
+        _drop_pool(self)
+        for process in processes:
+            process.kill()
+        self.shutdown(cancel_futures=False)
+
+    def shutdown(self, cancel_futures=True):
+        self._closed.set()
+        self._executor.shutdown(wait=False, cancel_futures=cancel_futures)
+
+    def retire(self):
+        """
+        Take no more parses but finish the ones submitted, still watched until they are done
+        """
+        self._retired.set()
+        self._executor.shutdown(wait=False, cancel_futures=False)
+
+
+def get_parse_pool(workers):
+    """
+    Return the shared parser process pool, (re)creating it for a new size or
+    category rules store (see categorizer.use_stored_rules)
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers or _pool.rules_path != stored_rules_path():
+            if _pool is not None:
+                # Requests and the job queue may still be waiting on its parses
+                _pool.retire()
+            logger.info(f"Starting parser pool with {workers} workers")
+            _pool = ParserPool(workers, stored_rules_path())
+            _pool_workers = workers
+        return _pool
+
+
+def _drop_pool(pool):
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+            _pool_workers = None
+
+
+def reset_parse_pool(pool):
+    """
+    Drop a pool whose workers died so the next batch starts a fresh one
+    """
+    _drop_pool(pool)
+    pool.shutdown()
+
+
+@atexit.register
+def shutdown_parse_pool():
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = None
+        _pool_workers = None
+
+
+class _BudgetExceeded(BaseException):
+    """
+    Raised from the SIGXCPU and SIGALRM handlers; not an Exception, so the
+    parser's handlers for bad pages and rows cannot swallow it
+    """
+
+
+def _address_space():
+    """
+    Bytes of address space this process has mapped, or None where /proc is not available
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return None
+
+
+@contextmanager
+def parse_budget(cpu_seconds=None, memory_mb=None, wall_seconds=None):
+    """
+    Limit the CPU time, memory and wall-clock time of the with block, in a
+    parser process.
+
+    The limits are the process's own rlimits and interval timer, set for
+    the block and put back afterwards, so a pooled process can run one
+    budgeted parse after another: CPU time to what the process has used so
+    far plus the budget, and address space to what it had mapped before its
+    first budgeted parse plus the budget, as memory earlier parses freed
+    stays mapped for later ones to reuse. Going over the CPU or wall-clock
+    budget raises ParseLimitExceeded by way of the SIGXCPU or SIGALRM
+    handler; going over the memory budget fails allocations with
+    MemoryError, also reported as ParseLimitExceeded. Without rlimits
+    (Windows) nothing is limited; neither are CPU and wall-clock time off
+    the main thread, where signal handlers cannot be set, nor memory without
+    /proc to measure it. ParserPool's watchdog covers a wall-clock budget
+    the signal cannot enforce.
+    """
+    global _base_address_space
+    try:
+        import resource
+    except ImportError:
+        yield
+        return
+
+    def exceeded(signum, frame):
+        raise _BudgetExceeded(signum)
+
+    saved = {}
+    previous_handlers = {}
+    on_main_thread = threading.current_thread() is threading.main_thread()
+    if cpu_seconds and on_main_thread:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        limit = math.ceil(usage.ru_utime + usage.ru_stime + cpu_seconds)
+        if hard == resource.RLIM_INFINITY or limit < hard:
+            previous_handlers[signal.SIGXCPU] = signal.signal(signal.SIGXCPU, exceeded)
+            saved[resource.RLIMIT_CPU] = (soft, hard)
+            resource.setrlimit(resource.RLIMIT_CPU, (limit, hard))
+    previous_timer = None
+    if wall_seconds and on_main_thread:
+        previous_handlers[signal.SIGALRM] = signal.signal(signal.SIGALRM, exceeded)
+        previous_timer = signal.setitimer(signal.ITIMER_REAL, wall_seconds)
+    if memory_mb and _base_address_space is None:
+        _base_address_space = _address_space()
+    if memory_mb and _base_address_space is not None:
+        soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+        limit = _base_address_space + memory_mb * 1024 * 1024
+        if hard == resource.RLIM_INFINITY or limit < hard:
+            saved[resource.RLIMIT_AS] = (soft, hard)
+            resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    try:
+        yield
+    except _BudgetExceeded as e:
+        if e.args[0] == signal.SIGALRM:
+            metrics.PARSE_LIMITS.inc(limit='time')
+            raise ParseLimitExceeded(f"Timed out after {wall_seconds} seconds") from None
+        metrics.PARSE_LIMITS.inc(limit='cpu')
+        raise ParseLimitExceeded(f"Parse used more than its {cpu_seconds} s CPU time budget") from None
+    except MemoryError:
+        if resource.RLIMIT_AS not in saved:
+            raise
+        metrics.PARSE_LIMITS.inc(limit='memory')
+        raise ParseLimitExceeded(f"Parse used more than its {memory_mb} MiB memory budget") from None
+    finally:
+        if previous_timer is not None:
+            signal.setitimer(signal.ITIMER_REAL, *previous_timer)
+        for which, limits in saved.items():
+            resource.setrlimit(which, limits)
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+
+
+class WorkerParseError(Exception):
+    """
+    A parse error raised in a parser process, with the metrics it recorded
+    """
+
+    def __init__(self, message, samples):
+        super().__init__(message, samples)
+        self.samples = samples
+
+    def __str__(self):
+        return self.args[0]
+
+
+def parse_pdf_in_worker(source, page_workers=0, limits=None, timeout=None, layout=False, task=0):
+    """
+    Pool entry point: parse_pdf within the limits (see
+    DEFAULT_PARSE_LIMITS) and timeout seconds, returning (statement_data,
+    metric samples). task identifies the parse to ParserPool's watchdog.
+    page_workers only applies without a CPU time or memory limit.
+
+    Metrics recorded in a parser process would never reach /metrics, so they
+    are captured and replayed into the parent's registry by parse_result.
+    """
+    limits = limits or DEFAULT_PARSE_LIMITS
+    if limits["cpu_seconds"] or limits["memory_mb"]:
+        # Page workers are processes of their own, outside this process's rlimits
+        page_workers = 0
+    if _slots is not None:
+        started, tasks = _slots
+        tasks[_slot] = task
+        started[_slot] = time.time()
+    try:
+        with metrics.capture() as samples:
+            try:
+                with parse_budget(limits["cpu_seconds"], limits["memory_mb"], timeout):
+                    # By the stored rules current as the file starts, however recently they were checked
+                    get_categorizer(refresh=True)
+                    statement_data = parse_pdf(source, page_workers, layout=layout, max_pages=limits["max_pages"],
+                                               max_fallback_rows=limits["max_fallback_rows"])
+                return statement_data, samples
+            except Exception as e:
+                # Carry the samples across with the error
+                raise WorkerParseError(str(e), samples) from None
+    finally:
+        if _slots is not None:
+            _slots[0][_slot] = 0
+
+
+def parse_result(future):
+    """
+    Return the statement_data of a parse_pdf_in_worker future, recording its metrics
+    """
+    try:
+        statement_data, samples = future.result()
+    except WorkerParseError as e:
+        metrics.registry.replay(e.samples)
+        raise
+    metrics.registry.replay(samples)
+    return statement_data
+
+
+def iter_parse_files(sources, workers=DEFAULT_PARSE_WORKERS, timeout=DEFAULT_PARSE_TIMEOUT, page_workers=0,
+                     limits=None, layout=False):
+    """
+    Parse several PDFs on the parser process pool, yielding each as it finishes.
+
+    Each source is a file path or the raw PDF bytes. Yields one
+    (index, statement_data, error) triple per source, in completion order;
+    exactly one of statement_data and error is set. timeout limits each
+    file's parse on its own, measured from when a parser process picks the
+    file up rather than from submission, so files queued behind others get
+    their full time; a file over it is reported as timed out and its
+    process moves on (see ParserPool). Files whose parse was lost when the
+    pool was killed or crashed are parsed once more on a fresh pool. With
+    workers=0 the files are parsed in this process, one after another, and
+    only the page and fallback row limits apply. page_workers is passed on
+    to parse_pdf to split very large documents by page range, and layout
+    to have it read table sections by column position.
+    """
+    limits = limits or DEFAULT_PARSE_LIMITS
+    if workers <= 0:
+        for index, source in enumerate(sources):
+            try:
+                yield index, parse_pdf(source, page_workers, layout=layout, max_pages=limits["max_pages"],
+                                       max_fallback_rows=limits["max_fallback_rows"]), None
+            except Exception as e:
+                yield index, None, str(e)
+        return
+
+    pool = get_parse_pool(workers)
+    futures = {pool.parse(source, page_workers, limits, timeout, layout): (index, pool)
+               for index, source in enumerate(sources)}
+    pending = set(futures)
+    retried = set()
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in sorted(done, key=futures.get):
+                index, future_pool = futures[future]
+                try:
+                    yield index, parse_result(future), None
+                except BrokenProcessPool:
+                    described = describe_pdf_source(sources[index])
+                    if future_pool.timed_out(future):
+                        logger.error(f"Timed out parsing {described} after {timeout}s")
+                        yield index, None, f"Timed out after {timeout} seconds"
+                        continue
+                    reset_parse_pool(future_pool)
+                    if index in retried:
+                        logger.error(f"Parser process died while parsing {described}")
+                        yield index, None, "Parser process terminated unexpectedly"
+                        continue
+                    # Most likely another file's parse took the pool down; try this one again
+                    logger.warning(f"Parser pool broke while parsing {described}; retrying it")
+                    retried.add(index)
+                    retry_pool = get_parse_pool(workers)
+                    retry = retry_pool.parse(sources[index], page_workers, limits, timeout, layout)
+                    futures[retry] = (index, retry_pool)
+                    pending.add(retry)
+                except Exception as e:
+                    yield index, None, str(e)
+    finally:
+        # The caller stopped early (e.g. a streaming client went away)
+        for future in pending:
+            future.cancel()
+
+
+def parse_files(sources, workers=DEFAULT_PARSE_WORKERS, timeout=DEFAULT_PARSE_TIMEOUT, page_workers=0, limits=None,
+                layout=False):
+    """
+    Parse several PDFs, fanning them out to the parser process pool.
+
+    Returns one (statement_data, error) pair per source, in the order given.
+    See iter_parse_files for the arguments.
+    """
+    results = [None] * len(sources)
+    for index, statement_data, error in iter_parse_files(sources, workers, timeout, page_workers, limits, layout):
+        results[index] = (statement_data, error)
+    return results
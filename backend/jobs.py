@@ -0,0 +1,413 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from ingest import DEFAULT_PARSE_TIMEOUT, DEFAULT_PARSE_WORKERS, get_parse_pool, parse_result, reset_parse_pool
+from parse_cache import decode_statement, encode_statement
+
+logger = logging.getLogger(__name__)
+
+# Attempts per file before a crashed parse is reported as failed
+DEFAULT_JOB_MAX_ATTEMPTS = 3
+
+# Seconds the dispatcher sleeps when there is nothing to do
+JOB_POLL_INTERVAL = 0.5
+
+FILE_STATUSES = ('queued', 'running', 'done', 'failed', 'cancelled')
+
+# Finished files whose parse times are averaged into backlog()'s estimate
+BACKLOG_SAMPLE = 50
+
+
+class JobQueue:
+    """
+    SQLite-backed queue of statement-ingestion jobs.
+
+    A job is a batch of uploaded PDFs spooled under spool_dir. A dispatcher
+    thread claims queued files and runs parse_pdf for each on the shared
+    parser process pool, within limits (see ingest.DEFAULT_PARSE_LIMITS),
+    never more than `workers` at a time, each within timeout seconds of
+    starting. A cancelled file's parse that already started keeps its slot
+    until its process is free again. Queued files are claimed in turn
+    across tenants, so one tenant's large batch does not hold up another's
+    file. Files whose parser process crashed are retried up to max_attempts
+    times; failed files can also be re-queued with retry(). Claims are
+    atomic updates, so several app processes can share one queue file.
+
+    on_result(file, statement_data) is called for every parsed file and may
+    return an error message to fail it.
+
+    Files left running by a stopped server are re-queued on startup and the
+    dispatcher started for them. With start=False they wait for resume() or
+    the next job instead, e.g. when the queue is built before a prefork
+    server forks, as the thread would only run in the parent.
+    """
+
+    def __init__(self, path, spool_dir, workers=DEFAULT_PARSE_WORKERS, timeout=DEFAULT_PARSE_TIMEOUT,
+                 page_workers=0, max_attempts=DEFAULT_JOB_MAX_ATTEMPTS, on_result=None, start=True, limits=None,
+                 layout=False):
+        self.path = path
+        self.spool_dir = spool_dir
+        self.workers = workers
+        self.timeout = timeout
+        self.page_workers = page_workers
+        self.max_attempts = max_attempts
+        self.limits = limits
+        self.layout = layout
+        self.on_result = on_result
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._wake = threading.Event()
+        # Future -> (file id, pool) of every parse that holds a pool process, owned by the dispatcher thread
+        self._running = {}
+        self._pool = None
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    created_at REAL NOT NULL,
+                    cancelled_at REAL
+                );
+                CREATE TABLE IF NOT EXISTS job_files (
+                    id INTEGER PRIMARY KEY,
+                    job_id TEXT NOT NULL REFERENCES jobs (id),
+                    filename TEXT NOT NULL,
+                    sha256 TEXT,
+                    cache_key TEXT,
+                    path TEXT,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    transactions INTEGER,
+                    statement_info TEXT,
+                    result BLOB,
+                    started_at REAL,
+                    finished_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS job_files_job ON job_files (job_id);
+                CREATE INDEX IF NOT EXISTS job_files_status ON job_files (status);
+            """)
+            # Queues created before admission control hold files of no tenant
+            if 'tenant' not in [row[1] for row in conn.execute("PRAGMA table_info(job_files)")]:
+                conn.execute("ALTER TABLE job_files ADD COLUMN tenant TEXT")
+            # Files that were mid-parse when the server stopped go back in the queue
+            requeued = conn.execute("UPDATE job_files SET status = 'queued' WHERE status = 'running'").rowcount
+        if requeued:
+            logger.info(f"Re-queued {requeued} interrupted job files")
+            if start:
+                self.ensure_started()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def new_job(self):
+        """
+        Return a fresh job id and the directory to spool its files into
+        """
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.spool_dir, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        return job_id, job_dir
+
+    def create_job(self, job_id, files, tenant=None):
+        """
+        Record a job and queue its files.
+
+        Each file is a dict with filename plus either path (a spooled PDF to
+        parse), result (statement data already known, e.g. from the parse
+        cache) or error (rejected upload). sha256 and cache_key are kept for
+        the on_result callback. tenant is who the job is parsed for.
+        """
+        now = time.time()
+        rows = []
+        for file in files:
+            result = file.get("result")
+            if file.get("error") is not None:
+                status, payload = 'failed', None
+            elif result is not None:
+                status, payload = 'done', encode_statement(result)
+            else:
+                status, payload = 'queued', None
+            rows.append((job_id, file["filename"], file.get("sha256"), file.get("cache_key"), file.get("path"),
+                         status, file.get("error"), len(result["transactions"]) if result else None,
+                         json.dumps(_statement_info(result)) if result else None, payload,
+                         now if status != 'queued' else None, tenant))
+        with self._connect() as conn:
+            conn.execute("INSERT INTO jobs (id, created_at) VALUES (?, ?)", (job_id, now))
+            conn.executemany(
+                "INSERT INTO job_files (job_id, filename, sha256, cache_key, path, status, error, transactions, "
+                "statement_info, result, finished_at, tenant) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        logger.info(f"Created job {job_id} with {len(rows)} files")
+        self.ensure_started()
+        return job_id
+
+    def backlog(self, tenant=None):
+        """
+        Return (files queued or running, those of the tenant, mean seconds
+        per parse of recently finished files or None)
+        """
+        with self._connect() as conn:
+            files, tenant_files = conn.execute(
+                "SELECT COUNT(*), COUNT(CASE WHEN tenant IS ? THEN 1 END) FROM job_files "
+                "WHERE status IN ('queued', 'running')", (tenant,)).fetchone()
+            (seconds,) = conn.execute(
+                "SELECT AVG(finished_at - started_at) FROM (SELECT finished_at, started_at FROM job_files "
+                "WHERE status = 'done' AND started_at IS NOT NULL ORDER BY id DESC LIMIT ?)",
+                (BACKLOG_SAMPLE,)).fetchone()
+        return files, tenant_files, seconds
+
+    def status(self, job_id):
+        """
+        Return the job's overall status and per-file progress, or None
+        """
+        with self._connect() as conn:
+            job = conn.execute("SELECT created_at, cancelled_at FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            files = conn.execute(
+                "SELECT filename, status, attempts, error, transactions, statement_info FROM job_files "
+                "WHERE job_id = ? ORDER BY id", (job_id,)).fetchall()
+
+        counts = dict.fromkeys(FILE_STATUSES, 0)
+        for file in files:
+            counts[file[1]] += 1
+        if counts['queued'] or counts['running']:
+            status = 'running' if counts['running'] or counts['done'] or counts['failed'] else 'queued'
+        elif job[1] is not None:
+            status = 'cancelled'
+        elif files and counts['failed'] == len(files):
+            status = 'failed'
+        else:
+            status = 'done'
+        return {
+            "id": job_id,
+            "status": status,
+            "created_at": job[0],
+            "progress": {"total": len(files), **counts},
+            "files": [
+                {"file": filename, "status": file_status, "attempts": attempts, "error": error,
+                 "transactions": transactions,
+                 "statement_info": json.loads(statement_info) if statement_info else None}
+                for filename, file_status, attempts, error, transactions, statement_info in files
+            ]
+        }
+
+    def results(self, job_id):
+        """
+        Return [(filename, statement_data or None, error or None)] for the job's finished files
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT filename, status, error, result FROM job_files WHERE job_id = ? "
+                "AND status IN ('done', 'failed', 'cancelled') ORDER BY id", (job_id,)).fetchall()
+        return [
+            (filename, decode_statement(result) if status == 'done' else None,
+             error if status == 'failed' else ("Cancelled" if status == 'cancelled' else None))
+            for filename, status, error, result in rows
+        ]
+
+    def cancel(self, job_id):
+        """
+        Cancel the job's queued and running files; returns False for unknown jobs
+        """
+        with self._connect() as conn:
+            if not conn.execute("UPDATE jobs SET cancelled_at = ? WHERE id = ?", (time.time(), job_id)).rowcount:
+                return False
+            paths = [row[0] for row in conn.execute(
+                "SELECT path FROM job_files WHERE job_id = ? AND status IN ('queued', 'running')", (job_id,))]
+            conn.execute("UPDATE job_files SET status = 'cancelled', finished_at = ? "
+                         "WHERE job_id = ? AND status IN ('queued', 'running')", (time.time(), job_id))
+        for path in paths:
+            _remove(path)
+        self._wake.set()
+        return True
+
+    def retry(self, job_id):
+        """
+        Re-queue the job's failed files; returns how many were queued
+        """
+        with self._connect() as conn:
+            queued = conn.execute(
+                "UPDATE job_files SET status = 'queued', error = NULL, attempts = 0, finished_at = NULL "
+                "WHERE job_id = ? AND status = 'failed' AND path IS NOT NULL", (job_id,)).rowcount
+            if queued:
+                conn.execute("UPDATE jobs SET cancelled_at = NULL WHERE id = ?", (job_id,))
+        if queued:
+            self.ensure_started()
+        return queued
+
+    def delete(self, job_id):
+        """
+        Cancel a job and drop its records and spooled files
+        """
+        if not self.cancel(job_id):
+            return False
+        with self._connect() as conn:
+            conn.execute("DELETE FROM job_files WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        shutil.rmtree(os.path.join(self.spool_dir, job_id), ignore_errors=True)
+        return True
+
+    def resume(self):
+        """
+        Start the dispatcher if any file is queued
+        """
+        with self._connect() as conn:
+            queued = conn.execute("SELECT 1 FROM job_files WHERE status = 'queued' LIMIT 1").fetchone()
+        if queued:
+            self.ensure_started()
+
+    def ensure_started(self):
+        """
+        Start the dispatcher thread if it is not running, and wake it up
+        """
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._dispatch, name='job-dispatcher', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _dispatch(self):
+        while True:
+            try:
+                if self._running:
+                    done, _ = wait(list(self._running), timeout=JOB_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._finish(future)
+                    self._drop_cancelled()
+                else:
+                    self._wake.wait(JOB_POLL_INTERVAL)
+                self._wake.clear()
+                self._claim()
+            except Exception as e:
+                logger.error(f"Job dispatcher error: {str(e)}")
+                time.sleep(JOB_POLL_INTERVAL)
+
+    def _claim(self):
+        free = self.workers - len(self._running)
+        if free <= 0:
+            return
+        with self._connect() as conn:
+            # Each tenant's oldest queued file first, pushed back by the tenant's files already running;
+            # between tenants with the same turn, the one whose last file was claimed longest ago
+            candidates = conn.execute("""
+                WITH running AS (
+                    SELECT tenant, COUNT(*) AS files FROM job_files WHERE status = 'running' GROUP BY tenant
+                ), claimed AS (
+                    SELECT tenant, MAX(started_at) AS last FROM job_files WHERE started_at IS NOT NULL GROUP BY tenant
+                )
+                SELECT queued.id, queued.path FROM (
+                    SELECT id, path, tenant, ROW_NUMBER() OVER (PARTITION BY tenant ORDER BY id) AS turn
+                    FROM job_files WHERE status = 'queued'
+                ) AS queued
+                LEFT JOIN running ON running.tenant IS queued.tenant
+                LEFT JOIN claimed ON claimed.tenant IS queued.tenant
+                ORDER BY queued.turn + COALESCE(running.files, 0), COALESCE(claimed.last, 0), queued.id
+                LIMIT ?
+            """, (free,)).fetchall()
+            claimed = []
+            for file_id, path in candidates:
+                # Another dispatcher may have claimed the file first
+                if conn.execute("UPDATE job_files SET status = 'running', attempts = attempts + 1, started_at = ? "
+                                "WHERE id = ? AND status = 'queued'", (time.time(), file_id)).rowcount:
+                    claimed.append((file_id, path))
+        if not claimed:
+            return
+        self._pool = get_parse_pool(self.workers)
+        for file_id, path in claimed:
+            future = self._pool.parse(path, self.page_workers, self.limits, self.timeout, self.layout)
+            self._running[future] = (file_id, self._pool)
+
+    def _finish(self, future):
+        file_id, pool = self._running.pop(future)
+        try:
+            statement_data = parse_result(future)
+        except BrokenProcessPool:
+            if pool.timed_out(future):
+                self._fail(file_id, f"Timed out after {self.timeout} seconds")
+                return
+            logger.error(f"Parser process died while parsing job file {file_id}")
+            reset_parse_pool(pool)
+            self._fail(file_id, "Parser process terminated unexpectedly", retryable=True)
+            return
+        except Exception as e:
+            self._fail(file_id, str(e))
+            return
+
+        if "error" in statement_data:
+            self._fail(file_id, statement_data["error"])
+            return
+        with self._connect() as conn:
+            # A file cancelled or deleted while it parsed is left as it is
+            file = conn.execute("SELECT filename, sha256, cache_key, path FROM job_files "
+                                "WHERE id = ? AND status = 'running'", (file_id,)).fetchone()
+        if file is None:
+            return
+        file = dict(zip(("filename", "sha256", "cache_key", "path"), file))
+        error = self.on_result(file, statement_data) if self.on_result else None
+        if error is not None:
+            self._fail(file_id, error)
+            return
+        with self._connect() as conn:
+            # A job cancelled meanwhile keeps its cancelled status
+            updated = conn.execute(
+                "UPDATE job_files SET status = 'done', transactions = ?, statement_info = ?, result = ?, "
+                "finished_at = ? WHERE id = ? AND status = 'running'",
+                (len(statement_data["transactions"]), json.dumps(_statement_info(statement_data)),
+                 encode_statement(statement_data), time.time(), file_id)).rowcount
+        if updated:
+            _remove(file["path"])
+
+    def _fail(self, file_id, error, retryable=False):
+        with self._connect() as conn:
+            if retryable:
+                requeued = conn.execute(
+                    "UPDATE job_files SET status = 'queued', error = ? "
+                    "WHERE id = ? AND status = 'running' AND attempts < ?",
+                    (error, file_id, self.max_attempts)).rowcount
+                if requeued:
+                    logger.warning(f"Retrying job file {file_id}: {error}")
+                    return
+            conn.execute("UPDATE job_files SET status = 'failed', error = ?, finished_at = ? "
+                         "WHERE id = ? AND status = 'running'", (error, time.time(), file_id))
+        logger.error(f"Job file {file_id} failed: {error}")
+
+    def _drop_cancelled(self):
+        if not self._running:
+            return
+        ids = {file_id: future for future, (file_id, _) in self._running.items()}
+        with self._connect() as conn:
+            cancelled = conn.execute(
+                f"SELECT id FROM job_files WHERE status = 'cancelled' AND id IN ({', '.join('?' * len(ids))})",
+                list(ids)).fetchall()
+        for (file_id,) in cancelled:
+            # A parse that already started runs to completion (or its timeout) and keeps its process
+            # until then, so it stays in _running; _finish ignores its result
+            future = ids[file_id]
+            if future.cancel():
+                del self._running[future]
+
+
+def _statement_info(statement_data):
+    return {key: value for key, value in statement_data.items()
+            if key not in ("transactions", "duplicates", "merchants")}
+
+
+def _remove(path):
+    if path and os.path.exists(path):
+        os.remove(path)
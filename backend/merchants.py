@@ -0,0 +1,229 @@
+import re
+import hashlib
+from functools import lru_cache
+import numpy as np
+from categorizer import normalize_description
+
+# MinHash signature length, split into LSH_BANDS bands of LSH_ROWS values. Two descriptions
+# become candidates when their signatures agree on a whole band: likely from about 50%
+# Jaccard similarity with 16 bands of 4
+SIGNATURE_SIZE = 64
+LSH_BANDS = 16
+LSH_ROWS = SIGNATURE_SIZE // LSH_BANDS
+
+# Candidates whose estimated similarity reaches this join the merchant
+SIMILARITY_THRESHOLD = 0.6
+
+# The first words usually name the merchant, so they are weighted: the first counts
+# LEADING_TOKENS times, the next one less, down to once
+LEADING_TOKENS = 3
+
+# Card processor prefixes and transaction verbs that say nothing about the merchant
+NOISE_TOKENS = frozenset(('tst', 'sq', 'sp', 'pp', 'pos', 'ach', 'debit', 'purchase', 'withdrawal', 'www', 'com'))
+
+# US state codes that end most card descriptions
+STATE_CODES = frozenset((
+    'al ak az ar ca co ct de dc fl ga hi id il in ia ks ky la me md ma mi mn ms mo mt ne nv nh nj nm ny nc nd oh ok '
+    'or pa ri sc sd tn tx ut vt va wa wv wi wy pr').split())
+
+# Buckets shared by more merchants than this hold only generic words ("cafe", "market") and
+# are skipped, which bounds the comparisons per description
+MAX_BUCKET_MERCHANTS = 32
+
+# Descriptions sketched per NumPy pass, bounding the (features x SIGNATURE_SIZE) work array
+SKETCH_CHUNK = 20000
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9&']+")
+
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+
+
+def _mix(values):
+    """
+    splitmix64 finalizer over a uint64 array (wrapping arithmetic)
+    """
+    values = (values ^ (values >> np.uint64(30))) * _MIX_1
+    values = (values ^ (values >> np.uint64(27))) * _MIX_2
+    return values ^ (values >> np.uint64(31))
+
+
+# One seed per signature position; derived, not drawn, so stored signatures stay comparable
+_SEEDS = _mix(np.arange(1, SIGNATURE_SIZE + 1, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15))
+
+
+@lru_cache(maxsize=65536)
+def _feature_hash(feature):
+    # Stable across processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def merchant_tokens(description):
+    """
+    Return the words of a description that identify its merchant, in order
+    and original case.
+
+    Processor prefixes and lone digits are dropped. A store or reference
+    number (two or more digits) after the first word ends the merchant's
+    name, as the location follows it; without one, only a trailing state
+    code is dropped.
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(description):
+        if sum(ch.isdigit() for ch in token) >= 2:
+            if tokens:
+                return tokens
+            continue
+        if not token.isdigit() and token.lower() not in NOISE_TOKENS:
+            tokens.append(token)
+    if len(tokens) > 1 and tokens[-1].lower() in STATE_CODES:
+        tokens.pop()
+    return tokens
+
+
+def merchant_features(tokens, description):
+    """
+    Return the feature set hashed into a description's signature: each
+    word, with extra copies of the leading ones as weight
+    """
+    features = set()
+    for position, token in enumerate(tokens):
+        word = token.lower()
+        features.update(f"{word}#{copy}" for copy in range(max(1, LEADING_TOKENS - position)))
+    return features or {normalize_description(description)}
+
+
+def sketch(descriptions):
+    """
+    Return (merchant tokens, MinHash signatures, LSH band keys) for descriptions.
+
+    Signatures are (n, SIGNATURE_SIZE) uint64: each position is the minimum
+    of one seeded hash over the description's features, computed for every
+    feature of a chunk at once. Band keys are (n, LSH_BANDS) int64, each
+    hashing one band's values and the band number.
+    """
+    tokens = [merchant_tokens(description) for description in descriptions]
+    signatures = np.empty((len(descriptions), SIGNATURE_SIZE), dtype=np.uint64)
+    for start in range(0, len(descriptions), SKETCH_CHUNK):
+        feature_sets = [merchant_features(words, description) for words, description
+                        in zip(tokens[start:start + SKETCH_CHUNK], descriptions[start:start + SKETCH_CHUNK])]
+        hashes = np.array([_feature_hash(feature) for features in feature_sets for feature in features],
+                          dtype=np.uint64)
+        starts = np.concatenate(([0], np.cumsum([len(features) for features in feature_sets])[:-1]))
+        values = _mix(hashes[:, None] ^ _SEEDS[None, :])
+        signatures[start:start + len(feature_sets)] = np.minimum.reduceat(values, starts, axis=0)
+    return tokens, signatures, band_keys(signatures)
+
+
+def band_keys(signatures):
+    """
+    Return the LSH bucket key of each band of each signature, as int64 for SQLite
+    """
+    keys = np.empty((len(signatures), LSH_BANDS), dtype=np.uint64)
+    for band in range(LSH_BANDS):
+        key = np.full(len(signatures), band + 1, dtype=np.uint64)
+        for column in range(band * LSH_ROWS, (band + 1) * LSH_ROWS):
+            key = _mix(key ^ signatures[:, column])
+        keys[:, band] = key
+    return keys.view(np.int64)
+
+
+def common_name(name, tokens):
+    """
+    Return the leading words name shares with tokens, or name if it shares none
+    """
+    words = name.split()
+    shared = 0
+    while shared < min(len(words), len(tokens)) and words[shared].lower() == tokens[shared].lower():
+        shared += 1
+    return ' '.join(words[:shared]) if shared else name
+
+
+class MerchantIndex:
+    """
+    LSH index of merchants that assigns descriptions to them incrementally.
+
+    Each merchant is represented by the signature of the first description
+    assigned to it, filed under its band keys. A description is compared
+    only with merchants sharing one of its buckets and joins the most
+    similar one at SIMILARITY_THRESHOLD or above, else starts a merchant of
+    its own, so assigning n descriptions costs O(n * LSH_BANDS) lookups, not
+    O(n^2) comparisons. A merchant's name shrinks to the leading words its
+    descriptions have in common.
+    """
+
+    def __init__(self, next_id=1):
+        self.next_id = next_id
+        self.buckets = {}
+        # Buckets of more than MAX_BUCKET_MERCHANTS merchants, no longer filed into or searched
+        self.generic = set()
+        self.names = {}
+        # Representative signatures, one row per merchant in self.rows order
+        self.rows = {}
+        self._signatures = np.empty((64, SIGNATURE_SIZE), dtype=np.uint64)
+
+    def add_merchant(self, merchant_id, name, signature, keys=()):
+        """
+        Index an existing merchant under the given bucket keys
+        """
+        self.names[merchant_id] = name
+        row = self.rows[merchant_id] = len(self.rows)
+        if row == len(self._signatures):
+            self._signatures = np.concatenate((self._signatures, np.empty_like(self._signatures)))
+        self._signatures[row] = signature
+        for key in keys:
+            self.file(key, merchant_id)
+
+    def file(self, key, merchant_id):
+        """
+        Add a merchant to a bucket
+        """
+        if key in self.generic:
+            return
+        merchants = self.buckets.setdefault(key, [])
+        merchants.append(merchant_id)
+        if len(merchants) > MAX_BUCKET_MERCHANTS:
+            self.mark_generic(key)
+
+    def mark_generic(self, key):
+        """
+        Drop a bucket known to hold more than MAX_BUCKET_MERCHANTS merchants
+        """
+        self.buckets.pop(key, None)
+        self.generic.add(key)
+
+    def assign(self, descriptions, sketches=None):
+        """
+        Assign descriptions to merchants, in order.
+
+        Returns (merchant id per description, new merchants as (id, name,
+        signature, band keys) tuples, {merchant id: new name} for renamed ones).
+        """
+        tokens, signatures, keys = sketches if sketches is not None else sketch(descriptions)
+        assigned = []
+        created = []
+        renamed = {}
+        for description, words, signature, row_keys in zip(descriptions, tokens, signatures, keys.tolist()):
+            candidates = set()
+            for key in row_keys:
+                candidates.update(self.buckets.get(key, ()))
+            best = None
+            if candidates:
+                candidates = sorted(candidates)
+                rows = [self.rows[merchant_id] for merchant_id in candidates]
+                similarity = (self._signatures[rows] == signature).mean(axis=1)
+                index = int(similarity.argmax())
+                if similarity[index] >= SIMILARITY_THRESHOLD:
+                    best = candidates[index]
+            if best is None:
+                best = self.next_id
+                self.next_id += 1
+                name = ' '.join(words) or description.strip()
+                self.add_merchant(best, name, signature, row_keys)
+                created.append((best, name, signature, row_keys))
+            else:
+                name = common_name(self.names[best], words)
+                if name != self.names[best]:
+                    self.names[best] = renamed[best] = name
+            assigned.append(best)
+        return assigned, created, renamed
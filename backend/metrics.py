@@ -0,0 +1,216 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Upper bounds in seconds, spanning a cached lookup to a very large statement
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Samples recorded inside capture() are collected here instead of applied
+_captured = ContextVar('captured_samples', default=None)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Metric:
+    """
+    A named metric with one series per combination of label values
+    """
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} takes labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _record(self, value, labels):
+        key = self._key(labels)
+        captured = _captured.get()
+        if captured is not None:
+            captured.append((self.name, key, value))
+        else:
+            self._apply(key, value)
+
+    def _apply(self, key, value):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for key, value in series:
+            lines.extend(self._render_series(key, value))
+        return lines
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing count, e.g. pennysprout_parse_fallbacks_total
+    """
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self._record(amount, labels)
+
+    def _apply(self, key, value):
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + value
+
+    def value(self, **labels):
+        with self._lock:
+            return self._series.get(self._key(labels), 0)
+
+    def _render_series(self, key, value):
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"]
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values in cumulative buckets, Prometheus style
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        self._record(value, labels)
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe the seconds spent in the with block
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _apply(self, key, value):
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket (not cumulative) counts with a final +Inf bucket, then sum
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def snapshot(self, **labels):
+        """
+        Return (count, sum) of one series
+        """
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return (sum(series[0]), series[1]) if series else (0, 0.0)
+
+    def _render_series(self, key, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, float('inf')), counts):
+            cumulative += count
+            labels = _format_labels(self.label_names, key, [('le', _format_value(float(bound)))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    The process's metrics, rendered in the Prometheus text exposition format
+    """
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self.register(Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def replay(self, samples):
+        """
+        Apply samples collected by capture(), e.g. in a parser process
+        """
+        for name, key, value in samples:
+            metric = self.metrics.get(name)
+            if metric is not None:
+                metric._apply(key, value)
+
+
+@contextmanager
+def capture():
+    """
+    Collect the samples recorded in the with block into a list instead of
+    applying them, so a worker process can send them back with its result
+    """
+    samples = []
+    token = _captured.set(samples)
+    try:
+        yield samples
+    finally:
+        _captured.reset(token)
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    'pennysprout_stage_seconds', 'Seconds spent in each statement parsing stage', labels=('stage',))
+PARSE_FALLBACKS = registry.counter(
+    'pennysprout_parse_fallbacks_total', 'Statements that needed a fallback parsing path', labels=('path',))
+PARSE_LIMITS = registry.counter(
+    'pennysprout_parse_limits_total', 'Parses cut short or refused by a resource limit', labels=('limit',))
+PAGES_PER_FILE = registry.histogram(
+    'pennysprout_pages_per_file', 'Pages per parsed PDF', buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000))
+ROWS_PER_SECOND = registry.histogram(
+    'pennysprout_parse_rows_per_second', 'Transactions extracted per second of parse_pdf, per file',
+    buckets=(100, 1000, 5000, 10000, 25000, 50000, 100000, 250000, 500000, 1000000))
+PARSED_ROWS = registry.counter('pennysprout_parsed_transactions_total', 'Transactions extracted from PDFs')
+REQUEST_SECONDS = registry.histogram(
+    'pennysprout_request_seconds', 'HTTP request latency by endpoint and status', labels=('endpoint', 'status'))
+
+
+def timed(stage):
+    """
+    Observe the seconds spent in the with block as one parsing stage
+    """
+    return STAGE_SECONDS.time(stage=stage)
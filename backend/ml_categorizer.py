@@ -0,0 +1,317 @@
+import os
+import csv
+import json
+import pickle
+import logging
+import sqlite3
+import argparse
+import threading
+import numpy as np
+from categorizer import UNCATEGORIZED, normalize_description
+
+logger = logging.getLogger(__name__)
+
+# Model file, read lazily once per process; empty disables the ML fallback
+DEFAULT_MODEL_PATH = 'category_model.pkl'
+
+# Character n-gram sizes and hashed feature-space size (2**bits columns)
+DEFAULT_NGRAM_RANGE = (3, 5)
+DEFAULT_HASH_BITS = 18
+
+# Predictions with a lower class probability are left Uncategorized
+DEFAULT_MIN_CONFIDENCE = 0.5
+
+MODEL_FORMAT = 1
+
+# Statement category names (Discover's) -> the app category they train as; others with no app
+# category of the same name are left out of training
+STATEMENT_CATEGORIES = {
+    'Supermarkets': 'Groceries',
+    'Merchandise': 'Shopping',
+    'Gasoline': 'Transportation',
+    'Automotive': 'Transportation',
+    'Medical': 'Health',
+    'Payment': 'Financial',
+}
+
+# FNV-1a style multiply-xor per byte, then a Fibonacci-hash mix to pick the column
+_HASH_MULTIPLIER = np.uint64(1099511628211)
+_MIX_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def hash_features(descriptions, ngram_range=DEFAULT_NGRAM_RANGE, bits=DEFAULT_HASH_BITS):
+    """
+    Hash the byte n-grams of each lowercased, space-padded description into a
+    CSR matrix with one row per description.
+
+    Every n-gram occurrence is weighted 1/sqrt(n-grams in the description), so
+    rows have roughly unit L2 norm. The hashing runs over all descriptions at
+    once in NumPy instead of one Python call per description.
+    """
+    from scipy import sparse
+
+    encoded = [f" {description.lower()} ".encode('utf-8') for description in descriptions]
+    low, high = ngram_range
+    # NUL-separated, with enough trailing NULs for the longest n-gram at the last position
+    buffer = np.frombuffer(b'\0'.join(encoded) + b'\0' * (high + 1), dtype=np.uint8).astype(np.uint64)
+    positions = len(buffer) - high
+    separators = np.concatenate(([0], np.cumsum(buffer == 0)))
+
+    # (positions, sizes) grids, flattened row-major so each description's entries stay contiguous
+    columns = np.empty((positions, high - low + 1), dtype=np.int64)
+    valid = np.empty((positions, high - low + 1), dtype=bool)
+    for size_index, n in enumerate(range(low, high + 1)):
+        hashes = np.full(positions, n, dtype=np.uint64)
+        for offset in range(n):
+            hashes = (hashes * _HASH_MULTIPLIER) ^ buffer[offset:offset + positions]
+        columns[:, size_index] = (hashes * _MIX_MULTIPLIER) >> np.uint64(64 - bits)
+        # An n-gram is real when it does not span a separator
+        valid[:, size_index] = separators[n:n + positions] == separators[:positions]
+    valid = valid.ravel()
+    indices = columns.ravel()[valid]
+
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)) + 1
+    # One entry per position: each description plus the separator after it
+    owners = np.repeat(np.arange(len(encoded)), lengths)
+    per_row = np.bincount(np.repeat(owners, high - low + 1)[valid], minlength=len(encoded))
+    indptr = np.concatenate(([0], np.cumsum(per_row)))
+    data = np.repeat(1 / np.sqrt(np.maximum(per_row, 1)), per_row)
+    return sparse.csr_matrix((data, indices, indptr), shape=(len(encoded), 1 << bits))
+
+
+class MLCategorizer:
+    """
+    Linear classifier over hashed character n-grams of the normalized description.
+
+    It only sees descriptions the keyword rules leave Uncategorized. Needs
+    scikit-learn (and SciPy) to train and to load a model; without them, or
+    without a model file, those rows simply stay Uncategorized.
+    """
+
+    def __init__(self, classifier, ngram_range=DEFAULT_NGRAM_RANGE, bits=DEFAULT_HASH_BITS,
+                 min_confidence=DEFAULT_MIN_CONFIDENCE):
+        self.classifier = classifier
+        self.ngram_range = tuple(ngram_range)
+        self.bits = bits
+        self.min_confidence = min_confidence
+        self.fingerprint = None
+
+    @classmethod
+    def train(cls, descriptions, categories, **options):
+        """
+        Fit a model on (description, category) pairs; needs scikit-learn
+        """
+        from sklearn.linear_model import SGDClassifier
+
+        model = cls(None, **options)
+        features = model.features(descriptions)
+        model.classifier = SGDClassifier(loss='log_loss', alpha=1e-6, max_iter=20, tol=None, random_state=0)
+        model.classifier.fit(features, list(categories))
+        return model
+
+    def features(self, descriptions):
+        return hash_features([normalize_description(description) for description in descriptions],
+                             self.ngram_range, self.bits)
+
+    def predict_many(self, descriptions):
+        """
+        Return a category per description, Uncategorized where the model is unsure.
+
+        Each distinct normalized description is scored once, in one sparse batch.
+        """
+        if not descriptions:
+            return []
+        keys = [normalize_description(description) for description in descriptions]
+        unique = list(dict.fromkeys(keys))
+        probabilities = self.classifier.predict_proba(hash_features(unique, self.ngram_range, self.bits))
+        best = probabilities.argmax(axis=1)
+        confident = probabilities[np.arange(len(unique)), best] >= self.min_confidence
+        labels = self.classifier.classes_[best].tolist()
+        predicted = {key: label if sure else UNCATEGORIZED
+                     for key, label, sure in zip(unique, labels, confident.tolist())}
+        return [predicted[key] for key in keys]
+
+    def save(self, path):
+        with open(path, 'wb') as model_file:
+            pickle.dump({
+                "format": MODEL_FORMAT,
+                "classifier": self.classifier,
+                "ngram_range": self.ngram_range,
+                "bits": self.bits,
+                "min_confidence": self.min_confidence
+            }, model_file)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a saved model; only load model files you trained yourself, as they are pickles
+        """
+        with open(path, 'rb') as model_file:
+            state = pickle.load(model_file)
+        if state.get("format") != MODEL_FORMAT:
+            raise ValueError(f"Unsupported category model format {state.get('format')!r}")
+        model = cls(state["classifier"], state["ngram_range"], state["bits"], state["min_confidence"])
+        stat = os.stat(path)
+        model.fingerprint = f"{stat.st_size}:{stat.st_mtime_ns}"
+        return model
+
+
+_model = None
+_model_key = None
+_model_lock = threading.Lock()
+
+
+def _model_path():
+    return os.environ.get('CATEGORY_MODEL_PATH', DEFAULT_MODEL_PATH)
+
+
+def get_ml_categorizer():
+    """
+    Return this process's model, loading it on first use; None when disabled,
+    missing or scikit-learn is not installed.
+
+    The file is stat'ed on every call, so retraining in place is picked up by
+    each server and parser process on its next statement.
+    """
+    global _model, _model_key
+    path = _model_path()
+    try:
+        stat = os.stat(path) if path else None
+    except OSError:
+        stat = None
+    key = (path, stat.st_size, stat.st_mtime_ns) if stat else None
+    if key != _model_key:
+        with _model_lock:
+            if key != _model_key:
+                _model = None
+                if key:
+                    try:
+                        _model = MLCategorizer.load(path)
+                        logger.info(f"Loaded category model from {path}")
+                    except ImportError:
+                        logger.warning(f"scikit-learn is not installed; ignoring category model {path}")
+                    except Exception as e:
+                        logger.error(f"Could not load category model {path}: {str(e)}")
+                _model_key = key
+    return _model
+
+
+def model_fingerprint():
+    """
+    Identify the loaded model for the parse cache fingerprint; None without one
+    """
+    model = get_ml_categorizer()
+    return model.fingerprint if model else None
+
+
+def fill_uncategorized(descriptions, categories):
+    """
+    Replace Uncategorized entries of categories with model predictions, in
+    place; returns how many were filled
+    """
+    model = get_ml_categorizer()
+    if model is None:
+        return 0
+    indexes = [index for index, category in enumerate(categories) if category == UNCATEGORIZED]
+    if not indexes:
+        return 0
+    filled = 0
+    for index, category in zip(indexes, model.predict_many([descriptions[index] for index in indexes])):
+        if category != UNCATEGORIZED:
+            categories[index] = category
+            filled += 1
+    return filled
+
+
+def fill_batch(batch):
+    """
+    Categorize a TransactionBatch's Uncategorized rows with the model, in place
+    """
+    model = get_ml_categorizer()
+    if model is None:
+        return 0
+    indexes = batch.indexes_of_category(UNCATEGORIZED)
+    if not indexes:
+        return 0
+    predicted = model.predict_many([batch.descriptions[index] for index in indexes])
+    filled = [(index, category) for index, category in zip(indexes, predicted) if category != UNCATEGORIZED]
+    batch.set_categories(filled)
+    return len(filled)
+
+
+def labelled_from_store(path):
+    """
+    Return (descriptions, categories) of the transactions in a store whose
+    category the statement supplied, in the store's app categories.
+
+    Rows the keyword rules or the model itself categorized would only teach
+    the model to repeat them (see transaction_store.category_source).
+    Statement category names are translated with STATEMENT_CATEGORIES.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        categories = json.loads(conn.execute(
+            "SELECT value FROM settings WHERE key = 'category_keywords'").fetchone()[0])
+        rows = conn.execute("SELECT description, category FROM transactions "
+                            "WHERE category_source = 'statement'").fetchall()
+    finally:
+        conn.close()
+    rows = [(description, STATEMENT_CATEGORIES.get(category, category)) for description, category in rows]
+    rows = [row for row in rows if row[1] in categories]
+    return [row[0] for row in rows], [row[1] for row in rows]
+
+
+def labelled_from_csv(path):
+    """
+    Return (descriptions, categories) from a CSV with description and category columns
+    """
+    with open(path, newline='') as csv_file:
+        rows = [(row["description"], row["category"]) for row in csv.DictReader(csv_file)
+                if row.get("category") and row["category"] != UNCATEGORIZED]
+    return [row[0] for row in rows], [row[1] for row in rows]
+
+
+def main():
+    """
+    Train offline from labelled transactions, e.g. the rows of the transaction
+    store categorized by their statement (Discover statements carry their own
+    categories):
+        python -m ml_categorizer --store transactions.sqlite3 --output category_model.pkl
+        python -m ml_categorizer --csv labelled.csv --output category_model.pkl
+    """
+    parser = argparse.ArgumentParser(description='Train the fallback category model')
+    parser.add_argument('--store', help='transaction store to take categorized rows from')
+    parser.add_argument('--csv', help='CSV file with description and category columns')
+    parser.add_argument('--output', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--min-confidence', type=float, default=DEFAULT_MIN_CONFIDENCE)
+    parser.add_argument('--holdout', type=float, default=0.2, help='fraction of rows held out to report accuracy')
+    args = parser.parse_args()
+    if not args.store and not args.csv:
+        parser.error('give --store and/or --csv')
+
+    descriptions, categories = [], []
+    for path, load in ((args.store, labelled_from_store), (args.csv, labelled_from_csv)):
+        if path:
+            more_descriptions, more_categories = load(path)
+            descriptions += more_descriptions
+            categories += more_categories
+    if len(set(categories)) < 2:
+        raise SystemExit(f"need at least two categories to train, found {sorted(set(categories))}")
+
+    order = np.random.default_rng(0).permutation(len(descriptions))
+    split = int(len(order) * (1 - args.holdout))
+    if 0 < split < len(order):
+        train_rows, test_rows = order[:split].tolist(), order[split:].tolist()
+        model = MLCategorizer.train([descriptions[i] for i in train_rows], [categories[i] for i in train_rows],
+                                    min_confidence=0)
+        predicted = model.predict_many([descriptions[i] for i in test_rows])
+        accuracy = sum(predicted[j] == categories[i] for j, i in enumerate(test_rows)) / len(test_rows)
+        print(f"held-out accuracy: {accuracy:.1%} on {len(test_rows):,} rows")
+
+    model = MLCategorizer.train(descriptions, categories, min_confidence=args.min_confidence)
+    model.save(args.output)
+    print(f"trained on {len(descriptions):,} rows, {len(model.classifier.classes_)} categories -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from bank_formats import registry
+from categorizer import current_category_keywords
+from ml_categorizer import model_fingerprint
+from transaction_batch import TransactionBatch
+
+logger = logging.getLogger(__name__)
+
+# Bump when parsing code changes in a way the format specs/category rules don't show
+PARSER_VERSION = 3
+
+DEFAULT_PARSE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+def parser_fingerprint(layout=False):
+    """
+    Fingerprint of everything that shapes a parse result besides the PDF bytes;
+    layout is whether table sections are read by column position
+    """
+    # Short dates are parsed into the current year, so a new year changes results
+    state = json.dumps([PARSER_VERSION, datetime.now().year, registry.fingerprint(), current_category_keywords(),
+                        model_fingerprint(), layout])
+    return hashlib.sha256(state.encode()).hexdigest()[:16]
+
+
+def sha256_stream(stream, chunk_size=1024 * 1024):
+    """
+    Hash a binary stream from its current position; returns (hexdigest, size)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def encode_statement(statement_data):
+    """
+    Compress statement data for storage; transactions are kept as their columns
+    """
+    return zlib.compress(json.dumps(
+        {**statement_data, "transactions": statement_data["transactions"].to_columns()}).encode())
+
+
+def decode_statement(payload):
+    """
+    Inverse of encode_statement
+    """
+    statement_data = json.loads(zlib.decompress(payload))
+    statement_data["transactions"] = TransactionBatch.from_columns(statement_data["transactions"])
+    return statement_data
+
+
+def content_key(sha256_hex, fingerprint):
+    """
+    Cache key for an uploaded PDF's SHA-256 under a parser fingerprint
+    """
+    return f"{sha256_hex}:{fingerprint}"
+
+
+class ParseCache:
+    """
+    Persistent SQLite store of parse results keyed on PDF content hash.
+
+    Entries are evicted least-recently-used first once the stored payloads
+    exceed max_bytes.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_PARSE_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS parse_cache (
+                    key TEXT PRIMARY KEY,
+                    payload BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS parse_cache_last_used ON parse_cache (last_used)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        """
+        Return the stored statement data for key, or None
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT payload FROM parse_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE parse_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return decode_statement(row[0])
+
+    def put(self, key, statement_data):
+        """
+        Store statement data under key and evict old entries past max_bytes
+        """
+        payload = encode_statement(statement_data)
+        evicted = 0
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO parse_cache (key, payload, size, last_used) VALUES (?, ?, ?, ?)",
+                         (key, payload, len(payload), time.time()))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM parse_cache").fetchone()[0]
+            if total > self.max_bytes:
+                for old_key, size in conn.execute(
+                        "SELECT key, size FROM parse_cache ORDER BY last_used").fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute("DELETE FROM parse_cache WHERE key = ?", (old_key,))
+                    total -= size
+                    evicted += 1
+        if evicted:
+            logger.info(f"Evicted {evicted} parse cache entries")
+            with self._lock:
+                self.evictions += evicted
+
+    def info(self):
+        """
+        Return hit-rate metrics and the size of the store
+        """
+        with self._connect() as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM parse_cache").fetchone()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": entries,
+                "bytes": size,
+                "max_bytes": self.max_bytes
+            }
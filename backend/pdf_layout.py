@@ -0,0 +1,284 @@
+import logging
+from PyPDF2.generic import ContentStream
+
+logger = logging.getLogger(__name__)
+
+# Advance width (per 1000 units of font size) of glyphs whose font declares none
+DEFAULT_GLYPH_WIDTH = 500
+
+# TJ adjustments (thousandths of an em) wider than this start a new run; smaller ones wider than
+# SPACE_ADJUSTMENT read as a space
+RUN_BREAK_ADJUSTMENT = 1000
+SPACE_ADJUSTMENT = 200
+
+# Runs closer than this many font sizes vertically share a row; horizontally, they share a cell,
+# with a space between them when further apart than CELL_SPACE
+ROW_TOLERANCE = 0.5
+CELL_GAP = 1.0
+CELL_SPACE = 0.15
+
+IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+
+def _multiply(m, n):
+    return (m[0] * n[0] + m[1] * n[2], m[0] * n[1] + m[1] * n[3],
+            m[2] * n[0] + m[3] * n[2], m[2] * n[1] + m[3] * n[3],
+            m[4] * n[0] + m[5] * n[2] + n[4], m[4] * n[1] + m[5] * n[3] + n[5])
+
+
+class _Font:
+    """
+    Decoding and glyph widths of one font resource, built on PyPDF2's char maps
+    """
+
+    def __init__(self, name, owner):
+        from PyPDF2._cmap import build_char_map
+
+        _, _, self.encoding, self.to_unicode, font = build_char_map(name, 200.0, owner)
+        self.code_bytes = 2 if self.to_unicode.get(-1) == 2 else 1
+        self.widths = {}
+        self.default_width = DEFAULT_GLYPH_WIDTH
+        if font.get('/Subtype') == '/Type0':
+            descendant = font['/DescendantFonts'][0].get_object()
+            self.default_width = float(descendant.get('/DW', 1000))
+            self._read_cid_widths(descendant.get('/W', []))
+        elif '/Widths' in font:
+            first = int(font.get('/FirstChar', 0))
+            self.widths = {first + index: float(width) for index, width in enumerate(font['/Widths'])}
+            descriptor = font.get('/FontDescriptor')
+            if descriptor is not None and '/MissingWidth' in descriptor.get_object():
+                self.default_width = float(descriptor.get_object()['/MissingWidth'])
+
+    def _read_cid_widths(self, entries):
+        # Either "first [w1 w2 ...]" or "first last w"
+        entries = list(entries)
+        index = 0
+        while index + 1 < len(entries):
+            first = int(entries[index])
+            following = entries[index + 1]
+            if isinstance(following, list):
+                for offset, width in enumerate(following):
+                    self.widths[first + offset] = float(width)
+                index += 2
+            else:
+                for code in range(first, int(following) + 1):
+                    self.widths[code] = float(entries[index + 2])
+                index += 3
+
+    def decode(self, raw):
+        """
+        Return (text, advance in thousandths of an em, character codes, space codes)
+        """
+        if isinstance(self.encoding, str):
+            try:
+                text = raw.decode(self.encoding, 'surrogatepass')
+            except Exception:
+                text = raw.decode('utf-16-be' if self.encoding == 'charmap' else 'charmap', 'surrogatepass')
+        else:
+            text = ''.join(self.encoding.get(byte, chr(byte)) for byte in raw)
+        if self.to_unicode:
+            text = ''.join(self.to_unicode.get(char, char) for char in text)
+        if self.code_bytes == 2:
+            codes = [int.from_bytes(raw[i:i + 2], 'big') for i in range(0, len(raw) - 1, 2)]
+        else:
+            codes = raw
+        width = sum(self.widths.get(code, self.default_width) for code in codes)
+        spaces = raw.count(32) if self.code_bytes == 1 else 0
+        return text, width, len(codes), spaces
+
+
+class _PageRuns:
+    """
+    Walks a content stream, tracking the text and graphics state, and
+    collects positioned text runs: (x0, x1, y, font size, text). Text shown
+    in a font that is missing or cannot be decoded raises ValueError rather
+    than being left out of the runs.
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.runs = []
+
+    def walk(self, owner, content, ctm=IDENTITY, depth=0):
+        resources = owner.get('/Resources')
+        resources = resources.get_object() if resources is not None else {}
+        font_resources = resources.get('/Font')
+        font_resources = font_resources.get_object() if font_resources is not None else {}
+        fonts = {}
+        # Why each font that cannot be used was rejected
+        font_errors = {}
+        stack = []
+        font = font_name = None
+        size = 12.0
+        char_spacing = word_spacing = leading = 0.0
+        scale = 1.0
+        text_matrix = line_matrix = IDENTITY
+        run = None
+
+        def start_run():
+            nonlocal run
+            if run and run[4].strip():
+                self.runs.append(tuple(run))
+            run = None
+
+        def show(raw):
+            nonlocal text_matrix, run
+            if font is None:
+                if font_name is None:
+                    raise ValueError("Text shown before any font was selected")
+                raise ValueError(f"Cannot decode text in font {font_name}: {font_errors[font_name]}")
+            if isinstance(raw, str):
+                raw = raw.encode('latin-1', 'replace')
+            text, width, count, spaces = font.decode(bytes(raw))
+            advance = (width / 1000 * size + char_spacing * count + word_spacing * spaces) * scale
+            matrix = _multiply(text_matrix, ctm)
+            x, y = matrix[4], matrix[5]
+            rendered_size = size * abs(matrix[3]) if matrix[3] else size
+            if run is None:
+                run = [x, x, y, rendered_size, '']
+            run[1] = x + advance * (matrix[0] or 1)
+            run[4] += text
+            text_matrix = (text_matrix[0], text_matrix[1], text_matrix[2], text_matrix[3],
+                           text_matrix[4] + advance * text_matrix[0], text_matrix[5] + advance * text_matrix[1])
+
+        def move(tx, ty):
+            nonlocal text_matrix, line_matrix
+            start_run()
+            line_matrix = _multiply((1.0, 0.0, 0.0, 1.0, tx, ty), line_matrix)
+            text_matrix = line_matrix
+
+        if not isinstance(content, ContentStream):
+            content = ContentStream(content, self.reader, 'bytes')
+        for operands, operator in content.operations:
+            if operator == b'Tj':
+                show(operands[0])
+            elif operator == b'TJ':
+                for item in operands[0]:
+                    if isinstance(item, (bytes, str)):
+                        show(item)
+                        continue
+                    adjustment = float(item)
+                    if -adjustment > RUN_BREAK_ADJUSTMENT:
+                        start_run()
+                    elif -adjustment > SPACE_ADJUSTMENT and run is not None and not run[4].endswith(' '):
+                        run[4] += ' '
+                    shift = -adjustment / 1000 * size * scale
+                    text_matrix = (text_matrix[0], text_matrix[1], text_matrix[2], text_matrix[3],
+                                   text_matrix[4] + shift * text_matrix[0], text_matrix[5] + shift * text_matrix[1])
+            elif operator in (b"'", b'"'):
+                if operator == b'"':
+                    word_spacing, char_spacing = float(operands[0]), float(operands[1])
+                move(0, -leading)
+                show(operands[-1])
+            elif operator == b'Td':
+                move(float(operands[0]), float(operands[1]))
+            elif operator == b'TD':
+                leading = -float(operands[1])
+                move(float(operands[0]), float(operands[1]))
+            elif operator == b'T*':
+                move(0, -leading)
+            elif operator == b'Tm':
+                start_run()
+                text_matrix = line_matrix = tuple(float(value) for value in operands)
+            elif operator == b'BT':
+                start_run()
+                text_matrix = line_matrix = IDENTITY
+            elif operator == b'ET':
+                start_run()
+            elif operator == b'Tf':
+                name = operands[0]
+                if name not in fonts:
+                    fonts[name] = None
+                    if name not in font_resources:
+                        font_errors[name] = "not in the page resources"
+                    else:
+                        try:
+                            fonts[name] = _Font(name, owner)
+                        except Exception as e:
+                            logger.debug("Cannot decode font %s: %s", name, e)
+                            font_errors[name] = str(e)
+                font = fonts[name]
+                font_name = name
+                size = float(operands[1])
+            elif operator == b'Tc':
+                char_spacing = float(operands[0])
+            elif operator == b'Tw':
+                word_spacing = float(operands[0])
+            elif operator == b'Tz':
+                scale = float(operands[0]) / 100
+            elif operator == b'TL':
+                leading = float(operands[0])
+            elif operator == b'q':
+                stack.append((ctm, font, font_name, size, char_spacing, word_spacing, scale, leading))
+            elif operator == b'Q' and stack:
+                ctm, font, font_name, size, char_spacing, word_spacing, scale, leading = stack.pop()
+            elif operator == b'cm':
+                start_run()
+                ctm = _multiply(tuple(float(value) for value in operands), ctm)
+            elif operator == b'Do' and depth < 4:
+                self._form(resources, operands[0], ctm, depth)
+        start_run()
+
+    def _form(self, resources, name, ctm, depth):
+        xobjects = resources.get('/XObject')
+        if xobjects is None or name not in xobjects.get_object():
+            return
+        form = xobjects.get_object()[name].get_object()
+        if form.get('/Subtype') != '/Form':
+            return
+        matrix = tuple(float(value) for value in form.get('/Matrix', IDENTITY))
+        self.walk(form, form, _multiply(matrix, ctm), depth + 1)
+
+
+def page_runs(page):
+    """
+    Return the positioned text runs of a PyPDF2 page as (x0, x1, y, font size, text)
+    tuples in content order; x1 is estimated from the font's glyph widths
+    """
+    contents = page.get_contents()
+    if contents is None:
+        return []
+    collector = _PageRuns(page.pdf)
+    collector.walk(page, contents)
+    return collector.runs
+
+
+def group_rows(runs):
+    """
+    Group text runs into rows, top to bottom, of cells left to right.
+
+    Each row is (y, cells) with cells as (x0, x1, text): runs on one
+    baseline closer than CELL_GAP font sizes are joined into one cell.
+    """
+    rows = []
+    for x0, x1, y, size, text in sorted(runs, key=lambda run: (-run[2], run[0])):
+        if rows and rows[-1][0] - y <= ROW_TOLERANCE * size:
+            rows[-1][1].append((x0, x1, size, text))
+        else:
+            rows.append((y, [(x0, x1, size, text)]))
+
+    result = []
+    for y, row_runs in rows:
+        row_runs.sort()
+        cells = []
+        for x0, x1, size, text in row_runs:
+            if cells and x0 - cells[-1][1] < CELL_GAP * size:
+                previous_x0, previous_x1, previous_text = cells[-1]
+                joiner = ' ' if x0 - previous_x1 > CELL_SPACE * size else ''
+                cells[-1] = (previous_x0, max(previous_x1, x1), (previous_text.rstrip() + joiner + text.lstrip())
+                             if joiner else previous_text + text)
+            else:
+                cells.append((x0, x1, text))
+        result.append((y, [(x0, x1, text.strip()) for x0, x1, text in cells]))
+    return result
+
+
+def page_layout(page):
+    """
+    Return (page text, rows) for a PyPDF2 page, rebuilt from positioned runs.
+
+    The text has one line per row with its cells joined by single spaces,
+    so it reads like PyPDF2's extract_text for the regex parsers.
+    """
+    rows = group_rows(page_runs(page))
+    return ''.join(' '.join(cell[2] for cell in cells) + '\n' for _, cells in rows), rows
@@ -0,0 +1,129 @@
+import numpy as np
+
+# (cadence, period in days, tolerance in days, minimum charges)
+CADENCES = (
+    ('weekly', 7.0, 2.0, 4),
+    ('biweekly', 14.0, 3.0, 3),
+    ('monthly', 30.44, 4.0, 3),
+    ('quarterly', 91.31, 8.0, 3),
+    ('annual', 365.25, 15.0, 2),
+)
+CADENCE_PERIODS = {name: period for name, period, _, _ in CADENCES}
+CADENCE_TOLERANCES = {name: tolerance for name, _, tolerance, _ in CADENCES}
+
+# Share of a merchant's intervals, and of its amount changes, that must fit the cadence
+MIN_REGULARITY = 0.75
+
+# A charge within this fraction of the previous one, or this many cents, is the same amount;
+# comparing neighbours rather than the median lets a price rise keep the subscription
+AMOUNT_TOLERANCE = 0.15
+AMOUNT_TOLERANCE_CENTS = 200
+
+# Only each merchant's latest charges are considered, so a store can refresh
+# a merchant from an index range instead of its whole history
+HISTORY_CHARGES = 24
+
+
+def _groups(merchants):
+    """
+    Return (group start flags, starts, counts, group of each row) of rows sorted by merchant
+    """
+    new_group = np.concatenate(([True], merchants[1:] != merchants[:-1]))
+    starts = np.flatnonzero(new_group)
+    counts = np.diff(np.append(starts, len(merchants)))
+    return new_group, starts, counts, np.cumsum(new_group) - 1
+
+
+def _group_median(values, group_codes, starts, counts):
+    """
+    Median of values per group, where rows are sorted by group and each
+    group's rows start at starts
+    """
+    ordered = values[np.lexsort((values, group_codes))].astype(np.float64)
+    return (ordered[starts + (counts - 1) // 2] + ordered[starts + counts // 2]) / 2
+
+
+def detect(merchant_codes, days, cents):
+    """
+    Find recurring charges in columnar transactions.
+
+    merchant_codes are integer merchant ids, days are days since the epoch and
+    cents the (positive) charge amounts. Rows are sorted by merchant and day
+    once, so interval and amount statistics are per-group NumPy reductions
+    instead of pairwise comparisons: O(n log n) overall. Each merchant's
+    latest HISTORY_CHARGES charges are considered.
+
+    Returns one dict per recurring merchant: merchant (code), cadence, period,
+    amount (latest charge, cents), count, first_day, last_day, next_day,
+    regularity and last (row index of its latest charge).
+    """
+    merchant_codes = np.asarray(merchant_codes, dtype=np.int64)
+    days = np.asarray(days, dtype=np.int64)
+    cents = np.asarray(cents, dtype=np.int64)
+    if len(days) < 2:
+        return []
+
+    order = np.lexsort((days, merchant_codes))
+    _, starts, counts, groups = _groups(merchant_codes[order])
+    # Drop all but each merchant's latest charges
+    order = order[(starts + counts)[groups] - np.arange(len(order)) <= HISTORY_CHARGES]
+    merchants = merchant_codes[order]
+    days = days[order]
+    cents = cents[order]
+    new_group, starts, counts, groups = _groups(merchants)
+
+    # Intervals between consecutive charges of the same merchant; group g's
+    # counts[g] - 1 intervals start at starts[g] - g once the others are dropped
+    same = ~new_group[1:]
+    intervals = np.diff(days)[same]
+    interval_groups = groups[1:][same]
+    has_intervals = counts > 1
+    interval_starts = starts - np.arange(len(starts))
+    interval_counts = counts - 1
+
+    median_interval = np.zeros(len(starts))
+    median_interval[has_intervals] = _group_median(
+        intervals, interval_groups, interval_starts[has_intervals], interval_counts[has_intervals])
+
+    # Cadence whose period the median interval falls within tolerance of
+    cadence = np.full(len(starts), -1)
+    period = np.zeros(len(starts))
+    tolerance = np.zeros(len(starts))
+    min_count = np.zeros(len(starts), dtype=np.int64)
+    for index, (_, cadence_period, cadence_tolerance, cadence_min) in enumerate(CADENCES):
+        fits = has_intervals & (cadence < 0) & (np.abs(median_interval - cadence_period) <= cadence_tolerance)
+        cadence[fits] = index
+        period[fits] = cadence_period
+        tolerance[fits] = cadence_tolerance
+        min_count[fits] = cadence_min
+
+    on_time = np.abs(intervals - period[interval_groups]) <= tolerance[interval_groups]
+    regularity = np.zeros(len(starts))
+    regularity[has_intervals] = (np.bincount(interval_groups, weights=on_time, minlength=len(starts))
+                                 [has_intervals] / interval_counts[has_intervals])
+
+    previous = cents[:-1][same]
+    same_amount = np.abs(cents[1:][same] - previous) <= np.maximum(previous * AMOUNT_TOLERANCE,
+                                                                   AMOUNT_TOLERANCE_CENTS)
+    amount_regularity = np.zeros(len(starts))
+    amount_regularity[has_intervals] = (np.bincount(interval_groups, weights=same_amount, minlength=len(starts))
+                                        [has_intervals] / interval_counts[has_intervals])
+
+    recurring = np.flatnonzero((cadence >= 0) & (counts >= min_count) & (regularity >= MIN_REGULARITY)
+                               & (amount_regularity >= MIN_REGULARITY))
+    ends = starts + counts - 1
+    return [
+        {
+            "merchant": int(merchants[starts[group]]),
+            "cadence": CADENCES[cadence[group]][0],
+            "period": float(period[group]),
+            "amount": int(cents[ends[group]]),
+            "count": int(counts[group]),
+            "first_day": int(days[starts[group]]),
+            "last_day": int(days[ends[group]]),
+            "next_day": int(days[ends[group]] + round(period[group])),
+            "regularity": round(float(min(regularity[group], amount_regularity[group])), 3),
+            "last": int(order[ends[group]])
+        }
+        for group in recurring.tolist()
+    ]
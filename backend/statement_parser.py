@@ -0,0 +1,234 @@
+import io
+import re
+import time
+import logging
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+import metrics
+from bank_formats import DEFAULT_MAX_FALLBACK_ROWS, registry
+
+logger = logging.getLogger(__name__)
+
+# Pages scanned to identify the bank before falling back to the whole document
+IDENTIFY_PAGES = 2
+
+# Documents with at least this many pages may be split across page workers
+PARALLEL_PAGE_THRESHOLD = 100
+
+class ParseLimitExceeded(Exception):
+    """
+    A parse refused or stopped for going over one of its resource limits
+    """
+
+def iter_page_text(pdf_reader, start=0, stop=None):
+    """
+    Yield the text of each page in [start, stop), one page at a time
+    """
+    if stop is None:
+        stop = len(pdf_reader.pages)
+    for page_num in range(start, stop):
+        yield pdf_reader.pages[page_num].extract_text() + "\n"
+
+def iter_page_layout(pdf_reader, start=0, stop=None):
+    """
+    Yield (text, rows) for each page in [start, stop), rebuilt from the
+    page's positioned text runs; rows are (page, y, cells) tuples, or None
+    for a page whose runs could not be read, which falls back to extract_text
+    """
+    from pdf_layout import page_layout
+
+    if stop is None:
+        stop = len(pdf_reader.pages)
+    for page_num in range(start, stop):
+        page = pdf_reader.pages[page_num]
+        try:
+            text, rows = page_layout(page)
+        except Exception as e:
+            logger.warning(f"Could not read the layout of page {page_num + 1}: {str(e)}")
+            yield page.extract_text() + "\n", None
+            continue
+        yield text, [(page_num, y, cells) for y, cells in rows]
+
+@contextmanager
+def open_pdf_source(source):
+    """
+    Open a PDF given as a file path, raw bytes or a binary stream
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield io.BytesIO(source)
+    elif hasattr(source, 'read'):
+        yield source
+    else:
+        with open(source, 'rb') as file:
+            yield file
+
+def describe_pdf_source(source):
+    """
+    Short description of a PDF source for log messages
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return f"<{len(source)} bytes in memory>"
+    if hasattr(source, 'read'):
+        return f"<stream {getattr(source, 'name', type(source).__name__)}>"
+    return str(source)
+
+def iter_pages(pdf_reader, start=0, stop=None, layout=False):
+    """
+    Yield (text, layout rows) per page; rows are None without layout
+    """
+    if layout:
+        return iter_page_layout(pdf_reader, start, stop)
+    return ((text, None) for text in iter_page_text(pdf_reader, start, stop))
+
+def _extract_page_range(source, start, stop, layout=False):
+    """
+    Worker entry point: extract the text (and layout) of one page range
+    """
+    import PyPDF2
+
+    with open_pdf_source(source) as file:
+        return list(iter_pages(PyPDF2.PdfReader(file), start, stop, layout))
+
+def iter_pages_parallel(source, page_count, page_workers, layout=False):
+    """
+    Yield pages extracted by worker processes, in page order
+    """
+    # Several ranges per worker so the first pages come back early
+    chunk_size = max(1, -(-page_count // (page_workers * 4)))
+    pool = ProcessPoolExecutor(max_workers=page_workers)
+    finished = False
+    try:
+        futures = [pool.submit(_extract_page_range, source, start, min(start + chunk_size, page_count), layout)
+                   for start in range(0, page_count, chunk_size)]
+        for future in futures:
+            yield from future.result()
+        finished = True
+    finally:
+        # Stopped early (a parse error, or the parse timeout): stop the workers rather than wait for their ranges
+        processes = [] if finished else list((pool._processes or {}).values())
+        pool.shutdown(wait=finished, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+def parse_pdf(source, page_workers=0, layout=False, max_pages=None, max_fallback_rows=DEFAULT_MAX_FALLBACK_ROWS):
+    """
+    Parse a PDF (path, bytes or binary stream) to extract bank statement information.
+
+    With layout, page text is rebuilt from positioned text runs and table
+    sections are read by column position; otherwise, the default until it
+    has been checked against more real statements, PyPDF2's extract_text
+    feeds the regex parsers alone. Documents of more than max_pages pages
+    are refused before any text is extracted; max_fallback_rows caps the
+    looser passes run when no transaction section matches.
+    """
+    # Imported on first parse, so processes that never read a PDF do not load it
+    import PyPDF2
+
+    logger.debug("Parsing PDF file: %s", describe_pdf_source(source))
+    try:
+        start = time.perf_counter()
+        with open_pdf_source(source) as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            page_count = len(pdf_reader.pages)
+            metrics.PAGES_PER_FILE.observe(page_count)
+            if max_pages is not None and page_count > max_pages:
+                metrics.PARSE_LIMITS.inc(limit='pages')
+                raise ParseLimitExceeded(f"PDF has {page_count} pages; at most {max_pages} are parsed")
+            
+            # Extract text page by page, splitting very large documents across processes
+            if page_workers > 1 and page_count >= PARALLEL_PAGE_THRESHOLD:
+                logger.debug(f"Extracting {page_count} pages with {page_workers} workers")
+                if hasattr(source, 'read'):
+                    # Worker processes need something they can unpickle
+                    file.seek(0)
+                    source = file.read()
+                pages = iter_pages_parallel(source, page_count, page_workers, layout)
+            else:
+                pages = iter_pages(pdf_reader, layout=layout)
+            
+            # The bank is nearly always named on the first page or two
+            first_pages = list(islice(pages, IDENTIFY_PAGES))
+            identify_start = time.perf_counter()
+            bank_type = identify_bank_type("".join(text for text, _ in first_pages))
+            text_start = time.perf_counter()
+            texts = []
+            rows = [] if layout else None
+            for text, page_rows in chain(first_pages, pages):
+                texts.append(text)
+                if rows is None:
+                    continue
+                if page_rows is None:
+                    # A page without layout leaves the whole document to the regex parsers
+                    rows = None
+                else:
+                    rows.extend(page_rows)
+            full_text = "".join(texts)
+            # Pages are extracted lazily, on both sides of the identification
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - text_start + identify_start - start,
+                                          stage='pdf_text')
+            metrics.STAGE_SECONDS.observe(text_start - identify_start, stage='identify')
+            
+            logger.debug("First 200 characters of PDF: %.200s", full_text)
+            
+            # Fall back to the whole document if the first pages were not enough
+            if not bank_type and page_count > IDENTIFY_PAGES:
+                with metrics.timed('identify'):
+                    bank_type = identify_bank_type(full_text)
+            
+            statement = parse_statement_text(full_text, bank_type, rows, max_fallback_rows)
+        elapsed = time.perf_counter() - start
+        metrics.STAGE_SECONDS.observe(elapsed, stage='parse_pdf')
+        rows = len(statement.get("transactions", ()))
+        metrics.PARSED_ROWS.inc(rows)
+        if rows and elapsed > 0:
+            metrics.ROWS_PER_SECOND.observe(rows / elapsed)
+        return statement
+    except (ParseLimitExceeded, MemoryError):
+        raise
+    except Exception as e:
+        logger.error(f"Error parsing PDF: {str(e)}")
+        raise Exception(f"Error parsing PDF: {str(e)}")
+
+def parse_statement_text(full_text, bank_type=None, layout=None, max_fallback_rows=DEFAULT_MAX_FALLBACK_ROWS):
+    """
+    Parse extracted statement text, falling back to keyword checks when the
+    bank type is not known; layout is the text's positioned rows, if any
+    """
+    if bank_type:
+        logger.info(f"Identified bank type: {bank_type}")
+        # Extract statement information based on bank type
+        return extract_statement_info(full_text, bank_type, layout, max_fallback_rows)
+    else:
+        # If bank type cannot be determined, try a fallback
+        logger.warning("Bank type not identified. Checking for known keywords...")
+        
+        bank_type = registry.identify_by_keyword(full_text)
+        metrics.PARSE_FALLBACKS.inc(path='keyword_detection' if bank_type else 'unsupported')
+        if bank_type:
+            name = registry[bank_type].name
+            logger.info(f"Found {name} keyword. Using {name} format.")
+            return extract_statement_info(full_text, bank_type, layout, max_fallback_rows)
+        else:
+            logger.error("Unsupported bank statement format")
+            return {
+                "error": f"Unsupported bank statement format. Currently supporting {registry.supported_names()} statements."
+            }
+
+def identify_bank_type(text):
+    """
+    Identify the bank type based on header patterns
+    """
+    return registry.identify(text)
+
+def extract_statement_info(text, bank_type, layout=None, max_fallback_rows=DEFAULT_MAX_FALLBACK_ROWS):
+    """
+    Extract statement information based on the bank type
+    """
+    return registry[bank_type].extract_statement_info(text, layout, max_fallback_rows)
+
+def extract_transactions(text, bank_type):
+    """
+    Extract transactions from statement text based on bank type
+    """
+    return registry[bank_type].extract_transactions(text)
@@ -0,0 +1,69 @@
+import os
+import pytest
+import bank_formats
+from categorizer import use_stored_rules
+from datetime import datetime
+from transaction_store import TransactionStore
+
+
+class FrozenDatetime(datetime):
+    """
+    datetime whose now() is pinned so short dates parse into a fixed year
+    """
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2024, 6, 1, tzinfo=tz)
+
+
+@pytest.fixture(autouse=True)
+def builtin_rules():
+    # An app points the categorizer at its store's rules; the next test starts from CATEGORY_KEYWORDS
+    yield
+    use_stored_rules(None)
+
+
+@pytest.fixture
+def frozen_year(monkeypatch):
+    monkeypatch.setattr(bank_formats, 'datetime', FrozenDatetime)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TransactionStore(str(tmp_path / 'transactions.sqlite3'))
+
+
+@pytest.fixture
+def app_config(tmp_path):
+    """
+    Settings for a test app whose stores all live in tmp_path
+    """
+    return {
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        'PARSE_CACHE_PATH': str(tmp_path / 'parse_cache.sqlite3'),
+        'TRANSACTION_STORE_PATH': str(tmp_path / 'transactions.sqlite3'),
+        'JOBS_PATH': str(tmp_path / 'jobs.sqlite3'),
+        'PARSE_WORKERS': 0,
+    }
+
+
+@pytest.fixture
+def app(app_config):
+    from app import create_app
+
+    return create_app(app_config)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def upload(client, *pdfs, path='/api/parse-statements', **kwargs):
+    """
+    POST PDFs (name, bytes) to an upload endpoint
+    """
+    import io
+
+    data = {'files': [(io.BytesIO(content), name) for name, content in pdfs]}
+    return client.post(path, data=data, content_type='multipart/form-data', **kwargs)
@@ -0,0 +1,124 @@
+import time
+import multiprocessing
+import pytest
+import admission as admission_module
+from admission import Overloaded, ParseAdmission
+from benchmarks.synthetic import statement_pdf
+from tests.conftest import upload
+
+
+def test_queue_limit():
+    admission = ParseAdmission('test', queue_limit=3, tenant_limit=0, workers=1)
+    release = admission.acquire('a', 2)
+    with pytest.raises(Overloaded) as error:
+        admission.acquire('b', 2)
+    assert error.value.retry_after >= 1
+    admission.acquire('b', 1)
+    release()
+    assert admission.in_flight() == 1
+
+
+def test_tenant_limit():
+    admission = ParseAdmission('test', queue_limit=0, tenant_limit=2, workers=1)
+    admission.acquire('a', 2)
+    with pytest.raises(Overloaded):
+        admission.acquire('a', 1)
+    admission.acquire('b', 2)
+    assert (admission.in_flight('a'), admission.in_flight('b'), admission.in_flight()) == (2, 2, 4)
+
+
+def test_oversized_request_is_admitted_when_nothing_is_in_flight():
+    admission = ParseAdmission('test', queue_limit=2, tenant_limit=1, workers=1)
+    release = admission.acquire('a', 5)
+    with pytest.raises(Overloaded):
+        admission.acquire('b', 1)
+    release()
+    admission.acquire('b', 1)
+
+
+def test_release_is_idempotent():
+    admission = ParseAdmission('test', queue_limit=2, tenant_limit=0, workers=1)
+    release = admission.acquire('a', 2)
+    release()
+    release()
+    assert admission.in_flight() == 0 and admission.in_flight('a') == 0
+
+
+def test_retry_after_scales_with_backlog_and_workers():
+    admission = ParseAdmission('test', queue_limit=1, tenant_limit=0, workers=2)
+    assert admission.retry_after(10, file_seconds=3) == 15
+    assert admission.retry_after(1, file_seconds=0.1) == 1
+
+
+def test_processes_sharing_a_path_share_the_limits(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite3')
+    # As two server processes would have them
+    admission, other = (ParseAdmission('test', queue_limit=2, tenant_limit=0, workers=1, path=path) for _ in range(2))
+    release = admission.acquire('a', 2)
+    with pytest.raises(Overloaded):
+        other.acquire('b', 1)
+    release()
+    other.acquire('b', 1)
+    assert admission.in_flight('b') == 1
+
+
+def test_places_without_a_heartbeat_are_given_back(tmp_path, monkeypatch):
+    monkeypatch.setattr(admission_module, 'ADMISSION_HEARTBEAT', 0.1)
+    monkeypatch.setattr(admission_module, 'ADMISSION_EXPIRY', 0.5)
+    path = str(tmp_path / 'jobs.sqlite3')
+    admission, other = (ParseAdmission('test', queue_limit=2, tenant_limit=0, workers=1, path=path) for _ in range(2))
+    # Admitted by a process that exits without releasing them
+    process = multiprocessing.get_context('fork').Process(target=admission.acquire, args=('a', 1))
+    process.start()
+    process.join()
+    # and by a live one, whose heartbeat keeps them
+    admission.acquire('b', 1)
+    time.sleep(1)
+    other.acquire('c', 1)
+    assert (admission.in_flight('a'), admission.in_flight('b'), admission.in_flight()) == (0, 1, 2)
+
+
+def test_default_limits_cover_every_server_process(monkeypatch):
+    from app import default_config
+
+    for name in ('PARSE_QUEUE_LIMIT', 'PARSE_TENANT_LIMIT', 'JOBS_PATH'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('WEB_CONCURRENCY', '3')
+    monkeypatch.setenv('PARSE_WORKERS', '2')
+    config = default_config()
+    assert (config['PARSE_QUEUE_LIMIT'], config['PARSE_TENANT_LIMIT']) == (24, 3)
+    # Without the job store to share them, each server process counts its own
+    monkeypatch.setenv('JOBS_PATH', '')
+    config = default_config()
+    assert (config['PARSE_QUEUE_LIMIT'], config['PARSE_TENANT_LIMIT']) == (8, 1)
+
+@pytest.fixture
+def limited_config(app_config):
+    app_config.update({'PARSE_TENANT_LIMIT': 1, 'PARSE_QUEUE_LIMIT': 2, 'JOB_TENANT_LIMIT': 1})
+    return app_config
+
+
+def test_parse_statements_turns_a_busy_tenant_away(limited_config):
+    from app import create_app
+
+    client = create_app(limited_config).test_client()
+    pdf = ('statement.pdf', statement_pdf('discover', 5))
+    # A streamed response holds its files' places until it is closed
+    streaming = upload(client, pdf, headers={'Accept': 'application/x-ndjson'})
+    busy = upload(client, ('other.pdf', statement_pdf('discover', 5, seed=1)))
+    assert busy.status_code == 429
+    assert int(busy.headers['Retry-After']) == busy.get_json()["retry_after"] >= 1
+    streaming.close()
+    assert upload(client, ('other.pdf', statement_pdf('discover', 5, seed=1))).status_code == 200
+
+
+def test_create_job_turns_a_busy_tenant_away(limited_config):
+    from app import create_app
+
+    app = create_app(limited_config)
+    # Nothing is claimed, so the first job's file stays queued
+    app.extensions['job_queue'].workers = 0
+    client = app.test_client()
+    assert upload(client, ('a.pdf', statement_pdf('discover', 5)), path='/api/jobs').status_code == 202
+    busy = upload(client, ('b.pdf', statement_pdf('discover', 5, seed=1)), path='/api/jobs')
+    assert busy.status_code == 429 and 'Retry-After' in busy.headers
@@ -0,0 +1,102 @@
+from aggregates import rollup
+from categorizer import CATEGORY_KEYWORDS, UNCATEGORIZED, categorize_transaction
+from transaction_batch import TransactionBatch
+
+MARCH = [
+    ('2024-03-01', 'PAYROLL DEPOSIT ACME', 2500.0, 'OCCU Checking'),
+    ('2024-03-02', 'SPROUTS FARMERS MKT', -82.15, 'Discover Credit Card'),
+    ('2024-03-09', 'MARUGAME UDON', -18.0, 'Discover Credit Card'),
+    ('2024-03-16', 'MARUGAME UDON', -21.5, 'Discover Credit Card'),
+]
+APRIL = [
+    ('2024-04-01', 'PAYROLL DEPOSIT ACME', 2500.0, 'OCCU Checking'),
+    ('2024-04-03', 'SHELL OIL 123', -45.3, 'Discover Credit Card'),
+    ('2024-04-20', 'MARUGAME UDON', -19.75, 'Discover Credit Card'),
+]
+
+
+def batch(rows):
+    return TransactionBatch.from_dicts([
+        {"date": date, "description": description, "category": categorize_transaction(description),
+         "amount": amount, "account": account}
+        for date, description, amount, account in rows
+    ])
+
+
+def expected(store):
+    """
+    The rollups worked out from scratch over every stored row
+    """
+    monthly = {}
+    categories = {}
+    accounts = {}
+    for row in store.query(limit=1000)[0]:
+        month = row["date"][:7]
+        income, expense = monthly.get(month, (0, 0))
+        if row["amount"] > 0:
+            income += row["amount"]
+        else:
+            expense -= row["amount"]
+            categories[row["category"]] = categories.get(row["category"], 0) - row["amount"]
+        monthly[month] = (income, expense)
+        accounts[row["account"]] = accounts.get(row["account"], 0) + row["amount"]
+    return ({month: (round(income, 2), round(expense, 2)) for month, (income, expense) in monthly.items()},
+            {category: round(total, 2) for category, total in categories.items()},
+            {account: round(net, 2) for account, net in accounts.items()})
+
+
+def actual(store):
+    aggregates = store.aggregates()
+    summary = aggregates["summary"]
+    return ({row["month"]: (row["income"], row["expense"]) for row in aggregates["monthly"]},
+            {row["name"]: row["value"] for row in summary["by_category"]},
+            {row["name"]: row["value"] for row in summary["accounts"]})
+
+
+def test_rollup_groups_in_cents():
+    totals = rollup(batch(MARCH + APRIL))
+    assert totals["monthly"] == [('2024-03', 250000, 12165, 4), ('2024-04', 250000, 6505, 3)]
+    assert sorted(totals["merchants"]) == [('MARUGAME UDON', 5925, 3), ('SHELL OIL 123', 4530, 1),
+                                           ('SPROUTS FARMERS MKT', 8215, 1)]
+    assert ('Restaurants', '2024-03', 3950, 2) in totals["category_months"]
+    assert sorted(totals["accounts"]) == [('Discover Credit Card', -18670, 5), ('OCCU Checking', 500000, 2)]
+    assert rollup(TransactionBatch.from_dicts([])) == {"monthly": [], "merchants": [], "category_months": [],
+                                                       "accounts": []}
+
+
+def test_totals_follow_added_and_replaced_statements(store):
+    store.add_statement('a' * 64, 'fp', 'march.pdf', batch(MARCH))
+    store.add_statement('b' * 64, 'fp', 'april.pdf', batch(APRIL))
+    assert actual(store) == expected(store)
+    assert store.aggregates()["summary"]["net"] == round(5000 - 82.15 - 18 - 21.5 - 45.3 - 19.75, 2)
+    # A statement stored again replaces its rows, and its totals
+    store.add_statement('a' * 64, 'fp', 'march.pdf', batch(MARCH[:2]))
+    assert actual(store) == expected(store)
+    assert store.aggregates()["monthly"][0]["count"] == 2
+
+
+def test_totals_follow_recategorized_rows(store):
+    store.add_statement('a' * 64, 'fp', 'march.pdf', batch(MARCH))
+    store.add_statement('b' * 64, 'fp', 'april.pdf', batch(APRIL))
+    store.recategorize({'Noodles': ['udon'], **CATEGORY_KEYWORDS})
+    by_category = actual(store)[1]
+    assert by_category["Noodles"] == 59.25 and 'Restaurants' not in by_category
+    assert actual(store) == expected(store)
+    noodles = store.aggregates()["categories"]["Noodles"]
+    assert noodles == [{"month": '2024-03', "spending": 39.5}, {"month": '2024-04', "spending": 19.75}]
+    store.recategorize({category: keywords for category, keywords in CATEGORY_KEYWORDS.items()
+                        if category != 'Transportation'})
+    assert actual(store)[1][UNCATEGORIZED] == 45.3
+    assert actual(store) == expected(store)
+
+
+def test_aggregates_api(client, app):
+    store = app.extensions['transaction_store']
+    store.add_statement('a' * 64, 'fp', 'march.pdf', batch(MARCH))
+    store.add_statement('b' * 64, 'fp', 'april.pdf', batch(APRIL))
+    monthly = client.get('/api/aggregates/monthly?start_month=2024-04').get_json()
+    assert monthly == {"monthly": [{"month": '2024-04', "income": 2500.0, "expense": 65.05, "net": 2434.95,
+                                    "count": 3}]}
+    merchants = client.get('/api/aggregates/merchants?merchants=1').get_json()["merchants"]
+    assert [(merchant["merchant"], merchant["spending"]) for merchant in merchants] == [('SPROUTS FARMERS MKT', 82.15)]
+    assert client.get('/api/aggregates/nothing').status_code == 404
@@ -0,0 +1,48 @@
+import json
+from benchmarks.synthetic import statement_pdf
+from tests.conftest import upload
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_ndjson_streams_each_file_then_a_summary(client, app):
+    pdfs = [('discover.pdf', statement_pdf('discover', 10, seed=1)), ('occu.pdf', statement_pdf('occu', 6, seed=2)),
+            ('broken.pdf', b'%PDF-1.4 not really')]
+    response = upload(client, *pdfs, headers={'Accept': 'application/x-ndjson'})
+    assert response.status_code == 200 and response.mimetype == 'application/x-ndjson'
+    records = ndjson(response)
+
+    assert records[-1]["type"] == 'summary'
+    assert [error["file"] for error in records[-1]["errors"]] == ['broken.pdf']
+    assert [record["file"] for record in records if record["type"] == 'error'] == ['broken.pdf']
+    statements = {record["file"]: record for record in records if record["type"] == 'statement'}
+    assert sorted(statements) == ['discover.pdf', 'occu.pdf']
+    for filename, statement in statements.items():
+        rows = [record for record in records if record["type"] == 'transaction' and record["file"] == filename]
+        assert len(rows) == statement["transactions"]
+        # A file's records follow its statement record, newest first
+        assert records.index(statement) < records.index(rows[0])
+        assert [row["date"] for row in rows] == sorted((row["date"] for row in rows), reverse=True)
+    assert records[-1]["transactions"] == sum(statement["transactions"] for statement in statements.values())
+    assert records[-1]["files"] == 2
+    # The files' places in the parse queue were given back when the stream ended
+    assert app.extensions['parse_admission'].in_flight() == 0
+
+
+def test_ndjson_rows_match_the_json_response(client):
+    pdf = ('discover.pdf', statement_pdf('discover', 10))
+    combined = upload(client, pdf).get_json()
+    streamed = ndjson(upload(client, pdf, headers={'Accept': 'application/x-ndjson'}))
+    rows = [{key: value for key, value in record.items() if key not in ('type', 'file')}
+            for record in streamed if record["type"] == 'transaction']
+    assert rows == combined["transactions"]
+
+
+def test_other_accept_headers_get_json(client):
+    pdf = ('discover.pdf', statement_pdf('discover', 10))
+    for accept in ('*/*', 'application/json', 'application/json, application/x-ndjson;q=0.5'):
+        response = upload(client, pdf, headers={'Accept': accept})
+        assert response.mimetype == 'application/json'
+        assert len(response.get_json()["transactions"]) == 11
@@ -0,0 +1,59 @@
+import pytest
+from bank_formats import BANK_FORMATS, FormatRegistry, registry, signature_tokens
+from benchmarks.synthetic import discover_statement_text, occu_statement_text
+
+YAML_STYLE_SPEC = {
+    'name': 'Example Bank',
+    'header_patterns': [r'EXAMPLE\s+BANK', r'Statement (?:Period|Date)'],
+    'sections': [{'name': 'transactions', 'pattern': r'DATE.*', 'account': 'Example Checking',
+                  'date_format': '%m/%d/%y',
+                  'rows': [{'pattern': r'(\d{2}/\d{2}/\d{2})\s+(.*?)\s+(-?\d+\.\d{2})$',
+                            'fields': ['date', 'description', 'amount']}]}],
+}
+
+
+@pytest.mark.parametrize('patterns, tokens', [
+    (['ORANGE COUNTY', 'CREDIT UNION'], {'orange county', 'credit union'}),
+    ([r'DISCOVER', r'(CARD|CARDMEMBER)'], {'discover', 'card'}),
+    ([r'EXAMPLE\s+BANK', r'Statement (?:Period|Date)'], {'example', 'bank', 'statement'}),
+    ([r'(?:Total)?\s+Due', r'ab|cd', r'quux?'], {'due', 'quu'}),
+])
+def test_signature_tokens_are_required_literals(patterns, tokens):
+    assert signature_tokens(patterns) == tokens
+
+
+def test_every_built_in_format_is_indexed():
+    for bank_type in BANK_FORMATS:
+        assert registry[bank_type].signature_tokens
+    assert not registry._unindexed
+
+
+def test_identify_through_the_index():
+    assert registry.identify(discover_statement_text(3)) == 'discover'
+    assert registry.identify(occu_statement_text(3)) == 'orange_county_credit_union'
+    assert registry.candidates('nothing to see here') == set()
+
+
+def test_loaded_spec_is_indexed_and_identified():
+    formats = FormatRegistry()
+    formats.register_all(BANK_FORMATS)
+    formats.register('example', YAML_STYLE_SPEC)
+    assert formats['example'].signature_tokens == {'example', 'bank', 'statement'}
+    text = 'Example   Bank\nStatement Date 01/31/24\nDATE DESCRIPTION AMOUNT\n01/02/24 COFFEE -4.50\n'
+    assert formats.candidates(text) == {'example'}
+    assert formats.identify(text) == 'example'
+
+
+def test_spec_without_literals_is_still_detected():
+    formats = FormatRegistry()
+    formats.register('bare', {**YAML_STYLE_SPEC, 'header_patterns': [r'\d{4}-\d{4}']})
+    assert formats._unindexed == ['bare']
+    assert formats.identify('card 1234-5678') == 'bare'
+
+
+@pytest.mark.parametrize('lines, truncated', [(3, False), (4, True)])
+def test_fallback_cap_marks_only_statements_it_cut(lines, truncated):
+    text = '\n'.join(f"03/0{day + 1} VENDOR {day} $1{day}.00" for day in range(lines))
+    statement_info = registry['discover'].extract_statement_info(text, max_fallback_rows=3)
+    assert len(statement_info["transactions"]) == 3
+    assert statement_info.get("truncated", False) == truncated
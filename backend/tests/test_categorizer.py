@@ -0,0 +1,105 @@
+import threading
+import pytest
+import categorizer
+from categorizer import (CATEGORY_KEYWORDS, UNCATEGORIZED, CachedCategorizer, CategoryCache, KeywordCategorizer,
+                         changed_keywords, get_categorizer, set_category_keywords)
+
+DESCRIPTIONS = [
+    'TST* MATCHA CAFE IRVINE CA', 'SPROUTS FARMERS MKT #123 IRVINE CA', 'CHEVRON 0091234 COSTA MESA CA',
+    'NETFLIX.COM LOS GATOS CA', 'AMAZON MKTPL*2K4LL1 AMZN.COM/BILL WA', 'ROUND1 BOWLING MAINPLACE SANTA ANA CA',
+    'ACH DEBIT VERIZON WIRELESS BILL', 'ZELLE TRANSFER TO J SMITH', 'DIVIDEND', '', '   ',
+    # Irregular whitespace and store numbers, which the cache key must not paper over
+    'AMAZON  PRIME', 'CARLS  JR 123', 'TEA  STUDIO', 'POP  MART', 'amazon prime 123', 'Starbucks #123',
+    'STARBUCKS #123', 'WHOLE\tFOODS', ' trader joes ',
+]
+
+
+def nested_loop_categorize(description, category_keywords=CATEGORY_KEYWORDS):
+    """
+    The original categorizer: first category, in table order, with a keyword in the description
+    """
+    description = description.lower()
+    for category, keywords in category_keywords.items():
+        for keyword in keywords:
+            if keyword.lower() in description:
+                return category
+    return UNCATEGORIZED
+
+
+@pytest.fixture
+def restore_keywords():
+    saved = {category: list(keywords) for category, keywords in CATEGORY_KEYWORDS.items()}
+    yield
+    set_category_keywords(saved)
+
+
+@pytest.mark.parametrize('description', DESCRIPTIONS)
+def test_compiled_matches_nested_loop(description):
+    assert KeywordCategorizer(CATEGORY_KEYWORDS).categorize(description) == nested_loop_categorize(description)
+
+
+@pytest.mark.parametrize('description', DESCRIPTIONS)
+def test_cached_matches_uncached(description):
+    cached = CachedCategorizer(KeywordCategorizer(CATEGORY_KEYWORDS), CategoryCache())
+    # A second lookup is answered from the cache
+    assert cached.categorize(description) == cached.categorize(description) == nested_loop_categorize(description)
+
+
+def test_cache_shares_entries_across_store_numbers():
+    cached = CachedCategorizer(KeywordCategorizer(CATEGORY_KEYWORDS), CategoryCache())
+    assert cached.cache_key('SPROUTS FARMERS MKT #123') == cached.cache_key('sprouts farmers mkt 0042')
+    cached.categorize('SPROUTS FARMERS MKT #123')
+    cached.categorize('sprouts farmers mkt 0042')
+    assert cached.cache_info()["hits"] == 1
+
+
+def test_cache_key_keeps_numbers_keywords_can_see():
+    rules = {'Bars': ['bar 1'], 'Other': ['bar']}
+    cached = CachedCategorizer(KeywordCategorizer(rules), CategoryCache())
+    assert cached.categorize('BAR 12') == 'Bars'
+    assert cached.categorize('BAR 34') == 'Other'
+    assert cached.categorize('BAR') == 'Other'
+
+
+def test_cache_is_bounded():
+    cached = CachedCategorizer(KeywordCategorizer(CATEGORY_KEYWORDS), CategoryCache(maxsize=2))
+    for description in ('CAFE ONE', 'CAFE TWO', 'CAFE THREE'):
+        cached.categorize(description)
+    info = cached.cache_info()
+    assert (info["size"], info["evictions"]) == (2, 1)
+
+
+def test_rule_edit_recompiles_with_a_fresh_cache(restore_keywords):
+    old = get_categorizer()
+    old.categorize('JOES MARKET')
+    new = set_category_keywords({'Joes': ['joes'], **CATEGORY_KEYWORDS})
+    assert new is not old and new.cache is not old.cache
+    assert new.categorize('JOES MARKET') == 'Joes'
+    # A thread still holding the old categorizer only fills the old cache
+    worker = threading.Thread(target=old.categorize, args=('JOES GRILL',))
+    worker.start()
+    worker.join()
+    assert new.cache_info()["size"] == 1
+    assert categorizer.categorize_transaction('JOES GRILL') == 'Joes'
+
+
+def test_changed_keywords():
+    old = {'A': ['apple', 'avocado'], 'B': ['banana']}
+    assert changed_keywords(old, old) == set()
+    assert changed_keywords(old, {'A': ['apple'], 'B': ['banana', 'avocado']}) == {'avocado'}
+    # Swapping precedence affects every keyword of both categories
+    assert changed_keywords(old, {'B': ['banana'], 'A': ['apple', 'avocado']}) == {'apple', 'avocado', 'banana'}
+
+
+def test_stored_rules_are_checked_at_most_once_per_interval(store, monkeypatch):
+    categorizer.use_stored_rules(store.path)
+    first = get_categorizer()
+    # Another process stores new rules
+    with store._connect() as conn:
+        store._set_category_rules(conn, {'Zzyzx': ['zzyzx'], **CATEGORY_KEYWORDS}, builtin=False)
+    assert get_categorizer() is first
+    assert get_categorizer(refresh=True).categorize('ZZYZX TRADING') == 'Zzyzx'
+    monkeypatch.setattr(categorizer, 'RULES_POLL_INTERVAL', 0)
+    with store._connect() as conn:
+        store._set_category_rules(conn, CATEGORY_KEYWORDS, builtin=False)
+    assert get_categorizer().categorize('ZZYZX TRADING') == UNCATEGORIZED
@@ -0,0 +1,60 @@
+import pytest
+import ingest
+from benchmarks.synthetic import statement_pdf
+from categorizer import CATEGORY_KEYWORDS, UNCATEGORIZED
+from tests.conftest import upload
+from transaction_batch import TransactionBatch
+
+FITNESS = 'POS WITHDRAWAL 24 HOUR FITNESS'
+
+
+def put_rules(client, category_keywords):
+    rules = [{"category": category, "keywords": keywords} for category, keywords in category_keywords.items()]
+    return client.put('/api/categories/keywords', json={"rules": rules})
+
+
+@pytest.fixture
+def pooled_config(app_config):
+    # Parser processes fork from the test process, so they start from a fresh pool
+    ingest.shutdown_parse_pool()
+    yield {**app_config, 'PARSE_WORKERS': 1}
+    ingest.shutdown_parse_pool()
+
+
+def test_edited_rules_reach_parser_processes_and_survive_restart(pooled_config):
+    from app import create_app
+
+    client = create_app(pooled_config).test_client()
+    before = upload(client, ('occu.pdf', statement_pdf('occu', 20))).get_json()
+    assert {row["category"] for row in before["transactions"] if row["description"] == FITNESS} == {'Health'}
+
+    edited = {'Fitness': ['fitness'], **CATEGORY_KEYWORDS}
+    changes = put_rules(client, edited).get_json()["changes"]
+    assert changes and {change["category"] for change in changes} == {'Fitness'}
+    # The parser process compiled its rules before the edit
+    after = upload(client, ('occu-next.pdf', statement_pdf('occu', 20, seed=6))).get_json()
+    assert {row["category"] for row in after["transactions"] if row["description"] == FITNESS} == {'Fitness'}
+
+    restarted = create_app(pooled_config).test_client()
+    rules = restarted.get('/api/categories/keywords').get_json()["rules"]
+    assert rules[0] == {"category": 'Fitness', "keywords": ['fitness']}
+    assert restarted.get('/api/categories').get_json()["categories"][0] == 'Fitness'
+
+
+def test_recategorize_keeps_statement_categories_only(store):
+    transactions = TransactionBatch.from_dicts([
+        {"date": '2024-03-02', "description": description, "category": category, "amount": -10.0,
+         "account": 'Discover Credit Card'}
+        for description, category in (
+            # The keyword rules' decision, the model's pick, and the statement's own category
+            ('ZZYZX FITNESS CLUB', 'Health'),
+            ('ZZYZX TRADING', 'Shopping'),
+            ('ZZYZX GYM', 'Recreation'),
+            ('PLAIN VENDOR', UNCATEGORIZED),
+        )
+    ])
+    store.add_statement('sha', 'fp', 'march.pdf', transactions)
+    result = store.recategorize({'Zzyzx': ['zzyzx'], **CATEGORY_KEYWORDS})
+    assert sorted((change["description"], change["category"]) for change in result["changes"]) == [
+        ('ZZYZX FITNESS CLUB', 'Zzyzx'), ('ZZYZX TRADING', 'Zzyzx')]
+    assert not store.follows_builtin_rules()
@@ -0,0 +1,77 @@
+import numpy as np
+from benchmarks.synthetic import statement_pdf
+from dedup import BloomFilter, UploadDeduplicator, dedup_keys
+from tests.conftest import upload
+from transaction_batch import TransactionBatch
+
+
+def batch(*rows):
+    return TransactionBatch.from_dicts([
+        {"date": date, "description": description, "category": "Restaurants", "amount": amount,
+         "account": "Discover Credit Card"}
+        for date, description, amount in rows
+    ])
+
+
+COFFEE = ('2024-03-02', 'BLUE BOTTLE COFFEE #12', -4.5)
+LUNCH = ('2024-03-03', 'JOLLIBEE CERRITOS CA', -12.25)
+DINNER = ('2024-03-04', 'MARUGAME UDON', -18.0)
+
+
+def test_keys_count_repeats_within_a_statement():
+    keys = dedup_keys(batch(COFFEE, COFFEE, LUNCH))
+    assert len(set(keys)) == 3
+    # The second coffee of an overlapping statement is the second coffee here
+    assert dedup_keys(batch(LUNCH, COFFEE, COFFEE)) == [keys[2], keys[0], keys[1]]
+
+
+def test_keys_ignore_store_numbers_and_case():
+    renamed = ('2024-03-02', 'blue bottle coffee 0012', -4.5)
+    assert dedup_keys(batch(renamed)) == dedup_keys(batch(COFFEE))
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000)
+    keys = np.random.default_rng(1).integers(-2 ** 63, 2 ** 63 - 1, size=1000).tolist()
+    bloom.add_many(keys)
+    assert bloom.might_contain_many(keys).all()
+    others = np.random.default_rng(2).integers(-2 ** 63, 2 ** 63 - 1, size=10000).tolist()
+    assert bloom.might_contain_many(others).mean() < 0.05
+
+
+def test_overlap_within_an_upload():
+    deduplicator = UploadDeduplicator()
+    kept, keys, dropped = deduplicator.dedupe('feb.pdf', 'a' * 64, batch(COFFEE, LUNCH))
+    assert len(kept) == 2 and not dropped
+    kept, keys, dropped = deduplicator.dedupe('mar.pdf', 'b' * 64, batch(LUNCH, DINNER))
+    assert [row[1] for row in kept.rows()] == ['MARUGAME UDON']
+    assert [(row["description"], row["duplicate_of"]) for row in dropped] == [('JOLLIBEE CERRITOS CA', 'feb.pdf')]
+    assert keys == dedup_keys(batch(LUNCH, DINNER))[1:]
+
+
+def test_overlap_with_the_store(store):
+    store.add_statement('a' * 64, 'fp', 'feb.pdf', batch(COFFEE, LUNCH))
+    kept, _, dropped = UploadDeduplicator(store).dedupe('mar.pdf', 'b' * 64, batch(LUNCH, DINNER))
+    assert [row[1] for row in kept.rows()] == ['MARUGAME UDON']
+    assert dropped[0]["duplicate_of"] == 'feb.pdf'
+
+
+def test_statement_is_not_a_duplicate_of_itself(store):
+    store.add_statement('a' * 64, 'fp', 'feb.pdf', batch(COFFEE, LUNCH))
+    kept, _, dropped = UploadDeduplicator(store).dedupe('feb.pdf', 'a' * 64, batch(COFFEE, LUNCH))
+    assert len(kept) == 2 and not dropped
+
+
+def test_reupload_as_different_bytes_returns_every_row(client, app):
+    pdf = statement_pdf('discover', 10)
+    first = upload(client, ('march.pdf', pdf)).get_json()
+    # The same statement saved again, e.g. downloaded twice: new bytes, same rows
+    again = upload(client, ('march-copy.pdf', pdf + b'\n% saved again\n'))
+    assert again.status_code == 200
+    body = again.get_json()
+    assert len(body["transactions"]) == len(first["transactions"]) == 11
+    assert {row["duplicate_of"] for row in body["duplicates"]} == {'march.pdf'}
+    assert len(body["duplicates"]) == 11
+    # Nothing was stored twice
+    stored, _ = app.extensions['transaction_store'].query()
+    assert len(stored) == 11
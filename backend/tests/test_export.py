@@ -0,0 +1,83 @@
+import io
+import csv
+import gzip
+import pytest
+from benchmarks.synthetic import statement_pdf
+from export import EXPORT_COLUMNS
+from tests.conftest import upload
+from tests.test_jobs import wait_for
+from transaction_batch import TransactionBatch
+
+
+def batch(rows, account='Discover Credit Card'):
+    return TransactionBatch.from_dicts([
+        {"date": date, "description": description, "category": 'Restaurants', "amount": amount, "account": account}
+        for date, description, amount in rows
+    ])
+
+
+@pytest.fixture
+def stored(app):
+    store = app.extensions['transaction_store']
+    # Four rows to a date, so chunk boundaries fall between rows of one date
+    store.add_statement('a' * 64, 'fp', 'discover.pdf', batch(
+        (f'2024-03-{day:02d}', f'MATCHA CAFE #{day}{n} IRVINE CA', -4.5 - n) for day in (1, 2, 3) for n in range(4)))
+    store.add_statement('b' * 64, 'fp', 'occu.pdf', batch(
+        [('2024-03-02', 'PAYROLL DEPOSIT ACME', 2500.0), ('2024-04-01', 'PAYROLL DEPOSIT ACME', 2500.0)],
+        account='OCCU Checking'))
+    return store
+
+
+def csv_rows(response):
+    return list(csv.reader(io.StringIO(gzip.decompress(response.get_data()).decode())))
+
+
+@pytest.mark.parametrize('filters', [{}, {"account": 'Discover Credit Card'}, {"start_date": '2024-03-02'},
+                                     {"min_amount": 0, "end_date": '2024-03-31'}])
+def test_chunks_hold_the_rows_query_returns(stored, filters):
+    chunks = list(stored.export_chunks(chunk_size=5, **filters))
+    assert all(len(chunk["id"]) == 5 for chunk in chunks[:-1])
+    exported = [row for chunk in chunks for row in zip(*(chunk[name] for name in EXPORT_COLUMNS))]
+    queried, _ = stored.query(sort='date', direction='asc', limit=1000, **filters)
+    assert len(exported) == len(queried)
+    # In (date, id) order, each row once
+    assert [(row[1], row[0]) for row in exported] == sorted((row["date"], row["id"]) for row in queried)
+    assert {row[3] for row in exported if row[2].startswith('MATCHA')} <= {'MATCHA CAFE'}
+
+
+def test_csv_export(client, stored):
+    response = client.get('/api/export?account=OCCU%20Checking')
+    assert response.status_code == 200 and response.mimetype == 'application/gzip'
+    assert response.headers['Content-Disposition'] == 'attachment; filename="transactions.csv.gz"'
+    rows = csv_rows(response)
+    assert rows[0] == list(EXPORT_COLUMNS)
+    assert [row[1:] for row in rows[1:]] == [
+        ['2024-03-02', 'PAYROLL DEPOSIT ACME', 'PAYROLL DEPOSIT ACME', 'Restaurants', 'OCCU Checking', '2500.0'],
+        ['2024-04-01', 'PAYROLL DEPOSIT ACME', 'PAYROLL DEPOSIT ACME', 'Restaurants', 'OCCU Checking', '2500.0'],
+    ]
+
+
+@pytest.mark.parametrize('export_format', ['parquet', 'arrow'])
+def test_arrow_exports(client, stored, export_format):
+    pa = pytest.importorskip('pyarrow')
+    response = client.get(f'/api/export?format={export_format}&start_date=2024-03-03')
+    assert response.status_code == 200
+    if export_format == 'parquet':
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(pa.BufferReader(response.get_data()))
+    else:
+        table = pa.ipc.open_stream(response.get_data()).read_all()
+    assert table.column_names == list(EXPORT_COLUMNS)
+    assert table.num_rows == 5
+    assert str(table.column('date')[0]) == '2024-03-03'
+
+
+def test_job_export_and_errors(client, app):
+    response = upload(client, ('discover.pdf', statement_pdf('discover', 10)), path='/api/jobs')
+    job_id = response.get_json()["id"]
+    wait_for(app.extensions['job_queue'], job_id)
+    rows = csv_rows(client.get(f'/api/export?job={job_id}'))
+    # Rows parsed but not stored have no id
+    assert len(rows) == 12 and {row[0] for row in rows[1:]} == {''}
+    assert client.get('/api/export?format=xlsx').status_code == 400
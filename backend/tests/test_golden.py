@@ -0,0 +1,59 @@
+"""
+Statement parsing checked against golden files.
+
+Each golden/*.txt statement is parsed with the clock frozen and compared
+with the neighbouring *.json. To rewrite the JSON from the current parser,
+run from the backend directory:
+    python -m tests.test_golden --update
+"""
+import os
+import sys
+import glob
+import json
+import pytest
+import bank_formats
+from statement_parser import identify_bank_type, parse_statement_text
+from tests.conftest import FrozenDatetime
+
+GOLDEN_DIR = os.path.join(os.path.dirname(__file__), 'golden')
+
+GOLDEN_FILES = sorted(glob.glob(os.path.join(GOLDEN_DIR, '*.txt')))
+
+
+def parse_golden(text):
+    """
+    Parse a statement's text as the golden JSON records it
+    """
+    try:
+        statement = parse_statement_text(text, identify_bank_type(text))
+        if "transactions" in statement:
+            statement["transactions"] = statement["transactions"].to_dicts()
+        return statement
+    except Exception as e:
+        return {"exception": f"{type(e).__name__}: {e}"}
+
+
+@pytest.mark.parametrize('text_path', GOLDEN_FILES, ids=os.path.basename)
+def test_golden(text_path, frozen_year):
+    with open(text_path) as text_file:
+        actual = parse_golden(text_file.read())
+    with open(text_path[:-len('.txt')] + '.json') as json_file:
+        expected = json.load(json_file)
+    assert json.loads(json.dumps(actual)) == expected
+
+
+def update_golden():
+    bank_formats.datetime = FrozenDatetime
+    for text_path in GOLDEN_FILES:
+        with open(text_path) as text_file:
+            actual = parse_golden(text_file.read())
+        with open(text_path[:-len('.txt')] + '.json', 'w') as json_file:
+            json.dump(actual, json_file, indent=2)
+            json_file.write('\n')
+    print(f"golden files rewritten in {GOLDEN_DIR}")
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['--update']:
+        raise SystemExit(__doc__)
+    update_golden()
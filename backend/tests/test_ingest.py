@@ -0,0 +1,68 @@
+import time
+import signal
+import pytest
+import ingest
+
+
+def slow_parse(source, page_workers=0, **kwargs):
+    if source == b'slow':
+        time.sleep(30)
+    return {"transactions": [], "source": source.decode()}
+
+
+def stuck_parse(source, page_workers=0, **kwargs):
+    if source == b'slow':
+        # Like a parse stuck in C code: the timeout's signal never gets through
+        signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGALRM})
+        time.sleep(30)
+    return {"transactions": [], "source": source.decode()}
+
+
+@pytest.fixture
+def fresh_pool():
+    # Parser processes fork from the test process, so they see its patches to ingest
+    ingest.shutdown_parse_pool()
+    yield
+    ingest.shutdown_parse_pool()
+
+
+def test_timeout_is_per_file_and_frees_the_process(monkeypatch, fresh_pool):
+    monkeypatch.setattr(ingest, 'parse_pdf', slow_parse)
+    start = time.monotonic()
+    results = ingest.parse_files([b'slow', b'a', b'b'], workers=1, timeout=1)
+    assert results[0] == (None, "Timed out after 1 seconds")
+    # The files queued behind the slow one still parse, on the same process
+    assert [statement_data["source"] for statement_data, _ in results[1:]] == ['a', 'b']
+    assert time.monotonic() - start < 10
+
+
+def test_watchdog_kills_a_parse_the_timeout_cannot_stop(monkeypatch, fresh_pool):
+    monkeypatch.setattr(ingest, 'parse_pdf', stuck_parse)
+    monkeypatch.setattr(ingest, 'PARSE_KILL_GRACE', 0.5)
+    monkeypatch.setattr(ingest, 'WATCHDOG_INTERVAL', 0.1)
+    start = time.monotonic()
+    results = ingest.parse_files([b'slow', b'a'], workers=2, timeout=0.5)
+    assert results[0] == (None, "Timed out after 0.5 seconds")
+    # The other file is parsed again after the pool it was on is killed
+    assert results[1][0]["source"] == 'a'
+    assert time.monotonic() - start < 10
+
+
+def test_page_workers_only_run_without_cpu_and_memory_limits(monkeypatch):
+    calls = []
+    monkeypatch.setattr(ingest, 'parse_pdf', lambda source, page_workers=0, **kwargs: calls.append(page_workers))
+    ingest.parse_pdf_in_worker(b'a', page_workers=4)
+    ingest.parse_pdf_in_worker(b'a', page_workers=4, limits={**ingest.DEFAULT_PARSE_LIMITS, "cpu_seconds": 0,
+                                                             "memory_mb": 0})
+    # Their processes would be outside the parser process's rlimits
+    assert calls == [0, 4]
+
+
+def test_resizing_the_pool_finishes_its_queued_parses(monkeypatch, fresh_pool):
+    monkeypatch.setattr(ingest, 'parse_pdf', slow_parse)
+    old = ingest.get_parse_pool(1)
+    futures = [old.parse(b'slow', timeout=1), old.parse(b'a'), old.parse(b'b')]
+    assert ingest.get_parse_pool(2) is not old
+    assert [ingest.parse_result(future)["source"] for future in futures[1:]] == ['a', 'b']
+    with pytest.raises(ingest.WorkerParseError, match='Timed out'):
+        ingest.parse_result(futures[0])
@@ -0,0 +1,141 @@
+import time
+import pytest
+import ingest
+from benchmarks.synthetic import statement_pdf
+from jobs import JobQueue
+from parse_cache import content_key
+
+
+def wait_for(queue, job_id, timeout=60):
+    """
+    Poll a job until none of its files are queued or running; returns its status
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = queue.status(job_id)
+        if status["status"] not in ('queued', 'running'):
+            return status
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} still {status['status']} after {timeout} s")
+
+
+def spool(job_dir, name, content):
+    path = f"{job_dir}/{name}"
+    with open(path, 'wb') as file:
+        file.write(content)
+    return {"filename": name, "sha256": name, "cache_key": content_key(name, 'fp'), "path": path}
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    queues = []
+
+    def make(**kwargs):
+        queue = JobQueue(str(tmp_path / 'jobs.sqlite3'), str(tmp_path / 'spool'), **{'workers': 1, **kwargs})
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.workers = 0
+
+
+def test_job_parses_its_files(make_queue):
+    stored = []
+    queue = make_queue(on_result=lambda file, statement_data: stored.append(file["filename"]))
+    job_id, job_dir = queue.new_job()
+    queue.create_job(job_id, [
+        spool(job_dir, 'discover.pdf', statement_pdf('discover', 10)),
+        spool(job_dir, 'occu.pdf', statement_pdf('occu', 10)),
+        {"filename": 'notes.txt', "error": 'Invalid file format. Only PDF files are allowed.'},
+    ])
+    status = wait_for(queue, job_id)
+    assert status["status"] == 'done'
+    assert status["progress"] == {"total": 3, "queued": 0, "running": 0, "done": 2, "failed": 1, "cancelled": 0}
+    assert sorted(stored) == ['discover.pdf', 'occu.pdf']
+    results = {filename: (statement_data, error) for filename, statement_data, error in queue.results(job_id)}
+    assert len(results['discover.pdf'][0]["transactions"]) == 11
+    assert results['notes.txt'] == (None, 'Invalid file format. Only PDF files are allowed.')
+
+
+def test_on_result_error_fails_the_file(make_queue):
+    queue = make_queue(on_result=lambda file, statement_data: "Could not store it")
+    job_id, job_dir = queue.new_job()
+    queue.create_job(job_id, [spool(job_dir, 'discover.pdf', statement_pdf('discover', 5))])
+    status = wait_for(queue, job_id)
+    assert status["status"] == 'failed' and status["files"][0]["error"] == "Could not store it"
+
+
+def test_cancel_and_retry(make_queue):
+    queue = make_queue(workers=0)
+    job_id, job_dir = queue.new_job()
+    queue.create_job(job_id, [spool(job_dir, 'discover.pdf', statement_pdf('discover', 5))])
+    assert queue.status(job_id)["status"] == 'queued'
+    assert queue.cancel(job_id)
+    assert queue.status(job_id)["status"] == 'cancelled'
+    assert queue.results(job_id) == [('discover.pdf', None, 'Cancelled')]
+    assert not queue.cancel('no-such-job')
+    assert queue.delete(job_id) and queue.status(job_id) is None
+
+
+def slow_parse(source, page_workers=0, parse_pdf=ingest.parse_pdf, **kwargs):
+    time.sleep(1.5)
+    return parse_pdf(source, page_workers, **kwargs)
+
+
+def test_cancelled_parse_keeps_its_slot_until_it_finishes(make_queue, monkeypatch):
+    # Parser processes fork from the test process, so they see the patch
+    ingest.shutdown_parse_pool()
+    monkeypatch.setattr(ingest, 'parse_pdf', slow_parse)
+    stored = []
+    queue = make_queue(on_result=lambda file, statement_data: stored.append(file["filename"]))
+    slow_id, slow_dir = queue.new_job()
+    queue.create_job(slow_id, [spool(slow_dir, 'slow.pdf', statement_pdf('discover', 5))])
+    while queue.status(slow_id)["status"] != 'running':
+        time.sleep(0.05)
+    queue.cancel(slow_id)
+    next_id, next_dir = queue.new_job()
+    queue.create_job(next_id, [spool(next_dir, 'next.pdf', statement_pdf('discover', 5))])
+    time.sleep(0.75)
+    # The only worker is still busy with the cancelled parse
+    assert queue.status(next_id)["status"] == 'queued'
+    assert wait_for(queue, next_id)["status"] == 'done'
+    assert queue.status(slow_id)["status"] == 'cancelled'
+    assert stored == ['next.pdf']
+    ingest.shutdown_parse_pool()
+
+
+def test_interrupted_files_are_requeued(make_queue, tmp_path):
+    queue = make_queue(workers=0)
+    job_id, job_dir = queue.new_job()
+    queue.create_job(job_id, [spool(job_dir, 'discover.pdf', statement_pdf('discover', 5))])
+    with queue._connect() as conn:
+        conn.execute("UPDATE job_files SET status = 'running'")
+    restarted = make_queue()
+    assert wait_for(restarted, job_id)["status"] == 'done'
+
+
+def test_backlog_counts_queued_files_per_tenant(make_queue):
+    queue = make_queue(workers=0)
+    for tenant, files in (('a', 3), ('b', 1)):
+        job_id, job_dir = queue.new_job()
+        queue.create_job(job_id, [spool(job_dir, f"{tenant}{index}.pdf", b'%PDF') for index in range(files)], tenant)
+    assert queue.backlog('a')[:2] == (4, 3)
+    assert queue.backlog('c')[:2] == (4, 0)
+
+
+def test_tenants_take_turns(make_queue):
+    queue = make_queue(workers=0)
+    jobs = []
+    for tenant, files in (('a', 3), ('b', 1)):
+        job_id, job_dir = queue.new_job()
+        queue.create_job(job_id, [spool(job_dir, f"{tenant}{index}.pdf", statement_pdf('discover', 5, seed=index))
+                                  for index in range(files)], tenant)
+        jobs.append(job_id)
+    queue.workers = 1
+    queue.ensure_started()
+    for job_id in jobs:
+        wait_for(queue, job_id)
+    with queue._connect() as conn:
+        order = [filename for (filename,) in conn.execute("SELECT filename FROM job_files ORDER BY started_at")]
+    assert order == ['a0.pdf', 'b0.pdf', 'a1.pdf', 'a2.pdf']
@@ -0,0 +1,64 @@
+import merchants
+import transaction_store
+from merchants import MAX_BUCKET_MERCHANTS, MerchantIndex, merchant_tokens, sketch
+
+CAFES = ['MATCHA', 'BOBA', 'TACO', 'PHO', 'RAMEN', 'BAGEL', 'DONUT', 'CREPE', 'GELATO', 'SUSHI', 'CURRY', 'KEBAB']
+
+
+def test_tokens_end_at_the_store_number():
+    assert merchant_tokens('TST* MATCHA CAFE 0412 IRVINE CA') == ['MATCHA', 'CAFE']
+    assert merchant_tokens('MATCHA CAFE #88 TUSTIN CA') == ['MATCHA', 'CAFE']
+    # A reference number before the name is skipped; without a store number only the state goes
+    assert merchant_tokens('POS 123456 SPROUTS FARMERS MKT IRVINE CA') == ['SPROUTS', 'FARMERS', 'MKT', 'IRVINE']
+
+
+def test_index_groups_variants_and_keeps_the_shared_name():
+    assigned, created, renamed = MerchantIndex().assign([
+        'MATCHA CAFE #88 TUSTIN CA',
+        'TST* MATCHA CAFE 0412 IRVINE CA',
+        'SPROUTS FARMERS MKT #123 IRVINE CA',
+        'SPROUTS FARMERS MKT #9 COSTA MESA CA',
+        'MATCHA CAFE IRVINE',
+    ])
+    assert assigned == [1, 1, 2, 2, 1]
+    assert [(merchant_id, name) for merchant_id, name, _, _ in created] == [(1, 'MATCHA CAFE'),
+                                                                            (2, 'SPROUTS FARMERS MKT')]
+    assert renamed == {}
+
+
+def test_buckets_stop_taking_merchants_past_the_limit():
+    index = MerchantIndex()
+    _, signatures, _ = sketch(['MATCHA CAFE'])
+    for merchant_id in range(1, MAX_BUCKET_MERCHANTS + 3):
+        index.add_merchant(merchant_id, 'CAFE', signatures[0], keys=[7])
+    assert 7 in index.generic and 7 not in index.buckets
+
+
+def test_store_assigns_variants_across_statements(store):
+    with store._connect() as conn:
+        first = store._assign_merchants(conn, ['TST* MATCHA CAFE 0412 IRVINE CA',
+                                               'SPROUTS FARMERS MKT #123 IRVINE CA'])
+    with store._connect() as conn:
+        second = store._assign_merchants(conn, ['MATCHA CAFE #88 TUSTIN CA', 'SPROUTS FARMERS MKT #123 IRVINE CA',
+                                                'BLUE BOTTLE COFFEE #12'])
+    assert second['MATCHA CAFE #88 TUSTIN CA'] == first['TST* MATCHA CAFE 0412 IRVINE CA']
+    assert second['SPROUTS FARMERS MKT #123 IRVINE CA'] == first['SPROUTS FARMERS MKT #123 IRVINE CA']
+    assert len(set(second.values())) == 3
+    names = store.merchant_names(['MATCHA CAFE #88 TUSTIN CA', 'UNKNOWN'])
+    assert names == {'MATCHA CAFE #88 TUSTIN CA': 'MATCHA CAFE'}
+
+
+def test_store_caps_generic_buckets(store, monkeypatch):
+    monkeypatch.setattr(merchants, 'MAX_BUCKET_MERCHANTS', 1)
+    monkeypatch.setattr(transaction_store, 'MAX_BUCKET_MERCHANTS', 1)
+    # Cafes share the buckets of their common word; a few statements at a time, so buckets fill across calls
+    for start in range(0, len(CAFES), 3):
+        with store._connect() as conn:
+            assigned = store._assign_merchants(conn, [f'CAFE {name} HOUSE' for name in CAFES[start:start + 3]])
+    with store._connect() as conn:
+        sizes = [count for (count,) in conn.execute("SELECT COUNT(*) FROM merchant_buckets GROUP BY bucket")]
+        assert max(sizes) == 2
+        assert conn.execute("SELECT COUNT(*) FROM merchants").fetchone()[0] == len(CAFES)
+        # A variant still finds its merchant through the buckets it shares with no one else
+        variant = store._assign_merchants(conn, ['CAFE KEBAB HOUSE #12 IRVINE CA'])
+    assert variant['CAFE KEBAB HOUSE #12 IRVINE CA'] == assigned['CAFE KEBAB HOUSE']
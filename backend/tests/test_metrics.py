@@ -0,0 +1,74 @@
+import os
+import pytest
+import metrics
+from benchmarks.synthetic import statement_pdf
+from metrics import MetricsRegistry, capture
+from tests.conftest import upload
+
+
+def test_exposition_format():
+    registry = MetricsRegistry()
+    requests = registry.counter('test_requests_total', 'Requests', labels=('path',))
+    seconds = registry.histogram('test_seconds', 'Seconds', buckets=(0.1, 1))
+    requests.inc(path='/a "quoted"\\path')
+    requests.inc(2, path='/b')
+    for value in (0.05, 0.1, 0.5, 3):
+        seconds.observe(value)
+    assert registry.render() == (
+        '# HELP test_requests_total Requests\n'
+        '# TYPE test_requests_total counter\n'
+        'test_requests_total{path="/a \\"quoted\\"\\\\path"} 1\n'
+        'test_requests_total{path="/b"} 2\n'
+        '# HELP test_seconds Seconds\n'
+        '# TYPE test_seconds histogram\n'
+        # Buckets are cumulative and a value on a bound falls in that bucket
+        'test_seconds_bucket{le="0.1"} 2\n'
+        'test_seconds_bucket{le="1"} 3\n'
+        'test_seconds_bucket{le="+Inf"} 4\n'
+        'test_seconds_sum 3.65\n'
+        'test_seconds_count 4\n'
+    )
+
+
+def test_labels_and_names_are_checked():
+    registry = MetricsRegistry()
+    requests = registry.counter('test_requests_total', 'Requests', labels=('path',))
+    with pytest.raises(ValueError):
+        requests.inc(status=200)
+    with pytest.raises(ValueError):
+        registry.counter('test_requests_total', 'Requests again')
+
+
+def test_captured_samples_apply_only_when_replayed():
+    registry = MetricsRegistry()
+    rows = registry.counter('test_rows_total', 'Rows')
+    with capture() as samples:
+        rows.inc(5)
+    assert rows.value() == 0
+    # As a parser process's samples arrive with its result
+    registry.replay(samples + [('test_unknown_total', (), 1)])
+    assert rows.value() == 5
+
+
+def test_metrics_endpoint_counts_requests_and_parse_stages(client):
+    before = metrics.REQUEST_SECONDS.snapshot(endpoint='/api/parse-statements', status=200)[0]
+    extracted = metrics.PARSED_ROWS.value()
+    upload(client, ('discover.pdf', statement_pdf('discover', 10)))
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    body = response.get_data(as_text=True)
+    assert '# TYPE pennysprout_stage_seconds histogram' in body
+    assert 'pennysprout_stage_seconds_count{stage="serialize"}' in body
+    assert metrics.REQUEST_SECONDS.snapshot(endpoint='/api/parse-statements', status=200)[0] == before + 1
+    assert metrics.PARSED_ROWS.value() == extracted + 11
+
+
+def test_profiled_requests_write_a_profile(app_config, tmp_path):
+    from app import create_app
+
+    profile_dir = str(tmp_path / 'profiles')
+    client = create_app({**app_config, 'PROFILE_REQUESTS': True, 'PROFILE_DIR': profile_dir}).test_client()
+    assert 'X-Profile' not in client.get('/metrics').headers
+    profile_path = client.get('/metrics?profile=1').headers['X-Profile']
+    assert os.path.dirname(profile_path) == profile_dir and os.path.getsize(profile_path)
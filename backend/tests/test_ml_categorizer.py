@@ -0,0 +1,56 @@
+import pytest
+from categorizer import UNCATEGORIZED
+from ml_categorizer import MLCategorizer, fill_batch, fill_uncategorized, labelled_from_store, model_fingerprint
+from transaction_batch import TransactionBatch
+
+
+def test_store_labels_are_the_statements_own(store):
+    transactions = TransactionBatch.from_dicts([
+        {"date": '2024-03-02', "description": description, "category": category, "amount": -10.0,
+         "account": 'Discover Credit Card'}
+        for description, category in (
+            # A statement category, translated into the app's
+            ('SPROUTS FARMERS MKT #123 IRVINE CA', 'Supermarkets'),
+            # The keyword rules' decision, and one of their categories where they have none, as the model fills in
+            ('TST* MATCHA CAFE IRVINE CA', 'Restaurants'),
+            ('ZZYZX TRADING CO', 'Shopping'),
+            # A statement category with no app counterpart, and no category at all
+            ('COUNTY RECORDER', 'Government'),
+            ('ANOTHER VENDOR', UNCATEGORIZED),
+        )
+    ])
+    store.add_statement('sha', 'fp', 'discover.pdf', transactions)
+    descriptions, categories = labelled_from_store(store.path)
+    assert sorted(zip(descriptions, categories)) == [('SPROUTS FARMERS MKT #123 IRVINE CA', 'Groceries')]
+
+
+def uncategorized_batch():
+    return TransactionBatch.from_dicts([
+        {"date": '2024-03-02', "description": description, "category": category, "amount": -10.0,
+         "account": 'Discover Credit Card'}
+        for description, category in (('ZZYZX TRADING CO', UNCATEGORIZED), ('SPROUTS FARMERS MKT', 'Groceries'))
+    ])
+
+
+@pytest.mark.parametrize('model_path', ['', 'missing.pkl', 'corrupt.pkl'])
+def test_rows_stay_uncategorized_without_a_model(tmp_path, monkeypatch, model_path):
+    (tmp_path / 'corrupt.pkl').write_bytes(b'not a pickle')
+    monkeypatch.setenv('CATEGORY_MODEL_PATH', str(tmp_path / model_path) if model_path else '')
+    batch = uncategorized_batch()
+    assert fill_batch(batch) == 0
+    assert batch.to_dicts() == uncategorized_batch().to_dicts()
+    categories = [UNCATEGORIZED]
+    assert fill_uncategorized(['ZZYZX TRADING CO'], categories) == 0 and categories == [UNCATEGORIZED]
+    assert model_fingerprint() is None
+
+
+def test_model_fills_only_uncategorized_rows(tmp_path, monkeypatch):
+    pytest.importorskip('sklearn')
+    path = tmp_path / 'category_model.pkl'
+    MLCategorizer.train(['ZZYZX TRADING CO', 'ZZYZX TRADING LLC', 'MARUGAME UDON', 'MARUGAME UDON IRVINE'],
+                        ['Shopping', 'Shopping', 'Restaurants', 'Restaurants']).save(str(path))
+    monkeypatch.setenv('CATEGORY_MODEL_PATH', str(path))
+    batch = uncategorized_batch()
+    assert fill_batch(batch) == 1
+    assert [row["category"] for row in batch.to_dicts()] == ['Shopping', 'Groceries']
+    assert model_fingerprint() is not None
@@ -0,0 +1,65 @@
+import io
+from benchmarks.synthetic import statement_pdf
+from categorizer import CATEGORY_KEYWORDS, set_category_keywords
+from parse_cache import ParseCache, parser_fingerprint, sha256_stream
+from tests.conftest import upload
+from transaction_batch import TransactionBatch
+
+
+def statement(description, amount=-4.5):
+    return {
+        "transactions": TransactionBatch.from_dicts([
+            {"date": '2024-03-02', "description": description, "category": 'Restaurants', "amount": amount,
+             "account": 'Discover Credit Card'}
+        ]),
+        "statement_info": {"bank": 'Discover'}
+    }
+
+
+def test_entries_round_trip(tmp_path):
+    cache = ParseCache(str(tmp_path / 'cache.sqlite3'))
+    assert cache.get('a') is None
+    cache.put('a', statement('BLUE BOTTLE COFFEE #12'))
+    statement_data = cache.get('a')
+    assert statement_data["statement_info"] == {"bank": 'Discover'}
+    assert [row["description"] for row in statement_data["transactions"].to_dicts()] == ['BLUE BOTTLE COFFEE #12']
+    assert cache.info()["hits"] == cache.info()["misses"] == 1
+
+
+def test_least_recently_used_entries_are_evicted_first(tmp_path):
+    cache = ParseCache(str(tmp_path / 'cache.sqlite3'))
+    cache.put('a', statement('A' * 500))
+    cache.max_bytes = cache.info()["bytes"] * 2
+    cache.put('b', statement('B' * 500))
+    cache.get('a')
+    cache.put('c', statement('C' * 500))
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.info()["evictions"] == 1
+
+
+def test_fingerprint_follows_the_category_rules():
+    before = parser_fingerprint()
+    assert parser_fingerprint(layout=True) != before
+    saved = dict(CATEGORY_KEYWORDS)
+    set_category_keywords({**CATEGORY_KEYWORDS, "Pets": ['PETCO']})
+    try:
+        assert parser_fingerprint() != before
+    finally:
+        set_category_keywords(saved)
+    assert parser_fingerprint() == before
+
+
+def test_hash_reads_the_whole_stream():
+    digest, size = sha256_stream(io.BytesIO(b'x' * 3000), chunk_size=1024)
+    assert size == 3000
+    assert digest == sha256_stream(io.BytesIO(b'x' * 3000))[0]
+
+
+def test_repeat_upload_is_served_from_the_cache(client, app):
+    pdf = statement_pdf('discover', 10)
+    first = upload(client, ('march.pdf', pdf)).get_json()
+    again = upload(client, ('march.pdf', pdf)).get_json()
+    assert again["transactions"] == first["transactions"]
+    info = client.get('/api/parse-cache').get_json()
+    assert (info["hits"], info["misses"], info["entries"]) == (1, 1, 1)
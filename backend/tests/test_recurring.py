@@ -0,0 +1,86 @@
+from datetime import date, timedelta
+from recurring import detect
+from transaction_batch import TransactionBatch, iso_to_day
+
+
+def charges(start, period, count, cents, merchant=1, jitter=(0,)):
+    """
+    (merchant, day, cents) columns of count charges every period days from start
+    """
+    day = iso_to_day(start)
+    return [(merchant, day + round(index * period) + jitter[index % len(jitter)], cents) for index in range(count)]
+
+
+def found(rows):
+    merchants, days, cents = zip(*rows)
+    return {charge["merchant"]: charge for charge in detect(merchants, days, cents)}
+
+
+def test_cadences():
+    recurring = found(charges('2024-01-15', 30.44, 6, 1599, merchant=1, jitter=(0, 2, -1))
+                      + charges('2024-01-01', 7, 8, 2500, merchant=2)
+                      + charges('2022-03-10', 365.25, 2, 13900, merchant=3)
+                      # Three visits to a restaurant weeks apart are not a subscription
+                      + [(4, iso_to_day('2024-01-03'), 1800), (4, iso_to_day('2024-01-24'), 2250),
+                         (4, iso_to_day('2024-03-30'), 1600)])
+    assert {merchant: charge["cadence"] for merchant, charge in recurring.items()} == {
+        1: 'monthly', 2: 'weekly', 3: 'annual'}
+    monthly = recurring[1]
+    assert (monthly["count"], monthly["amount"], monthly["regularity"]) == (6, 1599, 1.0)
+    assert monthly["next_day"] == monthly["last_day"] + 30
+
+
+def test_amounts_must_hold_steady():
+    # A price rise keeps the subscription; amounts all over the place are not one
+    assert found(charges('2024-01-15', 30.44, 3, 1599) + charges('2024-04-15', 30.44, 3, 1799, jitter=(1,)))
+    assert not found([(1, day, cents) for (_, day, _), cents
+                      in zip(charges('2024-01-15', 30.44, 6, 0), (1599, 4200, 900, 12000, 3100, 700))])
+
+
+def statement(month, rows):
+    return TransactionBatch.from_dicts([
+        {"date": f'2024-{month:02d}-{day:02d}', "description": description, "category": 'Entertainment',
+         "amount": amount, "account": 'Discover Credit Card'}
+        for day, description, amount in rows
+    ])
+
+
+def six_months():
+    """
+    A statement a month, January to June: a streaming subscription billed under store-number variants, a gym
+    billed every other Friday, a cancelled magazine and takeout on no schedule
+    """
+    fridays = [date(2024, 1, 5) + timedelta(days=14 * index) for index in range(13)]
+    takeout = {1: (4, 22), 2: (9,), 3: (1, 28), 4: (17,), 5: (3, 5), 6: (26,)}
+    for month in range(1, 7):
+        rows = [(14 + month % 3, f'STREAMFLIX.COM #{800 + month} LOS GATOS CA', -15.99)]
+        rows += [(day, 'GOLDEN DRAGON TAKEOUT', -12.5 - day) for day in takeout[month]]
+        rows += [(friday.day, 'IRON TEMPLE GYM', -25.0) for friday in fridays if friday.month == month]
+        if month <= 3:
+            rows.append((2, 'GAZETTE MAGAZINE', -9.99))
+        yield month, statement(month, rows)
+
+
+def test_recurring_across_stored_statements(client, app):
+    store = app.extensions['transaction_store']
+    for month, transactions in six_months():
+        store.add_statement(f'{month:064d}', 'fp', f'2024-{month:02d}.pdf', transactions)
+    charges_by_name = {charge["merchant"]: charge for charge in store.recurring()}
+    assert sorted(charges_by_name) == ['GAZETTE MAGAZINE', 'IRON TEMPLE GYM', 'STREAMFLIX']
+
+    streaming = charges_by_name['STREAMFLIX']
+    assert (streaming["cadence"], streaming["count"], streaming["amount"]) == ('monthly', 6, 15.99)
+    assert (streaming["first_date"], streaming["last_date"]) == ('2024-01-15', '2024-06-14')
+    assert streaming["description"] == 'STREAMFLIX.COM #806 LOS GATOS CA'
+    gym = charges_by_name['IRON TEMPLE GYM']
+    assert (gym["cadence"], gym["monthly_amount"], gym["active"]) == ('biweekly', 54.36, True)
+    assert not charges_by_name['GAZETTE MAGAZINE']["active"]
+
+    # Detected statement by statement, as a full rebuild finds them
+    with store._connect() as conn:
+        store._rebuild_recurring(conn)
+    assert store.recurring() == list(charges_by_name.values())
+
+    body = client.get('/api/recurring?active=1').get_json()
+    assert [charge["merchant"] for charge in body["recurring"]] == ['IRON TEMPLE GYM', 'STREAMFLIX']
+    assert body["monthly_total"] == round(54.36 + 15.99, 2)
@@ -0,0 +1,54 @@
+import json
+from transaction_batch import TransactionBatch, day_to_iso, iso_to_day, to_cents
+
+ROWS = [
+    {"date": '2024-03-02', "description": 'BLUE BOTTLE COFFEE #12', "category": 'Restaurants', "amount": -4.5,
+     "account": 'Discover Credit Card'},
+    {"date": '2024-02-29', "description": 'PAYROLL DEPOSIT ACME', "category": 'Financial', "amount": 2500.0,
+     "account": 'OCCU Checking'},
+    {"date": '2024-03-02', "description": 'SPROUTS FARMERS MKT', "category": 'Groceries', "amount": -82.15,
+     "account": 'Discover Credit Card'},
+    {"date": '2024-03-01', "description": 'MARUGAME UDON', "category": 'Restaurants', "amount": -0.07,
+     "account": 'Discover Credit Card'},
+]
+
+
+def test_dates_and_amounts_round_trip():
+    assert iso_to_day('1970-01-01') == 0
+    assert day_to_iso(iso_to_day('2024-02-29')) == '2024-02-29'
+    # Amounts whose float value is just below the cent still land on it
+    assert [to_cents(amount) for amount in (0.07, 82.15, -4.35, 1234567.89)] == [7, 8215, -435, 123456789]
+
+
+def test_rows_come_back_as_they_went_in():
+    batch = TransactionBatch.from_dicts(ROWS)
+    assert batch.to_dicts() == ROWS
+    # Each distinct string is stored once
+    assert batch.categories == ['Restaurants', 'Financial', 'Groceries']
+    assert batch.accounts == ['Discover Credit Card', 'OCCU Checking']
+    columns = json.loads(json.dumps(batch.to_columns()))
+    assert TransactionBatch.from_columns(columns).to_dicts() == ROWS
+
+
+def test_extend_re_encodes_the_other_batch():
+    batch = TransactionBatch.from_dicts(ROWS[2:])
+    batch.extend(TransactionBatch.from_dicts(ROWS[:2]))
+    assert batch.to_dicts() == ROWS[2:] + ROWS[:2]
+    assert batch.categories == ['Groceries', 'Restaurants', 'Financial']
+    batch.extend_rows([(iso_to_day('2024-03-05'), 'SHELL OIL 123', 'Transportation', 45.3)], 'OCCU Checking')
+    assert batch.to_dicts()[-1] == {"date": '2024-03-05', "description": 'SHELL OIL 123',
+                                    "category": 'Transportation', "amount": 45.3, "account": 'OCCU Checking'}
+
+
+def test_take_sort_and_recategorize():
+    batch = TransactionBatch.from_dicts(ROWS)
+    # Rows on the same day keep their order
+    assert [row["description"] for row in batch.sorted_by_date(reverse=True).to_dicts()] == [
+        'BLUE BOTTLE COFFEE #12', 'SPROUTS FARMERS MKT', 'MARUGAME UDON', 'PAYROLL DEPOSIT ACME']
+    assert batch.indexes_of_category('Restaurants') == [0, 3]
+    assert batch.indexes_of_category('Pets') == []
+    taken = batch.take([3])
+    taken.set_categories([(0, 'Noodles')])
+    assert taken.to_dicts() == [{**ROWS[3], "category": 'Noodles'}]
+    # The batch it was taken from is untouched
+    assert batch.to_dicts() == ROWS
@@ -0,0 +1,74 @@
+import pytest
+from transaction_batch import TransactionBatch
+
+
+def batch(rows, account='Discover Credit Card'):
+    return TransactionBatch.from_dicts([
+        {"date": date, "description": description, "category": 'Restaurants', "amount": amount, "account": account}
+        for date, description, amount in rows
+    ])
+
+
+def pages(store, **kwargs):
+    """
+    Every page of a query, following its cursors
+    """
+    cursor = None
+    while True:
+        transactions, cursor = store.query(cursor=cursor, **kwargs)
+        yield transactions
+        if cursor is None:
+            return
+
+
+@pytest.mark.parametrize('sort,direction', [('date', 'desc'), ('date', 'asc'), ('amount', 'asc')])
+def test_pages_cover_rows_with_equal_sort_keys_once(store, sort, direction):
+    # Seven rows to a date and one amount, so every page boundary falls inside a run of equal keys
+    store.add_statement('a' * 64, 'fp', 'march.pdf', batch(
+        (f'2024-03-{day:02d}', f'COFFEE {day} {n}', -4.5) for day in (1, 2, 3) for n in range(7)))
+    seen = [[row["id"] for row in page] for page in pages(store, sort=sort, direction=direction, limit=3)]
+    assert [len(page) for page in seen] == [3] * 7
+    ids = [row_id for page in seen for row_id in page]
+    assert sorted(ids) == sorted(set(ids)) and len(ids) == 21
+    if sort == 'date':
+        dates = [row["date"] for page in pages(store, sort=sort, direction=direction, limit=3) for row in page]
+        assert dates == sorted(dates, reverse=direction == 'desc')
+
+
+def test_filters_and_search(store):
+    store.add_statement('a' * 64, 'fp', 'discover.pdf', batch([
+        ('2024-03-02', 'BLUE BOTTLE COFFEE #12', -4.5),
+        ('2024-03-09', 'MARUGAME UDON', -18.0),
+        ('2024-04-01', 'PAYMENT - THANK YOU', 250.0),
+    ]))
+    store.add_statement('b' * 64, 'fp', 'checking.pdf', batch([('2024-03-05', 'BLUE BOTTLE COFFEE #3', -6.0)],
+                                                              account='OCCU Checking'))
+
+    def descriptions(**kwargs):
+        return sorted(row["description"] for row in store.query(**kwargs)[0])
+
+    assert descriptions(account='OCCU Checking') == ['BLUE BOTTLE COFFEE #3']
+    assert descriptions(start_date='2024-03-03', end_date='2024-03-31') == ['BLUE BOTTLE COFFEE #3', 'MARUGAME UDON']
+    assert descriptions(min_amount=0) == ['PAYMENT - THANK YOU']
+    assert descriptions(search='bottle coffee', max_amount=-5) == ['BLUE BOTTLE COFFEE #3']
+    # Too short for the trigram index, so matched by LIKE alone; wildcards are literal
+    assert descriptions(search='#1') == ['BLUE BOTTLE COFFEE #12']
+    assert descriptions(search='%') == []
+
+
+def test_replacing_a_statement_keeps_one_copy(store):
+    store.add_statement('a' * 64, 'fp', 'march.pdf', batch([('2024-03-02', 'MARUGAME UDON', -18.0)]))
+    assert store.has_statement('a' * 64, 'fp') and not store.has_statement('a' * 64, 'other')
+    store.add_statement('a' * 64, 'other', 'march.pdf', batch([('2024-03-02', 'MARUGAME UDON', -18.0)]))
+    assert store.info() == {"statements": 1, "transactions": 1}
+    assert [row["description"] for row in store.query(search='udon')[0]] == ['MARUGAME UDON']
+
+
+def test_bad_paging_arguments_are_rejected(store, client):
+    with pytest.raises(ValueError):
+        store.query(sort='id')
+    with pytest.raises(ValueError):
+        store.query(cursor='not-a-cursor')
+    response = client.get('/api/transactions?direction=sideways')
+    assert response.status_code == 400
+    assert client.get('/api/transactions').get_json() == {"transactions": [], "next_cursor": None}
@@ -0,0 +1,213 @@
+from array import array
+from itertools import repeat
+from datetime import date
+from functools import lru_cache
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+@lru_cache(maxsize=8192)
+def day_to_iso(day):
+    """
+    Convert days since 1970-01-01 to a yyyy-mm-dd string
+    """
+    return date.fromordinal(day + EPOCH_ORDINAL).isoformat()
+
+
+@lru_cache(maxsize=8192)
+def iso_to_day(iso_date):
+    """
+    Convert a yyyy-mm-dd string to days since 1970-01-01
+    """
+    return date.fromisoformat(iso_date).toordinal() - EPOCH_ORDINAL
+
+
+def to_cents(amount):
+    """
+    Convert a dollar amount to integer cents
+    """
+    # Exact for any amount with at most two decimals below 2**53 cents
+    return round(amount * 100)
+
+
+class TransactionBatch:
+    """
+    Struct-of-arrays batch of parsed transactions.
+
+    Dates are days since 1970-01-01 and amounts are integer cents, both in
+    compact arrays; categories and accounts are dictionary-encoded, so each
+    distinct string is stored once. The extractors append to a batch
+    directly and rows only become the API's JSON dicts in to_dicts().
+    """
+
+    def __init__(self):
+        self.days = array('i')
+        self.cents = array('q')
+        self.descriptions = []
+        self.category_codes = array('I')
+        self.categories = []
+        self.account_codes = array('I')
+        self.accounts = []
+        self._category_index = {}
+        self._account_index = {}
+
+    def __len__(self):
+        return len(self.cents)
+
+    def _category_code(self, category):
+        code = self._category_index.get(category)
+        if code is None:
+            code = self._category_index[category] = len(self.categories)
+            self.categories.append(category)
+        return code
+
+    def _account_code(self, account):
+        code = self._account_index.get(account)
+        if code is None:
+            code = self._account_index[account] = len(self.accounts)
+            self.accounts.append(account)
+        return code
+
+    def append(self, day, description, category, cents, account):
+        """
+        Add one transaction; day is days since the epoch and cents an integer
+        """
+        # Known strings, the common case, skip the encoding call
+        category_code = self._category_index.get(category)
+        if category_code is None:
+            category_code = self._category_code(category)
+        account_code = self._account_index.get(account)
+        if account_code is None:
+            account_code = self._account_code(account)
+        self.days.append(day)
+        self.descriptions.append(description)
+        self.category_codes.append(category_code)
+        self.cents.append(cents)
+        self.account_codes.append(account_code)
+
+    def extend_rows(self, rows, account):
+        """
+        Append (day, description, category, dollar amount) tuples that share one account
+        """
+        if not rows:
+            return
+        days, descriptions, categories, amounts = zip(*rows)
+        self.days.extend(days)
+        self.descriptions.extend(descriptions)
+        category_index = self._category_index
+        self.category_codes.extend([category_index[category] if category in category_index
+                                    else self._category_code(category) for category in categories])
+        self.cents.extend([round(amount * 100) for amount in amounts])
+        self.account_codes.extend(repeat(self._account_code(account), len(rows)))
+
+    def extend(self, other):
+        """
+        Append every transaction of another batch, re-encoding its strings
+        """
+        self.days.extend(other.days)
+        self.descriptions.extend(other.descriptions)
+        self.cents.extend(other.cents)
+        category_codes = [self._category_code(category) for category in other.categories]
+        self.category_codes.extend(category_codes[code] for code in other.category_codes)
+        account_codes = [self._account_code(account) for account in other.accounts]
+        self.account_codes.extend(account_codes[code] for code in other.account_codes)
+
+    def indexes_of_category(self, category):
+        """
+        Return the positions of the rows in a category
+        """
+        code = self._category_index.get(category)
+        if code is None:
+            return []
+        return [index for index, row_code in enumerate(self.category_codes) if row_code == code]
+
+    def set_categories(self, assignments):
+        """
+        Recategorize rows from (position, category) pairs
+        """
+        for index, category in assignments:
+            self.category_codes[index] = self._category_code(category)
+
+    def take(self, indexes):
+        """
+        Return a new batch with the rows at the given positions, in that order
+        """
+        batch = TransactionBatch()
+        batch.days = array('i', (self.days[index] for index in indexes))
+        batch.cents = array('q', (self.cents[index] for index in indexes))
+        batch.descriptions = [self.descriptions[index] for index in indexes]
+        batch.category_codes = array('I', (self.category_codes[index] for index in indexes))
+        batch.account_codes = array('I', (self.account_codes[index] for index in indexes))
+        batch.categories = list(self.categories)
+        batch.accounts = list(self.accounts)
+        batch._category_index = dict(self._category_index)
+        batch._account_index = dict(self._account_index)
+        return batch
+
+    def sorted_by_date(self, reverse=False):
+        """
+        Return a copy ordered by date; rows on the same day keep their order
+        """
+        return self.take(sorted(range(len(self)), key=self.days.__getitem__, reverse=reverse))
+
+    def rows(self):
+        """
+        Yield (date, description, category, amount, account) tuples
+        """
+        categories = self.categories
+        accounts = self.accounts
+        for day, description, category_code, cents, account_code in zip(
+                self.days, self.descriptions, self.category_codes, self.cents, self.account_codes):
+            yield day_to_iso(day), description, categories[category_code], cents / 100, accounts[account_code]
+
+    def to_dicts(self):
+        """
+        Return the transactions in the API's JSON shape
+        """
+        return [
+            {"date": date_iso, "description": description, "category": category, "amount": amount,
+             "account": account}
+            for date_iso, description, category, amount, account in self.rows()
+        ]
+
+    @classmethod
+    def from_dicts(cls, transactions):
+        """
+        Build a batch from transactions in the API's JSON shape
+        """
+        batch = cls()
+        for transaction in transactions:
+            batch.append(iso_to_day(transaction["date"]), transaction["description"], transaction["category"],
+                         to_cents(transaction["amount"]), transaction["account"])
+        return batch
+
+    def to_columns(self):
+        """
+        Return the batch as JSON-serializable columns
+        """
+        return {
+            "days": self.days.tolist(),
+            "descriptions": self.descriptions,
+            "category_codes": self.category_codes.tolist(),
+            "categories": self.categories,
+            "cents": self.cents.tolist(),
+            "account_codes": self.account_codes.tolist(),
+            "accounts": self.accounts
+        }
+
+    @classmethod
+    def from_columns(cls, columns):
+        """
+        Rebuild a batch from to_columns() output
+        """
+        batch = cls()
+        batch.days = array('i', columns["days"])
+        batch.descriptions = list(columns["descriptions"])
+        batch.category_codes = array('I', columns["category_codes"])
+        batch.categories = list(columns["categories"])
+        batch.cents = array('q', columns["cents"])
+        batch.account_codes = array('I', columns["account_codes"])
+        batch.accounts = list(columns["accounts"])
+        batch._category_index = {category: code for code, category in enumerate(batch.categories)}
+        batch._account_index = {account: code for code, account in enumerate(batch.accounts)}
+        return batch
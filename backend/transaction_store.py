@@ -0,0 +1,1012 @@
+import re
+import json
+import time
+import base64
+import sqlite3
+import logging
+import threading
+import numpy as np
+from contextlib import contextmanager
+import metrics
+from aggregates import rollup
+from categorizer import (CATEGORY_KEYWORDS, UNCATEGORIZED, KeywordCategorizer, changed_keywords, keyword_owners,
+                         stored_rules_changed)
+from dedup import MIN_BLOOM_CAPACITY, BloomFilter, dedup_keys
+from export import DEFAULT_EXPORT_CHUNK, EXPORT_COLUMNS
+from merchants import MAX_BUCKET_MERCHANTS, MerchantIndex, sketch
+from recurring import CADENCE_PERIODS, CADENCE_TOLERANCES, HISTORY_CHARGES, detect
+from transaction_batch import TransactionBatch, day_to_iso, iso_to_day, to_cents
+
+logger = logging.getLogger(__name__)
+
+# Columns /api/transactions can sort on
+SORT_COLUMNS = ('date', 'description', 'category', 'account', 'amount')
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Searches matching fewer rows than this are answered from the FTS index;
+# commoner terms are cheaper to check while walking the sort index
+RARE_MATCHES = 5000
+
+# Rollup tables maintained alongside the transactions: (table, key columns, summed columns)
+ROLLUP_TABLES = {
+    "monthly": ("monthly_totals", ("month",), ("income", "expense", "count")),
+    "merchants": ("merchant_totals", ("merchant_id",), ("expense", "count")),
+    "category_months": ("category_month_totals", ("category", "month"), ("expense", "count")),
+    "accounts": ("account_totals", ("account",), ("net", "count")),
+}
+
+DEFAULT_TOP_MERCHANTS = 10
+
+# Dedup keys per IN (...) lookup, well under SQLite's bound-parameter limit
+DEDUP_LOOKUP_CHUNK = 500
+
+# Recurring charges per description lookup
+RECURRING_LOOKUP_CHUNK = 500
+
+# Keywords, or transaction ids, per IN (...) lookup when recategorizing
+RECATEGORIZE_LOOKUP_CHUNK = 500
+
+# Descriptions, bucket keys or merchant ids per IN (...) lookup when assigning merchants
+MERCHANT_LOOKUP_CHUNK = 500
+
+DEDUP_CHECKS = metrics.registry.counter(
+    'pennysprout_dedup_checks_total', 'Dedup key checks by outcome', labels=('outcome',))
+
+
+def category_source(category, decision, category_keywords):
+    """
+    Tell where a parsed row's category came from, given the keyword rules' decision for its description:
+    'rules', 'model' or 'statement'.
+
+    The model only fills rows the rules leave Uncategorized, with one of the
+    rules' categories, while statements name their own categories. A
+    statement category that happens to match the rules' decision, or to be
+    one of the rules' categories where they have none, counts as the rules'
+    or the model's, so what is called 'statement' is never either.
+    """
+    if category == decision:
+        return 'rules'
+    if decision == UNCATEGORIZED and category in category_keywords:
+        return 'model'
+    return 'statement'
+
+
+def encode_cursor(value, row_id):
+    """
+    Opaque keyset cursor for the last row of a page
+    """
+    return base64.urlsafe_b64encode(json.dumps([value, row_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Return the (sort value, id) pair a cursor was made from
+    """
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(row_id, int):
+        raise ValueError("Invalid cursor")
+    return value, row_id
+
+
+def like_pattern(text):
+    """
+    LIKE pattern matching text anywhere, with wildcards in text escaped
+    """
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def filter_clauses(account=None, category=None, start_date=None, end_date=None, min_amount=None, max_amount=None):
+    """
+    Return (WHERE clauses on transactions t, their parameters) for the filters that are set
+    """
+    where = []
+    params = []
+    for clause, value in (("t.account = ?", account), ("t.category = ?", category),
+                          ("t.date >= ?", start_date), ("t.date <= ?", end_date),
+                          ("t.amount >= ?", min_amount), ("t.amount <= ?", max_amount)):
+        if value is not None:
+            where.append(clause)
+            params.append(value)
+    return where, params
+
+
+class TransactionStore:
+    """
+    Persistent SQLite store of parsed transactions.
+
+    Transactions are grouped by the statement they came from, keyed on the
+    SHA-256 of the uploaded PDF, so re-uploading a statement replaces its rows
+    instead of duplicating them. Descriptions have a trigram FTS index, so
+    search is a case-insensitive substring match like the old client-side filter.
+
+    Monthly, merchant, category-by-month and account totals are kept in
+    rollup tables that each statement's rows are added to or subtracted from
+    as it is stored or replaced, so reading them never scans transactions.
+
+    Every row also carries its dedup key (see dedup.dedup_keys) in an
+    indexed column. An in-memory Bloom filter of the stored keys answers
+    most lookups for new rows without touching the index; it catches up
+    with statements stored by other processes through statement_log.
+
+    Recurring charges (see recurring.detect) are kept in recurring_charges.
+    Storing a statement re-detects only the merchants it charged, from their
+    latest charges in the (merchant_id, date, amount) index.
+
+    keyword_matches is an inverted index from each keyword of the category
+    rules the stored categories reflect (kept in settings) to the rows whose
+    description contains it, ignoring case, so a rule change re-evaluates only
+    the rows it can affect (see recategorize). Each row also records where
+    its category came from (see category_source), so the category model
+    can train on the categories statements supplied alone.
+
+    Descriptions are clustered into merchants (see merchants.MerchantIndex)
+    as they are stored: merchant_buckets holds each merchant's LSH band
+    keys, so a new description is compared only with the merchants sharing
+    a bucket with it. A bucket takes no merchants past the first over
+    merchants.MAX_BUCKET_MERCHANTS, and such generic buckets are skipped by
+    their row count without reading their merchants. Each row carries its
+    merchant_id, and merchant totals and recurring charges are kept per
+    merchant, so every view groups a description under the same merchant.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._rules = None
+        self._bloom = None
+        self._bloom_seq = 0
+        self._bloom_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Merchant totals were kept per description before merchants were clustered
+            rekey_merchant_totals = 'merchant' in [row[1] for row in conn.execute("PRAGMA table_info(merchant_totals)")]
+            if rekey_merchant_totals:
+                conn.execute("DROP TABLE merchant_totals")
+            # Likewise recurring charges, which were detected per merchant key
+            rekey_recurring = 'merchant' in [row[1] for row in conn.execute("PRAGMA table_info(recurring_charges)")]
+            if rekey_recurring:
+                conn.execute("DROP TABLE recurring_charges")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS statements (
+                    id INTEGER PRIMARY KEY,
+                    sha256 TEXT NOT NULL UNIQUE,
+                    fingerprint TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    ingested_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS transactions (
+                    id INTEGER PRIMARY KEY,
+                    statement_id INTEGER NOT NULL REFERENCES statements (id),
+                    date TEXT NOT NULL,
+                    description TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    category_source TEXT NOT NULL DEFAULT '',
+                    account TEXT NOT NULL,
+                    amount REAL NOT NULL,
+                    dedup_key INTEGER,
+                    merchant_id INTEGER
+                );
+                -- Every index implicitly ends in the rowid, which is the keyset tie-breaker
+                CREATE INDEX IF NOT EXISTS transactions_date ON transactions (date);
+                CREATE INDEX IF NOT EXISTS transactions_account ON transactions (account, date);
+                CREATE INDEX IF NOT EXISTS transactions_category ON transactions (category, date);
+                CREATE INDEX IF NOT EXISTS transactions_amount ON transactions (amount);
+                CREATE INDEX IF NOT EXISTS transactions_description ON transactions (description);
+                CREATE INDEX IF NOT EXISTS transactions_statement ON transactions (statement_id);
+                CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5 (
+                    description, content='transactions', content_rowid='id', tokenize='trigram'
+                );
+                -- Rollups, amounts in cents
+                CREATE TABLE IF NOT EXISTS monthly_totals (
+                    month TEXT PRIMARY KEY,
+                    income INTEGER NOT NULL,
+                    expense INTEGER NOT NULL,
+                    count INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS merchant_totals (
+                    merchant_id INTEGER PRIMARY KEY,
+                    expense INTEGER NOT NULL,
+                    count INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS merchant_totals_expense ON merchant_totals (expense);
+                CREATE TABLE IF NOT EXISTS category_month_totals (
+                    category TEXT NOT NULL,
+                    month TEXT NOT NULL,
+                    expense INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (category, month)
+                );
+                CREATE TABLE IF NOT EXISTS account_totals (
+                    account TEXT PRIMARY KEY,
+                    net INTEGER NOT NULL,
+                    count INTEGER NOT NULL
+                );
+                -- Recurring charges per merchant, amounts in cents
+                CREATE TABLE IF NOT EXISTS recurring_charges (
+                    merchant_id INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    account TEXT NOT NULL,
+                    cadence TEXT NOT NULL,
+                    amount INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    first_date TEXT NOT NULL,
+                    last_date TEXT NOT NULL,
+                    next_date TEXT NOT NULL,
+                    regularity REAL NOT NULL
+                );
+                -- Append-only log of stored statements; seq is never reused, unlike rowids
+                CREATE TABLE IF NOT EXISTS statement_log (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    statement_id INTEGER NOT NULL
+                );
+                -- Keywords of the stored category rules found in each row's lowercased description
+                CREATE TABLE IF NOT EXISTS keyword_matches (
+                    keyword TEXT NOT NULL,
+                    transaction_id INTEGER NOT NULL,
+                    PRIMARY KEY (keyword, transaction_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS keyword_matches_transaction ON keyword_matches (transaction_id);
+                CREATE TABLE IF NOT EXISTS settings (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+                -- Description clusters: each merchant's representative MinHash signature and LSH buckets
+                CREATE TABLE IF NOT EXISTS merchants (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    signature BLOB NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS merchant_buckets (
+                    bucket INTEGER NOT NULL,
+                    merchant_id INTEGER NOT NULL,
+                    PRIMARY KEY (bucket, merchant_id)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS merchant_descriptions (
+                    description TEXT PRIMARY KEY,
+                    merchant_id INTEGER NOT NULL
+                ) WITHOUT ROWID;
+            """)
+            # Stores created before deduplication get the column and their keys once
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(transactions)")]
+            if 'dedup_key' not in columns:
+                conn.execute("ALTER TABLE transactions ADD COLUMN dedup_key INTEGER")
+                self._backfill_dedup_keys(conn)
+            conn.execute("CREATE INDEX IF NOT EXISTS transactions_dedup_key ON transactions (dedup_key)")
+            # Stores created before keyword indexing take the current rules as the ones they reflect
+            if conn.execute("SELECT 1 FROM settings WHERE key = 'category_keywords'").fetchone() is None:
+                self._set_category_rules(conn, CATEGORY_KEYWORDS)
+            # and a first version for processes to tell later changes by
+            conn.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('category_rules_version', '1')")
+            # Stores created before category sources derive them from the stored rules once
+            if 'category_source' not in columns:
+                conn.execute("ALTER TABLE transactions ADD COLUMN category_source TEXT NOT NULL DEFAULT ''")
+                rows = conn.execute("SELECT id, description, category FROM transactions").fetchall()
+                sources = self._category_sources(conn, [row[1] for row in rows], [row[2] for row in rows])
+                conn.executemany("UPDATE transactions SET category_source = ? WHERE id = ?",
+                                 zip(sources, (row[0] for row in rows)))
+            # Keywords were once indexed from normalized descriptions, which parsing does not categorize
+            if conn.execute("SELECT 1 FROM settings WHERE key = 'keyword_index'").fetchone() is None:
+                conn.execute("DELETE FROM keyword_matches")
+                self._index_keywords(conn, conn.execute("SELECT id, description FROM transactions").fetchall())
+                conn.execute("INSERT INTO settings (key, value) VALUES ('keyword_index', 'description')")
+            # Stores created before merchant clustering cluster every description once
+            has_transactions = conn.execute("SELECT 1 FROM transactions LIMIT 1").fetchone()
+            if has_transactions and not conn.execute("SELECT 1 FROM merchants LIMIT 1").fetchone():
+                logger.info("Clustering stored descriptions into merchants")
+                self._assign_merchants(conn, [description for (description,) in conn.execute(
+                    "SELECT DISTINCT description FROM transactions")])
+            # Stores created before rows carried their merchant take it from the clusters once, and
+            # re-detect recurring charges by it; their merchant keys go unused
+            if 'merchant_id' not in columns:
+                conn.execute("ALTER TABLE transactions ADD COLUMN merchant_id INTEGER")
+                conn.execute("UPDATE transactions SET merchant_id = (SELECT merchant_id FROM merchant_descriptions d "
+                             "WHERE d.description = transactions.description)")
+                conn.execute("DROP INDEX IF EXISTS transactions_merchant")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS transactions_merchant_id ON transactions (merchant_id, date, amount)")
+            if rekey_recurring or 'merchant_id' not in columns:
+                self._rebuild_recurring(conn)
+            # Stores created before buckets were capped keep one merchant past the limit in each generic one
+            if conn.execute("SELECT 1 FROM settings WHERE key = 'merchant_buckets_capped'").fetchone() is None:
+                conn.execute("""
+                    DELETE FROM merchant_buckets WHERE (bucket, merchant_id) IN (
+                        SELECT bucket, merchant_id FROM (
+                            SELECT bucket, merchant_id, ROW_NUMBER() OVER (PARTITION BY bucket ORDER BY merchant_id) AS n
+                            FROM merchant_buckets
+                        ) WHERE n > ?
+                    )
+                """, (MAX_BUCKET_MERCHANTS + 1,))
+                conn.execute("INSERT INTO settings (key, value) VALUES ('merchant_buckets_capped', '1')")
+            # Stores created before the rollups existed are backfilled once
+            has_rollups = conn.execute("SELECT 1 FROM account_totals LIMIT 1").fetchone()
+            if has_transactions and (rekey_merchant_totals or not has_rollups):
+                self._rebuild_rollups(conn)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        # WAL keeps the store consistent on power loss with NORMAL; only the last commits may be lost
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def has_statement(self, sha256, fingerprint):
+        """
+        Return True if the statement was already stored under this parser fingerprint
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT fingerprint FROM statements WHERE sha256 = ?", (sha256,)).fetchone()
+        return row is not None and row[0] == fingerprint
+
+    def add_statement(self, sha256, fingerprint, filename, transactions, keys=None):
+        """
+        Store a statement's TransactionBatch, replacing any earlier copy of it.
+
+        keys are the rows' dedup keys, computed here if not given; pass them
+        when the batch was already deduplicated, as keys count repeats.
+        """
+        if keys is None:
+            keys = dedup_keys(transactions)
+        with self._connect() as conn:
+            # Take the write lock before the lookup so concurrent uploads of one statement serialize
+            conn.execute("BEGIN IMMEDIATE")
+            merchant_ids = self._assign_merchants(conn, transactions.descriptions)
+            charged = {merchant_ids[description] for description, cents
+                       in zip(transactions.descriptions, transactions.cents) if cents < 0}
+            row = conn.execute("SELECT id FROM statements WHERE sha256 = ?", (sha256,)).fetchone()
+            if row is not None:
+                charged.update(merchant_id for (merchant_id,) in conn.execute(
+                    "SELECT DISTINCT merchant_id FROM transactions WHERE statement_id = ? AND amount < 0", (row[0],)))
+                self._delete_statement(conn, row[0])
+            statement_id = conn.execute(
+                "INSERT INTO statements (sha256, fingerprint, filename, ingested_at) VALUES (?, ?, ?, ?)",
+                (sha256, fingerprint, filename, time.time())).lastrowid
+            sources = self._category_sources(conn, transactions.descriptions,
+                                             [transactions.categories[code] for code in transactions.category_codes])
+            conn.executemany(
+                "INSERT INTO transactions (statement_id, date, description, category, category_source, account, "
+                "amount, dedup_key, merchant_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ((statement_id, date, description, category or '', source, account or '', amount, key,
+                  merchant_ids[description])
+                 for (date, description, category, amount, account), source, key
+                 in zip(transactions.rows(), sources, keys)))
+            conn.execute("INSERT INTO statement_log (statement_id) VALUES (?)", (statement_id,))
+            conn.execute("INSERT INTO transactions_fts (rowid, description) "
+                         "SELECT id, description FROM transactions WHERE statement_id = ?", (statement_id,))
+            self._index_keywords(conn, conn.execute(
+                "SELECT id, description FROM transactions WHERE statement_id = ?", (statement_id,)).fetchall())
+            self._apply_rollup(conn, rollup(transactions, merchant_ids), 1)
+            self._refresh_recurring(conn, charged)
+        logger.debug(f"Stored {len(transactions)} transactions from {filename}")
+        return statement_id
+
+    def _delete_statement(self, conn, statement_id):
+        self._apply_rollup(conn, self._statement_rollup(conn, statement_id), -1)
+        # External-content FTS rows are removed by replaying the indexed values
+        conn.execute("INSERT INTO transactions_fts (transactions_fts, rowid, description) "
+                     "SELECT 'delete', id, description FROM transactions WHERE statement_id = ?", (statement_id,))
+        conn.execute("DELETE FROM keyword_matches WHERE transaction_id IN "
+                     "(SELECT id FROM transactions WHERE statement_id = ?)", (statement_id,))
+        conn.execute("DELETE FROM transactions WHERE statement_id = ?", (statement_id,))
+        conn.execute("DELETE FROM statements WHERE id = ?", (statement_id,))
+
+    def find_dedup_keys(self, keys, exclude_sha256=None):
+        """
+        Return {dedup key: filename of its statement} for the given keys that
+        are already stored, ignoring the statement with exclude_sha256
+        """
+        with self._connect() as conn:
+            maybe = self._sync_bloom(conn).might_contain_many(keys).tolist()
+            candidates = [key for key, present in zip(keys, maybe) if present]
+            DEDUP_CHECKS.inc(len(keys) - len(candidates), outcome='bloom_negative')
+            found = {}
+            for start in range(0, len(candidates), DEDUP_LOOKUP_CHUNK):
+                chunk = candidates[start:start + DEDUP_LOOKUP_CHUNK]
+                for key, filename in conn.execute(
+                        "SELECT t.dedup_key, s.filename FROM transactions t "
+                        "JOIN statements s ON s.id = t.statement_id "
+                        f"WHERE t.dedup_key IN ({', '.join('?' * len(chunk))}) AND s.sha256 != ?",
+                        (*chunk, exclude_sha256 or '')):
+                    found.setdefault(key, filename)
+        DEDUP_CHECKS.inc(len(found), outcome='lookup_hit')
+        DEDUP_CHECKS.inc(len(candidates) - len(found), outcome='lookup_miss')
+        return found
+
+    def warm(self):
+        """
+        Build the in-memory state the first upload or rule edit would
+        otherwise build: the dedup Bloom filter and the compiled category rules
+        """
+        with self._connect() as conn:
+            self._sync_bloom(conn)
+            self._category_rules(conn)
+
+    def _sync_bloom(self, conn):
+        """
+        Return the Bloom filter of stored dedup keys, bringing it up to date
+        """
+        with self._bloom_lock:
+            # Read the log position first: rows stored meanwhile are at worst added twice
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM statement_log").fetchone()[0]
+            if self._bloom is not None and seq > self._bloom_seq:
+                self._bloom.add_many([key for (key,) in conn.execute(
+                    "SELECT t.dedup_key FROM statement_log l JOIN transactions t ON t.statement_id = l.statement_id "
+                    "WHERE l.seq > ?", (self._bloom_seq,))])
+                self._bloom_seq = seq
+            if self._bloom is None or self._bloom.count > self._bloom.capacity:
+                # Replaced statements leave stale keys behind, so a full filter is rebuilt, not grown
+                count = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+                bloom = BloomFilter(max(MIN_BLOOM_CAPACITY, 2 * count))
+                bloom.add_many([key for (key,) in conn.execute("SELECT dedup_key FROM transactions")])
+                logger.info(f"Built dedup Bloom filter over {bloom.count} transactions")
+                self._bloom = bloom
+                self._bloom_seq = seq
+            return self._bloom
+
+    def _backfill_dedup_keys(self, conn):
+        logger.info("Computing dedup keys of stored transactions")
+        for (statement_id,) in conn.execute("SELECT id FROM statements").fetchall():
+            ids = []
+            batch = TransactionBatch()
+            for row_id, date, description, category, account, amount in conn.execute(
+                    "SELECT id, date, description, category, account, amount FROM transactions "
+                    "WHERE statement_id = ? ORDER BY id", (statement_id,)):
+                ids.append(row_id)
+                batch.append(iso_to_day(date), description, category, to_cents(amount), account)
+            conn.executemany("UPDATE transactions SET dedup_key = ? WHERE id = ?", zip(dedup_keys(batch), ids))
+            conn.execute("INSERT INTO statement_log (statement_id) VALUES (?)", (statement_id,))
+
+    def _statement_rows(self, conn, statement_id):
+        batch = TransactionBatch()
+        for date, description, category, account, amount in conn.execute(
+                "SELECT date, description, category, account, amount FROM transactions WHERE statement_id = ?",
+                (statement_id,)):
+            batch.append(iso_to_day(date), description, category, to_cents(amount), account)
+        return batch
+
+    def _statement_rollup(self, conn, statement_id):
+        batch = self._statement_rows(conn, statement_id)
+        return rollup(batch, self._assign_merchants(conn, batch.descriptions))
+
+    def _assign_merchants(self, conn, descriptions):
+        """
+        Return {description: merchant id} for descriptions, clustering the ones
+        not seen before into merchants.
+
+        Only merchants sharing an LSH bucket with a new description are read
+        into the MerchantIndex that assigns them; new merchants and their
+        buckets, renames and the new descriptions' mappings are written back.
+        """
+        descriptions = list(dict.fromkeys(descriptions))
+        merchant_ids = {}
+        for start in range(0, len(descriptions), MERCHANT_LOOKUP_CHUNK):
+            chunk = descriptions[start:start + MERCHANT_LOOKUP_CHUNK]
+            merchant_ids.update(conn.execute(
+                "SELECT description, merchant_id FROM merchant_descriptions "
+                f"WHERE description IN ({', '.join('?' * len(chunk))})", chunk))
+        new = [description for description in descriptions if description not in merchant_ids]
+        if not new:
+            return merchant_ids
+
+        sketches = sketch(new)
+        index = MerchantIndex(conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM merchants").fetchone()[0])
+        buckets = sorted(set(sketches[2].ravel().tolist()))
+        filed = []
+        for start in range(0, len(buckets), MERCHANT_LOOKUP_CHUNK):
+            chunk = buckets[start:start + MERCHANT_LOOKUP_CHUNK]
+            placeholders = ', '.join('?' * len(chunk))
+            # Generic buckets are known by their count alone; only the others' merchants are read
+            for (bucket,) in conn.execute(f"SELECT bucket FROM merchant_buckets WHERE bucket IN ({placeholders}) "
+                                          "GROUP BY bucket HAVING COUNT(*) > ?", (*chunk, MAX_BUCKET_MERCHANTS)):
+                index.mark_generic(bucket)
+            filed += conn.execute(
+                "SELECT bucket, merchant_id FROM merchant_buckets WHERE bucket IN ("
+                f"SELECT bucket FROM merchant_buckets WHERE bucket IN ({placeholders}) "
+                "GROUP BY bucket HAVING COUNT(*) <= ?)", (*chunk, MAX_BUCKET_MERCHANTS)).fetchall()
+        candidates = sorted({merchant_id for _, merchant_id in filed})
+        for start in range(0, len(candidates), MERCHANT_LOOKUP_CHUNK):
+            chunk = candidates[start:start + MERCHANT_LOOKUP_CHUNK]
+            for merchant_id, name, signature in conn.execute(
+                    f"SELECT id, name, signature FROM merchants WHERE id IN ({', '.join('?' * len(chunk))})", chunk):
+                index.add_merchant(merchant_id, name, np.frombuffer(signature, dtype=np.uint64))
+        for bucket, merchant_id in filed:
+            index.file(bucket, merchant_id)
+
+        assigned, created, renamed = index.assign(new, sketches)
+        conn.executemany("INSERT INTO merchants (id, name, signature) VALUES (?, ?, ?)",
+                         ((merchant_id, name, signature.tobytes()) for merchant_id, name, signature, _ in created))
+        # A bucket stops taking merchants once it is generic, so none holds more than one past the limit
+        conn.executemany("INSERT OR IGNORE INTO merchant_buckets (bucket, merchant_id) SELECT ?, ? "
+                         "WHERE (SELECT COUNT(*) FROM merchant_buckets WHERE bucket = ?) <= ?",
+                         ((key, merchant_id, key, MAX_BUCKET_MERCHANTS)
+                          for merchant_id, _, _, keys in created for key in keys))
+        conn.executemany("UPDATE merchants SET name = ? WHERE id = ?",
+                         ((name, merchant_id) for merchant_id, name in renamed.items()))
+        conn.executemany("INSERT INTO merchant_descriptions (description, merchant_id) VALUES (?, ?)",
+                         zip(new, assigned))
+        merchant_ids.update(zip(new, assigned))
+        return merchant_ids
+
+    def merchant_names(self, descriptions):
+        """
+        Return {description: merchant name} for the stored descriptions among descriptions
+        """
+        with self._connect() as conn:
+            return self._merchant_names(conn, descriptions)
+
+    def _merchant_names(self, conn, descriptions):
+        descriptions = list(set(descriptions))
+        names = {}
+        for start in range(0, len(descriptions), MERCHANT_LOOKUP_CHUNK):
+            chunk = descriptions[start:start + MERCHANT_LOOKUP_CHUNK]
+            names.update(conn.execute(
+                "SELECT d.description, m.name FROM merchant_descriptions d JOIN merchants m ON m.id = d.merchant_id "
+                f"WHERE d.description IN ({', '.join('?' * len(chunk))})", chunk))
+        return names
+
+    def _apply_rollup(self, conn, totals, sign):
+        """
+        Add (sign=1) or subtract (sign=-1) a batch's totals from the rollup tables
+        """
+        for section, rows in totals.items():
+            if not rows:
+                continue
+            table, keys, columns = ROLLUP_TABLES[section]
+            updates = ', '.join(f"{column} = {column} + excluded.{column}" for column in columns)
+            conn.executemany(
+                f"INSERT INTO {table} ({', '.join(keys + columns)}) "
+                f"VALUES ({', '.join('?' * (len(keys) + len(columns)))}) "
+                f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}",
+                (row[:len(keys)] + tuple(sign * value for value in row[len(keys):]) for row in rows))
+            if sign < 0:
+                conn.execute(f"DELETE FROM {table} WHERE count <= 0")
+
+    def _rebuild_rollups(self, conn):
+        logger.info("Rebuilding transaction rollups")
+        for table, _, _ in ROLLUP_TABLES.values():
+            conn.execute(f"DELETE FROM {table}")
+        for (statement_id,) in conn.execute("SELECT id FROM statements").fetchall():
+            self._apply_rollup(conn, self._statement_rollup(conn, statement_id), 1)
+
+    def _category_rules(self, conn):
+        """
+        Return the category -> keywords table stored categories reflect, and its KeywordCategorizer
+        """
+        text = conn.execute("SELECT value FROM settings WHERE key = 'category_keywords'").fetchone()[0]
+        rules = self._rules
+        # Another process may have changed the rules since they were compiled
+        if rules is None or rules[0] != text:
+            category_keywords = json.loads(text)
+            rules = self._rules = (text, category_keywords, KeywordCategorizer(category_keywords))
+        return rules[1], rules[2]
+
+    def _category_sources(self, conn, descriptions, categories):
+        """
+        Return the category_source of each (description, category) row under the stored rules
+        """
+        category_keywords, categorizer = self._category_rules(conn)
+        # Histories repeat merchants, so each description is categorized once
+        decisions = {}
+        sources = []
+        for description, category in zip(descriptions, categories):
+            decision = decisions.get(description)
+            if decision is None:
+                decision = decisions[description] = categorizer.categorize(description)
+            sources.append(category_source(category or UNCATEGORIZED, decision, category_keywords))
+        return sources
+
+    def _set_category_rules(self, conn, category_keywords, builtin=True):
+        """
+        Store the rules, bumping their version if they changed (see categorizer.use_stored_rules)
+        """
+        text = json.dumps({category: list(keywords) for category, keywords in category_keywords.items()})
+        changed = conn.execute("INSERT INTO settings (key, value) VALUES ('category_keywords', ?) "
+                               "ON CONFLICT (key) DO UPDATE SET value = excluded.value "
+                               "WHERE value != excluded.value", (text,)).rowcount
+        if changed:
+            conn.execute("INSERT INTO settings (key, value) VALUES ('category_rules_version', '1') "
+                         "ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+        conn.execute("INSERT INTO settings (key, value) VALUES ('category_rules_builtin', ?) "
+                     "ON CONFLICT (key) DO UPDATE SET value = excluded.value", ('1' if builtin else '0',))
+
+    def follows_builtin_rules(self):
+        """
+        True unless the stored category rules were edited (see recategorize)
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM settings WHERE key = 'category_rules_builtin'").fetchone()
+        return row is None or row[0] == '1'
+
+    def _index_keywords(self, conn, rows):
+        """
+        Add the keyword_matches entries of (id, description) rows under the stored rules
+        """
+        keywords_in = self._category_rules(conn)[1].keywords_in
+        found = {}
+        entries = []
+        for row_id, description in rows:
+            keywords = found.get(description)
+            if keywords is None:
+                keywords = found[description] = keywords_in(description)
+            entries.extend((keyword, row_id) for keyword in keywords)
+        conn.executemany("INSERT OR IGNORE INTO keyword_matches (keyword, transaction_id) VALUES (?, ?)", entries)
+
+    def _keyword_rows(self, conn, keyword):
+        """
+        Return the ids of rows whose description contains a keyword, ignoring case
+        """
+        # Trigrams narrow the candidates to rows holding every word of three or more characters
+        words = [word for word in keyword.split() if len(word) >= 3]
+        if words:
+            rows = conn.execute(
+                "SELECT t.id, t.description FROM transactions_fts JOIN transactions t ON t.id = transactions_fts.rowid "
+                "WHERE transactions_fts MATCH ?", (' '.join('"' + word.replace('"', '""') + '"' for word in words),))
+        else:
+            rows = conn.execute("SELECT id, description FROM transactions WHERE description LIKE ? ESCAPE '\\'",
+                                (like_pattern(keyword.strip()),))
+        contains = {}
+        ids = []
+        for row_id, description in rows:
+            found = contains.get(description)
+            if found is None:
+                found = contains[description] = keyword in description.lower()
+            if found:
+                ids.append(row_id)
+        return ids
+
+    def recategorize(self, category_keywords, fallback=None, builtin=False):
+        """
+        Bring stored categories in line with a new category -> keywords table.
+
+        Only rows containing a keyword the change affects (see
+        categorizer.changed_keywords) are read: through keyword_matches for
+        keywords already indexed, through the description FTS index for new
+        ones. Of those, rows whose category the rules or the model gave (see
+        category_source) get the new rules' category, so statement-supplied
+        categories are kept. fallback(descriptions, categories), such as
+        ml_categorizer.fill_uncategorized, may fill the ones the new rules
+        leave Uncategorized. The category rollups move with the rows. The
+        new rules are stored as the ones every process categorizes by (see
+        categorizer.use_stored_rules); builtin=False marks them as edited,
+        so they no longer follow the built-in CATEGORY_KEYWORDS.
+
+        Returns the affected keywords, how many rows were checked, and the
+        changed rows with their previous category.
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            old_keywords = self._category_rules(conn)[0]
+            new_categorizer = KeywordCategorizer(category_keywords)
+            changed = sorted(changed_keywords(old_keywords, category_keywords))
+            indexed = keyword_owners(old_keywords)
+            kept = keyword_owners(category_keywords)
+
+            ids = set()
+            lookup = [keyword for keyword in changed if keyword in indexed]
+            for start in range(0, len(lookup), RECATEGORIZE_LOOKUP_CHUNK):
+                chunk = lookup[start:start + RECATEGORIZE_LOOKUP_CHUNK]
+                ids.update(row_id for (row_id,) in conn.execute(
+                    f"SELECT transaction_id FROM keyword_matches WHERE keyword IN ({', '.join('?' * len(chunk))})",
+                    chunk))
+            for keyword in changed:
+                if keyword not in indexed:
+                    found = self._keyword_rows(conn, keyword)
+                    conn.executemany("INSERT OR IGNORE INTO keyword_matches (keyword, transaction_id) VALUES (?, ?)",
+                                     ((keyword, row_id) for row_id in found))
+                    ids.update(found)
+            conn.executemany("DELETE FROM keyword_matches WHERE keyword = ?",
+                             ((keyword,) for keyword in changed if keyword not in kept))
+
+            rows = []
+            ids = sorted(ids)
+            for start in range(0, len(ids), RECATEGORIZE_LOOKUP_CHUNK):
+                chunk = ids[start:start + RECATEGORIZE_LOOKUP_CHUNK]
+                rows += conn.execute(
+                    "SELECT id, date, description, category, account, amount, category_source FROM transactions "
+                    f"WHERE id IN ({', '.join('?' * len(chunk))})", chunk).fetchall()
+            # Histories repeat merchants, so each description is categorized once
+            rules = {}
+            checked = []
+            categories = []
+            for row in rows:
+                if row[6] == 'statement':
+                    continue
+                decision = rules.get(row[2])
+                if decision is None:
+                    decision = rules[row[2]] = new_categorizer.categorize(row[2])
+                checked.append(row)
+                categories.append(decision)
+            if fallback is not None:
+                fallback([row[2] for row in checked], categories)
+
+            changes = [(row, category) for row, category in zip(checked, categories)
+                       if category != (row[3] or UNCATEGORIZED)]
+            if changes:
+                conn.executemany("UPDATE transactions SET category = ?, category_source = ? WHERE id = ?",
+                                 ((category, 'rules' if category == rules[row[2]] else 'model', row[0])
+                                  for row, category in changes))
+                # Expenses move between (category, month) rollup rows, as aggregates.rollup groups them
+                before = {}
+                after = {}
+                for (_, date, _, previous, _, amount, _), category in changes:
+                    if amount < 0:
+                        month = date[:7]
+                        for totals, key in ((before, (previous or UNCATEGORIZED, month)), (after, (category, month))):
+                            expense, count = totals.get(key, (0, 0))
+                            totals[key] = (expense - to_cents(amount), count + 1)
+                self._apply_rollup(conn, {"category_months": [key + value for key, value in before.items()]}, -1)
+                self._apply_rollup(conn, {"category_months": [key + value for key, value in after.items()]}, 1)
+            self._set_category_rules(conn, category_keywords, builtin)
+        # This process categorizes by the new rules from now on, the others within categorizer.RULES_POLL_INTERVAL
+        stored_rules_changed()
+
+        logger.info(f"Recategorized {len(changes)} of {len(checked)} transactions for {len(changed)} keyword changes")
+        return {
+            "keywords": changed,
+            "checked": len(checked),
+            "changes": [
+                {"id": row[0], "date": row[1], "description": row[2], "category": category,
+                 "previous_category": row[3], "account": row[4], "amount": row[5]}
+                for row, category in changes
+            ]
+        }
+
+    def query(self, account=None, category=None, start_date=None, end_date=None, min_amount=None,
+              max_amount=None, search=None, sort='date', direction='desc', limit=DEFAULT_PAGE_SIZE,
+              cursor=None):
+        """
+        Return one page of transactions and the cursor for the next page.
+
+        Pages are keyset-paginated on (sort column, id), so fetching a deep
+        page costs the same as fetching the first one. The next cursor is None
+        on the last page.
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Cannot sort by {sort!r}; expected one of {', '.join(SORT_COLUMNS)}")
+        if direction not in ('asc', 'desc'):
+            raise ValueError("Sort direction must be 'asc' or 'desc'")
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+        where, params = filter_clauses(account, category, start_date, end_date, min_amount, max_amount)
+        if cursor:
+            value, row_id = decode_cursor(cursor)
+            where.append(f"(t.{sort}, t.id) {'<' if direction == 'desc' else '>'} (?, ?)")
+            params.extend((value, row_id))
+
+        with self._connect() as conn:
+            if search:
+                words = search.split()
+                for word in words:
+                    where.append("t.description LIKE ? ESCAPE '\\'")
+                    params.append(like_pattern(word))
+                # Trigrams only index words of three or more characters
+                match = ' '.join('"' + word.replace('"', '""') + '"' for word in words if len(word) >= 3)
+                if match and self._is_rare(conn, match):
+                    where.append("t.id IN (SELECT rowid FROM transactions_fts WHERE transactions_fts MATCH ?)")
+                    params.append(match)
+
+            sql = "SELECT t.id, t.date, t.description, t.category, t.account, t.amount FROM transactions t"
+            if where:
+                sql += " WHERE " + " AND ".join(where)
+            sql += f" ORDER BY t.{sort} {direction.upper()}, t.id {direction.upper()} LIMIT ?"
+            params.append(limit + 1)
+            rows = conn.execute(sql, params).fetchall()
+            merchants = self._merchant_names(conn, [row[2] for row in rows[:limit]])
+
+        transactions = [
+            {"id": row[0], "date": row[1], "description": row[2], "merchant": merchants.get(row[2]),
+             "category": row[3], "account": row[4], "amount": row[5]}
+            for row in rows[:limit]
+        ]
+        next_cursor = None
+        if len(rows) > limit:
+            last = transactions[-1]
+            next_cursor = encode_cursor(last[sort], last["id"])
+        return transactions, next_cursor
+
+    def export_chunks(self, account=None, category=None, start_date=None, end_date=None, min_amount=None,
+                      max_amount=None, chunk_size=DEFAULT_EXPORT_CHUNK):
+        """
+        Yield the matching transactions in (date, id) order as chunks of
+        export columns (see export.EXPORT_COLUMNS), chunk_size rows each.
+
+        The filters are part of every chunk's query, so an account or date
+        range is read through its index and never in full. Each chunk is a
+        keyset query after the last row of the one before: memory stays at
+        one chunk, and no read transaction is held open across chunks, so a
+        long export does not hold back WAL checkpoints. Rows stored while an
+        export runs may or may not be included.
+        """
+        filters, params = filter_clauses(account, category, start_date, end_date, min_amount, max_amount)
+        sql = ("SELECT t.id, t.date, t.description, m.name, t.category, t.account, t.amount FROM transactions t "
+               "LEFT JOIN merchant_descriptions d ON d.description = t.description "
+               "LEFT JOIN merchants m ON m.id = d.merchant_id WHERE ")
+        last = None
+        with self._connect() as conn:
+            while True:
+                where = list(filters)
+                if last is not None:
+                    where.append("(t.date, t.id) > (?, ?)")
+                rows = conn.execute(
+                    sql + (" AND ".join(where) or "1") + " ORDER BY t.date, t.id LIMIT ?",
+                    (*params, *(last or ()), chunk_size)).fetchall()
+                if not rows:
+                    return
+                yield dict(zip(EXPORT_COLUMNS, zip(*rows)))
+                if len(rows) < chunk_size:
+                    return
+                last = (rows[-1][1], rows[-1][0])
+
+    def _refresh_recurring(self, conn, merchant_ids):
+        """
+        Re-detect the recurring charges of the given merchants
+        """
+        rows = []
+        for merchant_id in merchant_ids:
+            if merchant_id is None:
+                continue
+            conn.execute("DELETE FROM recurring_charges WHERE merchant_id = ?", (merchant_id,))
+            # An index range read per merchant, however long its history
+            rows += conn.execute(
+                "SELECT id, merchant_id, date, amount FROM transactions WHERE merchant_id = ? AND amount < 0 "
+                "ORDER BY date DESC LIMIT ?", (merchant_id, HISTORY_CHARGES)).fetchall()
+        self._store_recurring(conn, rows)
+
+    def _rebuild_recurring(self, conn):
+        logger.info("Detecting recurring charges")
+        conn.execute("DELETE FROM recurring_charges")
+        self._store_recurring(conn, conn.execute(
+            "SELECT id, merchant_id, date, amount FROM transactions WHERE amount < 0 AND merchant_id IS NOT NULL"
+        ).fetchall())
+
+    def _store_recurring(self, conn, rows):
+        """
+        Detect recurring charges among (id, merchant id, date, amount) charge rows and store them
+        """
+        if not rows:
+            return
+        ids, merchant_codes, dates, amounts = zip(*rows)
+        days = np.array(dates, dtype='datetime64[D]').astype(np.int64)
+        cents = np.rint(np.array(amounts) * -100).astype(np.int64)
+        found = detect(merchant_codes, days, cents)
+        # Describe each merchant by its latest charge
+        last_ids = [ids[charge["last"]] for charge in found]
+        latest = {}
+        for start in range(0, len(last_ids), RECURRING_LOOKUP_CHUNK):
+            chunk = last_ids[start:start + RECURRING_LOOKUP_CHUNK]
+            latest.update((row_id, (description, account)) for row_id, description, account in conn.execute(
+                f"SELECT id, description, account FROM transactions WHERE id IN ({', '.join('?' * len(chunk))})",
+                chunk))
+        conn.executemany(
+            "INSERT INTO recurring_charges (merchant_id, description, account, cadence, amount, count, first_date, "
+            "last_date, next_date, regularity) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((charge["merchant"], *latest[ids[charge["last"]]], charge["cadence"], charge["amount"],
+              charge["count"], day_to_iso(charge["first_day"]), day_to_iso(charge["last_day"]),
+              day_to_iso(charge["next_day"]), charge["regularity"])
+             for charge in found))
+
+    def recurring(self, active=None):
+        """
+        Return the detected recurring charges, largest monthly cost first.
+
+        A charge is active until its next expected date, plus the cadence's
+        tolerance, falls before the latest stored transaction; active=True or
+        False keeps only those that are or are not.
+        """
+        with self._connect() as conn:
+            latest = conn.execute("SELECT MAX(date) FROM transactions").fetchone()[0]
+            rows = conn.execute(
+                "SELECT r.merchant_id, m.name, r.description, r.account, r.cadence, r.amount, r.count, r.first_date, "
+                "r.last_date, r.next_date, r.regularity FROM recurring_charges r "
+                "JOIN merchants m ON m.id = r.merchant_id").fetchall()
+        latest_day = iso_to_day(latest) if latest else 0
+
+        charges = []
+        for merchant_id, merchant, description, account, cadence, amount, count, first_date, last_date, next_date, \
+                regularity in rows:
+            is_active = iso_to_day(next_date) + CADENCE_TOLERANCES[cadence] >= latest_day
+            if active is not None and is_active != active:
+                continue
+            charges.append({
+                "merchant": merchant,
+                "merchant_id": merchant_id,
+                "description": description,
+                "account": account,
+                "cadence": cadence,
+                "amount": amount / 100,
+                "monthly_amount": round(amount * CADENCE_PERIODS['monthly'] / CADENCE_PERIODS[cadence]) / 100,
+                "count": count,
+                "first_date": first_date,
+                "last_date": last_date,
+                "next_date": next_date,
+                "regularity": regularity,
+                "active": is_active
+            })
+        charges.sort(key=lambda charge: (-charge["monthly_amount"], charge["merchant"]))
+        return charges
+
+    def aggregates(self, start_month=None, end_month=None, top_merchants=DEFAULT_TOP_MERCHANTS):
+        """
+        Return the Dashboard/Insights rollups, sized by months x categories.
+
+        start_month and end_month (yyyy-mm, inclusive) bound the monthly and
+        category figures; merchant and account totals cover all history.
+        """
+        where = []
+        params = []
+        if start_month:
+            where.append("month >= ?")
+            params.append(start_month)
+        if end_month:
+            where.append("month <= ?")
+            params.append(end_month)
+        month_filter = f" WHERE {' AND '.join(where)}" if where else ""
+
+        with self._connect() as conn:
+            monthly_rows = conn.execute(
+                f"SELECT month, income, expense, count FROM monthly_totals{month_filter} ORDER BY month",
+                params).fetchall()
+            category_rows = conn.execute(
+                f"SELECT category, month, expense FROM category_month_totals{month_filter}", params).fetchall()
+            merchant_rows = conn.execute(
+                "SELECT t.merchant_id, m.name, t.expense, t.count FROM merchant_totals t "
+                "JOIN merchants m ON m.id = t.merchant_id ORDER BY t.expense DESC LIMIT ?",
+                (max(0, int(top_merchants)),)).fetchall()
+            account_rows = conn.execute("SELECT account, net FROM account_totals ORDER BY account").fetchall()
+
+        months = [row[0] for row in monthly_rows]
+        monthly = [
+            {"month": month, "income": income / 100, "expense": expense / 100, "net": (income - expense) / 100,
+             "count": count}
+            for month, income, expense, count in monthly_rows
+        ]
+
+        # Dense category x month matrix over the months that have data
+        category_months = {}
+        category_totals = {}
+        for category, month, expense in category_rows:
+            category_months.setdefault(category, {})[month] = expense
+            category_totals[category] = category_totals.get(category, 0) + expense
+        categories = {
+            category: [{"month": month, "spending": by_month.get(month, 0) / 100} for month in months]
+            for category, by_month in sorted(category_months.items())
+        }
+
+        income = sum(row[1] for row in monthly_rows)
+        expense = sum(row[2] for row in monthly_rows)
+        return {
+            "summary": {
+                "income": income / 100,
+                "expenses": expense / 100,
+                "net": (income - expense) / 100,
+                "by_category": [{"name": category, "value": total / 100}
+                                for category, total in sorted(category_totals.items(), key=lambda item: -item[1])],
+                "accounts": [{"name": account, "value": net / 100} for account, net in account_rows]
+            },
+            "monthly": monthly,
+            "categories": categories,
+            "merchants": [{"merchant": name, "merchant_id": merchant_id, "spending": total / 100, "count": count}
+                          for merchant_id, name, total, count in merchant_rows]
+        }
+
+    def _is_rare(self, conn, match):
+        row = conn.execute("SELECT COUNT(*) FROM (SELECT rowid FROM transactions_fts "
+                           "WHERE transactions_fts MATCH ? LIMIT ?)", (match, RARE_MATCHES)).fetchone()
+        return row[0] < RARE_MATCHES
+
+    def info(self):
+        """
+        Return the number of stored statements and transactions
+        """
+        with self._connect() as conn:
+            statements = conn.execute("SELECT COUNT(*) FROM statements").fetchone()[0]
+            transactions = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+        return {"statements": statements, "transactions": transactions}
@@ -0,0 +1,6 @@
+from app import create_app
+
+# Production entry point, served by gunicorn (see gunicorn.conf.py), which loads it once before forking
+# its workers. Everything requests would load on first use is loaded here, so the workers share it, and
+# the job dispatcher is left for each worker to start after the fork.
+app = create_app({'WARM_START': True, 'START_JOB_DISPATCHER': False})
@@ -17,6 +17,9 @@ import {
   ResponsiveContainer 
 } from 'recharts';
 
+// replace with your actual API endpoint
+const API_URL = 'http://localhost:5000';
+
 export default function Dashboard({ parsedData }) {
   const [summary, setSummary] = useState({
     totalIncome: 0,
@@ -41,57 +44,80 @@ export default function Dashboard({ parsedData }) {
     // Process data for dashboard
     if (parsedData.transactions) {
       const transactions = parsedData.transactions;
-      
-      // Calculate income, expenses, and net cashflow
-      const income = transactions
-        .filter(t => parseFloat(t.amount) > 0)
-        .reduce((sum, t) => sum + parseFloat(t.amount), 0);
-        
-      const expenses = transactions
-        .filter(t => parseFloat(t.amount) < 0)
-        .reduce((sum, t) => sum + Math.abs(parseFloat(t.amount)), 0);
-        
-      // Calculate spending by category
-      const categoryMap = {};
-      transactions
-        .filter(t => parseFloat(t.amount) < 0)
-        .forEach(t => {
-          const category = t.category || 'Uncategorized';
-          categoryMap[category] = (categoryMap[category] || 0) + Math.abs(parseFloat(t.amount));
-        });
-        
-      const spendingByCategory = Object.entries(categoryMap)
-        .map(([name, value]) => ({ name, value }))
-        .sort((a, b) => b.value - a.value);
-      
-      // Get account balances
-      const accountMap = {};
-      transactions.forEach(t => {
-        if (!accountMap[t.account]) {
-          accountMap[t.account] = 0;
-        }
-        accountMap[t.account] += parseFloat(t.amount);
-      });
-      
-      const balances = Object.entries(accountMap)
-        .map(([name, value]) => ({ name, value }));
+      let cancelled = false;
       
       // Get recent transactions
       const recentTransactions = [...transactions]
         .sort((a, b) => new Date(b.date) - new Date(a.date))
         .slice(0, 5);
       
-      setSummary({
-        totalIncome: income,
-        totalExpenses: expenses,
-        netCashflow: income - expenses,
-        spendingByCategory,
-        balances,
-        recentTransactions
-      });
+      // The server keeps the totals of every stored statement; without a store, sum the uploaded ones here
+      fetch(`${API_URL}/api/aggregates/summary`)
+        .then(response => response.ok ? response.json() : Promise.reject(response.status))
+        .then(({ summary: totals }) => ({
+          totalIncome: totals.income,
+          totalExpenses: totals.expenses,
+          netCashflow: totals.net,
+          spendingByCategory: totals.by_category,
+          balances: totals.accounts
+        }))
+        .catch(() => summarizeTransactions(transactions))
+        .then(totals => {
+          if (!cancelled) {
+            setSummary({ ...totals, recentTransactions });
+          }
+        });
+      
+      return () => {
+        cancelled = true;
+      };
     }
   }, [parsedData, navigate]);
 
+  const summarizeTransactions = (transactions) => {
+    // Calculate income, expenses, and net cashflow
+    const income = transactions
+      .filter(t => parseFloat(t.amount) > 0)
+      .reduce((sum, t) => sum + parseFloat(t.amount), 0);
+      
+    const expenses = transactions
+      .filter(t => parseFloat(t.amount) < 0)
+      .reduce((sum, t) => sum + Math.abs(parseFloat(t.amount)), 0);
+      
+    // Calculate spending by category
+    const categoryMap = {};
+    transactions
+      .filter(t => parseFloat(t.amount) < 0)
+      .forEach(t => {
+        const category = t.category || 'Uncategorized';
+        categoryMap[category] = (categoryMap[category] || 0) + Math.abs(parseFloat(t.amount));
+      });
+      
+    const spendingByCategory = Object.entries(categoryMap)
+      .map(([name, value]) => ({ name, value }))
+      .sort((a, b) => b.value - a.value);
+    
+    // Get account balances
+    const accountMap = {};
+    transactions.forEach(t => {
+      if (!accountMap[t.account]) {
+        accountMap[t.account] = 0;
+      }
+      accountMap[t.account] += parseFloat(t.amount);
+    });
+    
+    const balances = Object.entries(accountMap)
+      .map(([name, value]) => ({ name, value }));
+    
+    return {
+      totalIncome: income,
+      totalExpenses: expenses,
+      netCashflow: income - expenses,
+      spendingByCategory,
+      balances
+    };
+  };
+
   const formatCurrency = (amount) => {
     return new Intl.NumberFormat('en-US', {
       style: 'currency',
@@ -14,6 +14,10 @@ import {
   ResponsiveContainer 
 } from 'recharts';
 
+// replace with your actual API endpoint
+const API_URL = 'http://localhost:5000';
+const TOP_MERCHANTS = 5;
+
 export default function Insights({ parsedData }) {
   const [spendingTrends, setSpendingTrends] = useState([]);
   const [categoryTrends, setCategoryTrends] = useState({});
@@ -31,10 +35,77 @@ export default function Insights({ parsedData }) {
 
     if (parsedData.transactions) {
       const transactions = parsedData.transactions;
-      analyzeTransactions(transactions);
+      let cancelled = false;
+      const getJson = (path) => fetch(`${API_URL}${path}`)
+        .then(response => response.ok ? response.json() : Promise.reject(response.status));
+      
+      // The server keeps the rollups of every stored statement; without a store, analyze the uploaded ones here
+      Promise.all([getJson(`/api/aggregates?merchants=${TOP_MERCHANTS}`), getJson('/api/recurring?active=1')])
+        .then(([aggregates, recurring]) => {
+          if (!cancelled) {
+            analyzeAggregates(aggregates, recurring.recurring);
+          }
+        })
+        .catch(() => {
+          if (!cancelled) {
+            analyzeTransactions(transactions);
+          }
+        });
+      
+      return () => {
+        cancelled = true;
+      };
     }
   }, [parsedData, navigate]);
 
+  const analyzeAggregates = (aggregates, recurringCharges) => {
+    const spendingTrendsArray = aggregates.monthly.map(data => ({
+      date: data.month,
+      income: data.income,
+      expense: data.expense,
+      net: data.net,
+      month: formatMonthYear(data.month)
+    }));
+    
+    setSpendingTrends(spendingTrendsArray);
+    
+    const categoryTrendsData = {};
+    const categoryByDate = {};
+    
+    Object.entries(aggregates.categories).forEach(([category, data]) => {
+      categoryTrendsData[category] = data.map(point => ({
+        month: formatMonthYear(point.month),
+        spending: point.spending
+      }));
+      
+      // Only the months with spending, as analyzeTransactions counts them
+      categoryByDate[category] = {};
+      data
+        .filter(point => point.spending > 0)
+        .forEach(point => {
+          categoryByDate[category][point.month] = point.spending;
+        });
+    });
+    
+    setCategoryTrends(categoryTrendsData);
+    
+    const topMerchantsArray = aggregates.merchants
+      .slice(0, TOP_MERCHANTS)
+      .map(merchant => ({ name: merchant.merchant, amount: merchant.spending }));
+    
+    setTopMerchants(topMerchantsArray);
+    
+    const recurringMerchants = recurringCharges
+      .slice(0, 5)
+      .map(charge => ({
+        name: charge.merchant,
+        frequency: charge.cadence.charAt(0).toUpperCase() + charge.cadence.slice(1),
+        averageAmount: charge.monthly_amount
+      }));
+    
+    generateInsights(spendingTrendsArray, categoryByDate, topMerchantsArray, recurringMerchants);
+  };
+
   const analyzeTransactions = (transactions) => {
     // Group transactions by date (month and year)
     const spendingByDate = {};
@@ -50,7 +121,8 @@ export default function Insights({ parsedData }) {
       const monthYear = `${date.getFullYear()}-${date.getMonth() + 1}`;
       const amount = parseFloat(transaction.amount);
       const category = transaction.category || 'Uncategorized';
-      const merchant = transaction.description;
+      // The server clusters descriptions into merchants when it stores statements
+      const merchant = transaction.merchant || transaction.description;
       
       // Calculate spending by date
       if (!spendingByDate[monthYear]) {
@@ -121,16 +193,16 @@ export default function Insights({ parsedData }) {
     // Get top 5 merchants by spending
     const topMerchantsArray = Object.entries(merchantSpending)
       .sort((a, b) => b[1] - a[1])
-      .slice(0, 5)
+      .slice(0, TOP_MERCHANTS)
       .map(([name, amount]) => ({ name, amount }));
     
     setTopMerchants(topMerchantsArray);
     
     // Generate AI insights
-    generateInsights(transactions, spendingTrendsArray, categoryByDate, topMerchantsArray);
+    generateInsights(spendingTrendsArray, categoryByDate, topMerchantsArray, findRecurringExpenses(transactions));
   };
 
-  const generateInsights = (transactions, spendingTrends, categoryByDate, topMerchants) => {
+  const generateInsights = (spendingTrends, categoryByDate, topMerchants, recurringMerchants) => {
     const insights = [];
     
     // Insight 1: Overall spending trend
@@ -250,8 +322,6 @@ export default function Insights({ parsedData }) {
     }
     
     // Insight 5: Recurring expenses
-    const recurringMerchants = findRecurringExpenses(transactions);
-    
     if (recurringMerchants.length > 0) {
       const totalRecurring = recurringMerchants.reduce((sum, merchant) => sum + merchant.averageAmount, 0);
       
@@ -276,7 +346,7 @@ export default function Insights({ parsedData }) {
     transactions
       .filter(t => parseFloat(t.amount) < 0) // Only expenses
       .forEach(transaction => {
-        const merchant = transaction.description;
+        const merchant = transaction.merchant || transaction.description;
         const date = new Date(transaction.date);
         const amount = Math.abs(parseFloat(transaction.amount));
         
@@ -2,10 +2,15 @@
 import { useState } from "react";
 import { useNavigate } from 'react-router-dom';
 
+// replace with your actual API endpoint
+const API_URL = 'http://localhost:5000';
+const JOB_POLL_INTERVAL = 1000;
+
 export default function Upload({ setLoading, loading, setParsedData }) {
     const [files, setFiles] = useState([]);
     const [dragActive, setDragActive] = useState(false);
     const [error, setError] = useState(null);
+    const [progress, setProgress] = useState(null);
     const navigate = useNavigate();
 
     const handleDrag = (e) => {
@@ -67,23 +72,56 @@ export default function Upload({ setLoading, loading, setParsedData }) {
         });
 
         try {
-            // replace with your actual API endpoint
-            const response = await fetch('http://localhost:5000/api/parse-statements', {
+            // Queue the files as a background job, then poll until every file is parsed
+            let response = await fetch(`${API_URL}/api/jobs`, {
                 method: 'POST',
                 body: formData,
             });
+            // Servers without a job queue (JOBS_PATH unset) parse the upload in the request instead
+            const queued = response.status !== 404;
+            if (!queued) {
+                response = await fetch(`${API_URL}/api/parse-statements`, {
+                    method: 'POST',
+                    body: formData,
+                });
+            }
 
+            if (response.status === 429) {
+                // Too many files waiting to be parsed
+                const busy = await response.json();
+                throw new Error(`${busy.error} (retry in ${busy.retry_after} s)`);
+            }
             if (!response.ok) {
                 throw new Error('Failed to parse statements');
             }
 
-            const data = await response.json();
+            let resultsResponse = response;
+            if (queued) {
+                let job = await response.json();
+                while (job.status === 'queued' || job.status === 'running') {
+                    setProgress(job.progress);
+                    await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL));
+                    const statusResponse = await fetch(`${API_URL}/api/jobs/${job.id}`);
+                    if (!statusResponse.ok) {
+                        throw new Error('Failed to parse statements');
+                    }
+                    job = await statusResponse.json();
+                }
+
+                resultsResponse = await fetch(`${API_URL}/api/jobs/${job.id}/results`);
+                if (!resultsResponse.ok) {
+                    throw new Error('Failed to parse statements');
+                }
+            }
+
+            const data = await resultsResponse.json();
             setParsedData(data);
             navigate('/');
         } catch (err) {
             setError(err.message);
         } finally {
             setLoading(false);
+            setProgress(null);
         }
     };
 
@@ -183,7 +221,9 @@ export default function Upload({ setLoading, loading, setParsedData }) {
               : 'bg-blue-600 hover:bg-blue-700 text-white'
           }`}
         >
-          {loading ? 'Processing...' : 'Analyze Statements'}
+          {loading
+            ? (progress ? `Processing ${progress.done + progress.failed} of ${progress.total}...` : 'Processing...')
+            : 'Analyze Statements'}
         </button>
       </div>
     </div>